@@ -6,3 +6,9 @@ admin.site.register(Company)
 admin.site.register(Country)
 admin.site.register(State)
 
+
+@admin.register(JobRun)
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = ('task_name', 'status', 'started_at', 'duration', 'worker')
+    list_filter = ('task_name', 'status')
+
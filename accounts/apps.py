@@ -8,3 +8,4 @@ class AccountsConfig(AppConfig):
     def ready(self):
 
         from . import signals  # Import signals to ensure they are registered
+        from . import jobs  # Celery hooks that record JobRun rows
@@ -0,0 +1,165 @@
+"""
+Run history for Celery tasks.
+
+The Celery signal hooks below write a ``JobRun`` row for every task a worker
+executes (only those started by beat when ``JOB_RUN_PERIODIC_ONLY`` is on):
+start and end time, duration, memory and, with ``JOB_RUN_TRACE_MEMORY``, the
+tracemalloc peak of the run itself.
+
+``ru_maxrss`` is the peak RSS of the whole worker process, not of one run,
+so a run records both that peak and how far it grew during the run (zero
+when the run stayed under an earlier run's peak).
+
+Code running inside a task attributes time to a phase with
+``with phase('email'):`` and tallies outcomes with ``count('created')``. Both
+do nothing outside a recorded run, so shared code such as
+``AutoGenerateInvoiceAPIView.generate_invoices`` can call them from a view too.
+"""
+import logging
+import sys
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from celery.signals import task_failure, task_postrun, task_prerun, task_retry
+from django.conf import settings
+from django.utils import timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('job_run', default=None)
+_active = {}
+
+
+class _Recorder:
+    def __init__(self, run, trace_memory):
+        self.run = run
+        self.trace_memory = trace_memory
+        self.started = time.perf_counter()
+        self.rss_baseline_kb = _peak_rss_kb()
+        self.phases = defaultdict(float)
+        self.counts = Counter()
+        self.error = None
+
+
+@contextmanager
+def phase(name):
+    """Add the time spent in the block to phase ``name`` of the current run."""
+    recorder = _current.get()
+    if recorder is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.phases[name] += time.perf_counter() - started
+
+
+def count(outcome, amount=1):
+    """Add ``amount`` to the ``outcome`` tally of the current run."""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.counts[outcome] += amount
+
+
+def _peak_rss_kb():
+    """Peak RSS of this process so far, in kilobytes."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS.
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+@task_prerun.connect(dispatch_uid='accounts.jobs.prerun')
+def _start_run(task_id=None, task=None, **kwargs):
+    from .models import JobRun
+
+    periodic_task_name = getattr(task.request, 'periodic_task_name', None)
+    if getattr(settings, 'JOB_RUN_PERIODIC_ONLY', True) and not periodic_task_name:
+        return
+    try:
+        run = JobRun.objects.create(
+            task_name=task.name, task_id=task_id, periodic_task_name=periodic_task_name,
+            worker=task.request.hostname,
+        )
+    except Exception:
+        logger.exception('Could not record the start of %s', task.name)
+        return
+
+    trace_memory = getattr(settings, 'JOB_RUN_TRACE_MEMORY', False) and not tracemalloc.is_tracing()
+    if trace_memory:
+        tracemalloc.start()
+    recorder = _Recorder(run, trace_memory)
+    _active[task_id] = (recorder, _current.set(recorder))
+
+
+@task_failure.connect(dispatch_uid='accounts.jobs.failure')
+def _record_failure(task_id=None, exception=None, **kwargs):
+    entry = _active.get(task_id)
+    if entry is not None:
+        entry[0].error = f'{type(exception).__name__}: {exception}'
+
+
+@task_retry.connect(dispatch_uid='accounts.jobs.retry')
+def _record_retry(request=None, reason=None, **kwargs):
+    entry = _active.get(getattr(request, 'id', None))
+    if entry is not None:
+        entry[0].error = f'Retry: {reason}'
+
+
+@task_postrun.connect(dispatch_uid='accounts.jobs.postrun')
+def _finish_run(task_id=None, retval=None, state=None, **kwargs):
+    entry = _active.pop(task_id, None)
+    if entry is None:
+        return
+    recorder, token = entry
+    _current.reset(token)
+
+    run = recorder.run
+    run.finished_at = timezone.now()
+    run.duration = time.perf_counter() - recorder.started
+    run.phase_timings = {name: round(seconds, 6) for name, seconds in recorder.phases.items()}
+    run.counts = dict(recorder.counts)
+    run.peak_rss_kb = _peak_rss_kb()
+    if run.peak_rss_kb is not None and recorder.rss_baseline_kb is not None:
+        run.rss_growth_kb = run.peak_rss_kb - recorder.rss_baseline_kb
+    if recorder.trace_memory:
+        run.traced_peak_kb = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+
+    # Tasks in this repo catch their own exceptions and report
+    # ``{'success': False}`` instead of raising.
+    reported_failure = isinstance(retval, dict) and retval.get('success') is False
+    if state == 'RETRY':
+        run.status = 'retried'
+    elif state == 'SUCCESS' and not reported_failure:
+        run.status = 'succeeded'
+    else:
+        run.status = 'failed'
+    run.error = recorder.error or (retval.get('message') if reported_failure else None)
+
+    try:
+        run.save()
+    except Exception:
+        logger.exception('Could not record the end of %s', run.task_name)
+
+
+def prune_job_runs(days=None):
+    """Delete runs older than ``days`` (default ``JOB_RUN_RETENTION_DAYS``)."""
+    from .models import JobRun
+
+    if days is None:
+        days = getattr(settings, 'JOB_RUN_RETENTION_DAYS', 90)
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = JobRun.objects.filter(started_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from accounts.jobs import prune_job_runs
+
+
+class Command(BaseCommand):
+    help = 'Deletes job run history older than the retention period (JOB_RUN_RETENTION_DAYS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Override JOB_RUN_RETENTION_DAYS')
+
+    def handle(self, *args, **options):
+        deleted = prune_job_runs(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} job runs'))
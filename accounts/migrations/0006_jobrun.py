@@ -0,0 +1,38 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_company_token_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_name', models.CharField(max_length=255)),
+                ('task_id', models.CharField(db_index=True, max_length=255)),
+                ('periodic_task_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('worker', models.CharField(blank=True, max_length=255, null=True)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed'), ('retried', 'Retried')], default='running', max_length=20)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('duration', models.FloatField(blank=True, help_text='Seconds', null=True)),
+                ('phase_timings', models.JSONField(blank=True, default=dict, help_text='Seconds per phase')),
+                ('counts', models.JSONField(blank=True, default=dict, help_text='Items per outcome')),
+                ('peak_rss_kb', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('traced_peak_kb', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+                'indexes': [
+                    models.Index(fields=['task_name', '-started_at'], name='jobrun_task_started_idx'),
+                    models.Index(fields=['started_at'], name='jobrun_started_idx'),
+                ],
+            },
+        ),
+    ]
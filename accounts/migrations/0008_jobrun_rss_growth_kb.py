@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_company_logo_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobrun',
+            name='rss_growth_kb',
+            field=models.PositiveBigIntegerField(blank=True, help_text='How far this run raised the process peak RSS', null=True),
+        ),
+        migrations.AlterField(
+            model_name='jobrun',
+            name='peak_rss_kb',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Peak RSS of the worker process since it started', null=True),
+        ),
+    ]
@@ -79,7 +79,31 @@ class State(models.Model):
         return self.name
 
 
-class Company(models.Model):
+class TokenVersionMixin:
+    """
+    Bumps ``token_version`` whenever ``status`` changes (block/unblock), which
+    revokes every access token issued before the change.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def save(self, *args, **kwargs):
+        loaded_status = getattr(self, '_loaded_status', None)
+        self._token_version_bumped = bool(self.pk and loaded_status is not None and loaded_status != self.status)
+        if self._token_version_bumped:
+            self.token_version = (self.token_version or 0) + 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'token_version'}
+        super().save(*args, **kwargs)
+        self._loaded_status = self.status
+
+
+class Company(TokenVersionMixin, models.Model):
     user_id = models.CharField(max_length=255, unique=True,blank=True, null=True)
     company_name = models.CharField(max_length=255,blank=True, null=True)
     company_admin_name = models.CharField(max_length=255,blank=True, null=True)
@@ -88,12 +112,15 @@ class Company(models.Model):
     phone_no1 = models.CharField(max_length=15,blank=True, null=True)
     phone_no2 = models.CharField(max_length=15, blank=True, null=True)   
     company_logo = models.ImageField(upload_to='company_photos/', null=True, blank=True)
+    # Resized copies of company_logo; see rentbiz.utils.images.
+    logo_variants = models.JSONField(null=True, blank=True, editable=False)
 
     STATUS_CHOICES = [
         ('active', 'Active'),
         ('blocked', 'Blocked'),
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    token_version = models.PositiveIntegerField(default=0, editable=False)
     currency = models.CharField(max_length=255,blank=True, null=True) 
     currency_code = models.CharField(max_length=255,blank=True, null=True) 
     date_joined = models.DateTimeField(auto_now_add=True)
@@ -109,3 +136,39 @@ class Company(models.Model):
 
     def __str__(self):
         return str(self.company_name or "Unnamed Company")
+
+
+class JobRun(models.Model):
+    """One execution of a Celery task, recorded by ``accounts.jobs``."""
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('retried', 'Retried'),
+    ]
+    task_name = models.CharField(max_length=255)
+    task_id = models.CharField(max_length=255, db_index=True)
+    periodic_task_name = models.CharField(max_length=255, blank=True, null=True)
+    worker = models.CharField(max_length=255, blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    duration = models.FloatField(blank=True, null=True, help_text='Seconds')
+    phase_timings = models.JSONField(default=dict, blank=True, help_text='Seconds per phase')
+    counts = models.JSONField(default=dict, blank=True, help_text='Items per outcome')
+    peak_rss_kb = models.PositiveBigIntegerField(
+        blank=True, null=True, help_text='Peak RSS of the worker process since it started')
+    rss_growth_kb = models.PositiveBigIntegerField(
+        blank=True, null=True, help_text='How far this run raised the process peak RSS')
+    traced_peak_kb = models.PositiveBigIntegerField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['task_name', '-started_at'], name='jobrun_task_started_idx'),
+            models.Index(fields=['started_at'], name='jobrun_started_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task_name} {self.started_at:%Y-%m-%d %H:%M} ({self.status})'
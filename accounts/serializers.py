@@ -2,10 +2,13 @@
 from rest_framework import serializers
 from django.contrib.auth.hashers import make_password
 from .models import *
+from rentbiz.utils.images import variant_urls
 
 
 
 class CompanySerializer(serializers.ModelSerializer):
+    logo_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Company
         fields = '__all__'
@@ -13,6 +16,9 @@ class CompanySerializer(serializers.ModelSerializer):
             'password': {'write_only': True},
         }
 
+    def get_logo_variants(self, obj):
+        return variant_urls(obj.company_logo, obj.logo_variants)
+
     def create(self, validated_data):
         password = validated_data.pop('password', None)
         company = Company(**validated_data)
@@ -42,4 +48,9 @@ class CountrySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Country
-        fields = ['id', 'name', 'code', 'states']
\ No newline at end of file
+        fields = ['id', 'name', 'code', 'states']
+
+class JobRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = JobRun
+        fields = '__all__'
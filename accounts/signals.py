@@ -3,13 +3,20 @@ from django.db.models.signals import post_migrate
 from django.dispatch import receiver
 from django_celery_beat.models import PeriodicTask, IntervalSchedule
 from django.utils import timezone
+from rentbiz.utils import images
+from .models import Company
+import logging
+
+logger = logging.getLogger(__name__)
+
+images.register(Company, 'company_logo', 'logo_variants')
 
 @receiver(post_migrate)
 def setup_periodic_tasks(sender, **kwargs):
     """
     Setup periodic tasks after migrations are complete
     """
-    print(f"Signal received for app: {sender.name}")
+    logger.debug("Signal received for app: %s", sender.name)
     if sender.name == 'accounts':
 
 
@@ -30,3 +37,25 @@ def setup_periodic_tasks(sender, **kwargs):
                 'start_time': timezone.now(),
             }
         )
+
+        PeriodicTask.objects.update_or_create(
+            name='Prune Job Run History - Daily',
+            defaults={
+                'interval': schedule,
+                'task': 'accounts.tasks.prune_job_runs',
+                'description': 'Daily task to delete job runs past JOB_RUN_RETENTION_DAYS',
+                'enabled': True,
+                'start_time': timezone.now(),
+            }
+        )
+
+        PeriodicTask.objects.update_or_create(
+            name='Notify Expiring Documents - Daily',
+            defaults={
+                'interval': schedule,
+                'task': 'company.tasks.notify_expiring_documents',
+                'description': 'Daily digest of documents expiring within DOCUMENT_EXPIRY_NOTICE_DAYS',
+                'enabled': True,
+                'start_time': timezone.now(),
+            }
+        )
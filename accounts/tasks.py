@@ -2,37 +2,61 @@
 from celery import shared_task
 from django.utils import timezone
 from datetime import timedelta
+from company.models import InvoiceRun
 from company.views import AutoGenerateInvoiceAPIView
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
+from .jobs import prune_job_runs as delete_expired_job_runs
 import logging
 
 logger = logging.getLogger(__name__)
 
 @shared_task(bind=True)
-def generate_automated_invoices(self):
+def generate_automated_invoices(self, run_id=None):
     """
-    Celery task to generate automated invoices for all active configurations
+    Celery task to generate automated invoices for all active configurations.
+    An interrupted run is resumed from its last checkpoint.
     """
     try:
         logger.info("Starting automated invoice generation task")
-        
+
+        run = InvoiceRun.claim(run_id)
+        if run is None:
+            logger.info("Another invoice run is still in progress; nothing to do")
+            return {
+                'success': True,
+                'message': 'Another invoice run is in progress'
+            }
+        if run.last_config_id:
+            logger.info("Resuming invoice run %s after config %s", run.id, run.last_config_id)
+
         # Create an instance of the API view
         view = AutoGenerateInvoiceAPIView()
-        print("AutoGenerateInvoiceAPIView instance created")
+        logger.debug("AutoGenerateInvoiceAPIView instance created")
         
         # Call the generate_invoices method
-        results = view.generate_invoices()
+        results = view.generate_invoices(run)
         
-        logger.info(f"Automated invoice generation completed. Results: {results}")
+        logger.info("Automated invoice generation completed. Results: %s", results)
         return {
             'success': True,
             'message': 'Automated invoice generation completed',
+            'run_id': run.id,
             'results': results
         }
     except Exception as e:
-        logger.error(f"Error in automated invoice generation task: {str(e)}", exc_info=True)
+        logger.error("Error in automated invoice generation task: %s", e, exc_info=True)
         return {
             'success': False,
             'message': f'Failed to generate invoices: {str(e)}'
         }
+
+
+@shared_task
+def prune_job_runs(days=None):
+    """
+    Celery task to delete job run history older than JOB_RUN_RETENTION_DAYS
+    """
+    deleted = delete_expired_job_runs(days)
+    logger.info("Pruned %s job runs", deleted)
+    return {'success': True, 'deleted': deleted}
@@ -1,3 +1,222 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import tracemalloc
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from celery import shared_task
+from celery.backends.base import DisabledBackend
+from celery.exceptions import Retry
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import EmailMultiAlternatives
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from rentbiz.utils import images
+from . import jobs
+from .models import Company, Country, JobRun, State
+from .serializers import CompanySerializer
+
+
+class StaticReferenceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.country = Country.objects.create(name='United Arab Emirates', code='AE')
+        State.objects.create(name='Dubai', country=cls.country)
+
+    def test_countries_are_publicly_cacheable(self):
+        response = self.client.get('/accounts/countries/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=86400')
+        response = self.client.get('/accounts/countries/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_states_change_the_etag(self):
+        url = f'/accounts/countries/{self.country.id}/states/'
+        etag = self.client.get(url)['ETag']
+        State.objects.create(name='Sharjah', country=self.country)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+
+@shared_task(bind=True)
+def recorded_task(self, outcome='success'):
+    with jobs.phase('work'):
+        jobs.count('created', 2)
+    if outcome == 'reported':
+        return {'success': False, 'message': 'Nothing to invoice'}
+    if outcome == 'raise':
+        raise ValueError('boom')
+    if outcome == 'retry':
+        raise Retry('database is busy')
+    return {'success': True}
+
+
+@override_settings(JOB_RUN_PERIODIC_ONLY=False)
+class JobRunLedgerTests(TestCase):
+    def run_task(self, *args):
+        with mock.patch.object(recorded_task, '_backend', DisabledBackend(recorded_task.app)):
+            recorded_task.apply(args=args)
+        return JobRun.objects.get()
+
+    def test_successful_run(self):
+        run = self.run_task()
+        self.assertEqual((run.task_name, run.status, run.error), (recorded_task.name, 'succeeded', None))
+        self.assertEqual(run.counts, {'created': 2})
+        self.assertEqual(set(run.phase_timings), {'work'})
+        self.assertIsNotNone(run.finished_at)
+        self.assertGreaterEqual(run.duration, run.phase_timings['work'])
+
+    def test_reported_failure(self):
+        run = self.run_task('reported')
+        self.assertEqual((run.status, run.error), ('failed', 'Nothing to invoice'))
+
+    def test_exception(self):
+        run = self.run_task('raise')
+        self.assertEqual((run.status, run.error), ('failed', 'ValueError: boom'))
+
+    def test_retry(self):
+        run = self.run_task('retry')
+        self.assertEqual((run.status, run.error), ('retried', 'Retry: database is busy'))
+
+    def test_memory_is_measured_against_the_start_of_the_run(self):
+        # The process peak was already 900 MB when the run started.
+        with mock.patch.object(jobs, '_peak_rss_kb', side_effect=[900_000, 900_512]):
+            run = self.run_task()
+        self.assertEqual((run.peak_rss_kb, run.rss_growth_kb), (900_512, 512))
+
+    @override_settings(JOB_RUN_TRACE_MEMORY=True)
+    def test_traced_memory(self):
+        run = self.run_task()
+        self.assertIsNotNone(run.traced_peak_kb)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    @override_settings(JOB_RUN_PERIODIC_ONLY=True)
+    def test_only_periodic_runs_are_recorded(self):
+        with mock.patch.object(recorded_task, '_backend', DisabledBackend(recorded_task.app)):
+            recorded_task.apply()
+        self.assertFalse(JobRun.objects.exists())
+
+    def test_helpers_do_nothing_outside_a_run(self):
+        with jobs.phase('work'):
+            jobs.count('created')
+        self.assertFalse(JobRun.objects.exists())
+
+    def test_prune(self):
+        old = self.run_task()
+        JobRun.objects.filter(pk=old.pk).update(started_at=timezone.now() - timedelta(days=91))
+        recent = JobRun.objects.create(task_name='recent', task_id='recent')
+        self.assertEqual(jobs.prune_job_runs(), 1)
+        self.assertEqual(list(JobRun.objects.all()), [recent])
+
+
+def image_file(name, mode, size=(2000, 1000)):
+    content = BytesIO()
+    Image.new(mode, size, (200, 40, 40, 128) if mode == 'RGBA' else (200, 40, 40)).save(
+        content, 'PNG' if name.endswith('.png') else 'JPEG')
+    return SimpleUploadedFile(name, content.getvalue())
+
+
+class LogoVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        task = images.generate_image_variants
+        for patch in (
+            mock.patch.object(task, '_backend', DisabledBackend(task.app)),
+            # Run the task in-process when the commit hands it to Celery.
+            mock.patch.object(task, 'delay', lambda *args: task.apply(args=args)),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.company = Company.objects.create(user_id='acme', company_name='Acme', email_address='acme@example.com')
+
+    def upload(self, logo):
+        self.company.company_logo = logo
+        with self.captureOnCommitCallbacks(execute=True):
+            self.company.save()
+        self.company.refresh_from_db()
+        return self.company.logo_variants
+
+    def stored(self, name):
+        return default_storage.exists(name)
+
+    def test_variants_are_generated_after_the_commit(self):
+        variants = self.upload(image_file('acme.png', 'RGBA'))
+        self.assertEqual(set(variants), {'source', 'small', 'medium', 'large'})
+        self.assertEqual(variants['source'], self.company.company_logo.name)
+        for label, size in images.DEFAULT_VARIANTS.items():
+            with default_storage.open(variants[label]) as stored, Image.open(stored) as image:
+                self.assertEqual((image.format, max(image.size)), ('PNG', size))
+        urls = CompanySerializer(self.company).data['logo_variants']
+        self.assertEqual(urls['small'], default_storage.url(variants['small']))
+        self.assertEqual(urls['original'], self.company.company_logo.url)
+
+        response = self.client.get(f'/accounts/company/{self.company.id}/logo/', {'size': 'small'})
+        self.assertEqual(response['Location'], default_storage.url(variants['small']))
+
+    def test_opaque_logos_become_jpeg(self):
+        variants = self.upload(image_file('acme.jpg', 'RGB'))
+        self.assertTrue(variants['medium'].endswith('_medium_512.jpg'))
+
+    def test_original_is_served_until_the_variants_exist(self):
+        self.company.company_logo = image_file('acme.png', 'RGBA')
+        self.company.save()  # no commit yet, so no variants
+        urls = CompanySerializer(self.company).data['logo_variants']
+        self.assertEqual(set(urls.values()), {self.company.company_logo.url})
+
+    def test_failed_generation_falls_back_to_the_original(self):
+        render = images.render_variant
+
+        def fail_on_large(source, size):
+            if size == images.DEFAULT_VARIANTS['large']:
+                raise OSError('decoder error')
+            return render(source, size)
+
+        with mock.patch.object(images, 'render_variant', side_effect=fail_on_large), \
+                self.assertLogs('rentbiz.utils.images', 'ERROR'):
+            self.assertIsNone(self.upload(image_file('acme.png', 'RGBA')))
+        logo = self.company.company_logo
+        self.assertEqual(set(images.variant_urls(logo, None).values()), {logo.url})
+        # The variants made before the failure were removed again.
+        self.assertEqual(default_storage.listdir('company_photos/variants')[1], [])
+
+        # Emails still get a small inline logo, rendered on the fly.
+        email = EmailMultiAlternatives(to=['a@example.com'])
+        self.assertTrue(images.attach_inline(email, logo, None))
+        inline = email.attachments[0]
+        self.assertEqual(inline['Content-ID'], '<logo>')
+        with Image.open(BytesIO(inline.get_payload(decode=True))) as image:
+            self.assertEqual(max(image.size), images.DEFAULT_VARIANTS['small'])
+
+    def test_unreadable_logo_is_not_attached(self):
+        self.company.company_logo = SimpleUploadedFile('acme.png', b'not an image')
+        self.company.save()
+        email = EmailMultiAlternatives(to=['a@example.com'])
+        with self.assertLogs('rentbiz.utils.images', 'ERROR'):
+            self.assertFalse(images.attach_inline(email, self.company.company_logo, None))
+        self.assertEqual(email.attachments, [])
+
+    def test_replacing_or_removing_the_logo_deletes_old_variants(self):
+        first = self.upload(image_file('acme.png', 'RGBA'))
+        second = self.upload(image_file('acme2.png', 'RGBA'))
+        self.assertFalse(any(self.stored(first[label]) for label in images.DEFAULT_VARIANTS))
+        self.assertTrue(all(self.stored(second[label]) for label in images.DEFAULT_VARIANTS))
+
+        self.assertIsNone(self.upload(None))
+        self.assertFalse(any(self.stored(second[label]) for label in images.DEFAULT_VARIANTS))
+
+    def test_command_backfills_existing_logos(self):
+        name = default_storage.save('company_photos/old.png', image_file('old.png', 'RGBA'))
+        Company.objects.filter(pk=self.company.pk).update(company_logo=name)  # no signal
+        call_command('generate_logo_variants', stdout=StringIO())
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.logo_variants['source'], name)
@@ -9,8 +9,12 @@ urlpatterns = [
     path('company/create/', CompanyCreateAPIView.as_view(), name='company-create'),
     path('companies/<int:pk>/', CompanyDetailAPIView.as_view(), name='company-detail'),
     path('company/<int:company_id>/detail/', CompanyDetailView.as_view(), name='company-by-id'),
+    path('company/<int:company_id>/logo/', CompanyLogoView.as_view(), name='company-logo'),
     path('countries/', CountryListView.as_view(), name='country-list'),
-    path('countries/<int:country_id>/states/', StateListView.as_view(), name='state-list')
+    path('countries/<int:country_id>/states/', StateListView.as_view(), name='state-list'),
+    path('job-runs/', JobRunListView.as_view(), name='job-run-list'),
+    path('job-runs/trends/', JobRunTrendView.as_view(), name='job-run-trends'),
+    path('job-runs/<int:pk>/', JobRunDetailView.as_view(), name='job-run-detail'),
        
 ]
 
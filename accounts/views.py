@@ -2,11 +2,22 @@ from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Company
+from rest_framework.permissions import IsAdminUser
+from .models import Company, JobRun
 from accounts.models import Country, State
 from accounts.serializers import StateSerializer, CountrySerializer
-from .serializers import CompanySerializer
+from .serializers import CompanySerializer, JobRunSerializer
 from django.shortcuts import get_object_or_404
+from django.db.models import Avg, Count, Max, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import timedelta
+from rentbiz.utils.pagination import paginate_queryset
+from rentbiz.utils.conditional import conditional_get, queryset_version, STATIC_REFERENCE_CACHE_CONTROL
+from rentbiz.utils.images import attach_inline, variant_sizes, variant_url
+from django.http import HttpResponseRedirect
+from django.utils.cache import patch_cache_control
 import logging
 logger = logging.getLogger(__name__)
 from django.template.loader import render_to_string
@@ -24,9 +35,9 @@ class CompanyCreateAPIView(APIView):
 
             try:
                 self.send_welcome_email_with_logo(company)
-                logger.info(f"Company created and email sent to: {company.email_address}")
+                logger.info("Company created and email sent to: %s", company.email_address)
             except Exception as e:
-                logger.error(f"Error sending email: {str(e)}")
+                logger.error("Error sending email: %s", e)
 
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -45,7 +56,8 @@ class CompanyCreateAPIView(APIView):
             "phone_no2": company.phone_no2,
             "currency": company.currency,
             "currency_code": company.currency_code,
-            "date_joined": company.date_joined,            
+            "date_joined": company.date_joined,
+            "logo_cid": "logo" if company.company_logo else None,
         }
         
         html_message = render_to_string("company/add_company.html", context)
@@ -59,11 +71,7 @@ class CompanyCreateAPIView(APIView):
         )
         email.attach_alternative(html_message, "text/html")
 
-        if company.company_logo:
-            logo_file = company.company_logo
-            logo_file.open()
-            email.attach(logo_file.name, logo_file.read(), logo_file.file.content_type)
-            logo_file.close()
+        attach_inline(email, company.company_logo, company.logo_variants, cid="logo")
 
         email.send(fail_silently=False)
 
@@ -95,7 +103,26 @@ class CompanyDetailAPIView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class CompanyLogoView(APIView):
+    """Redirects to the company logo at ``?size=`` (small, medium, large or original)."""
+    def get(self, request, company_id):
+        size = request.query_params.get('size', 'medium')
+        if size != 'original' and size not in variant_sizes():
+            return Response({'error': f"size must be one of {', '.join([*variant_sizes(), 'original'])}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        company = Company.objects.filter(id=company_id).only('company_logo', 'logo_variants').first()
+        if company is None or not company.company_logo:
+            return Response({'error': 'Logo not found'}, status=status.HTTP_404_NOT_FOUND)
+        response = HttpResponseRedirect(variant_url(company.company_logo, company.logo_variants, size))
+        patch_cache_control(response, private=True, max_age=300)
+        return response
+
+
 class CountryListView(APIView):
+    def get_etag(self, request, country_id=None):
+        return queryset_version(Country.objects.all())
+
+    @conditional_get(STATIC_REFERENCE_CACHE_CONTROL)
     def get(self, request, country_id=None):
 
             countries = Country.objects.all()
@@ -104,6 +131,10 @@ class CountryListView(APIView):
 
 
 class StateListView(APIView):
+    def get_etag(self, request, country_id):
+        return queryset_version(State.objects.filter(country_id=country_id))
+
+    @conditional_get(STATIC_REFERENCE_CACHE_CONTROL)
     def get(self, request, country_id):
         try:
             states = State.objects.filter(country_id=country_id)
@@ -136,22 +167,61 @@ class CompanyDetailView(APIView):
             return Response({'error': 'Company not found'}, status=404)
 
 
-class CountryListView(APIView):
-    def get(self, request, country_id=None):
 
-            countries = Country.objects.all()
-            serializer = CountrySerializer(countries, many=True)
-            return Response(serializer.data)
+class JobRunListView(APIView):
+    """Recorded Celery task runs, newest first. Staff only."""
+    permission_classes = [IsAdminUser]
 
+    def get(self, request):
+        queryset = JobRun.objects.all()
+        task_name = request.query_params.get('task')
+        if task_name:
+            queryset = queryset.filter(task_name=task_name)
+        run_status = request.query_params.get('status')
+        if run_status:
+            queryset = queryset.filter(status=run_status)
+        since = request.query_params.get('since')
+        if since:
+            since_date = parse_date(since)
+            if since_date is None:
+                return Response({'error': 'since must be a YYYY-MM-DD date'}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = queryset.filter(started_at__date__gte=since_date)
+        return paginate_queryset(queryset, request, JobRunSerializer)
+
+
+class JobRunDetailView(APIView):
+    permission_classes = [IsAdminUser]
 
-class StateListView(APIView):
-    def get(self, request, country_id):
+    def get(self, request, pk):
+        run = get_object_or_404(JobRun, pk=pk)
+        return Response(JobRunSerializer(run).data)
+
+
+class JobRunTrendView(APIView):
+    """Per task, per day run counts and durations over the last ``days`` days."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
         try:
-            states = State.objects.filter(country_id=country_id)
-            serializer = StateSerializer(states, many=True)
-            return Response(serializer.data)
-        except Country.DoesNotExist:
-            return Response(
-                {"error": "Country not found"},
-                status=status.HTTP_404_NOT_FOUND
-            )
\ No newline at end of file
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({'error': 'days must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = JobRun.objects.filter(started_at__gte=timezone.now() - timedelta(days=days))
+        task_name = request.query_params.get('task')
+        if task_name:
+            queryset = queryset.filter(task_name=task_name)
+
+        rows = (
+            queryset.annotate(day=TruncDate('started_at'))
+            .values('task_name', 'day')
+            .annotate(
+                runs=Count('id'),
+                failed=Count('id', filter=Q(status='failed')),
+                avg_duration=Avg('duration'),
+                max_duration=Max('duration'),
+                max_peak_rss_kb=Max('peak_rss_kb'),
+                max_rss_growth_kb=Max('rss_growth_kb'),
+            )
+            .order_by('task_name', 'day')
+        )
+        return Response(list(rows))
@@ -0,0 +1,320 @@
+"""
+Principal resolution and token authentication.
+
+A login name belongs either to a company user (``Users.username``) or to the
+company account itself (``Company.user_id``). ``authenticate_principal``
+resolves it with a single UNION query over both unique indexes and then runs
+one password hash, whether the login succeeds, fails or the name is unknown.
+As before, when the name belongs to both and the user's password is wrong the
+company account is tried next, which costs a second hash. Outdated hashes
+(and legacy plain-text company passwords) are re-hashed on a background
+thread so the request does not pay for it. Logins and hash upgrades are
+logged as ``auth.*`` audit events by ``audit``.
+
+Access tokens issued by ``issue_tokens`` carry the principal kind and id, its
+company id, role and ``token_version``. ``CompanyJWTAuthentication`` turns such
+a token into a ``TokenPrincipal`` without touching the database; block/unblock
+events bump ``token_version`` and reach every process through
+``revocation_cache``, which reloads the revoked/bumped principals at most every
+``TOKEN_REVOCATION_CACHE_TTL`` seconds. Blocking a company also revokes the
+tokens of its users.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from django.db import connections, models
+from django.db.models import F, Q, Value
+from django.utils.crypto import constant_time_compare
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from accounts.models import Company
+from .models import Users
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_USER = 'user'
+PRINCIPAL_COMPANY = 'company'
+
+_hash_upgrades = ThreadPoolExecutor(max_workers=1, thread_name_prefix='password-upgrade')
+
+
+@dataclass
+class Principal:
+    kind: str
+    id: int
+    login: str
+    name: Optional[str]
+    email: Optional[str]
+    status: str
+    created_at: Optional[datetime]
+    password: Optional[str]
+    company_id: Optional[int]
+    user_role: Optional[str] = None
+    admin_name: Optional[str] = None
+    phone_no1: Optional[str] = None
+    phone_no2: Optional[str] = None
+    logo: Optional[str] = None
+    token_version: int = 0
+
+    @property
+    def is_blocked(self):
+        return self.status == 'blocked'
+
+    @property
+    def logo_url(self):
+        if not self.logo:
+            return None
+        return Company._meta.get_field('company_logo').storage.url(self.logo)
+
+
+_NULL_TEXT = Value(None, output_field=models.CharField())
+
+
+def resolve_principals(username):
+    """The ``Principal``s named ``username``: the user account first, then the company."""
+    users = Users.objects.filter(username=username).values_list(
+        Value(PRINCIPAL_USER, output_field=models.CharField()),
+        'id', 'username', 'name', 'email', 'status', 'created_at', 'password', 'company_id',
+        'user_role', _NULL_TEXT, _NULL_TEXT, _NULL_TEXT, _NULL_TEXT, 'token_version',
+    )
+    companies = Company.objects.filter(user_id=username).values_list(
+        Value(PRINCIPAL_COMPANY, output_field=models.CharField()),
+        'id', 'user_id', 'company_name', 'email_address', 'status', 'date_joined', 'password', F('id'),
+        _NULL_TEXT, 'company_admin_name', 'phone_no1', 'phone_no2', 'company_logo', 'token_version',
+    )
+    rows = sorted(users.union(companies, all=True), key=lambda row: row[0] != PRINCIPAL_USER)
+    return [Principal(*row) for row in rows]
+
+
+def resolve_principal(username):
+    """Return the ``Principal`` for ``username``, preferring a user account."""
+    principals = resolve_principals(username)
+    return principals[0] if principals else None
+
+
+def audit(event, outcome, principal_kind=None, principal_id=None, level=logging.INFO, exc_info=False):
+    """
+    Log an authentication event. The fields are in the message, which the
+    plain formatters print, and in ``extra`` for structured handlers.
+    """
+    logger.log(
+        level, '%s %s principal=%s:%s', event, outcome, principal_kind or '-',
+        '-' if principal_id is None else principal_id, exc_info=exc_info,
+        extra={'event': event, 'outcome': outcome, 'principal': principal_kind, 'principal_id': principal_id},
+    )
+
+
+def _store_upgraded_hash(kind, principal_id, raw_password):
+    try:
+        model = Users if kind == PRINCIPAL_USER else Company
+        model.objects.filter(id=principal_id).update(password=make_password(raw_password))
+        audit('auth.hash_upgrade', 'success', kind, principal_id)
+    except Exception:
+        audit('auth.hash_upgrade', 'error', kind, principal_id, level=logging.ERROR, exc_info=True)
+    finally:
+        connections.close_all()
+
+
+def schedule_hash_upgrade(principal, raw_password):
+    _hash_upgrades.submit(_store_upgraded_hash, principal.kind, principal.id, raw_password)
+
+
+def verify_password(principal, raw_password):
+    """Check ``raw_password`` against the principal's stored password with one hash."""
+    encoded = principal.password
+    if not encoded:
+        make_password(raw_password)  # same cost as a real check
+        return False
+
+    try:
+        identify_hasher(encoded)
+    except ValueError:
+        # Legacy company rows stored the password in plain text.
+        if constant_time_compare(encoded, raw_password):
+            schedule_hash_upgrade(principal, raw_password)
+            return True
+        make_password(raw_password)
+        return False
+
+    return check_password(
+        raw_password, encoded,
+        setter=lambda raw: schedule_hash_upgrade(principal, raw),
+    )
+
+
+def authenticate_principal(username, raw_password):
+    """
+    Resolve and verify a login.
+
+    Returns ``(principal, error)`` where ``error`` is ``None`` on success,
+    ``'blocked'`` for a blocked account or ``'invalid'`` for bad credentials.
+    """
+    principals = resolve_principals(username)
+    if not principals:
+        # Hash anyway so unknown names cost the same as wrong passwords.
+        make_password(raw_password)
+        audit('auth.login', 'unknown')
+        return None, 'invalid'
+
+    for principal in principals:
+        if principal.is_blocked:
+            audit('auth.login', 'blocked', principal.kind, principal.id)
+            return principal, 'blocked'
+
+        if verify_password(principal, raw_password):
+            audit('auth.login', 'success', principal.kind, principal.id)
+            return principal, None
+
+        # A wrong user password falls through to a company account of the same name.
+        audit('auth.login', 'invalid', principal.kind, principal.id)
+    return principal, 'invalid'
+
+
+def issue_tokens(principal):
+    """Refresh/access token pair scoped to ``principal`` and its company."""
+    refresh = RefreshToken()
+    # ``user_id`` keeps its historical meaning (Users pk or company login name).
+    claims = {
+        'user_id': principal.id if principal.kind == PRINCIPAL_USER else principal.login,
+        'role': principal.kind,
+        'principal_id': principal.id,
+        'company_id': principal.company_id,
+        'user_role': principal.user_role,
+        'ver': principal.token_version,
+    }
+    for claim, value in claims.items():
+        refresh[claim] = value
+    access_token = refresh.access_token
+    for claim, value in claims.items():
+        access_token[claim] = value
+    return refresh, access_token
+
+
+class RevocationCache:
+    """
+    In-process map of principals whose tokens may be revoked: blocked accounts
+    and accounts whose ``token_version`` moved past 0. Anything not in the map
+    is active with version 0, so the map stays small.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def _load(self):
+        entries = {}
+        for model, kind in ((Users, PRINCIPAL_USER), (Company, PRINCIPAL_COMPANY)):
+            rows = model.objects.filter(
+                Q(status='blocked') | Q(token_version__gt=0)
+            ).values_list('id', 'status', 'token_version')
+            for pk, status, version in rows:
+                entries[(kind, pk)] = (status == 'blocked', version)
+        return entries
+
+    def _current(self):
+        ttl = getattr(settings, 'TOKEN_REVOCATION_CACHE_TTL', 30)
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > ttl:
+            with self._lock:
+                if self._loaded_at is None or time.monotonic() - self._loaded_at > ttl:
+                    self._entries = self._load()
+                    self._loaded_at = time.monotonic()
+        return self._entries
+
+    def is_revoked(self, kind, principal_id, token_version, company_id=None):
+        """
+        True when the principal is blocked or has moved past ``token_version``,
+        or when ``company_id`` (the token's company) is blocked, which locks
+        out the company's users as well.
+        """
+        entries = self._current()
+        if company_id is not None:
+            company = entries.get((PRINCIPAL_COMPANY, company_id))
+            if company is not None and company[0]:
+                return True
+        entry = entries.get((kind, principal_id))
+        if entry is None:
+            return False
+        blocked, current_version = entry
+        return blocked or token_version < current_version
+
+
+revocation_cache = RevocationCache()
+
+
+class TokenPrincipal:
+    """``request.user`` for requests authenticated with a company scoped token."""
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+    is_staff = False
+    is_superuser = False
+
+    def __init__(self, kind, principal_id, company_id, user_role=None):
+        self.kind = kind
+        self.id = self.pk = principal_id
+        self.company_id = company_id
+        self.user_role = user_role
+
+    @property
+    def users_id(self):
+        """Primary key to store in ``Users`` foreign keys, if the principal is a user."""
+        return self.id if self.kind == PRINCIPAL_USER else None
+
+    def __str__(self):
+        return f'{self.kind}:{self.id}'
+
+
+class CompanyJWTAuthentication(BaseAuthentication):
+    """
+    Authenticates ``Authorization: Bearer <access token>`` headers issued by
+    ``issue_tokens`` without a database query.
+
+    While ``COMPANY_SCOPE_ENFORCED`` is off, tokens that are missing, expired or
+    predate the company scoped claims are ignored (the request stays anonymous)
+    so existing clients keep working; once it is on they are rejected.
+    """
+    www_authenticate_realm = 'api'
+
+    def _reject(self, message):
+        if getattr(settings, 'COMPANY_SCOPE_ENFORCED', False):
+            raise AuthenticationFailed(message)
+        return None
+
+    def authenticate(self, request):
+        header = get_authorization_header(request).split()
+        if not header or header[0].lower() != b'bearer':
+            return None
+        if len(header) != 2:
+            return self._reject('Invalid Authorization header.')
+
+        try:
+            token = AccessToken(header[1].decode())
+        except (TokenError, UnicodeError):
+            return self._reject('Token is invalid or expired.')
+
+        if 'principal_id' not in token or token.get('role') not in (PRINCIPAL_USER, PRINCIPAL_COMPANY):
+            return self._reject('Token is not company scoped, please log in again.')
+
+        kind, principal_id, company_id = token['role'], token['principal_id'], token.get('company_id')
+        if revocation_cache.is_revoked(kind, principal_id, token.get('ver', 0), company_id):
+            raise AuthenticationFailed('Token has been revoked.')
+
+        return TokenPrincipal(kind, principal_id, company_id, token.get('user_role')), token
+
+    def authenticate_header(self, request):
+        return f'Bearer realm="{self.www_authenticate_realm}"'
@@ -0,0 +1,150 @@
+"""
+Unit availability for a date range.
+
+A unit is unavailable for [start, end] (inclusive) when an active or pending
+tenancy of it overlaps the range, or its status is renovation or disputed.
+
+On PostgreSQL the overlapping tenancies are found with ``&&`` on
+``daterange(start_date, end_date, '[]')``, which migration 0066 backs with a
+partial GiST index; a tenancy without an end date blocks the unit
+indefinitely. On other databases the blocking tenancies of a company are
+loaded once per version of its tenancy table into an ``IntervalTree`` kept in
+process memory, and each search is a tree query.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+from django.db import connections, router
+from django.db.models import F, Func, Value
+from django.db.models.expressions import RawSQL
+
+from rentbiz.utils.conditional import queryset_version
+from .models import Tenancy, Units
+
+BLOCKING_STATUSES = ('active', 'pending')
+UNAVAILABLE_UNIT_STATUSES = ('renovation', 'disputed')
+
+
+class IntervalTree:
+    """
+    Static interval tree over closed intervals ``(start, end, value)``;
+    ``end`` may be None for an open-ended interval.
+
+    Intervals are kept sorted by start in an implicit balanced tree: the
+    middle of every slice is its root, and ``_max_end`` holds the latest end
+    within the slice, so a query skips every slice that ends before it.
+    """
+
+    def __init__(self, intervals):
+        self._intervals = sorted(intervals, key=lambda interval: interval[0])
+        self._max_end = [None] * len(self._intervals)
+        if self._intervals:
+            self._build(0, len(self._intervals) - 1)
+
+    @staticmethod
+    def _later(a, b):
+        if a is None or b is None:
+            return None
+        return max(a, b)
+
+    def _build(self, low, high):
+        mid = (low + high) // 2
+        max_end = self._intervals[mid][1]
+        if low < mid:
+            max_end = self._later(max_end, self._build(low, mid - 1))
+        if mid < high:
+            max_end = self._later(max_end, self._build(mid + 1, high))
+        self._max_end[mid] = max_end
+        return max_end
+
+    def overlapping(self, start, end):
+        """Values of the intervals that overlap [start, end]."""
+        found = []
+        stack = [(0, len(self._intervals) - 1)] if self._intervals else []
+        while stack:
+            low, high = stack.pop()
+            mid = (low + high) // 2
+            max_end = self._max_end[mid]
+            if max_end is not None and max_end < start:
+                continue  # everything in this slice ended before the range
+            interval_start, interval_end, value = self._intervals[mid]
+            if interval_start <= end and (interval_end is None or interval_end >= start):
+                found.append(value)
+            if low < mid:
+                stack.append((low, mid - 1))
+            # Slices right of mid start no earlier than mid.
+            if mid < high and interval_start <= end:
+                stack.append((mid + 1, high))
+        return found
+
+    def __len__(self):
+        return len(self._intervals)
+
+
+class DateRange(Func):
+    function = 'daterange'
+
+    def __init__(self, start, end, bounds='[]'):
+        from django.contrib.postgres.fields import DateRangeField
+        super().__init__(start, end, Value(bounds), output_field=DateRangeField())
+
+
+def blocking_tenancies(company_id):
+    return Tenancy.objects.filter(
+        company_id=company_id, status__in=BLOCKING_STATUSES,
+        unit__isnull=False, start_date__isnull=False,
+    )
+
+
+def _blocked_units_postgres(company_id, start, end):
+    return (
+        blocking_tenancies(company_id)
+        .annotate(period=DateRange(F('start_date'), F('end_date')))
+        .filter(period__overlap=DateRange(Value(start), Value(end)))
+        .values('unit_id')
+    )
+
+
+_trees = OrderedDict()
+_trees_lock = threading.Lock()
+_TREES_KEPT = 32
+
+
+def tenancy_tree(company_id):
+    """The company's blocking tenancies as an IntervalTree of unit ids."""
+    tenancies = blocking_tenancies(company_id)
+    key = (company_id, queryset_version(tenancies, 'updated_at'))
+    with _trees_lock:
+        tree = _trees.get(key)
+        if tree is not None:
+            _trees.move_to_end(key)
+            return tree
+    tree = IntervalTree(tenancies.values_list('start_date', 'end_date', 'unit_id'))
+    with _trees_lock:
+        _trees[key] = tree
+        while len(_trees) > _TREES_KEPT:
+            _trees.popitem(last=False)
+    return tree
+
+
+def available_units(company_id, start, end, unit_type=None, bedrooms=None, building=None):
+    """Units of the company free for every day of [start, end]."""
+    units = Units.objects.filter(company_id=company_id).exclude(unit_status__in=UNAVAILABLE_UNIT_STATUSES)
+    if unit_type is not None:
+        units = units.filter(unit_type_id=unit_type)
+    if bedrooms is not None:
+        units = units.filter(no_of_bedrooms=bedrooms)
+    if building is not None:
+        units = units.filter(building_id=building)
+
+    vendor = connections[router.db_for_read(Tenancy)].vendor
+    if vendor == 'postgresql':
+        return units.exclude(id__in=_blocked_units_postgres(company_id, start, end))
+
+    blocked = sorted(set(tenancy_tree(company_id).overlapping(start, end)))
+    if vendor == 'sqlite':
+        # One JSON parameter instead of one per id, which would overrun
+        # SQLite's variable limit for large portfolios.
+        return units.exclude(id__in=RawSQL('SELECT value FROM json_each(%s)', [json.dumps(blocked)]))
+    return units.exclude(id__in=blocked)
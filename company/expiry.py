@@ -0,0 +1,196 @@
+"""
+Document expiry index.
+
+Expiry dates live on five columns across four tables: the building, unit and
+tenant document tables, and a tenant's own and sponsor's ID validity dates.
+``DocumentExpiry`` mirrors every dated one as a row keyed by ``(kind,
+source_id)`` so "what expires in the next N days" is a single range scan on
+``(company, expiry_date)``.
+
+Signals call ``sync`` on every save and delete of a source row. Bulk inserts
+index their rows with ``index_sources``; other writes that skip signals
+(``update()``) should be followed by ``rebuild(company_id)``, which the
+``rebuild_document_expiries`` command also runs.
+"""
+import logging
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from accounts import jobs
+from .models import DocumentExpiry, DocumentType, Tenant, TenantDocumentType, UnitDocumentType
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NOTICE_DAYS = 30
+
+# kind -> (source model, date field, {DocumentExpiry field: source lookup})
+SOURCES = {
+    'building_document': (DocumentType, 'expiry_date', {
+        'company_id': 'building__company_id', 'building_id': 'building_id',
+        'label': 'doc_type__title', 'number': 'number',
+    }),
+    'unit_document': (UnitDocumentType, 'expiry_date', {
+        'company_id': 'unit__company_id', 'building_id': 'unit__building_id', 'unit_id': 'unit_id',
+        'label': 'doc_type__title', 'number': 'number',
+    }),
+    'tenant_document': (TenantDocumentType, 'expiry_date', {
+        'company_id': 'tenant__company_id', 'tenant_id': 'tenant_id',
+        'label': 'doc_type__title', 'number': 'number',
+    }),
+    'tenant_id': (Tenant, 'id_validity_date', {
+        'company_id': 'company_id', 'tenant_id': 'id',
+        'label': 'id_type__title', 'number': 'id_number',
+    }),
+    'sponsor_id': (Tenant, 'sponser_id_validity_date', {
+        'company_id': 'company_id', 'tenant_id': 'id',
+        'label': 'sponser_id_type__title', 'number': 'sponser_id_number',
+    }),
+}
+
+KINDS_BY_MODEL = {}
+for _kind, (_model, _, _) in SOURCES.items():
+    KINDS_BY_MODEL.setdefault(_model, []).append(_kind)
+
+
+def _rows(kind, **filters):
+    """Index rows for the dated, company-owned source rows matching ``filters``."""
+    model, date_field, lookups = SOURCES[kind]
+    company_lookup = lookups['company_id']
+    sources = (
+        model.objects.filter(**filters)
+        .filter(**{f'{date_field}__isnull': False, f'{company_lookup}__isnull': False})
+        .values('pk', date_field, *lookups.values())
+    )
+    for source in sources.iterator(chunk_size=2000):
+        fields = {name: source[lookup] for name, lookup in lookups.items()}
+        if fields['label'] is not None:
+            fields['label'] = fields['label'][:255]
+        yield DocumentExpiry(kind=kind, source_id=source['pk'], expiry_date=source[date_field], **fields)
+
+
+def sync(kind, source_id):
+    """Bring the index row for one source row up to date, or drop it."""
+    row = next(_rows(kind, pk=source_id), None)
+    if row is None:
+        DocumentExpiry.objects.filter(kind=kind, source_id=source_id).delete()
+        return None
+    defaults = {name: getattr(row, name) for name in (
+        'company_id', 'expiry_date', 'label', 'number', 'building_id', 'unit_id', 'tenant_id')}
+    return DocumentExpiry.objects.update_or_create(kind=kind, source_id=source_id, defaults=defaults)[0]
+
+
+def sync_instance(instance):
+    for kind in KINDS_BY_MODEL.get(type(instance), ()):
+        sync(kind, instance.pk)
+
+
+def forget_instance(instance):
+    kinds = KINDS_BY_MODEL.get(type(instance), ())
+    if kinds:
+        DocumentExpiry.objects.filter(kind__in=kinds, source_id=instance.pk).delete()
+
+
+def index_sources(kind, source_ids):
+    """Index source rows inserted without signals, e.g. by ``bulk_create``."""
+    rows = list(_rows(kind, pk__in=source_ids))
+    DocumentExpiry.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+    return len(rows)
+
+
+def rebuild(company_id=None):
+    """
+    Recreate the index for one company, or every company, from the source
+    tables. Notification state is carried over so nothing is re-sent.
+    """
+    existing = DocumentExpiry.objects.all()
+    if company_id is not None:
+        existing = existing.filter(company_id=company_id)
+
+    with transaction.atomic():
+        notified = {
+            (kind, source_id): notified_for
+            for kind, source_id, notified_for in existing.filter(notified_for__isnull=False)
+            .values_list('kind', 'source_id', 'notified_for')
+        }
+        existing.delete()
+        rows = []
+        for kind, (_, _, lookups) in SOURCES.items():
+            filters = {} if company_id is None else {lookups['company_id']: company_id}
+            for row in _rows(kind, **filters):
+                row.notified_for = notified.get((kind, row.source_id))
+                rows.append(row)
+        DocumentExpiry.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def expiring_documents(company_id, days, today=None, include_expired=False):
+    """The company's documents expiring within ``days`` of ``today``."""
+    today = today or timezone.localdate()
+    documents = DocumentExpiry.objects.filter(company_id=company_id, expiry_date__lte=today + timedelta(days=days))
+    if not include_expired:
+        documents = documents.filter(expiry_date__gte=today)
+    return documents
+
+
+def _expiry_email(company, documents, today):
+    html_content = render_to_string('company/document_expiry_email.html', {
+        'company': company, 'documents': documents, 'today': today,
+    })
+    email = EmailMultiAlternatives(
+        subject=f"{len(documents)} document(s) expiring soon for {company.company_name}",
+        body=html_content,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[company.email_address],
+    )
+    email.attach_alternative(html_content, "text/html")
+    return email
+
+
+def notify_expiring_documents(days=None, today=None):
+    """
+    Email each company one digest of its documents expiring in the next
+    ``days`` (DOCUMENT_EXPIRY_NOTICE_DAYS) that it has not been told about,
+    sending every digest over a single SMTP connection.
+    """
+    days = days if days is not None else getattr(settings, 'DOCUMENT_EXPIRY_NOTICE_DAYS', DEFAULT_NOTICE_DAYS)
+    today = today or timezone.localdate()
+    with jobs.phase('query'):
+        due = list(
+            DocumentExpiry.objects
+            .filter(expiry_date__gte=today, expiry_date__lte=today + timedelta(days=days))
+            .exclude(notified_for=F('expiry_date'))
+            .exclude(company__email_address__isnull=True)
+            .exclude(company__email_address='')
+            .select_related('company', 'building', 'unit', 'tenant')
+            .order_by('company_id', 'expiry_date', 'id')
+        )
+
+    result = {'companies': 0, 'documents': 0, 'failed': 0}
+    if not due:
+        return result
+
+    with get_connection() as connection:
+        for _, documents in groupby(due, key=lambda row: row.company_id):
+            documents = list(documents)
+            company = documents[0].company
+            try:
+                with jobs.phase('email'):
+                    connection.send_messages([_expiry_email(company, documents, today)])
+            except Exception:
+                logger.exception('Could not send the document expiry digest to company %s', company.pk)
+                jobs.count('email_failed')
+                result['failed'] += 1
+                continue
+            DocumentExpiry.objects.filter(pk__in=[row.pk for row in documents]).update(
+                notified_for=F('expiry_date'), updated_at=timezone.now())
+            jobs.count('email_sent')
+            result['companies'] += 1
+            result['documents'] += len(documents)
+    return result
@@ -0,0 +1,822 @@
+"""
+Spreadsheet imports for onboarding a landlord's portfolio and tenant book.
+
+A property import takes up to three sheets, either as separate CSV/XLSX files
+or as the like-named sheets of one workbook:
+
+    buildings  building_no*, building_name*, plot_no, description, remarks,
+               latitude, longitude, land_mark, building_address, country,
+               state, status
+    units      building* (a building_no), unit_name*, unit_type (title),
+               address, description, remarks, no_of_bedrooms,
+               no_of_bathrooms, premise_no, unit_status
+    documents  building* (a building_no), unit (a unit_name in that
+               building; blank for a building document), doc_type* (title),
+               number, issued_date, expiry_date, upload_id
+
+Buildings and units may refer to rows of the same import or to ones the
+company already has. Every row is validated before anything is written, so
+an import with errors writes nothing and reports them all, by sheet, row and
+column. A valid import is inserted with ``bulk_create`` in transactions of
+``IMPORT_BATCH_SIZE`` rows, each reserving its block of codes with
+``allocate_codes``.
+
+``TenantImport`` follows the same pattern for tenants and their documents,
+adding duplicate detection against the company's existing tenants.
+
+XLSX files need ``openpyxl``; CSV files work without it.
+"""
+import csv
+import io
+import logging
+import re
+import time
+import uuid
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from accounts.models import Company, Country, State
+from rentbiz.utils import geo
+from . import expiry
+from .models import (
+    Building, DocumentType, DocumentUpload, IDType, MasterDocumentType, Tenant, TenantDocumentType,
+    Units, UnitDocumentType, UnitType, allocate_codes,
+)
+
+try:
+    import openpyxl
+except ImportError:  # XLSX imports are optional
+    openpyxl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_MAX_ROWS = 50000
+MAX_REPORTED_ERRORS = 500
+
+IMPORTABLE_UNIT_STATUSES = ('vacant', 'renovation', 'disputed')
+
+
+class ImportFileError(Exception):
+    """The upload could not be read as a spreadsheet at all."""
+
+
+def batch_size():
+    return getattr(settings, 'IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# Reading -------------------------------------------------------------------
+
+def _header(value):
+    return re.sub(r'[^a-z0-9]+', '_', str(value or '').strip().lower()).strip('_')
+
+
+def _cell(value):
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def _rows_from(header, records):
+    keys = [_header(value) for value in header]
+    for number, record in enumerate(records, start=2):  # row 1 is the header
+        row = {key: _cell(value) for key, value in zip(keys, record) if key}
+        if any(value is not None for value in row.values()):
+            yield number, row
+
+
+def _is_xlsx(uploaded):
+    name = getattr(uploaded, 'name', '') or ''
+    if name.lower().endswith(('.xlsx', '.xlsm')):
+        return True
+    start = uploaded.read(4)
+    uploaded.seek(0)
+    return start == b'PK\x03\x04'
+
+
+def _open_workbook(uploaded):
+    if openpyxl is None:
+        raise ImportFileError('XLSX files need openpyxl installed; upload CSV instead')
+    try:
+        return openpyxl.load_workbook(uploaded, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFileError(f'Could not read the workbook: {e}')
+
+
+def _sheet_rows(sheet):
+    records = sheet.iter_rows(values_only=True)
+    header = next(records, None)
+    return list(_rows_from(header or [], records))
+
+
+def read_rows(uploaded):
+    """``[(row_number, {column: value})]`` from a CSV file or a workbook's first sheet."""
+    if _is_xlsx(uploaded):
+        workbook = _open_workbook(uploaded)
+        try:
+            return _sheet_rows(workbook.worksheets[0])
+        finally:
+            workbook.close()
+    try:
+        text = io.TextIOWrapper(getattr(uploaded, 'file', uploaded), encoding='utf-8-sig', newline='')
+        records = csv.reader(text)
+        header = next(records, None)
+        return list(_rows_from(header or [], records))
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ImportFileError(f'Could not read the CSV file: {e}')
+
+
+def read_sheets(files, names):
+    """
+    The named sheets of an import: from a ``workbook`` upload holding sheets
+    of those names, or from one upload per name. Missing sheets are empty.
+    """
+    sheets = {name: [] for name in names}
+    workbook_file = files.get('workbook')
+    if workbook_file is not None:
+        workbook = _open_workbook(workbook_file)
+        try:
+            for sheet in workbook.worksheets:
+                if _header(sheet.title) in sheets:
+                    sheets[_header(sheet.title)] = _sheet_rows(sheet)
+        finally:
+            workbook.close()
+    for name in names:
+        if name in files:
+            sheets[name] = read_rows(files[name])
+
+    max_rows = getattr(settings, 'IMPORT_MAX_ROWS', DEFAULT_MAX_ROWS)
+    for name, rows in sheets.items():
+        if len(rows) > max_rows:
+            raise ImportFileError(f'{name} has {len(rows)} rows; the limit is {max_rows}')
+    return sheets
+
+
+# Validation ----------------------------------------------------------------
+
+class RowError(ValueError):
+    def __init__(self, field, message):
+        super().__init__(message)
+        self.field = field
+
+
+class ErrorReport:
+    """Per-row problems, capped at MAX_REPORTED_ERRORS in the response."""
+
+    def __init__(self):
+        self.errors = []
+        self.total = 0
+
+    def add(self, sheet, row, field, message):
+        self.total += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'sheet': sheet, 'row': row, 'field': field, 'error': message})
+
+    def __bool__(self):
+        return self.total > 0
+
+    def as_dict(self):
+        return {'error_count': self.total, 'errors': self.errors}
+
+
+def text(row, field, max_length, required=False):
+    value = row.get(field)
+    if value is None:
+        if required:
+            raise RowError(field, 'This field is required.')
+        return None
+    value = str(value)
+    if isinstance(row.get(field), float) and value.endswith('.0'):
+        value = value[:-2]  # spreadsheet numbers such as building_no 12
+    if len(value) > max_length:
+        raise RowError(field, f'Ensure this field has no more than {max_length} characters.')
+    return value
+
+
+def integer(row, field, minimum=None):
+    value = row.get(field)
+    if value is None:
+        return None
+    try:
+        number = float(value)
+        if number != int(number):
+            raise ValueError
+        number = int(number)
+    except (TypeError, ValueError, OverflowError):
+        raise RowError(field, 'A whole number is required.')
+    if minimum is not None and number < minimum:
+        raise RowError(field, f'Must be at least {minimum}.')
+    return number
+
+
+def decimal_degrees(row, field, limit):
+    value = row.get(field)
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise RowError(field, 'A number is required.')
+    if not -limit <= number <= limit:
+        raise RowError(field, f'Must be between -{limit} and {limit}.')
+    return number
+
+
+def a_date(row, field):
+    value = row.get(field)
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    for pattern in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y'):
+        try:
+            return datetime.strptime(str(value), pattern).date()
+        except ValueError:
+            continue
+    raise RowError(field, 'Use a YYYY-MM-DD or DD/MM/YYYY date.')
+
+
+def choice(row, field, choices, default=None):
+    value = row.get(field)
+    if value is None:
+        return default
+    value = str(value).lower()
+    if value not in choices:
+        raise RowError(field, f"Must be one of: {', '.join(choices)}.")
+    return value
+
+
+def lookup(row, field, table, required=False, what='value'):
+    """Resolve a title/name column against ``table`` (lower-cased keys)."""
+    value = row.get(field)
+    if value is None:
+        if required:
+            raise RowError(field, 'This field is required.')
+        return None
+    found = table.get(str(value).strip().lower())
+    if found is None:
+        raise RowError(field, f'Unknown {what} "{value}".')
+    return found
+
+
+def completed_uploads(company_id, sheets_rows):
+    """Completed DocumentUpload file names by id, for the ``upload_id`` column."""
+    ids = set()
+    for row in sheets_rows:
+        value = row.get('upload_id')
+        if value is not None:
+            try:
+                ids.add(uuid.UUID(str(value)))
+            except ValueError:
+                pass
+    uploads = {}
+    for chunk in chunked(sorted(ids), 500):
+        for pk, name, owner in (
+            DocumentUpload.objects.filter(pk__in=chunk, status='complete')
+            .values_list('pk', 'file', 'company_id')
+        ):
+            if owner in (None, company_id):
+                uploads[str(pk)] = name
+    return uploads
+
+
+def upload_file(row, uploads):
+    value = row.get('upload_id')
+    if value is None:
+        return None
+    try:
+        name = uploads.get(str(uuid.UUID(str(value))))
+    except ValueError:
+        name = None
+    if name is None:
+        raise RowError('upload_id', f'No completed upload "{value}".')
+    return name
+
+
+# Property import -----------------------------------------------------------
+
+class PropertyImport:
+    """Validates and inserts a buildings/units/documents import for one company."""
+
+    SHEETS = ('buildings', 'units', 'documents')
+
+    def __init__(self, company, user_id=None):
+        self.company = company
+        self.owned = {'company': company, 'user_id': user_id}
+        self.errors = ErrorReport()
+        self.buildings = []
+        self.units = []
+        self.building_documents = []
+        self.unit_documents = []
+
+    def _load_lookups(self):
+        company_id = self.company.id
+        self.unit_types = {
+            title.strip().lower(): pk for pk, title in
+            UnitType.objects.filter(company_id=company_id, title__isnull=False).values_list('id', 'title')
+        }
+        self.doc_types = {
+            title.strip().lower(): pk for pk, title in
+            MasterDocumentType.objects.filter(company_id=company_id, title__isnull=False).values_list('id', 'title')
+        }
+        self.countries = {name.lower(): pk for pk, name in Country.objects.values_list('id', 'name')}
+        self.states = {}  # country id -> {name: id}
+        for pk, name, country_id in State.objects.values_list('id', 'name', 'country_id'):
+            self.states.setdefault(country_id, {})[name.lower()] = pk
+        # building_no -> Building (existing ones carry only their id)
+        self.building_by_no = {}
+        for pk, number in Building.objects.filter(company_id=company_id, building_no__isnull=False).values_list('id', 'building_no'):
+            self.building_by_no.setdefault(number.strip().lower(), Building(id=pk))
+        # (building_no, unit_name) -> Units
+        self.unit_by_key = {}
+        existing_units = (
+            Units.objects.filter(company_id=company_id, unit_name__isnull=False, building__building_no__isnull=False)
+            .values_list('id', 'building__building_no', 'unit_name')
+        )
+        for pk, number, name in existing_units.iterator(chunk_size=5000):
+            self.unit_by_key.setdefault((number.strip().lower(), name.strip().lower()), Units(id=pk))
+
+    def validate(self, sheets):
+        """Build the rows to insert; returns False if any row is invalid."""
+        self._load_lookups()
+        self.uploads = completed_uploads(self.company.id, [row for _, row in sheets['documents']])
+        for sheet, handler in (
+            ('buildings', self._building), ('units', self._unit), ('documents', self._document),
+        ):
+            for number, row in sheets[sheet]:
+                try:
+                    handler(row)
+                except RowError as e:
+                    self.errors.add(sheet, number, e.field, str(e))
+        return not self.errors
+
+    def _building(self, row):
+        number = text(row, 'building_no', 100, required=True)
+        key = number.lower()
+        if key in self.building_by_no:
+            raise RowError('building_no', f'Building {number} already exists.')
+        country = lookup(row, 'country', self.countries, what='country')
+        state = None
+        if row.get('state') is not None:
+            if country is None:
+                raise RowError('state', 'A state needs a country.')
+            state = lookup(row, 'state', self.states.get(country, {}), what='state')
+        latitude = decimal_degrees(row, 'latitude', 90)
+        longitude = decimal_degrees(row, 'longitude', 180)
+        building = Building(
+            building_no=number,
+            building_name=text(row, 'building_name', 100, required=True),
+            plot_no=text(row, 'plot_no', 100),
+            description=text(row, 'description', 10000),
+            remarks=text(row, 'remarks', 10000),
+            latitude=latitude,
+            longitude=longitude,
+            # bulk_create skips Building.save(), which normally sets this.
+            geohash=geo.encode(latitude, longitude),
+            land_mark=text(row, 'land_mark', 255),
+            building_address=text(row, 'building_address', 255),
+            country_id=country, state_id=state,
+            status=choice(row, 'status', ('active', 'inactive'), default='active'),
+            **self.owned,
+        )
+        self.building_by_no[key] = building
+        self.buildings.append(building)
+
+    def _building_for(self, row):
+        number = text(row, 'building', 100, required=True)
+        building = self.building_by_no.get(number.lower())
+        if building is None:
+            raise RowError('building', f'Unknown building {number}.')
+        return number, building
+
+    def _unit(self, row):
+        number, building = self._building_for(row)
+        name = text(row, 'unit_name', 100, required=True)
+        key = (number.lower(), name.lower())
+        if key in self.unit_by_key:
+            raise RowError('unit_name', f'Unit {name} already exists in building {number}.')
+        unit = Units(
+            building=building, unit_name=name,
+            unit_type_id=lookup(row, 'unit_type', self.unit_types, what='unit type'),
+            address=text(row, 'address', 255),
+            description=text(row, 'description', 10000),
+            remarks=text(row, 'remarks', 10000),
+            no_of_bedrooms=integer(row, 'no_of_bedrooms', minimum=0),
+            no_of_bathrooms=integer(row, 'no_of_bathrooms', minimum=0),
+            premise_no=text(row, 'premise_no', 100),
+            unit_status=choice(row, 'unit_status', IMPORTABLE_UNIT_STATUSES, default='vacant'),
+            **self.owned,
+        )
+        self.unit_by_key[key] = unit
+        self.units.append(unit)
+
+    def _document(self, row):
+        number, building = self._building_for(row)
+        fields = {
+            'doc_type_id': lookup(row, 'doc_type', self.doc_types, required=True, what='document type'),
+            'number': text(row, 'number', 100),
+            'issued_date': a_date(row, 'issued_date'),
+            'expiry_date': a_date(row, 'expiry_date'),
+            'upload_file': upload_file(row, self.uploads),
+        }
+        if fields['issued_date'] and fields['expiry_date'] and fields['expiry_date'] < fields['issued_date']:
+            raise RowError('expiry_date', 'Expiry date is before the issued date.')
+
+        unit_name = text(row, 'unit', 100)
+        if unit_name is None:
+            self.building_documents.append(DocumentType(building=building, **fields))
+            return
+        unit = self.unit_by_key.get((number.lower(), unit_name.lower()))
+        if unit is None:
+            raise RowError('unit', f'Unknown unit {unit_name} in building {number}.')
+        self.unit_documents.append(UnitDocumentType(unit=unit, **fields))
+
+    def report(self):
+        return {}
+
+    def counts(self):
+        return {
+            'buildings': len(self.buildings),
+            'units': len(self.units),
+            'documents': len(self.building_documents) + len(self.unit_documents),
+        }
+
+    def save(self):
+        """Insert the validated rows in chunked transactions."""
+        size = batch_size()
+        for chunk in chunked(self.buildings, size):
+            with transaction.atomic():
+                for building, code in zip(chunk, allocate_codes(Building, 'B', len(chunk))):
+                    building.code = code
+                Building.objects.bulk_create(chunk)
+        for chunk in chunked(self.units, size):
+            with transaction.atomic():
+                for unit, code in zip(chunk, allocate_codes(Units, 'U', len(chunk))):
+                    unit.code = code
+                Units.objects.bulk_create(chunk)
+        for model, kind, documents in (
+            (DocumentType, 'building_document', self.building_documents),
+            (UnitDocumentType, 'unit_document', self.unit_documents),
+        ):
+            for chunk in chunked(documents, size):
+                with transaction.atomic():
+                    created = model.objects.bulk_create(chunk)
+                    expiry.index_sources(kind, [document.pk for document in created if document.expiry_date])
+        return self.counts()
+
+
+# Tenant import -------------------------------------------------------------
+
+def normalize_email(value):
+    return value.strip().lower() if value else None
+
+
+def normalize_phone(value):
+    """Digits with an optional leading ``+``; ``00`` is read as ``+``."""
+    if not value:
+        return None
+    value = str(value).strip()
+    digits = re.sub(r'\D', '', value)
+    if value.startswith('00'):
+        return f'+{digits[2:]}'
+    return f'+{digits}' if value.startswith('+') else digits
+
+
+def phone_key(value):
+    """
+    The last PHONE_MATCH_DIGITS digits of a number, so ``+971 50 123 4567``
+    and ``050-123-4567`` match.
+    """
+    digits = re.sub(r'\D', '', value or '')
+    length = getattr(settings, 'PHONE_MATCH_DIGITS', 9)
+    return digits[-length:] if len(digits) >= length else None
+
+
+def normalize_id_number(value):
+    """Upper case without spaces or separators: ``784-1990-1234567-1`` -> ``784199012345671``."""
+    return re.sub(r'[^0-9A-Z]', '', str(value).upper()) or None if value else None
+
+
+def name_key(value):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', value.casefold()).split()) if value else None
+
+
+class TenantIndex:
+    """
+    Hash index over a company's tenants (and the rows imported so far) by
+    normalized email, ID number, phone and name. A candidate is a duplicate
+    when the email or ID number matches, or both phone and name do; phone or
+    name alone only makes it a possible duplicate worth a look.
+    """
+
+    def __init__(self):
+        self.by_email = {}
+        self.by_id_number = {}
+        self.by_phone = {}
+        self.by_name = {}
+
+    def add(self, ref, name, phones, id_numbers, email=None):
+        if email:
+            self.by_email.setdefault(email, []).append(ref)
+        for number in id_numbers:
+            if number:
+                self.by_id_number.setdefault(number, []).append(ref)
+        for phone in phones:
+            key = phone_key(phone)
+            if key:
+                self.by_phone.setdefault(key, []).append(ref)
+        key = name_key(name)
+        if key:
+            self.by_name.setdefault(key, []).append(ref)
+
+    def matches(self, name, phones, id_numbers, email=None):
+        """``{ref: {reasons}}`` of the indexed tenants resembling this one."""
+        found = {}
+        for ref in self.by_email.get(email, ()) if email else ():
+            found.setdefault(ref, set()).add('email')
+        for number in id_numbers:
+            for ref in self.by_id_number.get(number, ()) if number else ():
+                found.setdefault(ref, set()).add('id_number')
+        for phone in phones:
+            for ref in self.by_phone.get(phone_key(phone), ()) if phone_key(phone) else ():
+                found.setdefault(ref, set()).add('phone')
+        for ref in self.by_name.get(name_key(name), ()) if name_key(name) else ():
+            found.setdefault(ref, set()).add('name')
+        return found
+
+    @staticmethod
+    def is_duplicate(reasons):
+        return 'email' in reasons or 'id_number' in reasons or {'phone', 'name'} <= reasons
+
+
+class TenantImport:
+    """
+    Validates and inserts a tenants/documents import for one company.
+
+    tenants    tenant_name*, email, phone, alternative_phone, nationality,
+               tenant_type, license_no, address, description, id_type
+               (title), id_number, id_validity_date, sponser_name,
+               sponser_id_type, sponser_id_number, sponser_id_validity_date,
+               status, remarks
+    documents  tenant* (the tenant's email or ID number), doc_type* (title),
+               number, issued_date, expiry_date, upload_id
+
+    Emails are unique across all tenants, whatever their case: an email of
+    another company's tenant is a row error. Rows that duplicate a tenant
+    (see ``TenantIndex``) are skipped, with their documents, unless
+    ``create_duplicates``, which still cannot reuse an email; every
+    duplicate and possible duplicate is listed in the merge-candidate
+    report.
+    """
+
+    SHEETS = ('tenants', 'documents')
+
+    def __init__(self, company, user_id=None, create_duplicates=False):
+        self.company = company
+        self.owned = {'company': company, 'user_id': user_id}
+        self.create_duplicates = create_duplicates
+        self.errors = ErrorReport()
+        self.tenants = []
+        self.documents = []
+        self.candidates = []
+        self.skipped = {'tenants': 0, 'documents': 0}
+
+    def _load_lookups(self, sheets):
+        company_id = self.company.id
+        self.id_types = {
+            title.strip().lower(): pk for pk, title in
+            IDType.objects.filter(company_id=company_id, title__isnull=False).values_list('id', 'title')
+        }
+        self.doc_types = {
+            title.strip().lower(): pk for pk, title in
+            MasterDocumentType.objects.filter(company_id=company_id, title__isnull=False).values_list('id', 'title')
+        }
+
+        self.index = TenantIndex()
+        self.names = {}
+        self.by_reference = {}  # normalized email / ID number -> Tenant, for the documents sheet
+        existing = Tenant.objects.filter(company_id=company_id).values_list(
+            'id', 'tenant_name', 'phone', 'alternative_phone', 'email', 'id_number')
+        for pk, name, phone, alternative, email, id_number in existing.iterator(chunk_size=5000):
+            id_number, email = normalize_id_number(id_number), normalize_email(email)
+            self.index.add(pk, name, [phone, alternative], [id_number], email)
+            self.names[pk] = name
+            for reference in (email, id_number):
+                if reference:
+                    self.by_reference.setdefault(reference, Tenant(id=pk))
+
+        # Emails are unique across companies; check the file's in a few queries.
+        emails = sorted({
+            normalize_email(str(row['email'])) for _, row in sheets['tenants'] if row.get('email') is not None
+        })
+        self.taken_emails = set()
+        for chunk in chunked(emails, 500):
+            self.taken_emails.update(
+                Tenant.objects.annotate(email_key=Lower('email')).filter(email_key__in=chunk)
+                .values_list('email_key', flat=True))
+
+    def validate(self, sheets):
+        self._load_lookups(sheets)
+        self.uploads = completed_uploads(self.company.id, [row for _, row in sheets['documents']])
+        self.skipped_references = set()
+        for sheet, handler in (('tenants', self._tenant), ('documents', self._document)):
+            for number, row in sheets[sheet]:
+                try:
+                    handler(number, row)
+                except RowError as e:
+                    self.errors.add(sheet, number, e.field, str(e))
+        return not self.errors
+
+    def _email(self, row):
+        value = text(row, 'email', 254)
+        if value is None:
+            return None
+        email = normalize_email(value)
+        try:
+            validate_email(email)
+        except DjangoValidationError:
+            raise RowError('email', 'Enter a valid email address.')
+        return email
+
+    def _phone(self, row, field):
+        value = normalize_phone(text(row, field, 50))
+        if value is not None and len(value) > 15:
+            raise RowError(field, 'Phone numbers have at most 15 digits.')
+        return value
+
+    def _tenant(self, number, row):
+        email = self._email(row)
+        id_type_id = lookup(row, 'id_type', self.id_types, what='ID type')
+        sponsor_type_id = lookup(row, 'sponser_id_type', self.id_types, what='ID type')
+        tenant = Tenant(
+            tenant_name=text(row, 'tenant_name', 100, required=True),
+            email=email,
+            phone=self._phone(row, 'phone'),
+            alternative_phone=self._phone(row, 'alternative_phone'),
+            nationality=text(row, 'nationality', 100),
+            tenant_type=(choice(row, 'tenant_type', ('individual', 'organization')) or '').title() or None,
+            license_no=text(row, 'license_no', 100),
+            address=text(row, 'address', 255),
+            description=text(row, 'description', 10000),
+            id_type_id=id_type_id,
+            id_number=text(row, 'id_number', 100),
+            id_validity_date=a_date(row, 'id_validity_date'),
+            sponser_name=text(row, 'sponser_name', 100),
+            sponser_id_type_id=sponsor_type_id,
+            sponser_id_number=text(row, 'sponser_id_number', 100),
+            sponser_id_validity_date=a_date(row, 'sponser_id_validity_date'),
+            status=choice(row, 'status', ('active', 'inactive'), default='active').title(),
+            remarks=text(row, 'remarks', 10000),
+            **self.owned,
+        )
+        id_number = normalize_id_number(tenant.id_number)
+        phones = [tenant.phone, tenant.alternative_phone]
+        references = [reference for reference in (email, id_number) if reference]
+
+        matches = self.index.matches(tenant.tenant_name, phones, [id_number], email)
+        email_match = any('email' in reasons for reasons in matches.values())
+        if email in self.taken_emails and (self.create_duplicates or not email_match):
+            raise RowError('email', f'A tenant with email {email} already exists.')
+        if matches:
+            duplicate = any(TenantIndex.is_duplicate(reasons) for reasons in matches.values())
+            skip = duplicate and not self.create_duplicates
+            self.candidates.append({
+                'row': number,
+                'tenant_name': tenant.tenant_name,
+                'duplicate': duplicate,
+                'action': 'skipped' if skip else 'created',
+                'matches': [
+                    {**self._describe(ref), 'reasons': sorted(reasons)}
+                    for ref, reasons in sorted(matches.items(), key=lambda item: str(item[0]))
+                ],
+            })
+            if skip:
+                self.skipped['tenants'] += 1
+                self.skipped_references.update(references)
+                return
+
+        ref = f'row {number}'
+        self.index.add(ref, tenant.tenant_name, phones, [id_number], email)
+        self.names[ref] = tenant.tenant_name
+        if email:
+            self.taken_emails.add(email)
+        for reference in references:
+            self.by_reference[reference] = tenant
+        self.tenants.append(tenant)
+
+    def _describe(self, ref):
+        if isinstance(ref, int):
+            return {'tenant_id': ref, 'tenant_name': self.names.get(ref)}
+        return {'import_row': int(ref.split()[1]), 'tenant_name': self.names.get(ref)}
+
+    def _document(self, number, row):
+        value = text(row, 'tenant', 254, required=True)
+        reference = normalize_email(value) if '@' in value else normalize_id_number(value)
+        fields = {
+            'doc_type_id': lookup(row, 'doc_type', self.doc_types, required=True, what='document type'),
+            'number': text(row, 'number', 100),
+            'issued_date': a_date(row, 'issued_date'),
+            'expiry_date': a_date(row, 'expiry_date'),
+            'upload_file': upload_file(row, self.uploads),
+        }
+        if fields['issued_date'] and fields['expiry_date'] and fields['expiry_date'] < fields['issued_date']:
+            raise RowError('expiry_date', 'Expiry date is before the issued date.')
+        tenant = self.by_reference.get(reference)
+        if tenant is None:
+            if reference in self.skipped_references:
+                self.skipped['documents'] += 1
+                return
+            raise RowError('tenant', f'No tenant with email or ID number {value}.')
+        self.documents.append(TenantDocumentType(tenant=tenant, **fields))
+
+    def report(self):
+        return {'skipped': self.skipped, 'merge_candidates': self.candidates}
+
+    def counts(self):
+        return {'tenants': len(self.tenants), 'documents': len(self.documents)}
+
+    def save(self):
+        size = batch_size()
+        for chunk in chunked(self.tenants, size):
+            with transaction.atomic():
+                for tenant, code in zip(chunk, allocate_codes(Tenant, 'U', len(chunk))):
+                    tenant.code = code
+                created = Tenant.objects.bulk_create(chunk)
+                for kind, date_field in (('tenant_id', 'id_validity_date'), ('sponsor_id', 'sponser_id_validity_date')):
+                    expiry.index_sources(kind, [tenant.pk for tenant in created if getattr(tenant, date_field)])
+        for chunk in chunked(self.documents, size):
+            with transaction.atomic():
+                created = TenantDocumentType.objects.bulk_create(chunk)
+                expiry.index_sources('tenant_document', [document.pk for document in created if document.expiry_date])
+        return self.counts()
+
+
+def run_import(importer, sheets, dry_run=False):
+    """``(ok, payload)`` for an importer over already read ``sheets``."""
+    started = time.perf_counter()
+    if not importer.validate(sheets):
+        return False, importer.errors.as_dict()
+    counts = importer.counts() if dry_run else importer.save()
+    logger.info('%s for company %s: %s in %.2fs', type(importer).__name__, importer.company.id,
+                counts, time.perf_counter() - started)
+    return True, {'dry_run': dry_run, 'created': counts, **importer.report()}
+
+
+class ImportAPIView(APIView):
+    """
+    POST multipart sheets (see the module docstring); ``?dry_run=true`` only
+    validates. Responds 400 with every row error, or with the created counts.
+    """
+    importer_class = None
+
+    def importer_options(self, request):
+        return {}
+
+    def post(self, request, company_id):
+        company = Company.objects.filter(id=company_id).first()
+        if company is None:
+            return Response({'error': 'Company not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            sheets = read_sheets(request.FILES, self.importer_class.SHEETS)
+        except ImportFileError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not any(sheets.values()):
+            return Response({'error': f"Upload at least one of: {', '.join(self.importer_class.SHEETS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        importer = self.importer_class(
+            company, getattr(request.user, 'users_id', None), **self.importer_options(request))
+        dry_run = request.query_params.get('dry_run', '').lower() == 'true'
+        ok, payload = run_import(importer, sheets, dry_run)
+        if not ok:
+            return Response(payload, status=status.HTTP_400_BAD_REQUEST)
+        return Response(payload, status=status.HTTP_200_OK if dry_run else status.HTTP_201_CREATED)
+
+
+class PropertyImportView(ImportAPIView):
+    importer_class = PropertyImport
+
+
+class TenantImportView(ImportAPIView):
+    """``?duplicates=create`` imports rows that duplicate a tenant instead of skipping them."""
+    importer_class = TenantImport
+
+    def importer_options(self, request):
+        return {'create_duplicates': request.query_params.get('duplicates', '').lower() == 'create'}
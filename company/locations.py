@@ -0,0 +1,108 @@
+"""
+Building location search: buildings within a radius of a point, and the
+buildings (or clusters of them) inside a map viewport.
+
+Searches narrow on the ``(company, geohash)`` index first, using the cells
+that cover the area's bounding box (``rentbiz.utils.geo``). They then trim
+to the exact box in SQL and to the exact circle with the haversine distance.
+Buildings without coordinates have no geohash and never match.
+"""
+from django.conf import settings
+from django.db.models import Avg, Count, Max, Min, Q
+from django.db.models.functions import Substr
+
+from rentbiz.utils import geo
+from .models import Building
+
+DEFAULT_MAX_MARKERS = 500
+CLUSTER_TARGET = 64
+LOCATION_FIELDS = (
+    'id', 'code', 'building_name', 'building_no', 'building_address', 'status', 'latitude', 'longitude',
+)
+
+
+class LocationError(ValueError):
+    pass
+
+
+def check_box(south, west, north, east):
+    if not (-90 <= south <= north <= 90):
+        raise LocationError('south and north must be latitudes with south <= north.')
+    if not (-180 <= west <= 180 and -180 <= east <= 180):
+        raise LocationError('west and east must be longitudes between -180 and 180.')
+
+
+def buildings_in_box(company_id, south, west, north, east, statuses=None):
+    """The company's buildings inside the box; ``west > east`` crosses the antimeridian."""
+    check_box(south, west, north, east)
+    longitude = Q(longitude__gte=west, longitude__lte=east)
+    if west > east:
+        longitude = Q(longitude__gte=west) | Q(longitude__lte=east)
+    buildings = (
+        Building.objects.filter(company_id=company_id)
+        .filter(geo.geohash_filter('geohash', south, west, north, east))
+        .filter(longitude, latitude__gte=south, latitude__lte=north)
+    )
+    if statuses:
+        buildings = buildings.filter(status__in=statuses)
+    return buildings
+
+
+def buildings_near(company_id, latitude, longitude, radius_km, limit, statuses=None):
+    """
+    ``(count, buildings)``: how many buildings lie within ``radius_km`` of
+    the point and the nearest ``limit`` of them, each with ``distance_km``.
+    """
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise LocationError('lat and lng must be a valid latitude and longitude.')
+    nearby = []
+    candidates = buildings_in_box(company_id, *geo.box_around(latitude, longitude, radius_km), statuses=statuses)
+    for building in candidates.values(*LOCATION_FIELDS).iterator(chunk_size=2000):
+        distance = geo.haversine_km(latitude, longitude, building['latitude'], building['longitude'])
+        if distance <= radius_km:
+            building['distance_km'] = round(distance, 3)
+            nearby.append(building)
+    nearby.sort(key=lambda building: (building['distance_km'], building['id']))
+    return len(nearby), nearby[:limit]
+
+
+def viewport(company_id, south, west, north, east, statuses=None, max_markers=None):
+    """
+    The buildings in a map viewport. Up to ``max_markers`` (MAP_MAX_MARKERS)
+    come back one by one; beyond that they are grouped by geohash cell, sized
+    so the viewport holds about CLUSTER_TARGET clusters, each with its count,
+    mean position and extent.
+    """
+    if max_markers is None:
+        max_markers = getattr(settings, 'MAP_MAX_MARKERS', DEFAULT_MAX_MARKERS)
+    buildings = buildings_in_box(company_id, south, west, north, east, statuses=statuses)
+    count = buildings.count()
+    if count <= max_markers:
+        return {
+            'count': count,
+            'clustered': False,
+            'buildings': list(buildings.order_by('id').values(*LOCATION_FIELDS)),
+        }
+
+    precision = geo.cluster_precision(south, west, north, east, CLUSTER_TARGET)
+    cells = (
+        buildings.annotate(cell=Substr('geohash', 1, precision))
+        .values('cell')
+        .annotate(
+            count=Count('id'),
+            center_latitude=Avg('latitude'), center_longitude=Avg('longitude'),
+            south=Min('latitude'), west=Min('longitude'), north=Max('latitude'), east=Max('longitude'),
+            building_id=Min('id'),
+        )
+        .order_by('cell')
+    )
+    clusters = [{
+        'geohash': cell['cell'],
+        'count': cell['count'],
+        'latitude': cell['center_latitude'],
+        'longitude': cell['center_longitude'],
+        'bounds': [cell['south'], cell['west'], cell['north'], cell['east']],
+        # A cluster of one is a building the map can link to directly.
+        'building_id': cell['building_id'] if cell['count'] == 1 else None,
+    } for cell in cells]
+    return {'count': count, 'clustered': True, 'precision': precision, 'clusters': clusters}
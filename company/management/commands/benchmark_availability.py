@@ -0,0 +1,108 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import Company
+from company.availability import IntervalTree, available_units
+from company.models import Units, UnitType
+
+
+class Command(BaseCommand):
+    help = (
+        'Times availability searches against a company (e.g. one made with '
+        'generate_portfolio --buildings 100 --units 500 for 50k units) and, with '
+        '--synthetic, the in-memory interval tree against a linear scan'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('company_id', type=int, nargs='?')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='Also benchmark the interval tree on this many random tenancies')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def report(self, label, timings, extra=''):
+        self.stdout.write(
+            f'{label:<28} median {statistics.median(timings) * 1000:8.2f} ms  '
+            f'p95 {sorted(timings)[int(len(timings) * 0.95)] * 1000:8.2f} ms{extra}'
+        )
+
+    def random_range(self, rng):
+        start = date.today() + timedelta(days=rng.randint(-90, 365))
+        return start, start + timedelta(days=rng.randint(7, 365))
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        iterations = options['iterations']
+        if options['company_id'] is None and not options['synthetic']:
+            raise CommandError('Give a company_id, --synthetic N, or both')
+
+        if options['company_id'] is not None:
+            self.benchmark_company(rng, options['company_id'], iterations)
+        if options['synthetic']:
+            self.benchmark_tree(rng, options['synthetic'], iterations)
+
+    def benchmark_company(self, rng, company_id, iterations):
+        if not Company.objects.filter(id=company_id).exists():
+            raise CommandError(f'Company {company_id} does not exist')
+        unit_count = Units.objects.filter(company_id=company_id).count()
+        unit_types = list(UnitType.objects.filter(company_id=company_id).values_list('id', flat=True))
+        self.stdout.write(f'{unit_count} units, database {connection.vendor}')
+
+        available_units(company_id, *self.random_range(rng)).count()  # warm caches
+        for label, make_filters in [
+            ('all units', lambda: {}),
+            ('type + bedrooms', lambda: {
+                'unit_type': rng.choice(unit_types) if unit_types else None,
+                'bedrooms': rng.randint(0, 3),
+            }),
+        ]:
+            timings, queries, found = [], [], []
+            for _ in range(iterations):
+                start, end = self.random_range(rng)
+                filters = make_filters()
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    units = available_units(company_id, start, end, **filters)
+                    found.append(units.count())
+                    list(units.order_by('id')[:10])  # first page
+                    timings.append(time.perf_counter() - started)
+                queries.append(len(captured))
+            self.report(label, timings, f'  queries {max(queries)}  available {statistics.mean(found):.0f}')
+
+    def benchmark_tree(self, rng, size, iterations):
+        today = date.today()
+        intervals = []
+        for unit_id in range(size):
+            start = today + timedelta(days=rng.randint(-730, 365))
+            end = None if rng.random() < 0.02 else start + timedelta(days=rng.randint(30, 730))
+            intervals.append((start, end, unit_id))
+
+        started = time.perf_counter()
+        tree = IntervalTree(intervals)
+        self.stdout.write(f'built tree of {len(tree)} intervals in {(time.perf_counter() - started) * 1000:.1f} ms')
+
+        tree_timings, scan_timings = [], []
+        for _ in range(iterations):
+            start, end = self.random_range(rng)
+            began = time.perf_counter()
+            from_tree = set(tree.overlapping(start, end))
+            tree_timings.append(time.perf_counter() - began)
+
+            began = time.perf_counter()
+            from_scan = {
+                value for since, until, value in intervals
+                if since <= end and (until is None or until >= start)
+            }
+            scan_timings.append(time.perf_counter() - began)
+            if from_tree != from_scan:
+                raise CommandError(f'interval tree disagrees with a linear scan for {start} - {end}')
+
+        self.report('interval tree query', tree_timings)
+        self.report('linear scan', scan_timings)
+        self.stdout.write(self.style.SUCCESS('Interval tree results match the linear scan'))
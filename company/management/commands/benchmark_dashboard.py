@@ -0,0 +1,85 @@
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+
+from accounts.models import Company
+from company.authentication import issue_tokens, resolve_principal
+
+SECTION_PATHS = [
+    '/company/dashboard/properties-summary/{company_id}/',
+    '/company/dashboard/rent-collection/{company_id}/',
+    '/company/dashboard/tenency-expiring/{company_id}/',
+    '/company/dashboard/revenue-report/{company_id}/',
+]
+OVERVIEW_PATH = '/company/dashboard/overview/{company_id}/'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the wall-clock latency of the four sequential sync dashboard '
+        'requests with one request to the async dashboard overview endpoint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('company_id', type=int)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--year', help='Passed to the financial report section')
+
+    def report(self, label, timings):
+        self.stdout.write(
+            f'{label:<16} median {statistics.median(timings) * 1000:8.2f} ms  '
+            f'min {min(timings) * 1000:8.2f} ms  max {max(timings) * 1000:8.2f} ms'
+        )
+
+    def handle(self, *args, **options):
+        company_id, iterations = options['company_id'], options['iterations']
+        company = Company.objects.filter(id=company_id).first()
+        if company is None:
+            raise CommandError(f'Company {company_id} does not exist')
+
+        _, access_token = issue_tokens(resolve_principal(company.user_id))
+        headers = {'Authorization': f'Bearer {access_token}'}
+        query = {'year': options['year']} if options['year'] else {}
+        section_paths = [path.format(company_id=company_id) for path in SECTION_PATHS]
+        overview_path = OVERVIEW_PATH.format(company_id=company_id)
+
+        client = Client(headers=headers)
+
+        def sequential():
+            for path in section_paths:
+                # Only the financial report reads ``year``.
+                response = client.get(path, query)
+                if response.status_code != 200:
+                    raise CommandError(f'{path} returned {response.status_code}')
+
+        async def concurrent(async_client):
+            response = await async_client.get(overview_path, query)
+            if response.status_code != 200:
+                raise CommandError(f'{overview_path} returned {response.status_code}')
+
+        async def run_concurrent():
+            async_client = AsyncClient(headers=headers)
+            timings = []
+            await concurrent(async_client)  # warm up the executor threads
+            for _ in range(iterations):
+                started = time.perf_counter()
+                await concurrent(async_client)
+                timings.append(time.perf_counter() - started)
+            return timings
+
+        sequential()
+        sync_timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            sequential()
+            sync_timings.append(time.perf_counter() - started)
+
+        async_timings = asyncio.run(run_concurrent())
+
+        self.report('4 sync requests', sync_timings)
+        self.report('async overview', async_timings)
+        speedup = statistics.median(sync_timings) / statistics.median(async_timings)
+        self.stdout.write(self.style.SUCCESS(f'overview endpoint is {speedup:.2f}x faster (median)'))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from company.authentication import authenticate_principal
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures login throughput (logins/sec on one core) for a known account, '
+        'a wrong password and an unknown username'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Username of an existing user or company account')
+        parser.add_argument('password', help='Its password')
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def run(self, label, username, password, iterations, expected_error):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            _, error = authenticate_principal(username, password)
+            if error != expected_error:
+                raise CommandError(f'{label}: expected {expected_error!r}, got {error!r}')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{label:<16} {iterations / elapsed:8.2f} logins/sec  '
+            f'{elapsed * 1000 / iterations:8.2f} ms/login'
+        )
+
+    def handle(self, *args, **options):
+        username, password, iterations = options['username'], options['password'], options['iterations']
+        # The benchmark runs on the calling thread only, so the rates are per core.
+        self.run('success', username, password, iterations, None)
+        self.run('wrong password', username, password + '-wrong', iterations, 'invalid')
+        self.run('unknown user', f'{username}-missing', password, iterations, 'invalid')
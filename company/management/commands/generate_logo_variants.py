@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import Company
+from company.models import Users
+from rentbiz.utils.images import generate_image_variants
+
+
+class Command(BaseCommand):
+    help = 'Generates resized variants for company and user logos uploaded before they existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='store_true', help='Hand the work to Celery instead of running it here')
+
+    def handle(self, *args, **options):
+        total = 0
+        for model in (Company, Users):
+            pending = (
+                model.objects.exclude(company_logo='').exclude(company_logo__isnull=True)
+                .values_list('pk', 'company_logo', 'logo_variants')
+            )
+            for pk, logo, variants in pending.iterator():
+                if (variants or {}).get('source') == logo:
+                    continue
+                args = (model._meta.label, pk, 'company_logo', 'logo_variants')
+                if options['queue']:
+                    generate_image_variants.delay(*args)
+                else:
+                    generate_image_variants.apply(args=args, throw=True)
+                total += 1
+        verb = 'Queued' if options['queue'] else 'Generated'
+        self.stdout.write(self.style.SUCCESS(f'{verb} variants for {total} logos'))
@@ -0,0 +1,243 @@
+import calendar
+import random
+import secrets
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import Company
+from company.models import (
+    AdditionalCharge, Building, ChargeCode, Charges, IDType, Invoice, InvoiceAutomationConfig,
+    PaymentSchedule, Tenancy, Tenant, UnitOccupancy, Units, UnitType, Users,
+)
+from company import expiry
+from company.reference_data import bump_company_version
+from finance.models import Collection, Expense, PaymentDistribution, Refund
+from rentbiz.utils import geo
+
+BENCHMARK_PASSWORD = 'benchmark'
+CENT = Decimal('0.01')
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    year = day.year + month // 12
+    month = month % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates a synthetic portfolio: companies with buildings, units, tenants, '
+        'tenancies and their schedules, invoices, collections, distributions, '
+        'expenses and refunds. Rows are bulk inserted; run it against a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=1)
+        parser.add_argument('--buildings', type=int, default=5, help='Buildings per company')
+        parser.add_argument('--units', type=int, default=20, help='Units per building')
+        parser.add_argument('--occupancy', type=float, default=0.8, help='Share of units with an active tenancy')
+        parser.add_argument('--history', type=int, default=10, help='Months of tenancy history')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        run = secrets.token_hex(3)
+        password = make_password(BENCHMARK_PASSWORD)
+
+        for index in range(options['companies']):
+            with transaction.atomic():
+                company, counts = self.generate_company(rng, run, index, password, options)
+                counts['document expiries'] = expiry.rebuild(company.id)
+            bump_company_version(company.id)
+            summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+            self.stdout.write(self.style.SUCCESS(
+                f'Company {company.id} (login {company.user_id} / {BENCHMARK_PASSWORD}): {summary}'
+            ))
+
+    def generate_company(self, rng, run, index, password, options):
+        today = date.today()
+        prefix = f'{run}{index}'
+        company = Company.objects.create(
+            user_id=f'syn-{prefix}',
+            company_name=f'Synthetic Properties {prefix}',
+            company_admin_name='Benchmark Admin',
+            email_address=f'syn-{prefix}@example.com',
+            password=password,
+            currency='UAE Dirham',
+            currency_code='AED',
+        )
+        user = Users.objects.create(
+            company=company, name='Benchmark Admin', username=f'syn-{prefix}-admin',
+            email=f'syn-{prefix}-admin@example.com', password=password, user_role='Admin',
+        )
+        owned = {'company': company, 'user': user}
+
+        unit_types = UnitType.objects.bulk_create(
+            UnitType(title=title, **owned) for title in ('Studio', '1 BHK', '2 BHK', 'Shop'))
+        id_type = IDType.objects.create(title='Emirates ID', **owned)
+        rent_code, deposit_code, service_code = ChargeCode.objects.bulk_create(
+            ChargeCode(title=title, **owned) for title in ('RENT', 'DEPOSIT', 'SERVICE'))
+        rent, deposit, service = Charges.objects.bulk_create([
+            Charges(name='Rent', charge_code=rent_code, **owned),
+            Charges(name='Deposit', charge_code=deposit_code, **owned),
+            Charges(name='Maintenance', charge_code=service_code, **owned),
+        ])
+
+        buildings = []
+        for number in range(options['buildings']):
+            latitude, longitude = 25.0 + rng.random(), 55.0 + rng.random()
+            buildings.append(Building(
+                building_name=f'Tower {prefix}-{number}', building_no=str(number),
+                building_address=f'{number} Synthetic Street',
+                latitude=latitude, longitude=longitude, geohash=geo.encode(latitude, longitude),
+                code=f'B-{prefix}-{number}', **owned,
+            ))
+        buildings = Building.objects.bulk_create(buildings)
+
+        units = []
+        for building in buildings:
+            for number in range(options['units']):
+                occupied = rng.random() < options['occupancy']
+                units.append(Units(
+                    building=building, unit_name=f'{building.building_no}-{number:03d}',
+                    unit_type=rng.choice(unit_types), no_of_bedrooms=rng.randint(0, 3),
+                    no_of_bathrooms=rng.randint(1, 3), code=f'U-{prefix}-{len(units)}',
+                    unit_status='occupied' if occupied else 'vacant', **owned,
+                ))
+        units = Units.objects.bulk_create(units)
+        occupied_units = [unit for unit in units if unit.unit_status == 'occupied']
+
+        tenants = Tenant.objects.bulk_create(
+            Tenant(
+                tenant_name=f'Tenant {prefix}-{number}', nationality='AE',
+                phone=f'05{rng.randint(10000000, 99999999)}',
+                email=f'tenant-{prefix}-{number}@example.com', tenant_type='Individual',
+                id_type=id_type, id_number=f'784-{rng.randint(10**11, 10**12 - 1)}',
+                id_validity_date=today + timedelta(days=rng.randint(-30, 720)),
+                code=f'T-{prefix}-{number}', **owned,
+            )
+            for number in range(len(occupied_units))
+        )
+
+        tenancies = []
+        for number, (unit, tenant) in enumerate(zip(occupied_units, tenants)):
+            start = add_months(today.replace(day=1), -rng.randint(0, options['history']))
+            monthly = Decimal(rng.randrange(1500, 9000, 50))
+            tenancies.append(Tenancy(
+                tenant=tenant, building=unit.building, unit=unit, rental_months=12,
+                start_date=start, end_date=add_months(start, 12) - timedelta(days=1),
+                no_payments=12, first_rent_due_on=start, rent_per_frequency=monthly,
+                total_rent_receivable=monthly * 12, deposit=monthly, commission=Decimal('0'),
+                status='active', tenancy_code=f'TS{prefix}-{number}', **owned,
+            ))
+        tenancies = Tenancy.objects.bulk_create(tenancies)
+        UnitOccupancy.objects.bulk_create(
+            UnitOccupancy(
+                company=company, building=tenancy.building, unit=tenancy.unit, tenancy=tenancy,
+                occupied_from=tenancy.start_date,
+            )
+            for tenancy in tenancies
+        )
+
+        schedules, charges = [], []
+        for tenancy in tenancies:
+            schedules.append(PaymentSchedule(
+                tenancy=tenancy, charge_type=deposit, reason='Deposit', due_date=tenancy.start_date,
+                amount=tenancy.deposit, vat=0, tax=0, total=tenancy.deposit,
+                status='paid',
+            ))
+            for month in range(tenancy.no_payments):
+                due = add_months(tenancy.start_date, month)
+                schedules.append(PaymentSchedule(
+                    tenancy=tenancy, charge_type=rent, reason='Monthly Rent', due_date=due,
+                    amount=tenancy.rent_per_frequency, vat=0, tax=0, total=tenancy.rent_per_frequency,
+                    status='pending' if due > today else 'paid',
+                ))
+            if rng.random() < 0.3:
+                amount = Decimal(rng.randrange(100, 800))
+                charges.append(AdditionalCharge(
+                    tenancy=tenancy, charge_type=service, reason='Maintenance',
+                    due_date=today - timedelta(days=rng.randint(0, 60)), in_date=today,
+                    amount=amount, vat=0, tax=0, total=amount, status='pending',
+                ))
+        schedules = PaymentSchedule.objects.bulk_create(schedules)
+        charges = AdditionalCharge.objects.bulk_create(charges)
+
+        # One invoice per schedule that has fallen due; the most recent rent is
+        # left unpaid or partially paid so collections have work to do.
+        due_schedules = [schedule for schedule in schedules if schedule.due_date <= today]
+        latest_rent = {}
+        for schedule in due_schedules:
+            if schedule.charge_type_id == rent.id:
+                latest_rent[schedule.tenancy_id] = schedule
+        open_ids = {schedule.id for schedule in latest_rent.values()}
+
+        invoices = Invoice.objects.bulk_create(
+            Invoice(
+                tenancy=schedule.tenancy, invoice_number=f'INV-{prefix}-{number}',
+                in_date=schedule.due_date - timedelta(days=7), end_date=schedule.due_date,
+                total_amount=schedule.total, status='unpaid' if schedule.id in open_ids else 'paid',
+                **owned,
+            )
+            for number, schedule in enumerate(due_schedules)
+        )
+        Invoice.payment_schedules.through.objects.bulk_create(
+            Invoice.payment_schedules.through(invoice_id=invoice.id, paymentschedule_id=schedule.id)
+            for invoice, schedule in zip(invoices, due_schedules)
+        )
+        PaymentSchedule.objects.filter(id__in=open_ids).update(status='invoiced', updated_at=timezone.now())
+
+        paid = [(invoice, schedule) for invoice, schedule in zip(invoices, due_schedules)
+                if invoice.status == 'paid']
+        collections = Collection.objects.bulk_create(
+            Collection(
+                invoice=invoice, amount=invoice.total_amount,
+                collection_date=schedule.due_date + timedelta(days=rng.randint(0, 10)),
+                collection_mode=rng.choice(['cash', 'bank_transfer', 'cheque', 'online_payment']),
+                status='completed', reference_number=f'REF-{invoice.invoice_number}',
+            )
+            for invoice, schedule in paid
+        )
+        PaymentDistribution.objects.bulk_create(
+            PaymentDistribution(collection=collection, payment_schedule=schedule, amount=collection.amount)
+            for collection, (_, schedule) in zip(collections, paid)
+        )
+
+        expenses = []
+        for building in buildings:
+            for month in range(options['history'] + 1):
+                amount = Decimal(rng.randrange(500, 5000))
+                tax = (amount * Decimal('0.05')).quantize(CENT)
+                expenses.append(Expense(
+                    expense_type='general', status='paid', building=building, charge_type=service,
+                    amount=amount, tax=tax, total_amount=amount + tax,
+                    date=add_months(today, -month), description='Building maintenance', **owned,
+                ))
+        expenses = Expense.objects.bulk_create(expenses)
+
+        refunded = [tenancy for tenancy in tenancies if rng.random() < 0.05]
+        refunds = Refund.objects.bulk_create(
+            Refund(
+                tenancy=tenancy, refund_type='excess', amount=Decimal(rng.randrange(100, 500)),
+                refund_method='bank_transfer', reason='Synthetic refund', processed_by=user,
+            )
+            for tenancy in refunded
+        )
+
+        InvoiceAutomationConfig.objects.bulk_create(
+            InvoiceAutomationConfig(tenancy=tenancy, days_before_due=7, combine_charges=True)
+            for tenancy in tenancies
+        )
+
+        return company, {
+            'buildings': len(buildings), 'units': len(units), 'tenants': len(tenants),
+            'tenancies': len(tenancies), 'schedules': len(schedules),
+            'additional charges': len(charges), 'invoices': len(invoices),
+            'collections': len(collections), 'expenses': len(expenses), 'refunds': len(refunds),
+        }
@@ -0,0 +1,51 @@
+import time
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Company
+from company.imports import ImportFileError, PropertyImport, read_sheets, run_import
+
+
+class Command(BaseCommand):
+    help = 'Imports buildings, units and their documents from CSV/XLSX files (see company.imports)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('company_id', type=int)
+        parser.add_argument('--workbook', help='XLSX with buildings/units/documents sheets')
+        parser.add_argument('--buildings')
+        parser.add_argument('--units')
+        parser.add_argument('--documents')
+        parser.add_argument('--dry-run', action='store_true', help='Only validate')
+
+    def handle(self, *args, **options):
+        company = Company.objects.filter(id=options['company_id']).first()
+        if company is None:
+            raise CommandError(f"Company {options['company_id']} does not exist")
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            files = {
+                name: stack.enter_context(open(options[name], 'rb'))
+                for name in ('workbook', *PropertyImport.SHEETS) if options[name]
+            }
+            if not files:
+                raise CommandError('Give --workbook or at least one of --buildings, --units, --documents')
+            try:
+                sheets = read_sheets(files, PropertyImport.SHEETS)
+            except ImportFileError as e:
+                raise CommandError(str(e))
+        read_at = time.perf_counter()
+
+        ok, payload = run_import(PropertyImport(company), sheets, options['dry_run'])
+        if not ok:
+            for error in payload['errors']:
+                self.stderr.write(f"{error['sheet']} row {error['row']} {error['field']}: {error['error']}")
+            raise CommandError(f"{payload['error_count']} invalid rows; nothing was imported")
+
+        summary = ', '.join(f'{count} {name}' for name, count in payload['created'].items())
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {summary} (read {read_at - started:.2f}s, '
+            f'import {time.perf_counter() - read_at:.2f}s)'
+        ))
@@ -0,0 +1,112 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+
+from accounts.models import Company
+from company.authentication import issue_tokens, resolve_principal
+
+DASHBOARD_PATHS = [
+    '/company/dashboard/properties-summary/{company_id}/',
+    '/company/dashboard/rent-collection/{company_id}/',
+    '/company/dashboard/tenency-expiring/{company_id}/',
+    '/company/dashboard/revenue-report/{company_id}/',
+    '/company/dashboard/collection-list/{company_id}/',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Replays the dashboard endpoints in-process and reports throughput and the '
+        'number of database connections opened, once with CONN_MAX_AGE=0 and once '
+        'with the configured connection settings'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('company_id', type=int)
+        parser.add_argument('--rounds', type=int, default=50,
+                            help='Times each dashboard endpoint is requested per run')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Client threads; each thread holds its own connection')
+
+    def run(self, label, paths, rounds, concurrency, headers):
+        opened = []
+        lock = threading.Lock()
+
+        def count(sender, connection, **kwargs):
+            with lock:
+                opened.append(connection.alias)
+
+        def worker(path_batch):
+            client = Client(**headers)
+            try:
+                for path in path_batch:
+                    response = client.get(path)
+                    if response.status_code != 200:
+                        raise CommandError(f'{path} returned {response.status_code}')
+            finally:
+                connections.close_all()
+
+        batches = [[] for _ in range(concurrency)]
+        for index, path in enumerate(paths * rounds):
+            batches[index % concurrency].append(path)
+
+        connection_created.connect(count, weak=False)
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(worker, batches))
+        finally:
+            connection_created.disconnect(count)
+        elapsed = time.perf_counter() - started
+
+        total = len(paths) * rounds
+        self.stdout.write(
+            f'{label:<12} {total / elapsed:8.1f} req/s  {elapsed * 1000 / total:7.2f} ms/req  '
+            f'{len(opened):5d} connections opened'
+        )
+        return len(opened)
+
+    def handle(self, *args, **options):
+        company_id, rounds, concurrency = options['company_id'], options['rounds'], options['concurrency']
+        company = Company.objects.filter(id=company_id).first()
+        if company is None:
+            raise CommandError(f'Company {company_id} does not exist')
+
+        # Authenticate as the company so the run also works with COMPANY_SCOPE_ENFORCED.
+        _, access_token = issue_tokens(resolve_principal(company.user_id))
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {access_token}'}
+        paths = [path.format(company_id=company_id) for path in DASHBOARD_PATHS]
+
+        db_settings = settings.DATABASES['default']
+        self.stdout.write(
+            f'pool mode {settings.DB_POOL_MODE}, role {settings.DB_PROCESS_ROLE}, '
+            f'CONN_MAX_AGE {db_settings["CONN_MAX_AGE"]}, '
+            f'pool {db_settings.get("OPTIONS", {}).get("pool") or "off"}'
+        )
+        connections.close_all()
+
+        # Client threads build their connections from connections.settings.
+        configured_age = connections.settings['default']['CONN_MAX_AGE']
+        connections.settings['default']['CONN_MAX_AGE'] = 0
+        try:
+            baseline = self.run('per-request', paths, rounds, concurrency, headers)
+        finally:
+            connections.settings['default']['CONN_MAX_AGE'] = configured_age
+
+        reused = self.run('configured', paths, rounds, concurrency, headers)
+
+        pool = getattr(connection, 'pool', None)
+        if pool is not None:
+            # With a pool Django "connects" per request, but only borrows a
+            # physical connection; the pool counters show the real work.
+            self.stdout.write(f'pool stats: {pool.get_stats()}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{baseline - reused} fewer connections opened with the configured settings'
+        ))
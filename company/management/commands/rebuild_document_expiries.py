@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Company
+from company.expiry import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the document expiry index from the document and tenant tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('company_id', type=int, nargs='?', help='Only this company (default: all)')
+
+    def handle(self, *args, **options):
+        company_id = options['company_id']
+        if company_id is not None and not Company.objects.filter(id=company_id).exists():
+            raise CommandError(f'Company {company_id} does not exist')
+        indexed = rebuild(company_id)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} dated documents'))
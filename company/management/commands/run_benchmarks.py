@@ -0,0 +1,180 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import Company
+from company.authentication import issue_tokens, resolve_principal
+from company.models import Invoice
+
+READ_ENDPOINTS = [
+    ('tenancy_list', '/company/tenancies/company/{company_id}/'),
+    ('financial_summary', '/finance/income-expenses/{company_id}/'),
+    ('dashboard_overview', '/company/dashboard/overview/{company_id}/'),
+    ('dashboard_revenue_report', '/company/dashboard/revenue-report/{company_id}/'),
+    ('export_tenancies', '/company/tenancies/{company_id}/export/'),
+    ('export_invoices', '/company/invoices/company/{company_id}/export-csv/'),
+    ('export_collections', '/finance/collections/download/'),
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the hot endpoints (tenancy list, collection create, financial summary, '
+        'dashboard, exports, auto-invoice run) against a generate_portfolio company and '
+        'writes latency percentiles, query counts and peak memory to JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('company_id', type=int)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--output', help='JSON file to write (default benchmark-<commit>.json)')
+        parser.add_argument('--compare', help='Earlier JSON result to print p50 deltas against')
+        parser.add_argument('--skip-writes', action='store_true',
+                            help='Skip collection create and the auto-invoice run')
+
+    def request(self, client, method, path, data=None):
+        """Run one request; returns (seconds, queries, response)."""
+        started = time.perf_counter()
+        if method == 'post':
+            response = client.post(path, data, content_type='application/json')
+        else:
+            response = client.get(path, data)
+        queries = getattr(response.wsgi_request, 'query_stats', None)
+        queries = queries.queries if queries is not None else 0
+        if getattr(response, 'streaming', False):
+            # Exports run their queries while the body is consumed.
+            with CaptureQueriesContext(connection) as streamed:
+                b''.join(response.streaming_content)
+            queries += len(streamed)
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise CommandError(f'{method.upper()} {path} returned {response.status_code}')
+        return elapsed, queries, response
+
+    def measure(self, name, calls):
+        """``calls`` yields zero-argument callables, one per iteration plus one for memory."""
+        calls = list(calls)
+        timings, queries = [], []
+        for call in calls[:-1]:
+            elapsed, count, _ = call()
+            timings.append(elapsed)
+            queries.append(count)
+
+        tracemalloc.start()
+        try:
+            calls[-1]()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        result = {
+            'iterations': len(timings),
+            'p50_ms': percentile(timings, 50) * 1000,
+            'p90_ms': percentile(timings, 90) * 1000,
+            'p99_ms': percentile(timings, 99) * 1000,
+            'max_ms': max(timings) * 1000,
+            'queries_mean': statistics.mean(queries),
+            'queries_max': max(queries),
+            'peak_memory_kb': peak / 1024,
+        }
+        self.stdout.write(
+            f'{name:<26} p50 {result["p50_ms"]:8.2f} ms  p90 {result["p90_ms"]:8.2f} ms  '
+            f'p99 {result["p99_ms"]:8.2f} ms  queries {result["queries_max"]:4d}  '
+            f'peak {result["peak_memory_kb"]:9.1f} KiB'
+        )
+        return result
+
+    def handle(self, *args, **options):
+        company_id, iterations = options['company_id'], options['iterations']
+        if iterations < 1:
+            raise CommandError('--iterations must be at least 1')
+        company = Company.objects.filter(id=company_id).first()
+        if company is None:
+            raise CommandError(f'Company {company_id} does not exist')
+
+        _, access_token = issue_tokens(resolve_principal(company.user_id))
+        client = Client(headers={'Authorization': f'Bearer {access_token}'})
+        results = {}
+
+        for name, path in READ_ENDPOINTS:
+            path = path.format(company_id=company_id)
+            client.get(path)  # warm caches and connections
+            results[name] = self.measure(name, (
+                lambda path=path: self.request(client, 'get', path)
+                for _ in range(iterations + 1)
+            ))
+
+        if not options['skip_writes']:
+            with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+                invoice_ids = list(
+                    Invoice.objects.filter(company_id=company_id, status='unpaid')
+                    .order_by('id').values_list('id', flat=True)[:iterations + 1]
+                )
+                if len(invoice_ids) < iterations + 1:
+                    raise CommandError('Not enough unpaid invoices; generate a larger portfolio')
+                results['collection_create'] = self.measure('collection_create', (
+                    lambda invoice_id=invoice_id: self.request(client, 'post', '/finance/create-collection/', {
+                        'invoice': invoice_id, 'amount': '10.00', 'collection_mode': 'cash',
+                        'collection_date': date.today().isoformat(), 'status': 'completed',
+                    })
+                    for invoice_id in invoice_ids
+                ))
+                # The run creates invoices, so later iterations find less to do;
+                # it is the cost of a daily run that is being tracked.
+                results['auto_invoice_run'] = self.measure('auto_invoice_run', (
+                    lambda: self.request(client, 'post', '/company/invoices/auto-generate/', {})
+                    for _ in range(2)
+                ))
+
+        report = {
+            'commit': current_commit(),
+            'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'company_id': company_id,
+            'endpoints': results,
+        }
+        output = options['output'] or f'benchmark-{(report["commit"] or "unknown")[:10]}.json'
+        with open(output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+
+        if options['compare']:
+            with open(options['compare']) as handle:
+                baseline = json.load(handle)['endpoints']
+            for name, result in results.items():
+                if name in baseline:
+                    before, after = baseline[name]['p50_ms'], result['p50_ms']
+                    change = (after - before) / before * 100 if before else 0
+                    self.stdout.write(
+                        f'{name:<26} p50 {before:8.2f} -> {after:8.2f} ms ({change:+.1f}%)  '
+                        f'queries {baseline[name]["queries_max"]} -> {result["queries_max"]}'
+                    )
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2025-07-10 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0060_alter_additionalcharge_status_alter_invoice_status_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tenancy',
+            index=models.Index(fields=['company', 'status'], name='tenancy_company_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenancy',
+            index=models.Index(fields=['end_date'], name='tenancy_end_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentschedule',
+            index=models.Index(fields=['tenancy', 'status', 'due_date'], name='schedule_tenancy_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='additionalcharge',
+            index=models.Index(fields=['tenancy', 'status', 'due_date'], name='addcharge_tenancy_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['company', 'status', 'end_date'], name='invoice_company_status_idx'),
+        ),
+    ]
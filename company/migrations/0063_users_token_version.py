@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2025-07-14 08:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0062_updated_at_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='users',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
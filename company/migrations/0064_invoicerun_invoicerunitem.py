@@ -0,0 +1,78 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_invoiced_items(apps, schema_editor):
+    """Record the items of existing automated invoices so they are never invoiced twice."""
+    Invoice = apps.get_model('company', 'Invoice')
+    InvoiceRunItem = apps.get_model('company', 'InvoiceRunItem')
+    db_alias = schema_editor.connection.alias
+
+    items, seen = [], set()
+    relations = [
+        (Invoice.payment_schedules.through, 'paymentschedule_id', 'payment_schedule_id'),
+        (Invoice.additional_charges.through, 'additionalcharge_id', 'additional_charge_id'),
+    ]
+    for through, source, target in relations:
+        rows = (
+            through.objects.using(db_alias)
+            .filter(invoice__is_automated=True, invoice__tenancy__isnull=False)
+            .order_by('invoice_id')
+            .values_list('invoice_id', 'invoice__tenancy_id', source)
+        )
+        for invoice_id, tenancy_id, item_id in rows.iterator():
+            if (target, tenancy_id, item_id) in seen:
+                continue
+            seen.add((target, tenancy_id, item_id))
+            items.append(InvoiceRunItem(invoice_id=invoice_id, tenancy_id=tenancy_id, **{target: item_id}))
+    InvoiceRunItem.objects.using(db_alias).bulk_create(items, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0063_users_token_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('last_config_id', models.PositiveBigIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('created', models.PositiveIntegerField(default=0)),
+                ('skipped', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('emails_sent', models.PositiveIntegerField(default=0)),
+                ('emails_failed', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='InvoiceRunItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('additional_charge', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='invoice_run_items', to='company.additionalcharge')),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='run_items', to='company.invoice')),
+                ('payment_schedule', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='invoice_run_items', to='company.paymentschedule')),
+                ('run', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='items', to='company.invoicerun')),
+                ('tenancy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_run_items', to='company.tenancy')),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(condition=models.Q(('payment_schedule__isnull', False)), fields=('tenancy', 'payment_schedule'), name='unique_invoiced_schedule_per_tenancy'),
+                    models.UniqueConstraint(condition=models.Q(('additional_charge__isnull', False)), fields=('tenancy', 'additional_charge'), name='unique_invoiced_charge_per_tenancy'),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_invoiced_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def backfill_occupancy(apps, schema_editor):
+    """
+    Rebuild the timeline from existing tenancies and bring ``unit_status``
+    in line with it. Active tenancies stay open; terminated, closed and
+    renewed ones end at their end date, or at their last update if that
+    came first. Overlaps on a unit end at the next tenancy's start.
+    """
+    Tenancy = apps.get_model('company', 'Tenancy')
+    Units = apps.get_model('company', 'Units')
+    UnitOccupancy = apps.get_model('company', 'UnitOccupancy')
+    db_alias = schema_editor.connection.alias
+    today = django.utils.timezone.localdate()
+
+    tenancies = (
+        Tenancy.objects.using(db_alias)
+        .filter(unit__isnull=False, start_date__isnull=False,
+                status__in=['active', 'terminated', 'closed', 'renewed'])
+        .order_by('unit_id', 'start_date', 'id')
+        .values('id', 'unit_id', 'company_id', 'building_id', 'status', 'start_date', 'end_date', 'updated_at')
+    )
+
+    rows, previous = [], None
+    for tenancy in tenancies.iterator():
+        if tenancy['status'] == 'active':
+            occupied_to = None
+        else:
+            occupied_to = tenancy['end_date'] + datetime.timedelta(days=1) if tenancy['end_date'] else None
+            if tenancy['updated_at'] is not None:
+                updated = django.utils.timezone.localdate(tenancy['updated_at'])
+                occupied_to = min(occupied_to, updated) if occupied_to else updated
+            occupied_to = max(occupied_to or today, tenancy['start_date'])
+
+        if previous is not None and previous.unit_id == tenancy['unit_id']:
+            if previous.occupied_to is None or previous.occupied_to > tenancy['start_date']:
+                previous.occupied_to = max(tenancy['start_date'], previous.occupied_from)
+
+        previous = UnitOccupancy(
+            unit_id=tenancy['unit_id'], tenancy_id=tenancy['id'], company_id=tenancy['company_id'],
+            building_id=tenancy['building_id'], occupied_from=tenancy['start_date'], occupied_to=occupied_to,
+        )
+        rows.append(previous)
+    UnitOccupancy.objects.using(db_alias).bulk_create(rows, batch_size=1000)
+
+    now = django.utils.timezone.now()
+    current = UnitOccupancy.objects.using(db_alias).filter(occupied_to__isnull=True).values('unit_id')
+    Units.objects.using(db_alias).filter(id__in=current).exclude(unit_status='occupied').update(
+        unit_status='occupied', updated_at=now)
+    Units.objects.using(db_alias).filter(unit_status='occupied').exclude(id__in=current).update(
+        unit_status='vacant', updated_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0064_invoicerun_invoicerunitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnitOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('occupied_from', models.DateField()),
+                ('occupied_to', models.DateField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('building', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='unit_occupancies', to='company.building')),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='unit_occupancies', to='accounts.company')),
+                ('tenancy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancies', to='company.tenancy')),
+                ('unit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancies', to='company.units')),
+            ],
+            options={
+                'ordering': ['unit', 'occupied_from'],
+                'indexes': [
+                    models.Index(fields=['company', 'occupied_from', 'occupied_to'], name='occupancy_company_range_idx'),
+                    models.Index(fields=['unit', 'occupied_from'], name='occupancy_unit_from_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(condition=models.Q(('occupied_to__isnull', True)), fields=('unit',), name='unique_open_occupancy_per_unit'),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+    ]
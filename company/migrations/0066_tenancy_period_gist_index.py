@@ -0,0 +1,32 @@
+from django.db import migrations
+
+INDEX_NAME = 'tenancy_blocking_period_gist'
+
+
+def create_period_index(apps, schema_editor):
+    # Expression GiST index behind company.availability; PostgreSQL only,
+    # other databases use the in-memory interval tree.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON company_tenancy "
+        "USING gist (daterange(start_date, end_date, '[]')) "
+        "WHERE status IN ('active', 'pending')"
+    )
+
+
+def drop_period_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0065_unitoccupancy'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_period_index, drop_period_index),
+    ]
@@ -0,0 +1,86 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# kind -> (source model, date field, {DocumentExpiry field: source lookup});
+# a frozen copy of company.expiry.SOURCES.
+SOURCES = {
+    'building_document': ('DocumentType', 'expiry_date', {
+        'company_id': 'building__company_id', 'building_id': 'building_id',
+        'label': 'doc_type__title', 'number': 'number',
+    }),
+    'unit_document': ('UnitDocumentType', 'expiry_date', {
+        'company_id': 'unit__company_id', 'building_id': 'unit__building_id', 'unit_id': 'unit_id',
+        'label': 'doc_type__title', 'number': 'number',
+    }),
+    'tenant_document': ('TenantDocumentType', 'expiry_date', {
+        'company_id': 'tenant__company_id', 'tenant_id': 'tenant_id',
+        'label': 'doc_type__title', 'number': 'number',
+    }),
+    'tenant_id': ('Tenant', 'id_validity_date', {
+        'company_id': 'company_id', 'tenant_id': 'id',
+        'label': 'id_type__title', 'number': 'id_number',
+    }),
+    'sponsor_id': ('Tenant', 'sponser_id_validity_date', {
+        'company_id': 'company_id', 'tenant_id': 'id',
+        'label': 'sponser_id_type__title', 'number': 'sponser_id_number',
+    }),
+}
+
+
+def backfill_document_expiries(apps, schema_editor):
+    DocumentExpiry = apps.get_model('company', 'DocumentExpiry')
+    db_alias = schema_editor.connection.alias
+
+    rows = []
+    for kind, (model_name, date_field, lookups) in SOURCES.items():
+        sources = (
+            apps.get_model('company', model_name).objects.using(db_alias)
+            .filter(**{f'{date_field}__isnull': False, f"{lookups['company_id']}__isnull": False})
+            .values('pk', date_field, *lookups.values())
+        )
+        for source in sources.iterator(chunk_size=2000):
+            fields = {name: source[lookup] for name, lookup in lookups.items()}
+            if fields['label'] is not None:
+                fields['label'] = fields['label'][:255]
+            rows.append(DocumentExpiry(kind=kind, source_id=source['pk'], expiry_date=source[date_field], **fields))
+    DocumentExpiry.objects.using(db_alias).bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0067_documentupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentExpiry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('building_document', 'Building document'), ('unit_document', 'Unit document'), ('tenant_document', 'Tenant document'), ('tenant_id', 'Tenant ID'), ('sponsor_id', 'Sponsor ID')], max_length=20)),
+                ('source_id', models.PositiveBigIntegerField()),
+                ('expiry_date', models.DateField()),
+                ('label', models.CharField(blank=True, max_length=255, null=True)),
+                ('number', models.CharField(blank=True, max_length=100, null=True)),
+                ('notified_for', models.DateField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('building', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='document_expiries', to='company.building')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_expiries', to='accounts.company')),
+                ('tenant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='document_expiries', to='company.tenant')),
+                ('unit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='document_expiries', to='company.units')),
+            ],
+            options={
+                'ordering': ['expiry_date', 'id'],
+                'indexes': [
+                    models.Index(fields=['company', 'expiry_date'], name='document_expiry_company_idx'),
+                    models.Index(fields=['expiry_date'], name='document_expiry_date_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(fields=('kind', 'source_id'), name='unique_document_expiry_source'),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_document_expiries, migrations.RunPython.noop),
+    ]
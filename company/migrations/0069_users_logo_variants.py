@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0068_documentexpiry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='users',
+            name='logo_variants',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+from rentbiz.utils import geo
+
+
+def backfill_geohashes(apps, schema_editor):
+    Building = apps.get_model('company', 'Building')
+    buildings = Building.objects.filter(latitude__isnull=False, longitude__isnull=False).only(
+        'id', 'latitude', 'longitude')
+    batch = []
+    for building in buildings.iterator(chunk_size=2000):
+        building.geohash = geo.encode(building.latitude, building.longitude)
+        batch.append(building)
+        if len(batch) == 2000:
+            Building.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    Building.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0070_codesequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='building',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.RunPython(backfill_geohashes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='building',
+            index=models.Index(fields=['company', 'geohash'], name='building_company_geohash_idx'),
+        ),
+    ]
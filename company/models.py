@@ -1,13 +1,18 @@
 from django.db import models
 from django.contrib.auth.hashers import make_password, check_password
 from accounts.models import *
+import uuid
 from decimal import Decimal
-from datetime import date
+from datetime import date, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rentbiz.utils import geo
 
 
 
     
-class Users(models.Model):   
+class Users(TokenVersionMixin, models.Model):   
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='user_comp', null=True, blank=True) 
     name = models.CharField(max_length=100,null=True, blank=True)
     username = models.CharField(max_length=100, unique=True,null=True, blank=True)
@@ -15,6 +20,8 @@ class Users(models.Model):
     password = models.CharField(max_length=100,null=True, blank=True)
    
     company_logo = models.ImageField(upload_to='user_logo/', null=True, blank=True)
+    # Resized copies of company_logo; see rentbiz.utils.images.
+    logo_variants = models.JSONField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     user_role = models.CharField(
         max_length=255,
@@ -31,6 +38,7 @@ class Users(models.Model):
         ('blocked', 'Blocked'),
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    token_version = models.PositiveIntegerField(default=0, editable=False)
     
     def set_password(self, raw_password):
         """Hash password before saving"""
@@ -114,6 +122,7 @@ class MasterDocumentType(models.Model):
     expiry_date = models.BooleanField(default=False)
     upload_file =models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
     
     def __str__(self):
         return self.title if self.title else "Unnamed title"
@@ -128,9 +137,12 @@ class Building(models.Model):
     remarks = models.TextField(blank=True, null=True)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    # Kept in step with latitude/longitude by save(); see rentbiz.utils.geo.
+    geohash = models.CharField(max_length=12, null=True, blank=True, editable=False)
     land_mark = models.CharField(max_length=255,null=True, blank=True)    
     building_address = models.CharField(max_length=255,null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
     
     country = models.ForeignKey(Country, on_delete=models.SET_NULL, null=True, blank=True, related_name='buildings_country')
     state = models.ForeignKey(State, on_delete=models.SET_NULL, null=True, blank=True, related_name='buildings_state')
@@ -142,23 +154,28 @@ class Building(models.Model):
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     code = models.CharField(max_length=20, unique=True, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'geohash'], name='building_company_geohash_idx'),
+        ]
     
     def __str__(self):
         return self.building_name if self.building_name else "Unnamed Building"
     
     def save(self, *args, **kwargs):
-        if not self.code:
-            last_building = Building.objects.filter(code__startswith='B24').order_by('-code').first()
-            if last_building and last_building.code:
-                last_num_str = last_building.code[1:]  
-                last_num = int(last_num_str)
-                new_num = last_num + 1
-            else:
-                new_num = 24090001   
-            
-            self.code = f"B{new_num:08d}"  
-        
-        super().save(*args, **kwargs)
+        self.geohash = geo.encode(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+
+        if self.code:
+            return super().save(*args, **kwargs)
+        # The code comes from the locked sequence, so it cannot fall in a
+        # block an import has reserved but not committed yet.
+        with transaction.atomic():
+            self.code = allocate_codes(Building, 'B', 1)[0]
+            super().save(*args, **kwargs)
         
     
 class DocumentType(models.Model):  
@@ -180,6 +197,7 @@ class UnitType(models.Model):
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='unit_type_comp', null=True, blank=True) 
     title = models.CharField(max_length=100, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
     
     def __str__(self):
         return self.title if self.title else "No title"
@@ -205,21 +223,15 @@ class Units(models.Model):
     ]
     unit_status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
 
     def save(self, *args, **kwargs):
-        if not self.code:
-            last_unit = Units.objects.filter(code__startswith='U24').order_by('-code').first()
-            if last_unit and last_unit.code:
-                last_num_str = last_unit.code[1:]   
-                last_num = int(last_num_str)
-                new_num = last_num + 1
-            else:
-                new_num = 24090001   
-            
-            self.code = f"U{new_num:08d}"  
+        if self.code:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            self.code = allocate_codes(Units, 'U', 1)[0]
+            super().save(*args, **kwargs)
 
-        super().save(*args, **kwargs)
-        
     def __str__(self):
         return self.unit_name if self.unit_name else "Untitled Unit"
     
@@ -242,6 +254,7 @@ class IDType(models.Model):
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='id_comp', null=True, blank=True) 
     title = models.CharField(max_length=100, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
     
     def __str__(self):
         return self.title if self.title else "No title"
@@ -255,6 +268,7 @@ class Currency(models.Model):
     currency_code= models.CharField(max_length=100, null=True, blank=True)
     minor_unit = models.CharField(max_length=100, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
     
     def __str__(self):
         return self.country if self.country else "No country"
@@ -293,6 +307,7 @@ class Tenant(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     remarks = models.TextField(blank=True, null=True)   
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
     code = models.CharField(max_length=20, unique=True, blank=True, null=True) 
     
     
@@ -300,19 +315,10 @@ class Tenant(models.Model):
         return self.tenant_name if self.tenant_name else "Untitled Tenant"
     
     def save(self, *args, **kwargs):
-            if not self.code:
-                last_tenant = Tenant.objects.filter(code__startswith='U24').order_by('-code').first()
-                
-                if last_tenant and last_tenant.code:
-              
-                    last_num_str = last_tenant.code[1:]  
-                    last_num = int(last_num_str)
-                    new_num = last_num + 1
-                else:
-                    new_num = 24090001  
-                
-                self.code = f"U{new_num:08d}"  
-            
+        if self.code:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            self.code = allocate_codes(Tenant, 'U', 1)[0]
             super().save(*args, **kwargs)
         
 
@@ -336,6 +342,7 @@ class ChargeCode(models.Model):
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='charge_comp', null=True, blank=True) 
     title = models.CharField(max_length=100, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
     
     def __str__(self):
         return self.title if self.title else "No title"
@@ -348,6 +355,7 @@ class Charges(models.Model):
     taxes = models.ManyToManyField(Taxes, related_name='charges_taxes',blank=True)
     vat_percentage = models.FloatField(null=True, blank=True)  
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
     
     def __str__(self):
         return self.name if self.name else "Untitled Unit"
@@ -395,6 +403,15 @@ class Tenancy(models.Model):
     )
     
     tenancy_code = models.CharField(max_length=20, unique=True, blank=True, null=True)
+
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'status'], name='tenancy_company_status_idx'),
+            models.Index(fields=['end_date'], name='tenancy_end_date_idx'),
+        ]
+
     def get_renewal_number(self):
         """Return how deep the renewal chain is (1 for first renewal, 2 for second, etc)."""
         renewal_number = 1
@@ -475,6 +492,13 @@ class PaymentSchedule(models.Model):
     vat = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     tax = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     total = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tenancy', 'status', 'due_date'], name='schedule_tenancy_status_idx'),
+        ]
     
     def __str__(self):
         return f"{self.tenancy} - {self.charge_type} - Due: {self.due_date}"
@@ -500,6 +524,12 @@ class AdditionalCharge(models.Model):
     tax = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     total = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
 
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tenancy', 'status', 'due_date'], name='addcharge_tenancy_status_idx'),
+        ]
    
     def __str__(self):
         return f"{self.tenancy} - {self.charge_type} - Due: {self.due_date}"
@@ -528,6 +558,13 @@ class Invoice(models.Model):
     payment_schedules = models.ManyToManyField(PaymentSchedule, blank=True, related_name='invoices')
     additional_charges = models.ManyToManyField(AdditionalCharge, blank=True, related_name='invoices')
 
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'status', 'end_date'], name='invoice_company_status_idx'),
+        ]
+
     def __str__(self):
         return f"Invoice {self.invoice_number} for {self.tenancy}"
 
@@ -554,3 +591,233 @@ class InvoiceAutomationConfig(models.Model):
 
 
 
+
+
+class InvoiceRun(models.Model):
+    """
+    One pass of automated invoice generation. Configs are processed in id
+    order and ``last_config_id`` is committed together with each batch, so a
+    run that stops part way is resumed from its last checkpoint.
+    """
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    last_config_id = models.PositiveBigIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    emails_sent = models.PositiveIntegerField(default=0)
+    emails_failed = models.PositiveIntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"Invoice run {self.id} ({self.status}, checkpoint {self.last_config_id})"
+
+    @classmethod
+    def claim(cls, run_id=None):
+        """
+        Return the run to work on: ``run_id`` or the latest unfinished run if
+        there is one, else a new run. Returns None while that run is still
+        checkpointing (updated within INVOICE_RUN_STALE_SECONDS) elsewhere.
+        """
+        stale_before = timezone.now() - timedelta(
+            seconds=getattr(settings, 'INVOICE_RUN_STALE_SECONDS', 900))
+        with transaction.atomic():
+            unfinished = cls.objects.select_for_update().exclude(status='completed')
+            if run_id is not None:
+                run = unfinished.filter(pk=run_id).first()
+            else:
+                run = unfinished.order_by('-started_at').first()
+            if run is None:
+                return cls.objects.create()
+            if run.status == 'running' and run.updated_at > stale_before:
+                return None
+            run.status = 'running'
+            run.error = None
+            run.save(update_fields=['status', 'error', 'updated_at'])
+            return run
+
+
+class InvoiceRunItem(models.Model):
+    """
+    Ledger of schedules and charges already invoiced by automation. The
+    unique constraints make replaying a batch safe: a second invoice for the
+    same item fails to insert and its savepoint is rolled back.
+    """
+    run = models.ForeignKey(InvoiceRun, on_delete=models.SET_NULL, related_name='items', null=True, blank=True)
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='run_items')
+    tenancy = models.ForeignKey(Tenancy, on_delete=models.CASCADE, related_name='invoice_run_items')
+    payment_schedule = models.ForeignKey(PaymentSchedule, on_delete=models.CASCADE, related_name='invoice_run_items', null=True, blank=True)
+    additional_charge = models.ForeignKey(AdditionalCharge, on_delete=models.CASCADE, related_name='invoice_run_items', null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tenancy', 'payment_schedule'],
+                condition=models.Q(payment_schedule__isnull=False),
+                name='unique_invoiced_schedule_per_tenancy'
+            ),
+            models.UniqueConstraint(
+                fields=['tenancy', 'additional_charge'],
+                condition=models.Q(additional_charge__isnull=False),
+                name='unique_invoiced_charge_per_tenancy'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.invoice} item {self.payment_schedule_id or self.additional_charge_id}"
+
+
+class UnitOccupancy(models.Model):
+    """
+    Occupancy timeline of a unit: the unit is occupied by ``tenancy`` on
+    every day in [occupied_from, occupied_to); an open row (``occupied_to``
+    null) is the current occupancy. Rows are written by ``company.occupancy``
+    when tenancies are confirmed, renewed or terminated.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='unit_occupancies', null=True, blank=True)
+    building = models.ForeignKey(Building, on_delete=models.CASCADE, related_name='unit_occupancies', null=True, blank=True)
+    unit = models.ForeignKey(Units, on_delete=models.CASCADE, related_name='occupancies')
+    tenancy = models.ForeignKey(Tenancy, on_delete=models.CASCADE, related_name='occupancies')
+    occupied_from = models.DateField()
+    occupied_to = models.DateField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['unit'],
+                condition=models.Q(occupied_to__isnull=True),
+                name='unique_open_occupancy_per_unit'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['company', 'occupied_from', 'occupied_to'], name='occupancy_company_range_idx'),
+            models.Index(fields=['unit', 'occupied_from'], name='occupancy_unit_from_idx'),
+        ]
+        ordering = ['unit', 'occupied_from']
+
+    def __str__(self):
+        return f"{self.unit} occupied {self.occupied_from} - {self.occupied_to or 'now'}"
+
+
+class DocumentUpload(models.Model):
+    """
+    A document uploaded ahead of the building, unit or tenant that will use
+    it; see ``company.uploads``. Entity requests reference it by ``id``.
+    """
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('assembling', 'Assembling'),
+        ('complete', 'Complete'),
+        ('failed', 'Failed'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='document_uploads', null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, null=True, blank=True)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    sha256 = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    file = models.FileField(upload_to='document_files/', max_length=255, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size} bytes, {self.status})"
+
+
+class DocumentExpiry(models.Model):
+    """
+    One row per dated document of a company, whatever table it lives in, so
+    expiring documents are one indexed range query; see ``company.expiry``.
+    Maintained by signals on the source models.
+    """
+    KIND_CHOICES = [
+        ('building_document', 'Building document'),
+        ('unit_document', 'Unit document'),
+        ('tenant_document', 'Tenant document'),
+        ('tenant_id', 'Tenant ID'),
+        ('sponsor_id', 'Sponsor ID'),
+    ]
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='document_expiries')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    source_id = models.PositiveBigIntegerField()
+    expiry_date = models.DateField()
+    label = models.CharField(max_length=255, null=True, blank=True)
+    number = models.CharField(max_length=100, null=True, blank=True)
+    building = models.ForeignKey(Building, on_delete=models.CASCADE, related_name='document_expiries', null=True, blank=True)
+    unit = models.ForeignKey(Units, on_delete=models.CASCADE, related_name='document_expiries', null=True, blank=True)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='document_expiries', null=True, blank=True)
+    # The expiry date a notification went out for; a renewed document with a
+    # new date is notified again.
+    notified_for = models.DateField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['expiry_date', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'source_id'], name='unique_document_expiry_source'),
+        ]
+        indexes = [
+            models.Index(fields=['company', 'expiry_date'], name='document_expiry_company_idx'),
+            models.Index(fields=['expiry_date'], name='document_expiry_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.label or self.source_id} expires {self.expiry_date}"
+
+
+class CodeSequence(models.Model):
+    """
+    Last number handed out for a code series (e.g. ``B`` for buildings), so
+    single saves and bulk imports take codes under one row lock; see
+    ``allocate_codes``.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_value}"
+
+
+CODE_START = 24090000
+
+
+def allocate_codes(model, letter, count):
+    """
+    Reserve ``count`` consecutive codes of a ``<letter><8 digits>`` series
+    (``save()`` takes them one at a time). Must run inside the transaction
+    that inserts the rows; the sequence row stays locked until it commits,
+    so concurrent saves and imports get disjoint codes.
+    """
+    if count <= 0:
+        return []
+    name = f'{model._meta.label}:{letter}'
+    CodeSequence.objects.get_or_create(name=name)
+    sequence = CodeSequence.objects.select_for_update().get(name=name)
+
+    # Codes set without the sequence (older rows, fixtures) do not advance it.
+    latest = (
+        model.objects.filter(code__regex=rf'^{letter}[0-9]{{8}}$')
+        .order_by('-code').values_list('code', flat=True).first()
+    )
+    first = max(sequence.last_value, int(latest[1:]) if latest else CODE_START) + 1
+    last = first + count - 1
+    CodeSequence.objects.filter(name=name).update(last_value=last, updated_at=timezone.now())
+    return [f'{letter}{number:08d}' for number in range(first, last + 1)]
@@ -0,0 +1,180 @@
+"""
+Unit occupancy timeline.
+
+``UnitOccupancy`` rows are the source of truth for which tenancy occupied a
+unit on which days; ``Units.unit_status`` is kept in step with them. The
+tenancy lifecycle goes through ``occupy`` (confirm), ``hand_over`` (renew)
+and ``vacate`` (terminate/close), each in the caller's transaction with the
+unit row locked.
+
+Intervals are half open, [occupied_from, occupied_to), so a unit vacated on a
+day and let again the same day is never counted twice. Reports read the
+intervals that overlap the requested range with one indexed query and sweep
+them in Python.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import UnitOccupancy, Units
+
+
+def _lock_unit(unit_id):
+    return Units.objects.select_for_update().get(pk=unit_id)
+
+
+def _set_unit_status(unit_id, unit_status):
+    Units.objects.filter(pk=unit_id).exclude(unit_status=unit_status).update(
+        unit_status=unit_status, updated_at=timezone.now())
+
+
+def occupies_on(day):
+    """Filter for occupancies covering ``day``."""
+    return Q(occupied_from__lte=day) & (Q(occupied_to__isnull=True) | Q(occupied_to__gt=day))
+
+
+@transaction.atomic
+def occupy(tenancy, on=None):
+    """
+    Start ``tenancy``'s occupancy of its unit on ``on`` (default: the
+    tenancy's start date), or where the unit's timeline ends if that is
+    later. Any other open occupancy of the unit ends that day. Calling it
+    again for the same tenancy returns the existing row.
+    """
+    if tenancy.unit_id is None:
+        return None
+    _lock_unit(tenancy.unit_id)
+    current = UnitOccupancy.objects.filter(unit_id=tenancy.unit_id, occupied_to__isnull=True).first()
+    if current is not None and current.tenancy_id == tenancy.id:
+        return current
+
+    start = on or tenancy.start_date or timezone.localdate()
+    # Intervals never overlap: a backdated start moves up to the end of the
+    # unit's timeline (the start of the open interval, if there is one).
+    timeline_end = UnitOccupancy.objects.filter(unit_id=tenancy.unit_id).aggregate(
+        end=Max(Coalesce('occupied_to', 'occupied_from')))['end']
+    if timeline_end is not None:
+        start = max(start, timeline_end)
+    if current is not None:
+        current.occupied_to = start
+        current.save(update_fields=['occupied_to', 'updated_at'])
+    occupancy = UnitOccupancy.objects.create(
+        company_id=tenancy.company_id, building_id=tenancy.building_id,
+        unit_id=tenancy.unit_id, tenancy=tenancy, occupied_from=start,
+    )
+    _set_unit_status(tenancy.unit_id, 'occupied')
+    return occupancy
+
+
+@transaction.atomic
+def vacate(tenancy, on=None):
+    """End ``tenancy``'s open occupancy on ``on`` (default today) and free the unit."""
+    if tenancy.unit_id is None:
+        return None
+    _lock_unit(tenancy.unit_id)
+    occupancy = UnitOccupancy.objects.filter(tenancy=tenancy, occupied_to__isnull=True).first()
+    if occupancy is None:
+        return None
+    occupancy.occupied_to = max(on or timezone.localdate(), occupancy.occupied_from)
+    occupancy.save(update_fields=['occupied_to', 'updated_at'])
+    _set_unit_status(tenancy.unit_id, 'vacant')
+    return occupancy
+
+
+@transaction.atomic
+def hand_over(original, renewed):
+    """
+    Move the unit from ``original`` to its renewal, without a gap, on the
+    renewal's start date. Nothing changes if ``original`` had no open
+    occupancy (e.g. it had already been terminated).
+    """
+    if original.unit_id is None or renewed.unit_id != original.unit_id:
+        vacate(original)
+        return occupy(renewed)
+    _lock_unit(original.unit_id)
+    if not UnitOccupancy.objects.filter(tenancy=original, occupied_to__isnull=True).exists():
+        return None
+    return occupy(renewed, on=renewed.start_date)
+
+
+def occupied_unit_count(company_id, on=None):
+    """Units occupied on ``on`` (default today)."""
+    return (
+        UnitOccupancy.objects.filter(occupies_on(on or timezone.localdate()), company_id=company_id)
+        .values('unit_id').distinct().count()
+    )
+
+
+def vacancy_durations(company_id, on=None):
+    """
+    ``{unit_id: days}`` for every unit of the company vacant on ``on``:
+    days since its last occupancy ended, or since the unit was created if it
+    has never been occupied.
+    """
+    on = on or timezone.localdate()
+    units = (
+        Units.objects.filter(company_id=company_id)
+        .exclude(unit_status__in=['renovation', 'disputed'])
+        .annotate(
+            occupied=Exists(UnitOccupancy.objects.filter(occupies_on(on), unit_id=OuterRef('pk'))),
+            last_occupied=Max('occupancies__occupied_to', filter=Q(occupancies__occupied_to__lte=on)),
+        )
+        .filter(occupied=False)
+        .values_list('id', 'last_occupied', 'created_at')
+    )
+    durations = {}
+    for unit_id, last_occupied, created_at in units:
+        since = last_occupied or (timezone.localdate(created_at) if created_at else on)
+        durations[unit_id] = max((on - since).days, 0)
+    return durations
+
+
+def occupancy_rates(company_id, start, end):
+    """
+    Monthly occupancy between ``start`` and ``end`` (inclusive): for each
+    month, the share of unit-days (units counted from their creation) that
+    were occupied. Two queries, then one pass over the intervals and one over
+    the days, whatever the range.
+    """
+    days = (end - start).days + 1
+    if days <= 0:
+        return []
+    # Difference arrays over the days of the range: +1 where an interval
+    # (or a unit's existence) starts, -1 the day after it ends.
+    occupied_delta = [0] * (days + 1)
+    available_delta = [0] * (days + 1)
+
+    intervals = UnitOccupancy.objects.filter(
+        Q(occupied_to__isnull=True) | Q(occupied_to__gt=start),
+        company_id=company_id, occupied_from__lte=end,
+    ).values_list('occupied_from', 'occupied_to')
+    for since, to in intervals:
+        occupied_delta[max((since - start).days, 0)] += 1
+        occupied_delta[min((to - start).days, days) if to else days] -= 1
+
+    for created_at in Units.objects.filter(company_id=company_id).values_list('created_at', flat=True):
+        offset = (timezone.localdate(created_at) - start).days if created_at else 0
+        if offset < days:
+            available_delta[max(offset, 0)] += 1
+
+    rates, totals = [], {}
+    occupied = available = 0
+    for offset in range(days):
+        occupied += occupied_delta[offset]
+        available += available_delta[offset]
+        month = (start + timedelta(days=offset)).strftime('%Y-%m')
+        month_totals = totals.get(month)
+        if month_totals is None:
+            month_totals = totals[month] = {'month': month, 'unit_days': 0, 'occupied_days': 0}
+            rates.append(month_totals)
+        month_totals['unit_days'] += available
+        month_totals['occupied_days'] += occupied
+
+    for month_totals in rates:
+        unit_days = month_totals['unit_days']
+        month_totals['occupancy_rate'] = (
+            round(month_totals['occupied_days'] / unit_days * 100, 2) if unit_days else 0)
+    return rates
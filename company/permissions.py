@@ -0,0 +1,24 @@
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+from .authentication import TokenPrincipal
+
+
+class IsCompanyMember(BasePermission):
+    """
+    Restricts ``<company_id>`` endpoints to principals of that company, using
+    the company id carried in the access token (no query).
+
+    Only enforced when ``COMPANY_SCOPE_ENFORCED`` is on; endpoints without a
+    ``company_id`` URL argument are not affected.
+    """
+    message = 'You do not have access to this company.'
+
+    def has_permission(self, request, view):
+        if not getattr(settings, 'COMPANY_SCOPE_ENFORCED', False):
+            return True
+        company_id = view.kwargs.get('company_id')
+        if company_id is None:
+            return True
+        principal = request.user
+        return isinstance(principal, TokenPrincipal) and principal.company_id == int(company_id)
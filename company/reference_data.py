@@ -0,0 +1,121 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.views import APIView
+
+from accounts.models import Company, Country
+from accounts.serializers import CountrySerializer
+from rentbiz.utils.conditional import REFERENCE_CACHE_CONTROL
+from .models import ChargeCode, Charges, Currency, IDType, MasterDocumentType, Taxes, UnitType
+from .serializers import (
+    ChargeCodeSerializer, ChargesGetSerializer, CurrencySerializer, IDTypeSerializer,
+    MasterDocumentTypeSerializer, TaxesSerializer, UnitTypeSerializer,
+)
+
+BUNDLE_TIMEOUT = 60 * 60 * 24
+GLOBAL_VERSION_KEY = 'refdata:version:global'
+
+
+def _company_version_key(company_id):
+    return f'refdata:version:company:{company_id}'
+
+
+def _get_version(key):
+    # Versions start from a timestamp rather than 1 so an evicted counter
+    # can never come back with a value a client has already seen.
+    return cache.get_or_set(key, time.time_ns, None)
+
+
+def bump_company_version(company_id):
+    cache.set(_company_version_key(company_id), time.time_ns(), None)
+
+
+def bump_global_version():
+    cache.set(GLOBAL_VERSION_KEY, time.time_ns(), None)
+
+
+def bundle_version(company_id):
+    return f'{_get_version(_company_version_key(company_id))}-{_get_version(GLOBAL_VERSION_KEY)}'
+
+
+def build_bundle(company_id):
+    """Every lookup table the SPA needs on startup, keyed by table name."""
+    return {
+        'unit_types': UnitTypeSerializer(
+            UnitType.objects.filter(company_id=company_id).order_by('id'), many=True).data,
+        'document_types': MasterDocumentTypeSerializer(
+            MasterDocumentType.objects.filter(company_id=company_id).order_by('id'), many=True).data,
+        'id_types': IDTypeSerializer(
+            IDType.objects.filter(company_id=company_id).order_by('id'), many=True).data,
+        'currencies': CurrencySerializer(
+            Currency.objects.filter(company_id=company_id).order_by('id'), many=True).data,
+        'charge_codes': ChargeCodeSerializer(
+            ChargeCode.objects.filter(company_id=company_id).order_by('id'), many=True).data,
+        'charges': ChargesGetSerializer(
+            Charges.objects.filter(company_id=company_id)
+            .select_related('user', 'charge_code').prefetch_related('taxes').order_by('id'),
+            many=True).data,
+        'taxes': TaxesSerializer(
+            Taxes.objects.filter(company_id=company_id, is_active=True), many=True).data,
+        'countries': CountrySerializer(
+            Country.objects.prefetch_related('states').order_by('name'), many=True).data,
+    }
+
+
+class ReferenceDataBundleView(APIView):
+    """
+    GET /company/reference-data/<company_id>/
+
+    Returns all company lookup tables (unit types, document types, ID types,
+    currencies, charge codes, charges, active taxes) and the countries with
+    their states in one response. With REFERENCE_BUNDLE_CACHE the payload is
+    cached per bundle version; the version is bumped by signals whenever one
+    of those tables changes, and doubles as the ETag, so an unchanged bundle
+    costs no queries at all. Without a shared cache those bumps would not
+    reach other processes, so the bundle is rebuilt and its ETag is a digest
+    of the payload instead.
+    """
+
+    def get(self, request, company_id):
+        if not getattr(settings, 'REFERENCE_BUNDLE_CACHE', False):
+            return self.get_uncached(request, company_id)
+
+        version = bundle_version(company_id)
+        etag = quote_etag(version)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            cache_key = f'refdata:bundle:{company_id}:{version}'
+            payload = cache.get(cache_key)
+            if payload is None:
+                if not Company.objects.filter(id=company_id).exists():
+                    return Response({'error': 'Company not found'}, status=status.HTTP_404_NOT_FOUND)
+                payload = {'version': version, **build_bundle(company_id)}
+                cache.set(cache_key, payload, BUNDLE_TIMEOUT)
+            response = Response(payload, status=status.HTTP_200_OK)
+
+        response['ETag'] = etag
+        response['Cache-Control'] = REFERENCE_CACHE_CONTROL
+        return response
+
+    def get_uncached(self, request, company_id):
+        if not Company.objects.filter(id=company_id).exists():
+            return Response({'error': 'Company not found'}, status=status.HTTP_404_NOT_FOUND)
+        bundle = build_bundle(company_id)
+        version = hashlib.sha1(json.dumps(bundle, cls=JSONEncoder, sort_keys=True).encode()).hexdigest()
+        etag = quote_etag(version)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response({'version': version, **bundle}, status=status.HTTP_200_OK)
+
+        response['ETag'] = etag
+        response['Cache-Control'] = REFERENCE_CACHE_CONTROL
+        return response
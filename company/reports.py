@@ -4,9 +4,10 @@ from django.http import HttpResponse
 from django.db.models import Q
 import csv
 from .models import Tenancy
+from rentbiz.db_router import ReplicaReadMixin
 
 
-class TenancyExportAPIView(APIView):
+class TenancyExportAPIView(ReplicaReadMixin, APIView):
     def get(self, request, company_id):
 
         tenancies = Tenancy.objects.filter(company_id=company_id)
@@ -2,17 +2,25 @@
 from rest_framework import serializers
 from django.contrib.auth.hashers import make_password
 from .models import *
+from . import occupancy, unit_operations
+from .uploads import company_uploads
 from finance.models import PaymentDistribution
 from decimal import Decimal
 from datetime import datetime, timedelta,date
 from django.db import transaction
-from django.db.models import Sum
+from django.db.models import Sum, Count, Q
 from django.core.exceptions import ValidationError
+from rentbiz.utils.sparse_fields import SparseFieldsetMixin
+from rentbiz.utils.images import variant_urls
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class UserSerializer(serializers.ModelSerializer):
     confirm_password = serializers.CharField(write_only=True)    
     company_id = serializers.IntegerField(write_only=True, required=True)
+    logo_variants = serializers.SerializerMethodField()
    
     
 
@@ -56,15 +64,22 @@ class UserSerializer(serializers.ModelSerializer):
         validated_data['company'] = company
         user = Users.objects.create(**validated_data)
         return user
+
+    def get_logo_variants(self, obj):
+        return variant_urls(obj.company_logo, obj.logo_variants)
     
 class UserUpdateSerializer(serializers.ModelSerializer):
     confirm_password = serializers.CharField(write_only=True, required=False)
     company_id = serializers.IntegerField(write_only=True, required=False)
+    logo_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Users
         fields = '__all__'  
 
+    def get_logo_variants(self, obj):
+        return variant_urls(obj.company_logo, obj.logo_variants)
+
     def validate(self, data):
         
         if data.get('password') and data.get('confirm_password') and data.get('password') != data.get('confirm_password'):
@@ -101,7 +116,41 @@ class UserUpdateSerializer(serializers.ModelSerializer):
         return instance
 
 
-class DocumentTypeSerializer(serializers.ModelSerializer):
+class CompanyUploadField(serializers.PrimaryKeyRelatedField):
+    """
+    A finished upload of the company of the building, unit or tenant being
+    saved (or one made without a company).
+    """
+
+    def get_queryset(self):
+        root = self.root
+        if getattr(root, 'instance', None) is not None:
+            company_id = root.instance.company_id
+        else:
+            company_id = (getattr(root, 'initial_data', None) or {}).get('company')
+        try:
+            company_id = int(company_id) if company_id not in (None, '') else None
+        except (TypeError, ValueError):
+            company_id = None
+        return company_uploads(company_id).filter(status='complete')
+
+
+class UploadedDocumentMixin(serializers.Serializer):
+    """
+    Lets a document name a finished chunked upload (``upload_id``) instead of
+    carrying the file itself; see ``company.uploads``.
+    """
+    upload_id = CompanyUploadField(write_only=True, required=False, allow_null=True)
+
+    def validate(self, data):
+        data = super().validate(data)
+        upload = data.pop('upload_id', None)
+        if upload is not None:
+            data['upload_file'] = upload.file.name
+        return data
+
+
+class DocumentTypeSerializer(UploadedDocumentMixin, serializers.ModelSerializer):
     class Meta:
         model = DocumentType
         fields = '__all__'  
@@ -109,14 +158,50 @@ class DocumentTypeSerializer(serializers.ModelSerializer):
 class BuildingSerializer(serializers.ModelSerializer):
     build_comp = DocumentTypeSerializer(many=True, required=False) 
     unit_count = serializers.SerializerMethodField()
+    vacant_unit_count = serializers.SerializerMethodField()
+    occupied_unit_count = serializers.SerializerMethodField()
+    inactive_unit_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Building
         fields = '__all__'  
 
 
+    @classmethod
+    def annotate_queryset(cls, queryset):
+        """Occupancy counts for every building in one grouped query."""
+        return queryset.annotate(
+            unit_total=Count('unit_building', distinct=True),
+            vacant_units=Count('unit_building', distinct=True, filter=Q(unit_building__unit_status='vacant')),
+            occupied_units=Count('unit_building', distinct=True, filter=Q(unit_building__unit_status='occupied')),
+        )
+
+    def _occupancy(self, obj):
+        # Instances that did not come from annotate_queryset get all three
+        # counts from a single aggregate.
+        if not hasattr(obj, 'unit_total'):
+            counts = obj.unit_building.aggregate(
+                unit_total=Count('id'),
+                vacant_units=Count('id', filter=Q(unit_status='vacant')),
+                occupied_units=Count('id', filter=Q(unit_status='occupied')),
+            )
+            for name, value in counts.items():
+                setattr(obj, name, value)
+        return obj
+
     def get_unit_count(self, obj):
-        return obj.unit_building.count()
+        return self._occupancy(obj).unit_total
+
+    def get_vacant_unit_count(self, obj):
+        return self._occupancy(obj).vacant_units
+
+    def get_occupied_unit_count(self, obj):
+        return self._occupancy(obj).occupied_units
+
+    def get_inactive_unit_count(self, obj):
+        # Units under renovation, disputed or without a status.
+        obj = self._occupancy(obj)
+        return obj.unit_total - obj.vacant_units - obj.occupied_units
 
 
     def create(self, validated_data):
@@ -182,12 +267,13 @@ class UnitGetSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class UnitDocumentTypeSerializer(serializers.ModelSerializer):
+class UnitDocumentTypeSerializer(UploadedDocumentMixin, serializers.ModelSerializer):
     class Meta:
         model = UnitDocumentType
-        fields = ['id', 'doc_type', 'number', 'issued_date', 'expiry_date', 'upload_file']
+        fields = ['id', 'doc_type', 'number', 'issued_date', 'expiry_date', 'upload_file', 'upload_id']
 
     def validate(self, data):
+        data = super().validate(data)
         if not data.get('doc_type'):
             raise serializers.ValidationError("doc_type is required for unit_comp documents")
         return data
@@ -217,7 +303,7 @@ class UnitSerializer(serializers.ModelSerializer):
 
         # Update main unit fields
         for attr, value in validated_data.items():
-            print(f"Setting {attr} = {value}")
+            logger.debug("Setting %s = %s", attr, value)
             setattr(instance, attr, value)
         instance.save()
 
@@ -245,12 +331,12 @@ class UnitSerializer(serializers.ModelSerializer):
             # Delete documents not included in the update
             for doc_id in existing_docs:
                 if doc_id not in updated_ids:
-                    print(f"Deleting document {doc_id}")
+                    logger.debug("Deleting document %s", doc_id)
                     existing_docs[doc_id].delete()
         else:
-            print("No unit_comp data provided; preserving existing documents")
+            logger.debug("No unit_comp data provided; preserving existing documents")
 
-        print("Serializer update completed")
+        logger.debug("Serializer update completed")
         return instance
 
 class MasterDocumentTypeSerializer(serializers.ModelSerializer):
@@ -270,7 +356,7 @@ class CurrencySerializer(serializers.ModelSerializer):
         model = Currency
         fields = '__all__'
         
-class TenantDocumentTypeSerializer(serializers.ModelSerializer):
+class TenantDocumentTypeSerializer(UploadedDocumentMixin, serializers.ModelSerializer):
     doc_type = serializers.PrimaryKeyRelatedField(queryset=MasterDocumentType.objects.all(), required=True)
     number = serializers.CharField(required=False, allow_null=True, allow_blank=True)
     issued_date = serializers.DateField(allow_null=True, required=False)
@@ -286,6 +372,7 @@ class TenantDocumentTypeSerializer(serializers.ModelSerializer):
             'issued_date',
             'expiry_date',
             'upload_file',
+            'upload_id',
             'existing_file_url',
         ]
 class TenantGetSerializer(serializers.ModelSerializer):
@@ -783,7 +870,16 @@ class PaymentScheduleGetSerializer(serializers.ModelSerializer):
         model = PaymentSchedule
         fields = '__all__'
 
+    @classmethod
+    def annotate_queryset(cls, queryset):
+        return queryset.annotate(paid_total=Sum(
+            'paymentdistribution__amount',
+            filter=Q(paymentdistribution__collection__status='completed')
+        ))
+
     def get_amount_paid(self, obj):
+        if hasattr(obj, 'paid_total'):
+            return float(obj.paid_total or 0)
         # Sum the distributed amounts for this payment schedule from PaymentDistribution
         total_paid = PaymentDistribution.objects.filter(
             payment_schedule=obj,
@@ -806,7 +902,16 @@ class AdditionalChargeGetSerializer(serializers.ModelSerializer):
         model = AdditionalCharge
         fields = '__all__'
 
+    @classmethod
+    def annotate_queryset(cls, queryset):
+        return queryset.annotate(paid_total=Sum(
+            'paymentdistribution__amount',
+            filter=Q(paymentdistribution__collection__status='completed')
+        ))
+
     def get_amount_paid(self, obj):
+        if hasattr(obj, 'paid_total'):
+            return float(obj.paid_total or 0)
         # Sum the distributed amounts for this additional charge from PaymentDistribution
         total_paid = PaymentDistribution.objects.filter(
             additional_charge=obj,
@@ -831,7 +936,7 @@ class TenancyDetailSerializer(serializers.ModelSerializer):
         fields = '__all__'
        
         
-class TenancyListSerializer(serializers.ModelSerializer):
+class TenancyListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     tenant = TenantSerializer()
     company_name = serializers.CharField(source='company.name', read_only=True)
     building = BuildingSerializer()
@@ -896,6 +1001,7 @@ class TenancyRenewalSerializer(serializers.ModelSerializer):
         original_tenancy.status = 'renewed'
         original_tenancy.is_close = True
         original_tenancy.save()
+        occupancy.hand_over(original_tenancy, renewed_tenancy)
         
  
         self._create_payment_schedules(renewed_tenancy)
@@ -914,7 +1020,7 @@ class TenancyRenewalSerializer(serializers.ModelSerializer):
                         total=charge_data.get('total'),
                     )
             except Exception as e:
-                print(f"Error creating additional charge: {e}")
+                logger.exception("Error creating additional charge")
                 continue
         
         return renewed_tenancy
@@ -1144,7 +1250,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
         return f'INV{current_year}{new_sequence:04d}'
 
 
-class InvoiceGetSerializer(serializers.ModelSerializer):
+class InvoiceGetSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     tenancy = TenancyListSerializer(read_only=True)
     payment_schedules = PaymentScheduleGetSerializer(many=True, read_only=True)
     additional_charges = AdditionalChargeGetSerializer(many=True, read_only=True)
@@ -1420,3 +1526,43 @@ class DashboardInvoiceSerializer(serializers.ModelSerializer):
         if first_schedule:
             return first_schedule.due_date
         return None
+
+
+class DocumentExpirySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    kind_display = serializers.CharField(source='get_kind_display', read_only=True)
+    building_name = serializers.CharField(source='building.building_name', read_only=True, default=None)
+    unit_name = serializers.CharField(source='unit.unit_name', read_only=True, default=None)
+    tenant_name = serializers.CharField(source='tenant.tenant_name', read_only=True, default=None)
+
+    class Meta:
+        model = DocumentExpiry
+        fields = [
+            'id', 'kind', 'kind_display', 'source_id', 'expiry_date', 'label', 'number',
+            'building', 'building_name', 'unit', 'unit_name', 'tenant', 'tenant_name', 'notified_for',
+        ]
+
+
+class UnitBulkChangesSerializer(serializers.Serializer):
+    unit_status = serializers.ChoiceField(choices=unit_operations.SETTABLE_STATUSES, required=False)
+    unit_type = serializers.IntegerField(required=False, allow_null=True)
+    no_of_bedrooms = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+    no_of_bathrooms = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+    description = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    remarks = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    premise_no = serializers.CharField(required=False, allow_null=True, allow_blank=True, max_length=100)
+    address = serializers.CharField(required=False, allow_null=True, allow_blank=True, max_length=255)
+
+    def to_internal_value(self, data):
+        unknown = set(data) - set(self.fields) if isinstance(data, dict) else set()
+        if unknown:
+            raise serializers.ValidationError({field: 'This field cannot be bulk updated.' for field in unknown})
+        return super().to_internal_value(data)
+
+
+class UnitBulkOperationSerializer(serializers.Serializer):
+    buildings = serializers.ListField(child=serializers.IntegerField(), required=False)
+    unit_types = serializers.ListField(child=serializers.IntegerField(), required=False)
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=10000)
+    statuses = serializers.ListField(child=serializers.ChoiceField(choices=Units.STATUS_CHOICES), required=False)
+    changes = UnitBulkChangesSerializer()
+    dry_run = serializers.BooleanField(required=False, default=False)
@@ -0,0 +1,69 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from accounts.models import Company, Country, State
+from rentbiz.utils import images
+from .authentication import revocation_cache
+from . import expiry
+from .models import ChargeCode, Charges, Currency, IDType, MasterDocumentType, Taxes, UnitType, Users
+from .reference_data import bump_company_version, bump_global_version
+
+# Users are rendered inside each charge of the bundle (ChargesGetSerializer).
+REFERENCE_MODELS = (UnitType, MasterDocumentType, IDType, Currency, ChargeCode, Charges, Taxes, Users)
+
+
+def invalidate_company_reference_data(sender, instance, **kwargs):
+    if instance.company_id:
+        bump_company_version(instance.company_id)
+
+
+def invalidate_global_reference_data(sender, **kwargs):
+    bump_global_version()
+
+
+for model in REFERENCE_MODELS:
+    post_save.connect(invalidate_company_reference_data, sender=model,
+                      dispatch_uid=f'refdata_save_{model.__name__}')
+    post_delete.connect(invalidate_company_reference_data, sender=model,
+                        dispatch_uid=f'refdata_delete_{model.__name__}')
+
+for model in (Country, State):
+    post_save.connect(invalidate_global_reference_data, sender=model,
+                      dispatch_uid=f'refdata_save_{model.__name__}')
+    post_delete.connect(invalidate_global_reference_data, sender=model,
+                        dispatch_uid=f'refdata_delete_{model.__name__}')
+
+
+@receiver(m2m_changed, sender=Charges.taxes.through)
+def invalidate_charge_taxes(sender, instance, **kwargs):
+    if isinstance(instance, Charges):
+        invalidate_company_reference_data(Charges, instance)
+    else:
+        # Reverse side: the taxes of a company were attached or detached.
+        invalidate_company_reference_data(Taxes, instance)
+
+
+@receiver(post_save, sender=Users)
+@receiver(post_save, sender=Company)
+def reload_revocations(sender, instance, **kwargs):
+    # Other processes pick the change up when their cache expires.
+    if getattr(instance, '_token_version_bumped', False):
+        revocation_cache.invalidate()
+
+
+def sync_document_expiry(sender, instance, **kwargs):
+    expiry.sync_instance(instance)
+
+
+def forget_document_expiry(sender, instance, **kwargs):
+    expiry.forget_instance(instance)
+
+
+for model in expiry.KINDS_BY_MODEL:
+    post_save.connect(sync_document_expiry, sender=model,
+                      dispatch_uid=f'expiry_save_{model.__name__}')
+    post_delete.connect(forget_document_expiry, sender=model,
+                        dispatch_uid=f'expiry_delete_{model.__name__}')
+
+
+images.register(Users, 'company_logo', 'logo_variants')
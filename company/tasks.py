@@ -0,0 +1,20 @@
+from celery import shared_task
+
+from . import expiry
+from .uploads import assemble
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def assemble_document_upload(self, upload_id):
+    """Join the chunks of a finished upload into its final file."""
+    try:
+        upload = assemble(upload_id, last_attempt=self.request.retries >= self.max_retries)
+    except Exception as exc:
+        raise self.retry(exc=exc)
+    return {'id': str(upload.pk), 'status': upload.status, 'file': upload.file.name or None}
+
+
+@shared_task
+def notify_expiring_documents(days=None):
+    """Send each company a digest of its documents that are about to expire."""
+    return expiry.notify_expiring_documents(days)
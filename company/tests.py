@@ -1,3 +1,1639 @@
-from django.test import TestCase
+import hashlib
+import importlib
+import logging
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+from datetime import date, datetime, timedelta
+from io import BytesIO, StringIO
 
-# Create your tests here.
+import openpyxl
+from celery.backends.base import DisabledBackend
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections, router, transaction
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+
+from accounts.models import Company
+from rentbiz import db_router
+from rentbiz.db_router import REPLICA_ALIAS, ReplicaStickinessMiddleware, read_from_replica
+from rentbiz.utils import dashboard, geo
+from rentbiz.utils.dashboard import tenancy_expiring
+from rentbiz.utils.instrumentation import QueryBudgetExceeded
+from .models import (
+    AdditionalCharge, Building, CodeSequence, DocumentExpiry, DocumentType, DocumentUpload, Invoice,
+    InvoiceAutomationConfig, InvoiceRun, InvoiceRunItem, MasterDocumentType, PaymentSchedule, Tenancy, Tenant,
+    TenantDocumentType, UnitDocumentType, UnitOccupancy, Units, UnitType, Users,
+)
+from . import availability, expiry, imports, occupancy, unit_operations
+from .availability import IntervalTree
+from .authentication import CompanyJWTAuthentication, issue_tokens, resolve_principal, revocation_cache
+from .serializers import BuildingSerializer
+from .tasks import assemble_document_upload, notify_expiring_documents
+from .views import (
+    ActiveTenanciesByCompanyAPIView, AutoGenerateInvoiceAPIView, AvailableUnitsView, BuildingByCompanyView,
+    BuildingsWithOccupiedUnitsView, BuildingsWithVacantUnitsView,
+    CloseTenanciesByCompanyAPIView, ExpiringDocumentsView, PendingTenanciesByCompanyAPIView, TenantByCompanyView,
+    TerminatiionTenanciesByCompanyAPIView, UnitsByCompanyView,
+)
+
+
+class PortfolioMixin:
+    """A small synthetic portfolio (see ``generate_portfolio``) shared by a test class."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'generate_portfolio', companies=1, buildings=2, units=3, occupancy=0.7, history=2, seed=1,
+            stdout=StringIO(),
+        )
+        cls.company = Company.objects.latest('id')
+        cls.tenancy = Tenancy.objects.filter(company=cls.company).order_by('id').first()
+
+
+class SparseFieldsetTests(PortfolioMixin, TestCase):
+    def test_tenancy_list_collapses_unexpanded_relations(self):
+        response = self.client.get(f'/company/tenancies/company/{self.company.id}/?expand=unit,building')
+        self.assertEqual(response.status_code, 200)
+        row = response.json()['results'][0]
+        self.assertIsInstance(row['unit'], dict)
+        self.assertIsInstance(row['tenant'], int)
+
+    def test_tenancy_detail_fields(self):
+        response = self.client.get(f'/company/tenancies/{self.tenancy.id}/?fields=id,tenant')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['tenancy'], {'id': self.tenancy.id, 'tenant': self.tenancy.tenant_id})
+
+    def test_occupied_tenancies_fields(self):
+        response = self.client.get(f'/company/tenancies/occupied/{self.company.id}/?fields=id,unit')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'unit'})
+
+    def test_invoice_list_nested_fields(self):
+        response = self.client.get(
+            f'/company/invoices/company/{self.company.id}/?fields=id,tenancy.tenant&expand=tenancy')
+        self.assertEqual(response.status_code, 200)
+        row = response.json()['results'][0]
+        self.assertEqual(set(row), {'id', 'tenancy'})
+        self.assertEqual(set(row['tenancy']), {'tenant'})
+
+
+class QueryPlanMixin:
+    """Asserts a hot filter query is served by the composite index added for it."""
+
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor == 'postgresql':
+            # Tiny test tables make the planner prefer sequential scans even
+            # when an index fits; with them disabled only a usable index wins.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        if connection.vendor in ('postgresql', 'sqlite'):
+            self.assertRegex(plan, rf'\b{re.escape(index_name)}\b', f'{index_name} not used:\n{plan}')
+        list(queryset)
+
+
+class HotFilterIndexTests(QueryPlanMixin, PortfolioMixin, TestCase):
+    def test_active_tenancies_by_company(self):
+        self.assertUsesIndex(
+            Tenancy.objects.filter(company=self.company, status='active'), 'tenancy_company_status_idx')
+
+    def test_tenancies_expiring_soon(self):
+        today = date.today()
+        self.assertUsesIndex(
+            Tenancy.objects.filter(end_date__range=(today, today + timedelta(days=30))), 'tenancy_end_date_idx')
+
+    def test_pending_schedules_of_a_tenancy(self):
+        self.assertUsesIndex(
+            PaymentSchedule.objects.filter(tenancy=self.tenancy, status='pending', due_date__lte=date.today()),
+            'schedule_tenancy_status_idx')
+
+    def test_pending_additional_charges_of_a_tenancy(self):
+        self.assertUsesIndex(
+            AdditionalCharge.objects.filter(tenancy=self.tenancy, status='pending', due_date__lte=date.today()),
+            'addcharge_tenancy_status_idx')
+
+    def test_unpaid_invoices_by_company(self):
+        self.assertUsesIndex(
+            Invoice.objects.filter(company=self.company, status='unpaid', end_date__lt=date.today()),
+            'invoice_company_status_idx')
+
+
+class QueryBudgetMixin:
+    """Asserts a ``CompanyListAPIView`` takes exactly its ``query_budget`` queries."""
+
+    def assertQueryBudget(self, view_class, url, params=None):
+        params = params or {}
+        # The same count for one row and for a full page rules out N+1 queries.
+        for page_size in (1, 100):
+            with self.assertNumQueries(view_class.query_budget):
+                response = self.client.get(url, {**params, 'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+        count = response.json()['count']
+        self.assertGreater(count, 1)
+
+        # A stream has no pagination COUNT.
+        with self.assertNumQueries(view_class.query_budget - 1):
+            response = self.client.get(url, {**params, 'stream': 'ndjson'})
+            lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), count)
+
+
+class ListQueryBudgetTests(QueryBudgetMixin, PortfolioMixin, TestCase):
+    def test_active_tenancies(self):
+        self.assertQueryBudget(ActiveTenanciesByCompanyAPIView, f'/company/tenancies/occupied/{self.company.id}/')
+
+    def test_pending_tenancies(self):
+        self.flag_active_tenancies(status='pending')
+        self.assertQueryBudget(PendingTenanciesByCompanyAPIView, f'/company/tenancies/pending/{self.company.id}/')
+
+    def test_terminating_tenancies(self):
+        self.flag_active_tenancies(is_termination=True)
+        self.assertQueryBudget(
+            TerminatiionTenanciesByCompanyAPIView, f'/company/tenancies/termination/{self.company.id}/')
+
+    def test_closed_tenancies(self):
+        self.flag_active_tenancies(is_close=True)
+        self.assertQueryBudget(CloseTenanciesByCompanyAPIView, f'/company/tenancies/close/{self.company.id}/')
+
+    def flag_active_tenancies(self, **fields):
+        # Active tenancies have every nested relation filled.
+        Tenancy.objects.filter(company=self.company, status='active').update(**fields)
+
+    def test_buildings(self):
+        self.assertQueryBudget(BuildingByCompanyView, f'/company/buildings/company/{self.company.id}/')
+
+    def test_units(self):
+        self.assertQueryBudget(UnitsByCompanyView, f'/company/units/company/{self.company.id}/')
+
+    @mock.patch.object(availability, '_TREES_KEPT', 0)
+    def test_available_units(self):
+        # No interval tree is kept, so every request pays for loading one.
+        self.assertQueryBudget(
+            AvailableUnitsView, f'/company/units/company/{self.company.id}/available/',
+            {'start': '2000-01-01', 'end': '2000-01-31'})
+
+    def test_tenants(self):
+        self.assertQueryBudget(TenantByCompanyView, f'/company/tenant/company/{self.company.id}/')
+
+    def test_expiring_documents(self):
+        self.assertQueryBudget(
+            ExpiringDocumentsView, f'/company/documents/expiring/{self.company.id}/', {'days': 3650, 'expired': 'true'})
+
+
+class DashboardQueryBudgetTests(TransactionTestCase):
+    """
+    Every QUERY_BUDGETS entry, as the budget is spent in the worst case: an
+    authenticated request that reloads the revocation cache. Dashboards read
+    from the replica and the overview from worker threads, so the data must
+    be committed, hence ``TransactionTestCase``.
+    """
+    databases = {'default', REPLICA_ALIAS}
+
+    def setUp(self):
+        # Portfolios of N and 2N buildings take the same number of queries.
+        self.tokens = {}
+        for buildings in (2, 4):
+            call_command(
+                'generate_portfolio', companies=1, buildings=buildings, units=3, occupancy=0.7, history=2,
+                seed=buildings, stdout=StringIO(),
+            )
+            company = Company.objects.latest('id')
+            Users.objects.create(company=company, username=f'clerk{company.id}', password=make_password('pw'))
+            self.tokens[company.id] = str(issue_tokens(resolve_principal(f'clerk{company.id}'))[1])
+        self.addCleanup(revocation_cache.invalidate)
+
+    def test_query_budgets(self):
+        for name, budget in settings.QUERY_BUDGETS.items():
+            for company_id, token in self.tokens.items():
+                with self.subTest(view=name, company=company_id):
+                    cache.clear()
+                    revocation_cache.invalidate()
+                    response = self.client.get(
+                        reverse(name, kwargs={'company_id': company_id}), HTTP_AUTHORIZATION=f'Bearer {token}')
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.wsgi_request.query_stats.queries, budget)
+
+
+class DashboardOverviewTests(PortfolioMixin, TransactionTestCase):
+    """The sections run on worker threads with their own connections, hence ``TransactionTestCase``."""
+    databases = {'default', REPLICA_ALIAS}
+    sections = {
+        'properties_summary': 'properties-summary',
+        'rent_collection': 'rent-collection',
+        'tenancy_expiring': 'tenency-expiring',
+        'financial_report': 'revenue-report',
+    }
+
+    def setUp(self):
+        self.setUpTestData()
+        cache.clear()
+        self.url = f'/company/dashboard/overview/{self.company.id}/'
+
+    def test_sections_match_the_dashboard_endpoints(self):
+        year = timezone.localdate().year
+        response = self.client.get(self.url, {'year': year})
+        self.assertEqual(response.status_code, 200)
+        overview = response.json()
+        self.assertEqual(set(overview), set(self.sections))
+        for section, name in self.sections.items():
+            with self.subTest(section=section):
+                single = self.client.get(reverse(name, kwargs={'company_id': self.company.id}), {'year': year})
+                self.assertEqual(overview[section], single.json())
+
+    def test_sections_run_concurrently(self):
+        # Each section waits for all four; run one after another they would time out.
+        barrier = threading.Barrier(len(self.sections), timeout=10)
+
+        def after_barrier(compute):
+            def section(*args):
+                barrier.wait()
+                return compute(*args)
+            return section
+
+        patches = [
+            mock.patch.object(dashboard, section, after_barrier(getattr(dashboard, section)))
+            for section in self.sections
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_invalid_year(self):
+        response = self.client.get(self.url, {'year': 'last'})
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Invalid year format'}))
+
+    @override_settings(COMPANY_SCOPE_ENFORCED=True)
+    def test_company_scope(self):
+        self.addCleanup(revocation_cache.invalidate)
+        user = Users.objects.create(company=self.company, username='clerk', password=make_password('pw'))
+        Company.objects.create(user_id='other', company_name='Other', password=make_password('pw'))
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        token = str(issue_tokens(resolve_principal('other'))[1])
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 403)
+        token = str(issue_tokens(resolve_principal(user.username))[1])
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer invalid').status_code, 401)
+
+
+class TenancyExpiringTests(TestCase):
+    def test_buckets_include_both_ends(self):
+        company = Company.objects.create(company_name='Expiring')
+        today = timezone.now().date()
+        for days in (-1, 0, 30, 31, 60, 61, 90, 91):
+            Tenancy.objects.create(company=company, status='active', end_date=today + timedelta(days=days))
+        Tenancy.objects.create(company=company, status='closed', end_date=today + timedelta(days=5))
+        self.assertEqual(tenancy_expiring(company.id), {
+            'total_expiring': 6, 'ranges': {'0-30_days': 2, '31-60_days': 2, '61-90_days': 2}})
+
+
+class BuildingListQueryTests(TestCase):
+    """The building lists take as many queries for 2N buildings as for N."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(company_name='Buildings')
+
+    def add_buildings(self, count):
+        for _ in range(count):
+            building = Building.objects.create(company=self.company, building_name='Tower')
+            DocumentType.objects.create(building=building, number='TD-1')
+            for status in ('vacant', 'vacant', 'occupied', 'renovation'):
+                Units.objects.create(company=self.company, building=building, unit_name=status, unit_status=status)
+
+    def assertConstantQueries(self, view_class, url):
+        for total in (3, 6):
+            self.add_buildings(total - Building.objects.filter(company=self.company).count())
+            with self.assertNumQueries(view_class.query_budget):
+                response = self.client.get(url, {'page_size': 100})
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            rows = data['results'] if isinstance(data, dict) else data
+            self.assertEqual(len(rows), total)
+        self.assertEqual(
+            {(row['unit_count'], row['vacant_unit_count'], row['occupied_unit_count'], row['inactive_unit_count'])
+             for row in rows},
+            {(4, 2, 1, 1)})
+        self.assertEqual({len(row['build_comp']) for row in rows}, {1})
+
+    def test_buildings_by_company(self):
+        self.assertConstantQueries(BuildingByCompanyView, f'/company/buildings/company/{self.company.id}/')
+
+    def test_buildings_with_vacant_units(self):
+        self.assertConstantQueries(BuildingsWithVacantUnitsView, f'/company/buildings/vacant/{self.company.id}/')
+
+    def test_buildings_with_occupied_units(self):
+        self.assertConstantQueries(BuildingsWithOccupiedUnitsView, f'/company/buildings/occupied/{self.company.id}/')
+
+
+class ConditionalGetTests(PortfolioMixin, TestCase):
+    def assertRevalidates(self, url, change):
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_building_document_change(self):
+        self.assertRevalidates(
+            f'/company/buildings/{self.tenancy.building_id}/',
+            lambda: DocumentType.objects.create(building_id=self.tenancy.building_id, number='TD-1'))
+
+    def test_unit_change(self):
+        # Bulk unit updates and the occupancy timeline never touch the building row.
+        unit = Units.objects.filter(building_id=self.tenancy.building_id).exclude(pk=self.tenancy.unit_id).first()
+
+        def update(remarks):
+            result = unit_operations.bulk_update_units(self.company.id, {'remarks': remarks}, ids=[unit.id])
+            self.assertEqual(result['updated'], 1)
+
+        self.assertRevalidates(f'/company/buildings/{self.tenancy.building_id}/', lambda: update('Repainted'))
+        self.assertRevalidates(f'/company/tenancies/{self.tenancy.id}/', lambda: update('Rewired'))
+
+    def test_tenancy_document_change(self):
+        document = TenantDocumentType.objects.create(tenant_id=self.tenancy.tenant_id, number='EID-1')
+        self.assertRevalidates(f'/company/tenancies/{self.tenancy.id}/', document.delete)
+
+
+class ReferenceDataBundleTests(PortfolioMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = f'/company/reference-data/{self.company.id}/'
+
+    def assertChangesBundle(self, change):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_uncached_bundle_tracks_the_tables(self):
+        bundle = self.assertChangesBundle(lambda: UnitType.objects.create(title='Villa', company=self.company))
+        self.assertIn('Villa', [unit_type['title'] for unit_type in bundle['unit_types']])
+
+    @override_settings(REFERENCE_BUNDLE_CACHE=True)
+    def test_cached_bundle_follows_user_edits(self):
+        user = Users.objects.get(company=self.company)
+
+        def rename():
+            user.name = 'Renamed Admin'
+            user.save()
+
+        bundle = self.assertChangesBundle(rename)
+        self.assertIn('Renamed Admin', str(bundle['charges']))
+
+
+class LoginTests(TestCase):
+    """A login name can belong to a company user and a company account at once."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(
+            user_id='shared', company_name='Shared Co', email_address='co@example.com',
+            password=make_password('company-pass'))
+        cls.user = Users.objects.create(
+            company=cls.company, username='shared', email='user@example.com', password=make_password('user-pass'))
+
+    def login(self, password):
+        return self.client.post('/company/company-login/', {'username': 'shared', 'password': password})
+
+    def test_user_password_logs_in_the_user(self):
+        response = self.login('user-pass')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['role'], response.json()['id']), ('user', self.user.id))
+
+    def test_wrong_user_password_falls_back_to_the_company(self):
+        response = self.login('company-pass')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['role'], response.json()['id']), ('company', self.company.id))
+
+    def test_wrong_password_for_both(self):
+        self.assertEqual(self.login('nope').status_code, 401)
+
+    def test_blocked_user_is_not_bypassed(self):
+        Users.objects.filter(pk=self.user.pk).update(status='blocked')
+        response = self.login('company-pass')
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('account is blocked', response.json()['error'])
+
+    def test_logins_are_audited_by_the_standard_formatter(self):
+        with self.assertLogs('company.authentication', 'INFO') as logs:
+            self.login('company-pass')
+        formatter = logging.Formatter(settings.LOGGING['formatters']['standard']['format'])
+        lines = [formatter.format(record) for record in logs.records if record.event == 'auth.login']
+        self.assertEqual(len(lines), 2)
+        self.assertIn(f'auth.login invalid principal=user:{self.user.id}', lines[0])
+        self.assertIn(f'auth.login success principal=company:{self.company.id}', lines[1])
+
+    def test_blocked_company_after_wrong_user_password(self):
+        Company.objects.filter(pk=self.company.pk).update(status='blocked')
+        response = self.login('company-pass')
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('company is blocked', response.json()['error'])
+
+
+class TokenRevocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(user_id='acme', company_name='Acme', password=make_password('pw'))
+        cls.user = Users.objects.create(company=cls.company, username='clerk', password=make_password('pw'))
+
+    def setUp(self):
+        revocation_cache.invalidate()
+        self.addCleanup(revocation_cache.invalidate)
+
+    def token(self, login):
+        return str(issue_tokens(resolve_principal(login))[1])
+
+    def authenticate(self, token):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return CompanyJWTAuthentication().authenticate(request)
+
+    def set_status(self, model, pk, status):
+        instance = model.objects.get(pk=pk)
+        instance.status = status
+        instance.save()
+
+    def test_blocking_revokes_the_principal_token(self):
+        token = self.token('clerk')
+        self.assertEqual(self.authenticate(token)[0].id, self.user.id)
+        self.set_status(Users, self.user.pk, 'blocked')
+        with self.assertRaisesMessage(AuthenticationFailed, 'revoked'):
+            self.authenticate(token)
+
+    def test_unblocking_keeps_earlier_tokens_revoked(self):
+        token = self.token('clerk')
+        self.set_status(Users, self.user.pk, 'blocked')
+        self.set_status(Users, self.user.pk, 'active')
+        self.assertEqual(Users.objects.get(pk=self.user.pk).token_version, 2)
+        with self.assertRaisesMessage(AuthenticationFailed, 'revoked'):
+            self.authenticate(token)
+        self.assertEqual(self.authenticate(self.token('clerk'))[0].id, self.user.id)
+
+    def test_blocking_a_company_revokes_its_users_tokens(self):
+        user_token, company_token = self.token('clerk'), self.token('acme')
+        self.set_status(Company, self.company.pk, 'blocked')
+        for token in (user_token, company_token):
+            with self.assertRaisesMessage(AuthenticationFailed, 'revoked'):
+                self.authenticate(token)
+
+    @override_settings(TOKEN_REVOCATION_CACHE_TTL=30)
+    def test_other_processes_see_changes_after_the_ttl(self):
+        token = self.token('clerk')
+        now = time.monotonic()
+        with mock.patch('company.authentication.time.monotonic', return_value=now):
+            self.authenticate(token)
+            # A change made elsewhere does not signal this process's cache.
+            Users.objects.filter(pk=self.user.pk).update(status='blocked')
+            self.assertIsNotNone(self.authenticate(token))
+        with mock.patch('company.authentication.time.monotonic', return_value=now + 31):
+            with self.assertRaisesMessage(AuthenticationFailed, 'revoked'):
+                self.authenticate(token)
+
+
+class ReplicaRoutingTests(PortfolioMixin, TransactionTestCase):
+    """
+    ``replica`` is a second alias mirroring the ``default`` test database. A
+    mirror is a separate connection that cannot see rows a ``TestCase`` has
+    not committed, hence ``TransactionTestCase``.
+    """
+    databases = {'default', REPLICA_ALIAS}
+
+    def setUp(self):
+        self.setUpTestData()
+        cache.clear()
+        db_router._lag_checked_at = None
+
+    def test_reads_in_block_use_the_replica(self):
+        self.assertEqual(Company.objects.all().db, 'default')
+        with read_from_replica() as used:
+            self.assertTrue(used)
+            self.assertEqual(Company.objects.all().db, REPLICA_ALIAS)
+            self.assertEqual(router.db_for_write(Company), 'default')
+        self.assertEqual(Company.objects.all().db, 'default')
+
+    @override_settings(REPLICA_MAX_LAG_SECONDS=10)
+    def test_lagging_replica_reads_from_primary(self):
+        with mock.patch.object(db_router, 'replica_lag_seconds', return_value=30):
+            with read_from_replica() as used:
+                self.assertFalse(used)
+                self.assertEqual(Company.objects.all().db, 'default')
+
+    def test_successful_write_makes_the_caller_sticky(self):
+        factory = RequestFactory()
+        request = factory.post('/company/', REMOTE_ADDR='203.0.113.9')
+        ReplicaStickinessMiddleware(lambda request: HttpResponse(status=400))(request)
+        with read_from_replica(request) as used:
+            self.assertTrue(used)
+
+        ReplicaStickinessMiddleware(lambda request: HttpResponse(status=201))(request)
+        with read_from_replica(factory.get('/company/', REMOTE_ADDR='203.0.113.9')) as used:
+            self.assertFalse(used)
+        with read_from_replica(factory.get('/company/', REMOTE_ADDR='203.0.113.10')) as used:
+            self.assertTrue(used)
+
+    def test_report_views_read_from_the_replica(self):
+        url = f'/company/tenancies/{self.company.id}/export/'
+        with CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica_queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.tenancy.tenancy_code, response.content.decode())
+        self.assertTrue(replica_queries.captured_queries)
+
+        # A write sends the same caller's next report to the primary.
+        response = self.client.post('/company/unit-types/create/', {'title': 'Villa', 'company': self.company.id})
+        self.assertEqual(response.status_code, 201)
+        with CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica_queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(replica_queries.captured_queries, [])
+
+
+class QueryInstrumentationTests(PortfolioMixin, TestCase):
+    def setUp(self):
+        self.url = f'/company/tenancies/occupied/{self.company.id}/'
+
+    def test_streamed_queries_are_counted(self):
+        response = self.client.get(self.url, {'stream': 'ndjson'})
+        stats = response.wsgi_request.query_stats
+        before = stats.queries
+        with CaptureQueriesContext(connection) as queries:
+            b''.join(response.streaming_content)
+        self.assertGreater(len(queries), 0)
+        self.assertEqual(stats.queries, before + len(queries))
+
+    @override_settings(QUERY_BUDGET_ACTION='raise')
+    def test_overrun_raises_only_under_tests_or_debug(self):
+        with mock.patch.object(ActiveTenanciesByCompanyAPIView, 'query_budget', 1):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(self.url)
+            with override_settings(TESTING=False, DEBUG=False), \
+                    self.assertLogs('rentbiz.utils.instrumentation', 'WARNING') as logs:
+                response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('(budget 1)', logs.output[-1])
+
+
+class SharedCacheSettingsTests(SimpleTestCase):
+    def load_settings(self, **environ):
+        env = {**os.environ, 'CACHE_URL': '', **environ}
+        return subprocess.run(
+            [sys.executable, '-c', 'import django; django.setup()'],
+            env={**env, 'DJANGO_SETTINGS_MODULE': 'rentbiz.settings'}, capture_output=True, text=True,
+        )
+
+    def test_replica_needs_a_shared_cache(self):
+        result = self.load_settings(DATABASE_REPLICA_NAME='/tmp/replica.sqlite3')
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('ImproperlyConfigured: A read replica needs a cache shared by every process', result.stderr)
+
+    def test_reference_bundle_cache_needs_a_shared_cache(self):
+        result = self.load_settings(REFERENCE_BUNDLE_CACHE='true')
+        self.assertIn('ImproperlyConfigured: REFERENCE_BUNDLE_CACHE needs a cache', result.stderr)
+
+    def test_without_replica_or_bundle_cache(self):
+        self.assertEqual(self.load_settings().returncode, 0)
+
+
+class MetricsViewTests(TestCase):
+    def test_disabled_by_default(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(METRICS_ENABLED=True, METRICS_TOKEN='scrape-secret')
+    def test_requires_token_or_staff(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+
+        staff = get_user_model().objects.create_user('ops', password='ops-pass', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+@override_settings(DOCUMENT_UPLOAD_STORAGE='default', DOCUMENT_UPLOAD_CHUNK_SIZE=4, DOCUMENT_UPLOAD_ASYNC=False)
+class DocumentUploadTests(TestCase):
+    content = b'lease-scan'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(company_name='Uploads')
+        cls.other = Company.objects.create(company_name='Elsewhere')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def create(self):
+        response = self.client.post('/company/uploads/', {
+            'filename': 'Lease.PDF', 'size': len(self.content), 'company': self.company.id,
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def put(self, upload_id, start, end, total=None, company=None):
+        return self.client.put(
+            f'/company/uploads/{upload_id}/?company={company or self.company.id}', self.content[start:end + 1],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{total or len(self.content)}',
+        )
+
+    def upload(self):
+        upload_id = self.create()
+        self.assertEqual(self.put(upload_id, 0, 3).status_code, 202)
+        self.assertEqual(self.put(upload_id, 4, 7).status_code, 202)
+        # The test transaction never commits; run the assembly queued for the commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.put(upload_id, 8, 9).json()['status'], 'assembling')
+        return self.client.get(f'/company/uploads/{upload_id}/?company={self.company.id}').json()
+
+    def test_chunks_resume_and_assemble(self):
+        upload_id = self.create()
+        self.assertEqual(self.put(upload_id, 0, 3).status_code, 202)
+
+        # An interrupted client asks where to resume; a retried chunk is acknowledged as is.
+        progress = self.client.get(f'/company/uploads/{upload_id}/?company={self.company.id}').json()
+        self.assertEqual(progress['received'], 4)
+        self.assertEqual(self.put(upload_id, 0, 3).json()['received'], 4)
+        self.assertEqual(self.put(upload_id, 8, 9).status_code, 400)
+
+        self.assertEqual(self.put(upload_id, 4, 7).status_code, 202)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.put(upload_id, 8, 9).status_code, 202)
+        upload = DocumentUpload.objects.get(pk=upload_id)
+        self.assertEqual(upload.status, 'complete')
+        self.assertEqual(upload.sha256, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(upload.file.name, f'document_files/{upload.sha256[:2]}/{upload.sha256}.pdf')
+        with upload.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def run_task(self, task, *args):
+        # An eager run still reports to the result backend; keep it off Redis.
+        with mock.patch.object(task, '_backend', DisabledBackend(task.app)):
+            return task.apply(args=args)
+
+    def receive(self):
+        """An upload with every chunk received, waiting to be assembled."""
+        upload_id = self.create()
+        for start in range(0, len(self.content), 4):
+            self.put(upload_id, start, min(start + 3, len(self.content) - 1))
+        return upload_id
+
+    def test_assembly_is_retried_after_a_storage_error(self):
+        upload_id = self.receive()
+        save = FileSystemStorage.save
+        failures = [OSError('disk full')]
+
+        def flaky_save(storage, name, content, *args, **kwargs):
+            if name.startswith('document_files/') and failures:
+                storage._save(name, ContentFile(self.content[:3]))  # a partial write
+                raise failures.pop()
+            return save(storage, name, content, *args, **kwargs)
+
+        with mock.patch.object(FileSystemStorage, 'save', flaky_save), self.assertLogs('company.uploads', 'ERROR'):
+            result = self.run_task(assemble_document_upload, upload_id)
+        self.assertTrue(result.successful(), result.traceback)
+        upload = DocumentUpload.objects.get(pk=upload_id)
+        self.assertEqual(upload.status, 'complete')
+        with upload.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_assembly_fails_after_the_last_retry(self):
+        upload_id = self.receive()
+        with mock.patch.object(FileSystemStorage, 'save', side_effect=OSError('disk full')), \
+                self.assertLogs('company.uploads', 'ERROR') as logs:
+            result = self.run_task(assemble_document_upload, upload_id)
+        self.assertEqual(len(logs.records), assemble_document_upload.max_retries + 1)
+        self.assertTrue(result.failed())
+        self.assertEqual(DocumentUpload.objects.get(pk=upload_id).status, 'failed')
+
+    def test_identical_documents_are_stored_once(self):
+        first, second = self.upload(), self.upload()
+        self.assertNotEqual(first['id'], second['id'])
+        self.assertEqual(first['file'], second['file'])
+
+    def test_wrong_total_is_rejected_before_the_chunk_is_stored(self):
+        upload_id = self.create()
+        response = self.put(upload_id, 0, 3, total=len(self.content) + 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(DocumentUpload.objects.get(pk=upload_id).received, 0)
+        self.assertEqual(self.put(upload_id, 0, 3).status_code, 202)
+
+    def test_uploads_are_scoped_to_their_company(self):
+        upload_id = self.upload()['id']
+        self.assertEqual(self.client.get(f'/company/uploads/{upload_id}/?company={self.other.id}').status_code, 404)
+        self.assertEqual(self.put(upload_id, 0, 3, company=self.other.id).status_code, 404)
+
+        documents = {'build_comp': [{'upload_id': upload_id}]}
+        foreign = BuildingSerializer(data={'company': self.other.id, 'building_name': 'B', **documents})
+        self.assertFalse(foreign.is_valid())
+        self.assertIn('build_comp', foreign.errors)
+        own = BuildingSerializer(data={'company': self.company.id, 'building_name': 'A', **documents})
+        self.assertTrue(own.is_valid(), own.errors)
+        self.assertEqual(own.validated_data['build_comp'][0]['upload_file'], DocumentUpload.objects.get(pk=upload_id).file.name)
+
+
+def csv_file(name, rows):
+    return SimpleUploadedFile(f'{name}.csv', '\n'.join(','.join(row) for row in rows).encode())
+
+
+class PropertyImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(company_name='Imports')
+        UnitType.objects.create(company=cls.company, title='Studio')
+        MasterDocumentType.objects.create(company=cls.company, title='Title Deed')
+        cls.url = f'/company/imports/properties/{cls.company.id}/'
+
+    def sheets(self):
+        return {
+            'buildings': csv_file('buildings', [
+                ['Building No', 'Building Name', 'Latitude', 'Longitude'],
+                ['B1', 'Marina Heights', '25.08', '55.14'],
+                ['B2', 'Palm View', '', ''],
+                ['B3', 'Creek Side', '', ''],
+            ]),
+            'units': csv_file('units', [
+                ['building', 'unit_name', 'unit_type', 'no_of_bedrooms'],
+                ['b1', '101', 'studio', '1'],
+                ['B1', '102', '', '2.0'],
+                ['B2', '201', '', ''],
+            ]),
+            'documents': csv_file('documents', [
+                ['building', 'unit', 'doc_type', 'expiry_date'],
+                ['B1', '', 'Title Deed', '2030-01-31'],
+                ['B1', '101', 'title deed', '31/12/2029'],
+            ]),
+        }
+
+    @override_settings(IMPORT_BATCH_SIZE=2)
+    def test_csv_import_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, self.sheets())
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['created'], {'buildings': 3, 'units': 3, 'documents': 2})
+
+        inserts = [query['sql'] for query in queries if query['sql'].startswith('INSERT INTO "company_building"')]
+        self.assertEqual(len(inserts), 2)  # 3 buildings in batches of 2
+        codes = list(Building.objects.filter(company=self.company).order_by('code').values_list('code', flat=True))
+        self.assertEqual(codes, ['B24090001', 'B24090002', 'B24090003'])
+        unit = Units.objects.get(company=self.company, unit_name='101')
+        self.assertEqual((unit.building.building_no, unit.unit_type.title, unit.no_of_bedrooms), ('B1', 'Studio', 1))
+        self.assertIsNotNone(Building.objects.get(building_no='B1').geohash)
+        self.assertEqual(UnitDocumentType.objects.get(unit=unit).expiry_date, date(2029, 12, 31))
+        self.assertTrue(DocumentType.objects.filter(building__building_no='B1').exists())
+
+    def test_workbook_sheets(self):
+        workbook = openpyxl.Workbook()
+        buildings = workbook.active
+        buildings.title = 'Buildings'
+        buildings.append(['building_no', 'building_name'])
+        buildings.append([12, 'Numbered'])
+        units = workbook.create_sheet('Units')
+        units.append(['building', 'unit_name'])
+        units.append([12, 'G01'])
+        content = BytesIO()
+        workbook.save(content)
+
+        workbook_file = SimpleUploadedFile('portfolio.xlsx', content.getvalue())
+        response = self.client.post(self.url, {'workbook': workbook_file})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertTrue(Units.objects.filter(building__building_no='12', unit_name='G01').exists())
+
+    def test_row_errors_are_reported_and_nothing_is_written(self):
+        sheets = self.sheets()
+        sheets['buildings'] = csv_file('buildings', [
+            ['building_no', 'building_name', 'latitude'],
+            ['B1', 'Marina Heights', '95'],
+            ['B2', '', ''],
+        ])
+        sheets['units'] = csv_file('units', [['building', 'unit_name'], ['B9', '901']])
+        del sheets['documents']
+        response = self.client.post(self.url, sheets)
+        self.assertEqual(response.status_code, 400)
+        body = response.json()
+        self.assertEqual(body['error_count'], 3)
+        self.assertIn({'sheet': 'buildings', 'row': 2, 'field': 'latitude', 'error': 'Must be between -90 and 90.'},
+                      body['errors'])
+        self.assertIn(('buildings', 3, 'building_name'), [(e['sheet'], e['row'], e['field']) for e in body['errors']])
+        self.assertIn(('units', 2, 'building'), [(e['sheet'], e['row'], e['field']) for e in body['errors']])
+        self.assertFalse(Building.objects.filter(company=self.company).exists())
+
+    def test_dry_run_validates_without_writing(self):
+        response = self.client.post(f'{self.url}?dry_run=true', self.sheets())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], {'buildings': 3, 'units': 3, 'documents': 2})
+        self.assertFalse(Building.objects.filter(company=self.company).exists())
+
+    def test_existing_rows_are_rejected(self):
+        Building.objects.create(company=self.company, building_no='B1', building_name='Existing')
+        response = self.client.post(self.url, self.sheets())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['field'], 'building_no')
+
+    def test_single_saves_and_imports_share_the_code_sequence(self):
+        first = Building.objects.create(company=self.company, building_name='Before')
+        self.assertEqual(self.client.post(self.url, self.sheets()).status_code, 201)
+        after = Building.objects.create(company=self.company, building_name='After')
+        self.assertEqual((first.code, after.code), ('B24090001', 'B24090005'))
+        self.assertEqual(CodeSequence.objects.get(name='company.Building:B').last_value, 24090005)
+
+    def test_save_skips_a_reserved_block(self):
+        with transaction.atomic():
+            reserved = imports.allocate_codes(Building, 'B', 10)
+            building = Building.objects.create(company=self.company, building_name='Single')
+        self.assertEqual(building.code, 'B24090011')
+        self.assertNotIn(building.code, reserved)
+
+
+class TenantImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(company_name='Tenants')
+        MasterDocumentType.objects.create(company=cls.company, title='Passport')
+        cls.existing = Tenant.objects.create(
+            company=cls.company, tenant_name='John Smith', email='John@X.com', phone='+971501234567',
+            id_number='784-1990-1234567-1',
+        )
+        other = Company.objects.create(company_name='Elsewhere')
+        Tenant.objects.create(company=other, tenant_name='Somebody', email='Taken@Y.com')
+        cls.url = f'/company/imports/tenants/{cls.company.id}/'
+
+    def post(self, tenants, documents=None, query=''):
+        files = {'tenants': csv_file('tenants', [
+            ['tenant_name', 'email', 'phone', 'id_number'], *tenants,
+        ])}
+        if documents:
+            files['documents'] = csv_file('documents', [['tenant', 'doc_type', 'number'], *documents])
+        return self.client.post(self.url + query, files)
+
+    def test_normalization(self):
+        self.assertEqual(imports.normalize_email('  John@X.COM '), 'john@x.com')
+        self.assertEqual(imports.normalize_phone('00971 50 123 4567'), '+971501234567')
+        self.assertEqual(imports.normalize_phone('(050) 123-4567'), '0501234567')
+        self.assertEqual(imports.phone_key('+971 50 123 4567'), imports.phone_key('050-123-4567'))
+        self.assertIsNone(imports.phone_key('12345'))
+        self.assertEqual(imports.normalize_id_number('784-1990 1234567-1'), '784199012345671')
+        self.assertEqual(imports.name_key("  O'Brien,  JOHN "), 'o brien john')
+
+    def test_duplicate_classification(self):
+        index = imports.TenantIndex()
+        index.add(1, 'John Smith', ['+971501234567'], ['784199012345671'], 'john@x.com')
+        self.assertEqual(index.matches('Jane Doe', [], [], 'john@x.com'), {1: {'email'}})
+        self.assertEqual(index.matches('Jane Doe', [], ['784199012345671']), {1: {'id_number'}})
+        self.assertEqual(index.matches('john  smith', ['050 123 4567'], [None]), {1: {'name', 'phone'}})
+        self.assertTrue(imports.TenantIndex.is_duplicate({'email'}))
+        self.assertTrue(imports.TenantIndex.is_duplicate({'id_number'}))
+        self.assertTrue(imports.TenantIndex.is_duplicate({'phone', 'name'}))
+        self.assertFalse(imports.TenantIndex.is_duplicate({'phone'}))
+        self.assertFalse(imports.TenantIndex.is_duplicate({'name'}))
+
+    def test_email_of_an_existing_tenant_in_another_case_is_a_duplicate(self):
+        response = self.post([['Johnny', 'john@x.com', '', '']])
+        self.assertEqual(response.status_code, 201, response.content)
+        body = response.json()
+        self.assertEqual(body['created']['tenants'], 0)
+        self.assertEqual(body['skipped']['tenants'], 1)
+        [candidate] = body['merge_candidates']
+        self.assertTrue(candidate['duplicate'])
+        self.assertEqual(candidate['matches'][0]['tenant_id'], self.existing.id)
+        self.assertEqual(candidate['matches'][0]['reasons'], ['email'])
+
+        # Creating the duplicate anyway would repeat the email.
+        response = self.post([['Johnny', 'john@x.com', '', '']], query='?duplicates=create')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['field'], 'email')
+        self.assertEqual(Tenant.objects.filter(email__iexact='john@x.com').count(), 1)
+
+    def test_email_of_another_company_is_an_error(self):
+        response = self.post([['Someone Else', 'taken@y.com', '', '']])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['field'], 'email')
+
+    def test_duplicates_are_skipped_with_their_documents(self):
+        response = self.post(
+            [
+                ['J. Smith', 'j.smith@x.com', '', '784 1990 1234567 1'],  # same ID number
+                ['john smith', '', '050 123 4567', ''],  # same phone and name
+                ['John Smith', 'other@x.com', '', ''],  # same name only
+                ['Mary Major', 'mary@x.com', '0551112222', 'P123'],
+            ],
+            documents=[['j.smith@x.com', 'Passport', 'A1'], ['P123', 'passport', 'B2']],
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        body = response.json()
+        self.assertEqual(body['created'], {'tenants': 2, 'documents': 1})
+        self.assertEqual(body['skipped'], {'tenants': 2, 'documents': 1})
+        classified = {candidate['row']: (candidate['duplicate'], candidate['action'])
+                      for candidate in body['merge_candidates']}
+        self.assertEqual(classified, {2: (True, 'skipped'), 3: (True, 'skipped'), 4: (False, 'created')})
+        self.assertTrue(TenantDocumentType.objects.filter(tenant__email='mary@x.com', number='B2').exists())
+
+    def test_duplicates_create(self):
+        response = self.post([['J. Smith', 'j.smith@x.com', '', '784199012345671']], query='?duplicates=create')
+        self.assertEqual(response.status_code, 201, response.content)
+        body = response.json()
+        self.assertEqual(body['created']['tenants'], 1)
+        self.assertEqual(body['merge_candidates'][0]['action'], 'created')
+        self.assertEqual(Tenant.objects.filter(company=self.company).count(), 2)
+
+
+class OccupancyTimelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(company_name='Timeline')
+        cls.building = Building.objects.create(company=cls.company, building_name='Tower')
+        cls.units = [
+            Units.objects.create(company=cls.company, building=cls.building, unit_name=name, unit_status='vacant')
+            for name in ('101', '102')
+        ]
+        # Both units exist for the whole report range.
+        Units.objects.filter(company=cls.company).update(created_at=timezone.make_aware(datetime(2026, 1, 1)))
+        cls.tenant = Tenant.objects.create(company=cls.company, tenant_name='Resident')
+
+    def tenancy(self, start, unit=None, **fields):
+        unit = unit or self.units[0]
+        return Tenancy.objects.create(
+            company=self.company, building=self.building, unit=unit, tenant=self.tenant,
+            start_date=start, end_date=start + timedelta(days=365), **fields)
+
+    def timeline(self, unit=None):
+        rows = UnitOccupancy.objects.filter(unit=unit or self.units[0]).order_by('id')
+        return list(rows.values_list('tenancy_id', 'occupied_from', 'occupied_to'))
+
+    def test_confirm_occupies_from_the_start_date(self):
+        tenancy = self.tenancy(date(2026, 3, 1))
+        response = self.client.post(f'/company/tenancy/{tenancy.id}/confirm/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.timeline(), [(tenancy.id, date(2026, 3, 1), None)])
+        self.assertEqual(Units.objects.get(pk=self.units[0].pk).unit_status, 'occupied')
+        # Confirming again is a no-op for the timeline.
+        self.assertEqual(occupancy.occupy(tenancy).tenancy_id, tenancy.id)
+        self.assertEqual(len(self.timeline()), 1)
+
+    def test_overlapping_tenancy_ends_the_open_occupancy(self):
+        first, second = self.tenancy(date(2026, 3, 1)), self.tenancy(date(2026, 5, 1))
+        occupancy.occupy(first)
+        occupancy.occupy(second)
+        self.assertEqual(self.timeline(), [
+            (first.id, date(2026, 3, 1), date(2026, 5, 1)),
+            (second.id, date(2026, 5, 1), None),
+        ])
+        # A backdated tenancy starts where the timeline ends, so nothing overlaps.
+        backdated = self.tenancy(date(2026, 4, 1))
+        occupancy.occupy(backdated)
+        self.assertEqual(self.timeline(), [
+            (first.id, date(2026, 3, 1), date(2026, 5, 1)),
+            (second.id, date(2026, 5, 1), date(2026, 5, 1)),
+            (backdated.id, date(2026, 5, 1), None),
+        ])
+        occupancy.vacate(backdated, on=date(2026, 7, 1))
+        occupancy.occupy(self.tenancy(date(2026, 6, 1)))
+        self.assertEqual(self.timeline()[-1][1], date(2026, 7, 1))
+
+    def test_terminate_vacates_today(self):
+        tenancy = self.tenancy(date(2026, 3, 1))
+        occupancy.occupy(tenancy)
+        response = self.client.put(f'/company/tenancies/{tenancy.id}/terminate/', {}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.timeline(), [(tenancy.id, date(2026, 3, 1), timezone.localdate())])
+        self.assertEqual(Units.objects.get(pk=self.units[0].pk).unit_status, 'vacant')
+
+    def test_backdated_vacate(self):
+        tenancy = self.tenancy(date(2026, 3, 1))
+        occupancy.occupy(tenancy)
+        occupancy.vacate(tenancy, on=date(2026, 4, 15))
+        self.assertEqual(self.timeline(), [(tenancy.id, date(2026, 3, 1), date(2026, 4, 15))])
+        self.assertIsNone(occupancy.vacate(tenancy))  # nothing open any more
+
+        other = self.tenancy(date(2026, 6, 1))
+        occupancy.occupy(other)
+        occupancy.vacate(other, on=date(2026, 5, 1))  # before it began
+        self.assertEqual(self.timeline()[1], (other.id, date(2026, 6, 1), date(2026, 6, 1)))
+
+    def test_hand_over_to_the_renewal(self):
+        original = self.tenancy(date(2026, 1, 1), status='active')
+        occupancy.occupy(original)
+        renewed = self.tenancy(date(2027, 1, 1), previous_tenancy=original)
+        occupancy.hand_over(original, renewed)
+        self.assertEqual(self.timeline(), [
+            (original.id, date(2026, 1, 1), date(2027, 1, 1)),
+            (renewed.id, date(2027, 1, 1), None),
+        ])
+
+    def test_hand_over_after_termination_does_not_reoccupy(self):
+        original = self.tenancy(date(2026, 1, 1))
+        occupancy.occupy(original)
+        occupancy.vacate(original, on=date(2026, 6, 1))
+        renewed = self.tenancy(date(2027, 1, 1), previous_tenancy=original)
+        self.assertIsNone(occupancy.hand_over(original, renewed))
+        self.assertEqual(len(self.timeline()), 1)
+
+    def test_hand_over_to_another_unit(self):
+        original = self.tenancy(date(2026, 1, 1))
+        occupancy.occupy(original)
+        renewed = self.tenancy(date(2027, 1, 1), unit=self.units[1], previous_tenancy=original)
+        occupancy.hand_over(original, renewed)
+        self.assertIsNotNone(self.timeline()[0][2])
+        self.assertEqual(self.timeline(self.units[1]), [(renewed.id, date(2027, 1, 1), None)])
+
+    def test_occupancy_rates_and_counts(self):
+        first, second = self.tenancy(date(2026, 6, 11)), self.tenancy(date(2026, 6, 25), unit=self.units[1])
+        occupancy.occupy(first)
+        occupancy.vacate(first, on=date(2026, 6, 21))
+        occupancy.occupy(second)
+
+        rates = occupancy.occupancy_rates(self.company.id, date(2026, 6, 1), date(2026, 7, 31))
+        self.assertEqual(rates, [
+            # Days 11-20 of one unit and 25-30 of the other, out of 2 x 30.
+            {'month': '2026-06', 'unit_days': 60, 'occupied_days': 16, 'occupancy_rate': 26.67},
+            {'month': '2026-07', 'unit_days': 62, 'occupied_days': 31, 'occupancy_rate': 50.0},
+        ])
+        # Half-open intervals: the vacate day is no longer occupied.
+        self.assertEqual(occupancy.occupied_unit_count(self.company.id, date(2026, 6, 20)), 1)
+        self.assertEqual(occupancy.occupied_unit_count(self.company.id, date(2026, 6, 21)), 0)
+        self.assertEqual(occupancy.occupied_unit_count(self.company.id, date(2026, 6, 25)), 1)
+
+
+class InvoiceRunTests(PortfolioMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        today = timezone.localdate()
+        rent = PaymentSchedule.objects.filter(tenancy__company=cls.company).first().charge_type
+        PaymentSchedule.objects.bulk_create(
+            PaymentSchedule(
+                tenancy=config.tenancy, charge_type=rent, reason='Monthly Rent', due_date=today + timedelta(days=3),
+                amount=1000, vat=0, tax=0, total=1000,
+            )
+            for config in InvoiceAutomationConfig.objects.select_related('tenancy')
+        )
+        window = (today, today + timedelta(days=7))
+        cls.due_schedules = set(PaymentSchedule.objects.filter(
+            status='pending', due_date__range=window, tenancy__invoice_configs__is_active=True,
+        ).values_list('id', flat=True))
+        cls.due_charges = set(AdditionalCharge.objects.filter(
+            status='pending', due_date__range=window, tenancy__invoice_configs__is_active=True,
+        ).values_list('id', flat=True))
+
+    def setUp(self):
+        patcher = mock.patch.object(AutoGenerateInvoiceAPIView, 'send_invoice_email', return_value=True)
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def generate(self, run=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return AutoGenerateInvoiceAPIView().generate_invoices(run)
+
+    def assertInvoicedOnce(self):
+        items = InvoiceRunItem.objects.all()
+        schedules = [item.payment_schedule_id for item in items if item.payment_schedule_id]
+        charges = [item.additional_charge_id for item in items if item.additional_charge_id]
+        self.assertEqual(sorted(schedules), sorted(self.due_schedules))
+        self.assertEqual(sorted(charges), sorted(self.due_charges))
+        invoices = Invoice.objects.filter(is_automated=True)
+        self.assertEqual(invoices.count(), len({item.invoice_id for item in items}))
+        emailed = [call.args[0].id for call in self.send.call_args_list]
+        self.assertEqual(sorted(emailed), sorted(invoices.values_list('id', flat=True)))
+
+    def test_endpoint_invoices_each_due_item_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/company/invoices/auto-generate/')
+        self.assertEqual(response.status_code, 200)
+        run = InvoiceRun.objects.get(pk=response.json()['run_id'])
+        self.assertEqual(run.status, 'completed')
+        self.assertEqual(run.processed, InvoiceAutomationConfig.objects.count())
+        self.assertEqual(run.created, run.processed)
+        self.assertEqual(run.emails_sent, run.created)
+        self.assertInvoicedOnce()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/company/invoices/auto-generate/')
+        rerun = InvoiceRun.objects.get(pk=response.json()['run_id'])
+        self.assertNotEqual(rerun.pk, run.pk)
+        self.assertEqual((rerun.created, rerun.skipped), (0, rerun.processed))
+        self.assertInvoicedOnce()
+
+    def test_claim(self):
+        run = InvoiceRun.claim()
+        self.assertEqual(run.status, 'running')
+        # A run still checkpointing elsewhere is not claimed twice.
+        self.assertIsNone(InvoiceRun.claim())
+        self.assertIsNone(InvoiceRun.claim(run.pk))
+        response = self.client.post('/company/invoices/auto-generate/')
+        self.assertEqual(response.status_code, 409)
+
+        stale = timezone.now() - timedelta(seconds=settings.INVOICE_RUN_STALE_SECONDS + 1)
+        InvoiceRun.objects.filter(pk=run.pk).update(updated_at=stale)
+        self.assertEqual(InvoiceRun.claim(), run)
+        InvoiceRun.objects.filter(pk=run.pk).update(status='failed', error='boom')
+        resumed = InvoiceRun.claim(run.pk)
+        self.assertEqual((resumed.pk, resumed.status, resumed.error), (run.pk, 'running', None))
+        InvoiceRun.objects.filter(pk=run.pk).update(status='completed')
+        self.assertNotEqual(InvoiceRun.claim(), run)
+
+    def test_unique_constraints(self):
+        self.generate()
+        item = InvoiceRunItem.objects.filter(payment_schedule__isnull=False).first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            InvoiceRunItem.objects.create(
+                invoice=item.invoice, tenancy=item.tenancy, payment_schedule=item.payment_schedule)
+        charge = AdditionalCharge.objects.filter(tenancy=item.tenancy).first() or AdditionalCharge.objects.create(
+            tenancy=item.tenancy, charge_type=item.payment_schedule.charge_type, amount=10, total=10)
+        InvoiceRunItem.objects.create(invoice=item.invoice, tenancy=item.tenancy, additional_charge=charge)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            InvoiceRunItem.objects.create(invoice=item.invoice, tenancy=item.tenancy, additional_charge=charge)
+
+    @override_settings(INVOICE_RUN_BATCH_SIZE=2)
+    def test_run_killed_mid_batch_is_replayed(self):
+        view = AutoGenerateInvoiceAPIView
+        original = view.generate_invoice_for_config
+        calls = []
+
+        def killed_on_the_fourth_config(self, config, run, today):
+            calls.append(config.id)
+            if len(calls) == 4:
+                raise KeyboardInterrupt
+            return original(self, config, run, today)
+
+        with mock.patch.object(view, 'generate_invoice_for_config', killed_on_the_fourth_config):
+            with self.assertRaises(KeyboardInterrupt):
+                self.generate(InvoiceRun.claim())
+        run = InvoiceRun.objects.get()
+        # The first batch committed and was emailed; the second rolled back.
+        self.assertEqual((run.status, run.last_config_id, run.processed), ('running', calls[1], 2))
+        self.assertEqual(self.send.call_count, run.created)
+        self.assertEqual(InvoiceRunItem.objects.exclude(tenancy__invoice_configs__id__in=calls[:2]).count(), 0)
+
+        stale = timezone.now() - timedelta(seconds=settings.INVOICE_RUN_STALE_SECONDS + 1)
+        InvoiceRun.objects.filter(pk=run.pk).update(updated_at=stale)
+        self.assertEqual(InvoiceRun.claim(), run)
+        self.generate(run)
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'completed')
+        self.assertEqual(run.processed, InvoiceAutomationConfig.objects.count())
+        self.assertInvoicedOnce()
+
+        # Replaying committed batches from the start creates nothing new.
+        InvoiceRun.objects.filter(pk=run.pk).update(status='failed', last_config_id=0)
+        self.generate(InvoiceRun.claim(run.pk))
+        self.assertInvoicedOnce()
+
+    def test_item_invoiced_concurrently_is_skipped(self):
+        # Data prepared before another worker invoiced the same schedules.
+        view = AutoGenerateInvoiceAPIView()
+        config = InvoiceAutomationConfig.objects.get(tenancy=PaymentSchedule.objects.get(
+            id=min(self.due_schedules)).tenancy)
+        today = timezone.localdate()
+        stale = view.prepare_invoice_data(config.tenancy, today + timedelta(days=config.days_before_due), True)
+        run = InvoiceRun.objects.create()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(view.generate_invoice_for_config(config, run, today)['status'], 'created')
+        with mock.patch.object(AutoGenerateInvoiceAPIView, 'prepare_invoice_data', return_value=stale):
+            with self.captureOnCommitCallbacks(execute=True):
+                result = view.generate_invoice_for_config(config, run, today)
+        self.assertEqual((result['status'], result['message']), ('skipped', 'Items already invoiced'))
+        self.assertEqual(Invoice.objects.filter(tenancy=config.tenancy, is_automated=True).count(), 1)
+        self.assertEqual(self.send.call_count, 1)
+
+
+class IntervalTreeTests(SimpleTestCase):
+    def test_matches_a_linear_scan(self):
+        rng = random.Random(7)
+        intervals = []
+        for value in range(200):
+            start = date(2026, 1, 1) + timedelta(days=rng.randrange(365))
+            end = None if rng.random() < 0.1 else start + timedelta(days=rng.randrange(60))
+            intervals.append((start, end, value))
+        tree = IntervalTree(intervals)
+        self.assertEqual(len(tree), 200)
+        for _ in range(200):
+            start = date(2025, 12, 1) + timedelta(days=rng.randrange(420))
+            end = start + timedelta(days=rng.randrange(30))
+            expected = {value for low, high, value in intervals if low <= end and (high is None or high >= start)}
+            self.assertEqual(set(tree.overlapping(start, end)), expected)
+
+    def test_boundaries_are_inclusive(self):
+        tree = IntervalTree([(date(2026, 1, 1), date(2026, 3, 31), 'a'), (date(2026, 5, 1), None, 'b')])
+        self.assertEqual(tree.overlapping(date(2026, 3, 31), date(2026, 4, 30)), ['a'])
+        self.assertEqual(tree.overlapping(date(2026, 4, 1), date(2026, 4, 30)), [])
+        self.assertEqual(tree.overlapping(date(2026, 4, 1), date(2026, 5, 1)), ['b'])
+        self.assertEqual(tree.overlapping(date(2040, 1, 1), date(2040, 1, 1)), ['b'])
+        self.assertEqual(IntervalTree([]).overlapping(date(2026, 1, 1), date(2026, 1, 2)), [])
+
+
+class AvailableUnitsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(company_name='Availability')
+        building = Building.objects.create(company=cls.company, building_name='Tower')
+        cls.let, cls.reserved, cls.ended, cls.free, cls.renovating = (
+            Units.objects.create(company=cls.company, building=building, unit_name=name, unit_status=status)
+            for name, status in (
+                ('101', 'occupied'), ('102', 'vacant'), ('103', 'vacant'), ('104', 'vacant'), ('105', 'renovation'),
+            )
+        )
+        tenant = Tenant.objects.create(company=cls.company, tenant_name='Resident')
+        for unit, status, start, end in (
+            (cls.let, 'active', date(2026, 1, 1), date(2026, 3, 31)),
+            (cls.reserved, 'pending', date(2026, 5, 1), None),
+            (cls.ended, 'terminated', date(2026, 1, 1), date(2026, 12, 31)),
+        ):
+            Tenancy.objects.create(
+                company=cls.company, building=building, unit=unit, tenant=tenant,
+                status=status, start_date=start, end_date=end)
+
+    def available(self, start, end, **params):
+        query = '&'.join(f'{name}={value}' for name, value in {'start': start, 'end': end, **params}.items())
+        response = self.client.get(f'/company/units/company/{self.company.id}/available/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [unit['unit_name'] for unit in response.json()['results']]
+
+    def test_check_out_day_is_still_occupied(self):
+        # Tenancy periods are closed ranges, like daterange(start, end, '[]').
+        self.assertEqual(self.available('2026-03-31', '2026-04-10'), ['102', '103', '104'])
+        self.assertEqual(self.available('2026-04-01', '2026-04-10'), ['101', '102', '103', '104'])
+        self.assertEqual(self.available('2025-12-01', '2026-01-01'), ['102', '103', '104'])
+
+    def test_pending_tenancies_block_without_an_end_date(self):
+        self.assertEqual(self.available('2026-04-20', '2026-04-30'), ['101', '102', '103', '104'])
+        self.assertEqual(self.available('2026-04-20', '2026-05-01'), ['101', '103', '104'])
+        self.assertEqual(self.available('2031-01-01', '2031-01-31'), ['101', '103', '104'])
+
+    def test_new_tenancy_invalidates_the_tree(self):
+        self.assertEqual(self.available('2026-06-01', '2026-06-30', building=self.free.building_id),
+                         ['101', '103', '104'])
+        Tenancy.objects.create(
+            company=self.company, unit=self.free, status='pending',
+            start_date=date(2026, 6, 30), end_date=date(2026, 7, 31))
+        self.assertEqual(self.available('2026-06-01', '2026-06-30'), ['101', '103'])
+
+    def test_invalid_ranges(self):
+        url = f'/company/units/company/{self.company.id}/available/'
+        self.assertEqual(self.client.get(f'{url}?start=2026-05-01').status_code, 400)
+        self.assertEqual(self.client.get(f'{url}?start=2026-05-02&end=2026-05-01').status_code, 400)
+        self.assertEqual(self.client.get(f'{url}?start=2026-05-01&end=2026-05-02&bedrooms=two').status_code, 400)
+
+
+class TenancyPeriodIndexMigrationTests(TestCase):
+    migration = importlib.import_module('company.migrations.0066_tenancy_period_gist_index')
+
+    def test_skipped_off_postgres(self):
+        self.assertEqual(connection.vendor, 'sqlite')
+        schema_editor = mock.Mock(connection=connection)
+        self.migration.create_period_index(None, schema_editor)
+        self.migration.drop_period_index(None, schema_editor)
+        schema_editor.execute.assert_not_called()
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, Tenancy._meta.db_table)
+        self.assertNotIn(self.migration.INDEX_NAME, indexes)
+
+    def test_gist_index_on_postgres(self):
+        schema_editor = mock.Mock(connection=mock.Mock(vendor='postgresql'))
+        self.migration.create_period_index(None, schema_editor)
+        sql = schema_editor.execute.call_args.args[0]
+        self.assertIn("USING gist (daterange(start_date, end_date, '[]'))", sql)
+        self.assertIn("WHERE status IN ('active', 'pending')", sql)
+        self.migration.drop_period_index(None, schema_editor)
+        self.assertEqual(
+            schema_editor.execute.call_args.args[0], f'DROP INDEX IF EXISTS {self.migration.INDEX_NAME}')
+
+    def test_sqlite_uses_the_interval_tree(self):
+        company = Company.objects.create(company_name='Fallback')
+        with mock.patch.object(availability, '_blocked_units_postgres') as postgres:
+            list(availability.available_units(company.id, date(2026, 1, 1), date(2026, 1, 31)))
+        postgres.assert_not_called()
+
+
+class UnitBulkOperationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(company_name='Bulk')
+        cls.building = Building.objects.create(company=cls.company, building_name='Tower')
+        cls.units = {
+            name: Units.objects.create(company=cls.company, building=cls.building, unit_name=name, unit_status=status)
+            for name, status in (
+                ('free', 'vacant'), ('renovating', 'renovation'), ('confirmed', 'vacant'),
+                ('reserved', 'vacant'), ('legacy', 'occupied'),
+            )
+        }
+        tenant = Tenant.objects.create(company=cls.company, tenant_name='Resident')
+        for name, status in (('confirmed', 'active'), ('reserved', 'pending')):
+            Tenancy.objects.create(
+                company=cls.company, building=cls.building, unit=cls.units[name], tenant=tenant,
+                status=status, start_date=date(2026, 1, 1), end_date=date(2026, 12, 31))
+        occupancy.occupy(Tenancy.objects.get(unit=cls.units['confirmed']))
+        # Marked occupied before the timeline existed: no occupancy row.
+        Units.objects.filter(pk=cls.units['legacy'].pk).update(unit_status='occupied')
+
+    def post(self, **data):
+        return self.client.post(
+            f'/company/units/company/{self.company.id}/bulk/', data, content_type='application/json')
+
+    def statuses(self):
+        return dict(Units.objects.filter(company=self.company).values_list('unit_name', 'unit_status'))
+
+    def test_status_change_skips_units_held_by_a_tenancy(self):
+        held = sorted(self.units[name].id for name in ('confirmed', 'reserved', 'legacy'))
+        response = self.post(buildings=[self.building.id], changes={'unit_status': 'renovation'}, dry_run=True)
+        self.assertEqual(response.json(), {
+            'matched': 5, 'updated': 2, 'blocked': 3, 'blocked_unit_ids': held, 'dry_run': True})
+        self.assertEqual(self.statuses()['free'], 'vacant')
+
+        response = self.post(buildings=[self.building.id], changes={'unit_status': 'renovation'})
+        self.assertEqual(response.json()['updated'], 2)
+        self.assertEqual(self.statuses(), {
+            'free': 'renovation', 'renovating': 'renovation', 'confirmed': 'occupied',
+            'reserved': 'vacant', 'legacy': 'occupied',
+        })
+
+    def test_legacy_occupied_units_cannot_be_vacated(self):
+        response = self.post(ids=[self.units['legacy'].id], statuses=['occupied'], changes={'unit_status': 'vacant'})
+        self.assertEqual((response.json()['updated'], response.json()['blocked']), (0, 1))
+        self.assertEqual(self.statuses()['legacy'], 'occupied')
+
+    def test_status_change_locks_the_matched_units(self):
+        select_for_update = QuerySet.select_for_update
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True, side_effect=select_for_update) as lock:
+            unit_operations.bulk_update_units(self.company.id, {'remarks': 'Repainted'}, buildings=[self.building.id])
+            lock.assert_not_called()
+            unit_operations.bulk_update_units(
+                self.company.id, {'unit_status': 'disputed'}, buildings=[self.building.id])
+        lock.assert_called_once()
+        self.assertEqual(lock.call_args.args[0].model, Units)
+
+    def test_field_changes_apply_to_held_units(self):
+        response = self.post(ids=[unit.id for unit in self.units.values()], changes={'no_of_bedrooms': 2})
+        self.assertEqual((response.json()['updated'], response.json()['blocked']), (5, 0))
+        self.assertEqual(set(Units.objects.filter(company=self.company).values_list('no_of_bedrooms', flat=True)), {2})
+
+    def test_invalid_requests(self):
+        other = Building.objects.create(company=Company.objects.create(company_name='Other'), building_name='Other')
+        for data in (
+            {'changes': {'unit_status': 'renovation'}},
+            {'buildings': [other.id], 'changes': {'unit_status': 'renovation'}},
+            {'buildings': [self.building.id], 'changes': {'unit_status': 'occupied'}},
+            {'buildings': [self.building.id], 'changes': {}},
+        ):
+            with self.subTest(data=data):
+                self.assertEqual(self.post(**data).status_code, 400)
+        self.assertEqual(self.statuses()['free'], 'vacant')
+
+
+class GeohashTests(SimpleTestCase):
+    def test_encode(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geo.encode(-25.38262, -49.26561, 8), '6gkzwgjz')
+        self.assertIsNone(geo.encode(None, 10.0))
+        south, west, north, east = geo.bounds(geo.encode(25.2048, 55.2708))
+        self.assertTrue(south <= 25.2048 <= north and west <= 55.2708 <= east)
+
+    def assertCovers(self, box, points):
+        cells = geo.covering_cells(*box)
+        for latitude, longitude in points:
+            geohash = geo.encode(latitude, longitude)
+            with self.subTest(point=(latitude, longitude)):
+                self.assertTrue(any(geohash.startswith(cell) for cell in cells))
+
+    def test_covering_cells(self):
+        rng = random.Random(3)
+        box = (25.0, 55.0, 25.3, 55.5)
+        self.assertCovers(box, [(rng.uniform(25.0, 25.3), rng.uniform(55.0, 55.5)) for _ in range(100)])
+
+    def test_antimeridian_box(self):
+        box = (-10.0, 170.0, 10.0, -170.0)
+        self.assertCovers(box, [(0.0, 179.9), (5.0, 170.0), (-5.0, -179.9), (9.9, -170.0)])
+        cells = geo.covering_cells(*box)
+        self.assertFalse(any(geo.encode(0.0, 0.0).startswith(cell) for cell in cells))
+        self.assertEqual(geo.cluster_precision(*box), geo.cluster_precision(-10.0, -10.0, 10.0, 10.0))
+
+    def test_box_around(self):
+        south, west, north, east = geo.box_around(0.0, 0.0, 111.195)
+        self.assertAlmostEqual(north, 1.0, places=3)
+        self.assertAlmostEqual(east, 1.0, places=3)
+        # Across the antimeridian the box wraps: west > east.
+        south, west, north, east = geo.box_around(0.0, 179.9, 50)
+        self.assertGreater(west, east)
+        self.assertAlmostEqual(east, -179.65, places=2)
+
+    def test_box_around_the_poles(self):
+        # A circle reaching a pole covers every longitude.
+        self.assertEqual(geo.box_around(89.99, 45.0, 5)[1:4:2], (-180.0, 180.0))
+        self.assertEqual(geo.box_around(89.99, 45.0, 5)[2], 90.0)
+        self.assertEqual(geo.box_around(-89.99, 45.0, 5)[:2], (-90.0, -180.0))
+        # Near a pole the circle is widest well north of its centre: a point
+        # 100 km from (89, 45) lies 64 degrees of longitude east.
+        south, west, north, east = geo.box_around(89.0, 45.0, 100)
+        self.assertAlmostEqual(geo.haversine_km(89.0, 45.0, 89.5627, 109.07), 100, places=1)
+        self.assertTrue(west <= 45 - 64.07 and 109.07 <= east and south <= 89.5627 <= north)
+        self.assertEqual(geo.box_around(89.5, 45.0, 100)[1:4:2], (-180.0, 180.0))
+
+    def test_haversine(self):
+        self.assertAlmostEqual(geo.haversine_km(0, 0, 1, 0), 111.195, places=2)
+        self.assertAlmostEqual(geo.haversine_km(0, 179.5, 0, -179.5), 111.195, places=2)
+        self.assertAlmostEqual(geo.haversine_km(89.9, 0, 89.9, 180), 22.239, places=2)
+
+
+class BuildingLocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(company_name='Locations')
+        cls.points = {
+            'centre': (25.2000, 55.3000),
+            'near': (25.2050, 55.3000),      # ~0.56 km
+            'nearer': (25.2010, 55.3000),    # ~0.11 km
+            'far': (25.3000, 55.3000),       # ~11 km
+            'east': (0.0, 179.5),
+            'west': (0.0, -179.5),
+            'pole': (89.9, 0.0),
+            'pole_opposite': (89.9, 180.0),
+            'arctic': (89.56, 108.0),       # ~99 km from (89, 45)
+        }
+        for name, (latitude, longitude) in cls.points.items():
+            Building.objects.create(company=cls.company, building_name=name, latitude=latitude, longitude=longitude)
+        Building.objects.create(company=cls.company, building_name='unmapped')
+
+    def nearby(self, latitude, longitude, **params):
+        response = self.client.get(
+            f'/company/buildings/company/{self.company.id}/nearby/', {'lat': latitude, 'lng': longitude, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def viewport(self, south, west, north, east):
+        response = self.client.get(
+            f'/company/buildings/company/{self.company.id}/viewport/',
+            {'south': south, 'west': west, 'north': north, 'east': east})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_nearest_first(self):
+        data = self.nearby(25.2, 55.3, radius=5)
+        self.assertEqual(data['count'], 3)
+        self.assertEqual([row['building_name'] for row in data['results']], ['centre', 'nearer', 'near'])
+        distances = [row['distance_km'] for row in data['results']]
+        self.assertEqual(distances, sorted(distances))
+        self.assertAlmostEqual(distances[2], 0.556, places=2)
+
+        data = self.nearby(25.2, 55.3, radius=20, limit=2)
+        self.assertEqual((data['count'], len(data['results'])), (4, 2))
+
+    def test_nearby_across_the_antimeridian_and_the_pole(self):
+        data = self.nearby(0.0, 179.9, radius=100)
+        self.assertEqual([row['building_name'] for row in data['results']], ['east', 'west'])
+        data = self.nearby(89.95, 90.0, radius=20)
+        self.assertEqual({row['building_name'] for row in data['results']}, {'pole', 'pole_opposite'})
+        data = self.nearby(89.0, 45.0, radius=100)
+        self.assertEqual([row['building_name'] for row in data['results']], ['arctic'])
+
+    def test_viewport(self):
+        data = self.viewport(25.0, 55.0, 25.25, 55.5)
+        self.assertFalse(data['clustered'])
+        self.assertEqual([row['building_name'] for row in data['buildings']], ['centre', 'near', 'nearer'])
+        data = self.viewport(-1, 179, 1, -179)
+        self.assertEqual([row['building_name'] for row in data['buildings']], ['east', 'west'])
+
+    @override_settings(MAP_MAX_MARKERS=2)
+    def test_crowded_viewport_is_clustered(self):
+        data = self.viewport(-90, -180, 90, 180)
+        self.assertTrue(data['clustered'])
+        self.assertEqual(data['count'], len(self.points))
+        self.assertEqual(sum(cluster['count'] for cluster in data['clusters']), len(self.points))
+        for cluster in data['clusters']:
+            south, west, north, east = cluster['bounds']
+            self.assertTrue(south <= cluster['latitude'] <= north and west <= cluster['longitude'] <= east)
+            self.assertEqual(len(cluster['geohash']), data['precision'])
+            self.assertEqual(cluster['building_id'] is None, cluster['count'] > 1)
+        dubai = [cluster for cluster in data['clusters'] if cluster['count'] == 4]
+        self.assertEqual(len(dubai), 1)
+
+    def test_invalid_requests(self):
+        url = f'/company/buildings/company/{self.company.id}/'
+        self.assertEqual(self.client.get(f'{url}nearby/', {'lat': 25.2}).status_code, 400)
+        self.assertEqual(self.client.get(f'{url}nearby/', {'lat': 95, 'lng': 0}).status_code, 400)
+        self.assertEqual(self.client.get(f'{url}nearby/', {'lat': 0, 'lng': 0, 'radius': 500}).status_code, 400)
+        box = {'south': 10, 'west': 0, 'north': -10, 'east': 10}
+        self.assertEqual(self.client.get(f'{url}viewport/', box).status_code, 400)
+
+
+class DocumentExpiryIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(company_name='Expiry', email_address='office@example.com')
+        cls.building = Building.objects.create(company=cls.company, building_name='Tower')
+        cls.unit = Units.objects.create(company=cls.company, building=cls.building, unit_name='101')
+        cls.tenant = Tenant.objects.create(company=cls.company, tenant_name='Resident')
+        cls.licence = MasterDocumentType.objects.create(company=cls.company, title='Trade licence')
+        cls.today = timezone.localdate()
+
+    def index(self, **filters):
+        return list(DocumentExpiry.objects.filter(company=self.company, **filters).order_by('kind').values_list(
+            'kind', 'expiry_date', 'label', 'number'))
+
+    def test_save_and_delete_keep_the_index_in_step(self):
+        expires = self.today + timedelta(days=10)
+        document = TenantDocumentType.objects.create(
+            tenant=self.tenant, doc_type=self.licence, number='TL-1', expiry_date=expires)
+        self.assertEqual(self.index(), [('tenant_document', expires, 'Trade licence', 'TL-1')])
+        row = DocumentExpiry.objects.get()
+        self.assertEqual((row.tenant_id, row.source_id), (self.tenant.id, document.id))
+
+        document.expiry_date = expires + timedelta(days=365)
+        document.save()
+        self.assertEqual(self.index(), [('tenant_document', expires + timedelta(days=365), 'Trade licence', 'TL-1')])
+        document.expiry_date = None
+        document.save()
+        self.assertEqual(self.index(), [])
+        document.expiry_date = expires
+        document.save()
+        document.delete()
+        self.assertEqual(self.index(), [])
+
+    def test_every_source(self):
+        expires = self.today + timedelta(days=5)
+        DocumentType.objects.create(building=self.building, doc_type=self.licence, number='B-1', expiry_date=expires)
+        UnitDocumentType.objects.create(unit=self.unit, doc_type=self.licence, number='U-1', expiry_date=expires)
+        self.tenant.id_number, self.tenant.id_validity_date = 'ID-1', expires
+        self.tenant.sponser_id_number, self.tenant.sponser_id_validity_date = 'SP-1', expires
+        self.tenant.save()
+        self.assertEqual([kind for kind, *_ in self.index()],
+                         ['building_document', 'sponsor_id', 'tenant_id', 'unit_document'])
+        self.assertEqual(DocumentExpiry.objects.get(kind='unit_document').building_id, self.building.id)
+
+        # Deleting the tenant drops both of its ID rows.
+        Tenant.objects.get(pk=self.tenant.pk).delete()
+        self.assertEqual([kind for kind, *_ in self.index()], ['building_document', 'unit_document'])
+
+    def test_rebuild_keeps_the_notification_state(self):
+        expires = self.today + timedelta(days=5)
+        DocumentType.objects.create(building=self.building, number='B-1', expiry_date=expires)
+        DocumentExpiry.objects.update(notified_for=expires)
+        # update() skips the signals; rebuild catches the index up.
+        DocumentType.objects.update(number='B-2')
+        self.assertEqual(expiry.rebuild(self.company.id), 1)
+        row = DocumentExpiry.objects.get()
+        self.assertEqual((row.number, row.notified_for), ('B-2', expires))
+
+    def run_digest(self, days=None):
+        with mock.patch.object(notify_expiring_documents, '_backend', DisabledBackend(notify_expiring_documents.app)):
+            return notify_expiring_documents.apply(args=(days,)).get()
+
+    def test_digest(self):
+        soon = TenantDocumentType.objects.create(
+            tenant=self.tenant, doc_type=self.licence, number='TL-1', expiry_date=self.today + timedelta(days=3))
+        TenantDocumentType.objects.create(
+            tenant=self.tenant, doc_type=self.licence, number='TL-2', expiry_date=self.today + timedelta(days=60))
+        TenantDocumentType.objects.create(
+            tenant=self.tenant, doc_type=self.licence, number='TL-3', expiry_date=self.today - timedelta(days=1))
+        silent = Company.objects.create(company_name='No email')
+        DocumentType.objects.create(
+            building=Building.objects.create(company=silent, building_name='Annex'),
+            number='B-1', expiry_date=self.today + timedelta(days=3))
+
+        self.assertEqual(self.run_digest(), {'companies': 1, 'documents': 1, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['office@example.com'])
+        self.assertIn('TL-1', mail.outbox[0].body)
+        self.assertNotIn('TL-2', mail.outbox[0].body)
+
+        # Nothing is sent twice, but a renewed document with a new date is.
+        self.assertEqual(self.run_digest()['companies'], 0)
+        soon.expiry_date = self.today + timedelta(days=20)
+        soon.save()
+        self.assertEqual(self.run_digest()['documents'], 1)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(self.run_digest(days=90)['documents'], 1)
+
+    def test_failed_digest_is_retried_next_run(self):
+        TenantDocumentType.objects.create(
+            tenant=self.tenant, doc_type=self.licence, number='TL-1', expiry_date=self.today + timedelta(days=3))
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError):
+            self.assertEqual(self.run_digest(), {'companies': 0, 'documents': 0, 'failed': 1})
+        self.assertIsNone(DocumentExpiry.objects.get().notified_for)
+        self.assertEqual(self.run_digest()['companies'], 1)
@@ -0,0 +1,111 @@
+"""
+Bulk unit operations: one status change or field update applied to every
+unit of a company matching a filter (buildings, unit types, ids, current
+status), e.g. taking a building offline for renovation.
+
+The change runs as a single ``UPDATE``. ``occupied`` follows the tenancy
+timeline (``company.occupancy``) and cannot be set here. A status change
+leaves alone the units that are occupied or held by an active or pending
+tenancy. It first locks the matched units, as ``occupancy.occupy`` does, so
+a tenancy confirmed concurrently either waits for the change or is seen by
+it. Creating a pending tenancy takes no lock; one created during the
+statement may miss the check.
+"""
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .availability import BLOCKING_STATUSES
+from .models import Building, Tenancy, UnitOccupancy, Units, UnitType
+
+SETTABLE_STATUSES = ('vacant', 'renovation', 'disputed')
+UPDATABLE_FIELDS = (
+    'unit_status', 'unit_type', 'no_of_bedrooms', 'no_of_bathrooms',
+    'description', 'remarks', 'premise_no', 'address',
+)
+BLOCKED_IDS_REPORTED = 100
+
+
+class BulkUnitError(ValueError):
+    pass
+
+
+def matching_units(company_id, buildings=None, unit_types=None, ids=None, statuses=None):
+    if not (buildings or unit_types or ids):
+        # Never let an empty filter touch the whole portfolio.
+        raise BulkUnitError('Filter by buildings, unit_types or ids.')
+    units = Units.objects.filter(company_id=company_id)
+    if buildings:
+        found = Building.objects.filter(company_id=company_id, id__in=buildings).count()
+        if found != len(set(buildings)):
+            raise BulkUnitError('Some buildings do not belong to this company.')
+        units = units.filter(building_id__in=buildings)
+    if unit_types:
+        units = units.filter(unit_type_id__in=unit_types)
+    if ids:
+        units = units.filter(id__in=ids)
+    if statuses:
+        units = units.filter(unit_status__in=statuses)
+    return units
+
+
+def held_by_tenancy():
+    """
+    Condition for units occupied now or reserved by an active or pending
+    tenancy. Units marked occupied before the timeline existed have no
+    occupancy rows, so their status counts too.
+    """
+    return (
+        Q(unit_status='occupied')
+        | Exists(UnitOccupancy.objects.filter(unit_id=OuterRef('pk'), occupied_to__isnull=True))
+        | Exists(Tenancy.objects.filter(unit_id=OuterRef('pk'), status__in=BLOCKING_STATUSES))
+    )
+
+
+def bulk_update_units(company_id, changes, dry_run=False, **filters):
+    """
+    Apply ``changes`` to the matching units. Returns the counts of units
+    matched, updated and left alone because a tenancy holds them (with up to
+    BLOCKED_IDS_REPORTED of their ids).
+    """
+    unknown = set(changes) - set(UPDATABLE_FIELDS)
+    if unknown:
+        raise BulkUnitError(f"Cannot update {', '.join(sorted(unknown))}.")
+    if not changes:
+        raise BulkUnitError('Nothing to change.')
+    if 'unit_status' in changes and changes['unit_status'] not in SETTABLE_STATUSES:
+        raise BulkUnitError(
+            f"unit_status must be one of {', '.join(SETTABLE_STATUSES)}; occupancy follows tenancies.")
+    values = dict(changes)
+    if 'unit_type' in values:
+        unit_type = values.pop('unit_type')
+        if unit_type is not None and not UnitType.objects.filter(company_id=company_id, id=unit_type).exists():
+            raise BulkUnitError('unit_type does not belong to this company.')
+        values['unit_type_id'] = unit_type
+
+    units = matching_units(company_id, **filters)
+    with transaction.atomic():
+        if 'unit_status' in values and not dry_run:
+            # In id order, like concurrent runs, so they cannot deadlock.
+            list(units.select_for_update().order_by('id').values_list('id', flat=True))
+        matched = units.count()
+        blocked_ids = []
+        if 'unit_status' in values:
+            blocked = units.filter(held_by_tenancy())
+            blocked_ids = list(blocked.order_by('id').values_list('id', flat=True)[:BLOCKED_IDS_REPORTED])
+            blocked_count = blocked.count() if len(blocked_ids) == BLOCKED_IDS_REPORTED else len(blocked_ids)
+            units = units.exclude(held_by_tenancy())
+        else:
+            blocked_count = 0
+
+        if dry_run:
+            updated = matched - blocked_count
+        else:
+            updated = units.update(**values, updated_at=timezone.now())
+    return {
+        'matched': matched,
+        'updated': updated,
+        'blocked': blocked_count,
+        'blocked_unit_ids': blocked_ids,
+        'dry_run': dry_run,
+    }
@@ -0,0 +1,286 @@
+"""
+Chunked, resumable document uploads.
+
+    POST /company/uploads/        {"filename", "size", "content_type"}
+                                  -> {"id", "chunk_size", "received": 0, ...}
+    PUT  /company/uploads/<id>/   raw bytes of one chunk, with
+                                  Content-Range: bytes <start>-<end>/<size>
+    GET  /company/uploads/<id>/   progress; an interrupted client resumes
+                                  from ``received``
+
+An upload belongs to the company of the caller's token (or, without one, the
+``company`` it was created with, passed again as ``?company=`` on GET and
+PUT). Only that company's uploads, and those made without a company, can be
+read, written or referenced.
+
+Each chunk is written straight to the ``DOCUMENT_UPLOAD_STORAGE`` storage as
+its own part, so no request holds more than one chunk in memory and any
+worker can take the next chunk. After the last chunk the parts are streamed
+into the final file (by a Celery task when ``DOCUMENT_UPLOAD_ASYNC`` is on).
+The file is named after its SHA-256, so a document uploaded twice is stored
+once. Building, unit and tenant documents then send ``upload_id`` instead of
+the file.
+"""
+import hashlib
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .authentication import TokenPrincipal
+from .models import DocumentUpload
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 5 * 1024 * 1024
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+def upload_storage():
+    return storages[getattr(settings, 'DOCUMENT_UPLOAD_STORAGE', 'default')]
+
+
+def chunk_size():
+    return getattr(settings, 'DOCUMENT_UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def _parts_dir(upload):
+    return f'uploads/{upload.pk}'
+
+
+def _part_name(upload, start):
+    # Zero padded so the parts list in byte order.
+    return f'{_parts_dir(upload)}/{start:015d}.part'
+
+
+class _PartsReader(io.RawIOBase):
+    """The upload's parts, in order, as one readable stream."""
+
+    def __init__(self, storage, names):
+        self._storage = storage
+        self._names = list(names)
+        self._current = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            if self._current is None:
+                if not self._names:
+                    return 0
+                self._current = self._storage.open(self._names.pop(0), 'rb')
+            read = self._current.readinto(buffer) if hasattr(self._current, 'readinto') else None
+            if read is None:
+                data = self._current.read(len(buffer))
+                read = len(data)
+                buffer[:read] = data
+            if read:
+                return read
+            self._current.close()
+            self._current = None
+
+    def close(self):
+        if self._current is not None:
+            self._current.close()
+        super().close()
+
+
+def company_uploads(company_id):
+    """The uploads a company may use: its own and those made without a company."""
+    return DocumentUpload.objects.filter(Q(company__isnull=True) | Q(company_id=company_id))
+
+
+def create_upload(filename, size, content_type=None, company_id=None):
+    max_size = getattr(settings, 'DOCUMENT_UPLOAD_MAX_SIZE', DEFAULT_MAX_SIZE)
+    if size <= 0 or size > max_size:
+        raise UploadError(f'size must be between 1 and {max_size} bytes')
+    return DocumentUpload.objects.create(
+        filename=os.path.basename(filename)[:255], size=size,
+        content_type=content_type, company_id=company_id,
+    )
+
+
+def accept_chunk(upload_id, start, data, total):
+    """
+    Store ``data`` as the chunk at byte ``start`` of an upload of ``total``
+    bytes. A chunk the upload already has is acknowledged without being
+    written again, so retrying is safe.
+    """
+    with transaction.atomic():
+        # The row lock serializes chunks of one upload across workers.
+        upload = DocumentUpload.objects.select_for_update().get(pk=upload_id)
+        if total != upload.size:
+            raise UploadError('Content-Range size does not match the upload')
+        if upload.status != 'uploading' or start + len(data) <= upload.received:
+            return upload
+        if start != upload.received:
+            raise UploadError(f'expected the chunk starting at byte {upload.received}')
+        if start + len(data) > upload.size:
+            raise UploadError('chunk runs past the declared size')
+
+        storage = upload_storage()
+        name = _part_name(upload, start)
+        if storage.exists(name):
+            storage.delete(name)  # left by an attempt whose commit failed
+        storage.save(name, ContentFile(data))
+
+        upload.received = start + len(data)
+        if upload.received == upload.size:
+            upload.status = 'assembling'
+        upload.save(update_fields=['received', 'status', 'updated_at'])
+
+        if upload.status == 'assembling':
+            if getattr(settings, 'DOCUMENT_UPLOAD_ASYNC', True):
+                from .tasks import assemble_document_upload
+                transaction.on_commit(lambda: assemble_document_upload.delay(str(upload.pk)))
+            else:
+                transaction.on_commit(lambda: assemble(upload.pk))
+    return upload
+
+
+def assemble(upload_id, last_attempt=True):
+    """
+    Stream the parts into the content-addressed final file and drop them.
+    An error leaves the upload assembling, with its parts, so that a retry
+    can finish it; only the ``last_attempt`` marks it failed.
+    """
+    upload = DocumentUpload.objects.get(pk=upload_id)
+    if upload.status != 'assembling':
+        return upload
+    storage = upload_storage()
+    partial = None
+    try:
+        _, part_names = storage.listdir(_parts_dir(upload))
+        names = [f'{_parts_dir(upload)}/{part}' for part in sorted(part_names)]
+        digest = hashlib.sha256()
+        with io.BufferedReader(_PartsReader(storage, names)) as parts:
+            for block in iter(lambda: parts.read(1024 * 1024), b''):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+
+        extension = os.path.splitext(upload.filename)[1].lower()
+        final_name = f'document_files/{sha256[:2]}/{sha256}{extension}'
+        if storage.exists(final_name):
+            name = final_name
+        else:
+            partial = final_name
+            with io.BufferedReader(_PartsReader(storage, names)) as parts:
+                content = File(parts, name=upload.filename)
+                content.size = upload.size
+                name = storage.save(final_name, content)
+    except Exception:
+        logger.exception('Could not assemble upload %s', upload.pk)
+        if partial is not None and storage.exists(partial):
+            storage.delete(partial)  # the next attempt writes it again
+        if last_attempt:
+            DocumentUpload.objects.filter(pk=upload.pk).update(status='failed', updated_at=timezone.now())
+        raise
+
+    upload.file.name = name
+    upload.sha256 = sha256
+    upload.status = 'complete'
+    upload.save(update_fields=['file', 'sha256', 'status', 'updated_at'])
+    for part in names:
+        storage.delete(part)
+    return upload
+
+
+def _parse_content_range(header):
+    """``(start, end, total)`` from ``bytes <start>-<end>/<total>``."""
+    try:
+        unit, spec = header.split(' ', 1)
+        byte_range, total = spec.split('/', 1)
+        start, end = byte_range.split('-', 1)
+        if unit != 'bytes':
+            raise ValueError
+        return int(start), int(end), int(total)
+    except ValueError:
+        raise UploadError('Content-Range must look like "bytes <start>-<end>/<size>"')
+
+
+def _describe(upload):
+    return {
+        'id': str(upload.pk),
+        'filename': upload.filename,
+        'size': upload.size,
+        'received': upload.received,
+        'status': upload.status,
+        'chunk_size': chunk_size(),
+        'sha256': upload.sha256,
+        'file': upload.file.url if upload.file else None,
+    }
+
+
+def _caller_company_id(request, supplied):
+    principal = request.user
+    if isinstance(principal, TokenPrincipal):
+        return principal.company_id
+    try:
+        return int(supplied) if supplied not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+class DocumentUploadCreateView(APIView):
+    def post(self, request):
+        try:
+            size = int(request.data.get('size', 0))
+        except (TypeError, ValueError):
+            return Response({'error': 'size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        filename = request.data.get('filename')
+        if not filename:
+            return Response({'error': 'filename is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        company_id = _caller_company_id(request, request.data.get('company'))
+        try:
+            upload = create_upload(filename, size, request.data.get('content_type'), company_id)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(_describe(upload), status=status.HTTP_201_CREATED)
+
+
+class DocumentUploadView(APIView):
+    def get_queryset(self, request):
+        return company_uploads(_caller_company_id(request, request.query_params.get('company')))
+
+    def get(self, request, upload_id):
+        upload = self.get_queryset(request).filter(pk=upload_id).first()
+        if upload is None:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(_describe(upload))
+
+    def put(self, request, upload_id):
+        if not self.get_queryset(request).filter(pk=upload_id).exists():
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            start, end, total = _parse_content_range(request.headers.get('Content-Range', ''))
+            length = end - start + 1
+            if length <= 0 or length > chunk_size():
+                raise UploadError(f'chunks must be between 1 and {chunk_size()} bytes')
+            # Read the raw stream: request.body would apply the form-data
+            # memory limit, and parsers are not needed for octet streams.
+            data = request.stream.read(length + 1) if request.stream else b''
+            if len(data) != length:
+                raise UploadError('body length does not match Content-Range')
+            upload = accept_chunk(upload_id, start, data, total)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        upload.refresh_from_db()
+        code = status.HTTP_200_OK if upload.status == 'complete' else status.HTTP_202_ACCEPTED
+        return Response(_describe(upload), status=code)
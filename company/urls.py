@@ -4,6 +4,10 @@ from  .views import *
 from .reports import (
     TenancyExportAPIView,
     )
+from .reference_data import ReferenceDataBundleView
+from .uploads import DocumentUploadCreateView, DocumentUploadView
+from .imports import PropertyImportView, TenantImportView
+from django.views.decorators.gzip import gzip_page
 from rentbiz.utils.dashboard import *
 
 urlpatterns = [
@@ -11,18 +15,32 @@ urlpatterns = [
     
     # company login
     path('company-login/', CompanyLoginView.as_view(), name='company-login'),
+
+    # reference data bundle
+    path('reference-data/<int:company_id>/', gzip_page(ReferenceDataBundleView.as_view()), name='reference-data-bundle'),
     
+    # chunked document uploads
+    path('uploads/', DocumentUploadCreateView.as_view(), name='document-upload-create'),
+    path('uploads/<uuid:upload_id>/', DocumentUploadView.as_view(), name='document-upload'),
+
+    # spreadsheet imports
+    path('imports/properties/<int:company_id>/', PropertyImportView.as_view(), name='import-properties'),
+    path('imports/tenants/<int:company_id>/', TenantImportView.as_view(), name='import-tenants'),
+
     # user management
     path('users/create/', UserCreateAPIView.as_view(), name='user-create'),
     path('users/company/<int:company_id>/', UserListByCompanyAPIView.as_view(), name='user-list-by-company'),
     path('users/<int:user_id>/', UserDetailAPIView.as_view(), name='user-detail'),
     path('user/<int:user_id>/details/', UserDetailView.as_view(), name='user-detail'),
+    path('users/<int:user_id>/logo/', UserLogoView.as_view(), name='user-logo'),
     
 
     # Building Properties                                                                                
     path('buildings/create/', BuildingCreateView.as_view(), name='building-create'),
     path('buildings/<int:pk>/', BuildingDetailView.as_view(), name='building-detail'),
     path('buildings/company/<int:company_id>/', BuildingByCompanyView.as_view(), name='building-by-company'),
+    path('buildings/company/<int:company_id>/nearby/', BuildingsNearbyView.as_view(), name='buildings-nearby'),
+    path('buildings/company/<int:company_id>/viewport/', BuildingViewportView.as_view(), name='buildings-viewport'),
     path('buildings/vacant/<int:company_id>/', BuildingsWithVacantUnitsView.as_view(), name='buildings-with-vacant-units'),
     path('buildings/occupied/<int:company_id>/', BuildingsWithOccupiedUnitsView.as_view(), name='buildings-with-vacant-units'),
     
@@ -32,6 +50,8 @@ urlpatterns = [
     path('units/<int:pk>/', UnitDetailView.as_view(), name='unit-detail'),
     path('units/<int:id>/edit/', UnitEditAPIView.as_view(), name='unit-edit'),
     path('units/company/<int:company_id>/', UnitsByCompanyView.as_view(), name='units-by-company'),
+    path('units/company/<int:company_id>/available/', AvailableUnitsView.as_view(), name='available-units'),
+    path('units/company/<int:company_id>/bulk/', UnitBulkOperationView.as_view(), name='units-bulk'),
     path('units/<int:building_id>/vacant-units/', VacantUnitsByBuildingView.as_view(), name='vacant-units-by-building'),
     path('units/<int:building_id>/occupied-units/', OccupiedUnitsByBuildingView.as_view(), name='vacant-units-by-building'),
    
@@ -124,6 +144,9 @@ urlpatterns = [
     path('dashboard/tenency-expiring/<int:company_id>/', TenancyExpiringView.as_view(), name='tenency-expiring'),
     path('dashboard/revenue-report/<int:company_id>/', FinancialReportView.as_view(), name='revenue-report'),
     path('dashboard/collection-list/<int:company_id>/',CollectionListView.as_view(),name='collection-list'),
+    path('dashboard/overview/<int:company_id>/', DashboardOverviewView.as_view(), name='dashboard-overview'),
+    path('dashboard/occupancy/<int:company_id>/', OccupancyReportView.as_view(), name='dashboard-occupancy'),
+    path('documents/expiring/<int:company_id>/', ExpiringDocumentsView.as_view(), name='documents-expiring'),
 
     # Reports
     path('tenancies/<int:company_id>/export/', TenancyExportAPIView.as_view(), name='tenancy-export'),
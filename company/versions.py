@@ -0,0 +1,29 @@
+"""
+ETag fingerprints of company records whose representation nests related rows.
+"""
+from rentbiz.utils.conditional import queryset_version
+from .models import AdditionalCharge, PaymentSchedule, Tenancy, Units
+
+
+def tenancy_version(tenancy_id):
+    """Fingerprint of a tenancy, its schedules, charges and their collections."""
+    return '|'.join([
+        queryset_version(
+            Tenancy.objects.filter(pk=tenancy_id),
+            'updated_at', 'tenant__updated_at', 'building__updated_at', 'unit__updated_at',
+            relations=['tenant__tenant_comp', 'building__build_comp', 'unit__unit_comp'],
+        ),
+        # The nested building carries the occupancy counts of all its units.
+        queryset_version(
+            Units.objects.filter(building__tenancies__pk=tenancy_id), 'updated_at'),
+        queryset_version(
+            PaymentSchedule.objects.filter(tenancy_id=tenancy_id),
+            'updated_at', 'charge_type__updated_at',
+            'paymentdistribution__id', 'paymentdistribution__collection__updated_at',
+        ),
+        queryset_version(
+            AdditionalCharge.objects.filter(tenancy_id=tenancy_id),
+            'updated_at', 'charge_type__updated_at',
+            'paymentdistribution__id', 'paymentdistribution__collection__updated_at',
+        ),
+    ])
@@ -2,6 +2,18 @@
 # Django imports
 # ------------------------------------------------------------------
 from rentbiz.utils.pagination import paginate_queryset, CustomPagination
+from rentbiz.utils.sparse_fields import sparse_context, optimize_queryset
+from rentbiz.utils.listing import CompanyListAPIView
+from rentbiz.utils.images import attach_inline, variant_sizes, variant_url
+from rentbiz.db_router import ReplicaReadMixin
+from accounts import jobs
+from . import expiry, locations, occupancy, unit_operations
+from .availability import available_units
+from .versions import tenancy_version
+from .authentication import authenticate_principal, issue_tokens, PRINCIPAL_USER
+from rentbiz.utils.conditional import (
+    conditional_get, queryset_version, REFERENCE_CACHE_CONTROL
+)
 from .models import *
 from .serializers import *
 from io import BytesIO
@@ -11,7 +23,7 @@ from django.template.loader import get_template
 from datetime import date
 from django.db import IntegrityError
 import re
-from collections import defaultdict
+from collections import Counter, defaultdict
 from urllib.parse import quote
 import uuid
 import json
@@ -20,7 +32,7 @@ import csv
 from datetime import datetime, timedelta, date
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import generics
-from rest_framework import status
+from rest_framework import exceptions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import render, get_object_or_404
@@ -28,19 +40,13 @@ from django.template.loader import render_to_string, get_template
 from django.utils.html import strip_tags
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-from django.http import HttpResponse, StreamingHttpResponse
-from django.db.models import Q
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.db.models import Exists, F, OuterRef, Q
 from django.utils import timezone
 from decimal import Decimal
 from decimal import Decimal, InvalidOperation
 import logging
-logging.basicConfig(level=logging.INFO)
-log = logging.getLogger(__name__)
-
-try:
-    amount = Decimal('invalid')  # This will raise InvalidOperation
-except InvalidOperation:
-    print("Invalid decimal input.")
 
 # ------------------------------------------------------------------
 # REST Framework imports
@@ -67,138 +73,56 @@ logger = logging.getLogger(__name__)
 
 class CompanyLoginView(APIView):
     def post(self, request, *args, **kwargs):
-        print("=== LOGIN REQUEST DEBUG ===")
-        print("Request data:", request.data)
-
         username = request.data.get('username')
         password = request.data.get('password')
 
-        print(f"Username received: '{username}'")
-        print(f"Password received: '{password}'")
-
         if not username or not password:
-            print("Missing username or password")
             return Response({'error': 'Username and password must be provided'}, status=status.HTTP_400_BAD_REQUEST)
 
-        print("\n--- Checking for USER ---")
-        try:
-            user = Users.objects.get(username=username)
-            print(f"Found user: {user.name} (ID: {user.id})")
-            print(f"User status: {user.status}")
+        principal, error = authenticate_principal(username, password)
 
-            if user.status == 'blocked':
-                print("User is blocked")
+        if error == 'blocked':
+            if principal.kind == PRINCIPAL_USER:
                 return Response({'error': 'Your account is blocked. Please contact support.'}, status=status.HTTP_403_FORBIDDEN)
+            return Response({'error': 'Your company is blocked. Please contact support.'}, status=status.HTTP_403_FORBIDDEN)
+        if error:
+            return Response({'error': 'Invalid username or password'}, status=status.HTTP_401_UNAUTHORIZED)
 
-            print(f"Checking user password...")
-            password_check = user.check_password(password)
-            print(f"User password check result: {password_check}")
-
-            if not password_check:
-                print("User password check failed, continuing to company check")
-                raise Users.DoesNotExist()
-
-            print("User login successful, generating tokens...")
-            refresh = RefreshToken()
-            access_token = refresh.access_token
-            access_token['user_id'] = user.id
-            access_token['role'] = 'user'
-
-            refresh['user_id'] = user.id
-            refresh['role'] = 'user'
+        refresh, access_token = issue_tokens(principal)
 
+        if principal.kind == PRINCIPAL_USER:
             response_data = {
-                'id': user.id,
-                'username': user.username,
-                'name': user.name,
-                'email': user.email,
-                'status': user.status,
-                'created_at': user.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                'company_id': user.company.id if user.company else None,
+                'id': principal.id,
+                'username': principal.login,
+                'name': principal.name,
+                'email': principal.email,
+                'status': principal.status,
+                'created_at': principal.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+                'company_id': principal.company_id,
                 'role': 'user',
-                'user_role': user.user_role,
-                'access': str(access_token),
-                'refresh': str(refresh),
-            }
-            print("User login response:", response_data)
-            return Response(response_data, status=status.HTTP_200_OK)
-
-        except Users.DoesNotExist:
-            print("User not found or password incorrect")
-
-        # Try to find company
-        print("\n--- Checking for COMPANY ---")
-        try:
-            print(f"Looking for company with user_id: '{username}'")
-            company = Company.objects.get(user_id=username)
-            print(f"Found company: {company.company_name} (ID: {company.id})")
-            print(f"Company user_id: {company.user_id}")
-            print(f"Company status: {company.status}")
-            print(
-                f"Company password hash: {company.password[:50]}..." if company.password else "No password set")
-
-            if company.status == 'blocked':
-                print("Company is blocked")
-                return Response({'error': 'Your company is blocked. Please contact support.'}, status=status.HTTP_403_FORBIDDEN)
-
-            print(f"Checking company password...")
-            password_check = company.check_password(password)
-            print(f"Company password check result: {password_check}")
-
-            # If password check fails, try to detect if it's a plain text password
-            if not password_check:
-                print(
-                    "Password check failed, checking if password is stored as plain text...")
-
-                # Check if the stored password matches the input password directly (plain text)
-                if company.password == password:
-                    print("Password was stored as plain text! Fixing it now...")
-                    # Hash the password properly
-                    company.set_password(password)
-                    print("Password has been hashed and saved properly")
-
-                    # Now the password check should work
-                    password_check = company.check_password(password)
-                    print(f"Password check after fixing: {password_check}")
-                else:
-                    print("Password doesn't match plain text either")
-
-                if not password_check:
-                    print("Company password check failed even after plain text fix")
-                    raise Company.DoesNotExist()
-
-            print("Company login successful, generating tokens...")
-            refresh = RefreshToken()
-            access_token = refresh.access_token
-            access_token['user_id'] = company.user_id
-            access_token['role'] = 'company'
-
-            refresh['user_id'] = company.user_id
-            refresh['role'] = 'company'
-
-            response_data = {
-                'id': company.id,
-                'user_id': company.user_id,
-                'company_name': company.company_name,
-                'company_admin_name': company.company_admin_name,
-                'username': company.user_id,
-                'phone_no1': company.phone_no1,
-                'phone_no2': company.phone_no2,
-                'email_address': company.email_address,
-                'created_at': company.date_joined.strftime('%Y-%m-%d %H:%M:%S'),
-                'company_logo': company.company_logo.url if company.company_logo else None,
-                'status': company.status,
-                'role': 'company',
+                'user_role': principal.user_role,
                 'access': str(access_token),
                 'refresh': str(refresh),
             }
-            print("Company login response:", response_data)
             return Response(response_data, status=status.HTTP_200_OK)
 
-        except Company.DoesNotExist:
-            print("Company not found or password incorrect")
-            print("=== LOGIN FAILED ===")
-            return Response({'error': 'Invalid username or password'}, status=status.HTTP_401_UNAUTHORIZED)
+        response_data = {
+            'id': principal.id,
+            'user_id': principal.login,
+            'company_name': principal.name,
+            'company_admin_name': principal.admin_name,
+            'username': principal.login,
+            'phone_no1': principal.phone_no1,
+            'phone_no2': principal.phone_no2,
+            'email_address': principal.email,
+            'created_at': principal.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'company_logo': principal.logo_url,
+            'status': principal.status,
+            'role': 'company',
+            'access': str(access_token),
+            'refresh': str(refresh),
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
 
 
 class UserCreateAPIView(APIView):
@@ -209,9 +133,9 @@ class UserCreateAPIView(APIView):
 
             try:
                 self.send_welcome_email_to_user(user)
-                logger.info(f"User created and email sent to: {user.email}")
+                logger.info("User created and email sent to: %s", user.email)
             except Exception as e:
-                logger.error(f"Error sending user welcome email: {str(e)}")
+                logger.error("Error sending user welcome email: %s", e)
 
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -225,7 +149,8 @@ class UserCreateAPIView(APIView):
             "email": user.email,
             "username": user.username,
 
-            "company_name": user.company.company_name if user.company else "N/A"
+            "company_name": user.company.company_name if user.company else "N/A",
+            "logo_cid": "logo" if user.company_logo else None,
         }
 
         html_message = render_to_string("users/add_users.html", context)
@@ -239,12 +164,7 @@ class UserCreateAPIView(APIView):
         )
         email.attach_alternative(html_message, "text/html")
 
-        if user.company_logo:
-            logo_file = user.company_logo
-            logo_file.open()
-            email.attach(logo_file.name, logo_file.read(),
-                         logo_file.file.content_type)
-            logo_file.close()
+        attach_inline(email, user.company_logo, user.logo_variants, cid="logo")
 
         email.send(fail_silently=False)
 
@@ -299,7 +219,7 @@ class UserDetailAPIView(APIView):
 
 class BuildingCreateView(APIView):
     def post(self, request, *args, **kwargs):
-        print("Request data:", request.data)
+        logger.debug("Request data: %s", request.data)
 
         def get_value_or_none(key, convert_type=None):
             value = request.data.get(key, '')
@@ -347,14 +267,14 @@ class BuildingCreateView(APIView):
 
         for index in sorted(document_groups.keys()):
             doc_data = document_groups[index]
-            if 'upload_file' in doc_data:
+            if 'upload_file' in doc_data or 'upload_id' in doc_data:
                 documents_data.append(doc_data)
 
         # Combine building and documents data
         final_data = building_data.copy()
         final_data['build_comp'] = documents_data
 
-        print("Processed data:", final_data)
+        logger.debug("Processed data: %s", final_data)
 
         # Serialize and save
         serializer = BuildingSerializer(data=final_data)
@@ -362,7 +282,7 @@ class BuildingCreateView(APIView):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        print("Serializer errors:", serializer.errors)
+        logger.debug("Serializer errors: %s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -373,25 +293,28 @@ class BuildingDetailView(APIView):
         except Building.DoesNotExist:
             return None
 
+    def get_etag(self, request, pk):
+        return '|'.join([
+            queryset_version(Building.objects.filter(pk=pk), 'updated_at', relations=['build_comp']),
+            # The occupancy counts change with any unit's status.
+            queryset_version(Units.objects.filter(building_id=pk), 'updated_at'),
+        ])
+
+    @conditional_get()
     def get(self, request, pk):
-        building = self.get_object(pk)
+        building = optimize_queryset(Building.objects.filter(pk=pk), BuildingSerializer).first()
         if not building:
             return Response({'error': 'Building not found'}, status=status.HTTP_404_NOT_FOUND)
 
         serializer = BuildingSerializer(building)
-        unit_count = building.unit_building.count()
-
-        data = serializer.data
-        data['unit_count'] = unit_count
-
-        return Response(data)
+        return Response(serializer.data)
 
     def put(self, request, pk):
         building = self.get_object(pk)
         if not building:
             return Response({'error': 'Building not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        print("Request data:", request.data)
+        logger.debug("Request data: %s", request.data)
 
         def get_value_or_none(key, convert_type=None):
             value = request.data.get(key, '')
@@ -442,7 +365,7 @@ class BuildingDetailView(APIView):
                 for index in sorted(document_groups.keys()):
                     doc_data = document_groups[index]
 
-                    if any(key in doc_data for key in ['doc_type', 'number', 'issued_date', 'expiry_date', 'upload_file']):
+                    if any(key in doc_data for key in ['doc_type', 'number', 'issued_date', 'expiry_date', 'upload_file', 'upload_id']):
 
                         if 'id' in doc_data and doc_data['id']:
                             try:
@@ -467,7 +390,7 @@ class BuildingDetailView(APIView):
             for index in sorted(document_groups.keys()):
                 doc_data = document_groups[index]
 
-                if any(key in doc_data for key in ['doc_type', 'number', 'issued_date', 'expiry_date', 'upload_file']):
+                if any(key in doc_data for key in ['doc_type', 'number', 'issued_date', 'expiry_date', 'upload_file', 'upload_id']):
 
                     if 'id' in doc_data and doc_data['id']:
                         try:
@@ -480,11 +403,11 @@ class BuildingDetailView(APIView):
 
         if documents_provided:
             final_data['build_comp'] = documents_data
-            print("Documents data included:", documents_data)
+            logger.debug("Documents data included: %s", documents_data)
         else:
-            print("No document data provided - preserving existing documents")
+            logger.debug("No document data provided - preserving existing documents")
 
-        print("Processed data:", final_data)
+        logger.debug("Processed data: %s", final_data)
 
         serializer = BuildingSerializer(
             building, data=final_data, partial=True)
@@ -492,7 +415,7 @@ class BuildingDetailView(APIView):
             serializer.save()
             return Response(serializer.data)
 
-        print("Serializer errors:", serializer.errors)
+        logger.debug("Serializer errors: %s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, pk):
@@ -611,8 +534,11 @@ class BuildingDetailView(APIView):
 #         return Response({'message': 'Building deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
 
 
-class BuildingByCompanyView(APIView):
-    def get(self, request, company_id):
+class BuildingByCompanyView(CompanyListAPIView):
+    serializer_class = BuildingSerializer
+    query_budget = 3
+
+    def get_queryset(self, request, company_id):
         status_filter = request.query_params.get('status', '').strip().lower()
         search_query = request.query_params.get('search', '').strip()
         buildings = Building.objects.filter(company__id=company_id)
@@ -626,14 +552,71 @@ class BuildingByCompanyView(APIView):
             )
         if status_filter in ['active', 'inactive']:
             buildings = buildings.filter(status=status_filter)
-        buildings = buildings.order_by('id')
+        return buildings.order_by('id')
+
+
+def _location_params(params, names):
+    values = []
+    for name in names:
+        try:
+            values.append(float(params[name]))
+        except KeyError:
+            raise exceptions.ValidationError({'error': f'{name} is required'})
+        except ValueError:
+            raise exceptions.ValidationError({'error': f'{name} must be a number'})
+    return values
+
 
-        return paginate_queryset(buildings, request, BuildingSerializer)
+def _status_params(params):
+    return [value for value in params.get('status', '').lower().split(',') if value] or None
+
+
+class BuildingsNearbyView(APIView):
+    """
+    Buildings within ``?radius=`` km (default 2, at most 100) of
+    ``?lat=&lng=``, nearest first, with their distance. ``?limit=``
+    caps the list (default 100, at most 1000); ``count`` is the total.
+    """
+    def get(self, request, company_id):
+        params = request.query_params
+        latitude, longitude = _location_params(params, ('lat', 'lng'))
+        try:
+            radius = float(params.get('radius', 2))
+        except ValueError:
+            return Response({'error': 'radius must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < radius <= 100:
+            return Response({'error': 'radius must be between 0 and 100 km'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(params.get('limit', 100))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, 1000))
+        try:
+            count, buildings = locations.buildings_near(
+                company_id, latitude, longitude, radius, limit, statuses=_status_params(params))
+        except locations.LocationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'count': count, 'radius_km': radius, 'results': buildings}, status=status.HTTP_200_OK)
+
+
+class BuildingViewportView(APIView):
+    """
+    Buildings inside the map viewport ``?south=&west=&north=&east=``
+    (``west > east`` crosses the antimeridian). Crowded viewports, such as
+    zoomed-out maps, come back as ``clusters`` instead of ``buildings``.
+    """
+    def get(self, request, company_id):
+        box = _location_params(request.query_params, ('south', 'west', 'north', 'east'))
+        try:
+            result = locations.viewport(company_id, *box, statuses=_status_params(request.query_params))
+        except locations.LocationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_200_OK)
 
 
 class UnitCreateView(APIView):
     def post(self, request):
-        print("Raw request data:", request.data)
+        logger.debug("Raw request data: %s", request.data)
 
         # Extract base unit data (excluding nested unit_comp fields)
         unit_data = {}
@@ -646,28 +629,28 @@ class UnitCreateView(APIView):
 
         # Always assign unit_comp (even if it's an empty list)
         unit_data['unit_comp'] = unit_comp_data
-        print("Processed unit data:", unit_data)
+        logger.debug("Processed unit data: %s", unit_data)
 
         serializer = UnitSerializer(data=unit_data)
         if serializer.is_valid():
             serializer.save()
-            print("Successfully created unit:", serializer.data)
+            logger.debug("Successfully created unit: %s", serializer.data)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
-            print("Serializer errors:", serializer.errors)
+            logger.debug("Serializer errors: %s", serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def parse_unit_comp_data(self, data, files):
         documents = defaultdict(dict)
 
-        print("Starting to parse unit_comp data...")
-        print("Available keys:", list(data.keys()))
-        print("Available file keys:", list(files.keys()))
+        logger.debug("Starting to parse unit_comp data...")
+        logger.debug("Available keys: %s", list(data.keys()))
+        logger.debug("Available file keys: %s", list(files.keys()))
 
         # Handle regular form fields (non-file fields)
         for key, value in data.items():
-            print(
-                f"Processing key: {key}, value: {value}, type: {type(value)}")
+            logger.debug(
+                "Processing key: %s, value: %s, type: %s", key, value, type(value))
             if key.startswith("unit_comp["):
                 try:
                     # Remove unit_comp[ and split by ][
@@ -691,18 +674,19 @@ class UnitCreateView(APIView):
                             value, list) and value else value
 
                         documents[index][field] = actual_value
-                        print(
-                            f"✅ Parsed field: {key} -> index={index}, field={field}, value={actual_value}")
+                        logger.debug(
+                            "Parsed field: %s -> index=%s, field=%s, value=%s",
+                            key, index, field, actual_value)
                     else:
-                        print(f"❌ Invalid key format: {key}, parts: {parts}")
+                        logger.warning("Invalid key format: %s, parts: %s", key, parts)
 
                 except (ValueError, IndexError, AttributeError) as e:
-                    print(f"❌ Error parsing key {key}: {e}")
+                    logger.warning("Error parsing key %s: %s", key, e)
 
         # Handle file uploads
         for file_key, file_value in files.items():
-            print(
-                f"Processing file key: {file_key}, value type: {type(file_value)}")
+            logger.debug(
+                "Processing file key: %s, value type: %s", file_key, type(file_value))
             if file_key.startswith("unit_comp["):
                 try:
                     # Remove unit_comp[ and split by ][
@@ -719,21 +703,21 @@ class UnitCreateView(APIView):
 
                         if field == 'upload_file':
                             documents[index][field] = file_value
-                            print(
-                                f"✅ Parsed file: {file_key} -> index={index}, field={field}")
+                            logger.debug(
+                                "Parsed file: %s -> index=%s, field=%s", file_key, index, field)
                         else:
-                            print(f"❌ Unexpected file field: {field}")
+                            logger.warning("Unexpected file field: %s", field)
                     else:
-                        print(
-                            f"❌ Invalid file key format: {file_key}, parts: {parts}")
+                        logger.warning(
+                            "Invalid file key format: %s, parts: %s", file_key, parts)
 
                 except (ValueError, IndexError) as e:
-                    print(f"❌ Error parsing file key {file_key}: {e}")
+                    logger.warning("Error parsing file key %s: %s", file_key, e)
 
-        print("Raw documents dict:", dict(documents))
+        logger.debug("Raw documents dict: %s", dict(documents))
         result = list(documents.values())
-        print("Final unit_comp list:", result)
-        print("Number of documents parsed:", len(result))
+        logger.debug("Final unit_comp list: %s", result)
+        logger.debug("Number of documents parsed: %s", len(result))
 
         return result
 
@@ -750,8 +734,11 @@ class UnitDetailView(APIView):
         return Response({'message': 'Unit deleted'}, status=status.HTTP_204_NO_CONTENT)
 
 
-class UnitsByCompanyView(APIView):
-    def get(self, request, company_id):
+class UnitsByCompanyView(CompanyListAPIView):
+    serializer_class = UnitGetSerializer
+    query_budget = 5
+
+    def get_queryset(self, request, company_id):
         units = Units.objects.filter(company__id=company_id)
         search_query = request.query_params.get('search', '').strip()
         status_filter = request.query_params.get('status', '').strip().lower()
@@ -767,9 +754,89 @@ class UnitsByCompanyView(APIView):
             )
         if status_filter in ['occupied', 'renovation', 'vacant', 'disputed']:
             units = units.filter(unit_status__iexact=status_filter)
-        units = units.order_by('id')
+        return units.order_by('id')
+
+class AvailableUnitsView(CompanyListAPIView):
+    """
+    Units free for every day of ``?start=`` to ``?end=`` (YYYY-MM-DD), across
+    all buildings; narrow with ``?unit_type=``, ``?bedrooms=`` and
+    ``?building=``.
+    """
+    serializer_class = UnitGetSerializer
+    # Including the load of a process's first interval tree for the company.
+    query_budget = 7
+
+    def get_queryset(self, request, company_id):
+        params = request.query_params
+        try:
+            start = date.fromisoformat(params.get('start', ''))
+            end = date.fromisoformat(params.get('end', ''))
+        except ValueError:
+            raise exceptions.ValidationError({'error': 'start and end must be YYYY-MM-DD dates'})
+        if start > end:
+            raise exceptions.ValidationError({'error': 'start must not be after end'})
+
+        filters = {}
+        for name in ('unit_type', 'bedrooms', 'building'):
+            value = params.get(name, '').strip()
+            if value:
+                try:
+                    filters[name] = int(value)
+                except ValueError:
+                    raise exceptions.ValidationError({'error': f'{name} must be an integer'})
+        return available_units(company_id, start, end, **filters).order_by('id')
+
+
+class ExpiringDocumentsView(CompanyListAPIView):
+    """
+    Building, unit and tenant documents and tenant/sponsor IDs expiring in
+    the next ``?days=`` (default 30); ``?kind=`` narrows to one kind and
+    ``?expired=true`` also lists documents that have already expired.
+    """
+    serializer_class = DocumentExpirySerializer
+    query_budget = 2
+
+    def get_queryset(self, request, company_id):
+        params = request.query_params
+        try:
+            days = int(params.get('days', expiry.DEFAULT_NOTICE_DAYS))
+        except ValueError:
+            raise exceptions.ValidationError({'error': 'days must be an integer'})
+        if not 0 <= days <= 3650:
+            raise exceptions.ValidationError({'error': 'days must be between 0 and 3650'})
+
+        documents = expiry.expiring_documents(
+            company_id, days, include_expired=params.get('expired', '').lower() == 'true')
+        kind = params.get('kind', '').strip()
+        if kind:
+            if kind not in expiry.SOURCES:
+                raise exceptions.ValidationError({'error': f"kind must be one of {', '.join(expiry.SOURCES)}"})
+            documents = documents.filter(kind=kind)
+        return documents.order_by('expiry_date', 'id')
+
+
+class UnitBulkOperationView(APIView):
+    """
+    Change the status or fields of every unit matching ``buildings``,
+    ``unit_types``, ``ids`` and ``statuses`` in one UPDATE, e.g.
+    ``{"buildings": [4], "changes": {"unit_status": "renovation"}}``.
+    Units held by a tenancy keep their status and are reported as blocked.
+    """
+    def post(self, request, company_id):
+        serializer = UnitBulkOperationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        try:
+            result = unit_operations.bulk_update_units(
+                company_id, dict(data['changes']), dry_run=data['dry_run'],
+                buildings=data.get('buildings'), unit_types=data.get('unit_types'),
+                ids=data.get('ids'), statuses=data.get('statuses'),
+            )
+        except unit_operations.BulkUnitError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_200_OK)
 
-        return paginate_queryset(units, request, UnitGetSerializer)
 
 class UnitEditAPIView(APIView):
     def get_object(self, id):
@@ -781,7 +848,7 @@ class UnitEditAPIView(APIView):
         return Response(serializer.data)
 
     def put(self, request, id):
-        print("Incoming PUT data:", request.data)
+        logger.debug("Incoming PUT data: %s", request.data)
         unit = self.get_object(id)
 
         # Extract unit data (excluding document-related fields)
@@ -805,9 +872,9 @@ class UnitEditAPIView(APIView):
                 if isinstance(unit_comp_json, list):
                     unit_comp_json = unit_comp_json[0]
                 unit_comp_data = json.loads(unit_comp_json)
-                print("Parsed unit_comp_json:", unit_comp_data)
+                logger.debug("Parsed unit_comp_json: %s", unit_comp_data)
             except (json.JSONDecodeError, TypeError) as e:
-                print(f"Error parsing unit_comp_json: {e}")
+                logger.warning("Error parsing unit_comp_json: %s", e)
                 return Response({"error": "Invalid unit_comp_json format"}, status=status.HTTP_400_BAD_REQUEST)
 
         # Handle file uploads
@@ -815,20 +882,20 @@ class UnitEditAPIView(APIView):
             file_key = f'document_file_{index}'
             if file_key in request.FILES:
                 doc_data['upload_file'] = request.FILES[file_key]
-                print(f"Added file for document {index}: {doc_data['upload_file'].name}")
+                logger.debug("Added file for document %s: %s", index, doc_data['upload_file'].name)
 
         # Add unit_comp_data to unit_data
         unit_data['unit_comp'] = unit_comp_data
-        print("Processed unit data:", unit_data)
+        logger.debug("Processed unit data: %s", unit_data)
 
         # Update unit with serializer
         serializer = UnitSerializer(unit, data=unit_data, partial=True)
         if serializer.is_valid():
             serializer.save()
-            print("Unit updated successfully")
+            logger.debug("Unit updated successfully")
             return Response(serializer.data)
         else:
-            print("Errors in serializer:", serializer.errors)
+            logger.debug("Errors in serializer: %s", serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -842,6 +909,10 @@ class UnitTypeListCreateAPIView(APIView):
 
 
 class UnitTypeByCompanyAPIView(APIView):
+    def get_etag(self, request, company_id):
+        return queryset_version(UnitType.objects.filter(company_id=company_id), 'updated_at')
+
+    @conditional_get(REFERENCE_CACHE_CONTROL)
     def get(self, request, company_id):
         unit_types = UnitType.objects.filter(company_id=company_id)
         search_query = request.query_params.get('search', '').strip()
@@ -900,6 +971,11 @@ class MasterDocumentListCreateAPIView(APIView):
 
 
 class MasterDocumentByCompanyAPIView(APIView):
+    def get_etag(self, request, company_id):
+        return queryset_version(
+            MasterDocumentType.objects.filter(company_id=company_id), 'updated_at')
+
+    @conditional_get(REFERENCE_CACHE_CONTROL)
     def get(self, request, company_id):
         unit_types = MasterDocumentType.objects.filter(company_id=company_id)
         serializer = MasterDocumentTypeSerializer(unit_types, many=True)
@@ -939,6 +1015,11 @@ class IDListCreateAPIView(APIView):
 
 
 class IDByCompanyAPIView(APIView):
+    def get_etag(self, request, company_id):
+        return queryset_version(
+            IDType.objects.filter(company_id=company_id), 'updated_at')
+
+    @conditional_get(REFERENCE_CACHE_CONTROL)
     def get(self, request, company_id):
         unit_types = IDType.objects.filter(company_id=company_id)
         serializer = IDTypeSerializer(unit_types, many=True)
@@ -999,6 +1080,11 @@ class CurrencyDetailView(APIView):
 
 
 class CurrencyByCompanyAPIView(APIView):
+    def get_etag(self, request, company_id):
+        return queryset_version(
+            Currency.objects.filter(company_id=company_id), 'updated_at')
+
+    @conditional_get(REFERENCE_CACHE_CONTROL)
     def get(self, request, company_id):
         unit_types = Currency.objects.filter(company_id=company_id)
         serializer = CurrencySerializer(unit_types, many=True)
@@ -1007,7 +1093,7 @@ class CurrencyByCompanyAPIView(APIView):
 
 class TenantCreateView(APIView):
     def post(self, request):
-        print("Raw request data:", request.data)
+        logger.debug("Raw request data: %s", request.data)
 
         tenant_data = {}
         for key, value in request.data.items():
@@ -1032,15 +1118,15 @@ class TenantCreateView(APIView):
             except json.JSONDecodeError:
                 return Response({'error': 'Invalid JSON in document_comp_json'}, status=status.HTTP_400_BAD_REQUEST)
 
-        print("Processed tenant data:", tenant_data)
+        logger.debug("Processed tenant data: %s", tenant_data)
 
         serializer = TenantSerializer(data=tenant_data)
         if serializer.is_valid():
             tenant = serializer.save()
-            print("Successfully created tenant:", serializer.data)
+            logger.debug("Successfully created tenant: %s", serializer.data)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
-            print("Serializer errors:", serializer.errors)
+            logger.debug("Serializer errors: %s", serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -1059,7 +1145,7 @@ class TenantDetailView(APIView):
         return Response(serializer.data)
 
     def put(self, request, pk):
-        print("Raw data:", request.data)
+        logger.debug("Raw data: %s", request.data)
         tenant = self.get_object(pk)
         if not tenant:
             return Response({'error': 'Tenant not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -1085,7 +1171,10 @@ class TenantDetailView(APIView):
             }
             file_key = f'tenant_comp[{comp_index}][upload_file]'
             existing_file_key = f'tenant_comp[{comp_index}][existing_file_url]'
-            if file_key in request.FILES:
+            upload_key = f'tenant_comp[{comp_index}][upload_id]'
+            if upload_key in request.data:
+                doc_data['upload_id'] = request.data.get(upload_key)
+            elif file_key in request.FILES:
                 doc_data['upload_file'] = request.FILES[file_key]
             elif file_key in request.data:
                 doc_data['upload_file'] = request.data.get(file_key)
@@ -1096,13 +1185,13 @@ class TenantDetailView(APIView):
             comp_index += 1
         if tenant_comp:
             tenant_data['tenant_comp'] = tenant_comp
-        print("Processed tenant data:", tenant_data)
+        logger.debug("Processed tenant data: %s", tenant_data)
         serializer = TenantSerializer(tenant, data=tenant_data, partial=True)
         if serializer.is_valid():
             serializer.save()
-            print("Updated tenant:", serializer.data)
+            logger.debug("Updated tenant: %s", serializer.data)
             return Response(serializer.data)
-        print("Serializer errors:", serializer.errors)
+        logger.debug("Serializer errors: %s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, pk):
@@ -1113,8 +1202,11 @@ class TenantDetailView(APIView):
         return Response({'message': 'Building deleted'}, status=status.HTTP_204_NO_CONTENT)
 
 
-class TenantByCompanyView(APIView):
-    def get(self, request, company_id):
+class TenantByCompanyView(CompanyListAPIView):
+    serializer_class = TenantGetSerializer
+    query_budget = 3
+
+    def get_queryset(self, request, company_id):
         search_query = request.query_params.get('search', '').strip()
         status_filter = request.query_params.get('status', '').strip().lower()
 
@@ -1132,9 +1224,7 @@ class TenantByCompanyView(APIView):
         if status_filter in ['active', 'inactive']:
             tenants = tenants.filter(status__iexact=status_filter)
 
-        tenants = tenants.order_by('id')
-
-        return paginate_queryset(tenants, request, TenantGetSerializer)
+        return tenants.order_by('id')
 
 
 class ChargecodeListCreateAPIView(APIView):
@@ -1147,6 +1237,11 @@ class ChargecodeListCreateAPIView(APIView):
 
 
 class ChargecodeByCompanyAPIView(APIView):
+    def get_etag(self, request, company_id):
+        return queryset_version(
+            ChargeCode.objects.filter(company_id=company_id), 'updated_at')
+
+    @conditional_get(REFERENCE_CACHE_CONTROL)
     def get(self, request, company_id):
         unit_types = ChargeCode.objects.filter(company_id=company_id)
         serializer = ChargeCodeSerializer(unit_types, many=True)
@@ -1228,9 +1323,11 @@ class TerminateTenancyAPIView(APIView):
                 tenancy.is_termination = True
                 tenancy.status = "terminated"
                 tenancy.save()
+                occupancy.vacate(tenancy)
 
                 response_data = {
-                    'tenancy': TenancyListSerializer(tenancy).data
+                    'tenancy': TenancyListSerializer(
+                        tenancy, context=sparse_context(request)).data
                 }
 
                 if apply_charge:
@@ -1251,7 +1348,7 @@ class TerminateTenancyAPIView(APIView):
                         company=tenancy.company,
                         title='Termination Charge Code',
                         defaults={
-                            'user': request.user if request.user.is_authenticated else None
+                            'user_id': getattr(request.user, 'users_id', None)
                         }
                     )
 
@@ -1262,7 +1359,7 @@ class TerminateTenancyAPIView(APIView):
                         defaults={
                             'name': 'Termination Charge',
                             'charge_code': charge_code,
-                            'user': request.user if request.user.is_authenticated else None
+                            'user_id': getattr(request.user, 'users_id', None)
                         }
                     )
 
@@ -1321,6 +1418,11 @@ class ChargesListCreateAPIView(APIView):
 
 
 class ChargesByCompanyAPIView(APIView):
+    def get_etag(self, request, company_id):
+        return queryset_version(
+            Charges.objects.filter(company_id=company_id), 'updated_at', 'charge_code__updated_at', 'taxes__updated_at')
+
+    @conditional_get(REFERENCE_CACHE_CONTROL)
     def get(self, request, company_id):
         unit_types = Charges.objects.filter(company_id=company_id)
         serializer = ChargesGetSerializer(unit_types, many=True)
@@ -1428,10 +1530,11 @@ class PaymentSchedulePreviewView(APIView):
             reference_date_obj = datetime.strptime(
                 reference_date, '%Y-%m-%d').date() if reference_date else date.today()
 
-            print(
-                f"Calculating tax for charge: {charge.name}, amount: {amount}, reference_date: {reference_date_obj}")
+            logger.debug(
+                "Calculating tax for charge: %s, amount: %s, reference_date: %s",
+                charge.name, amount, reference_date_obj)
 
-            taxes = charge.taxes.filter(
+            taxes = list(charge.taxes.filter(
                 company=charge.company,
                 is_active=True,
                 applicable_from__lte=reference_date_obj,
@@ -1441,9 +1544,9 @@ class PaymentSchedulePreviewView(APIView):
                 is_active=True,
                 applicable_from__lte=reference_date_obj,
                 applicable_to__isnull=True
-            )
+            ))
 
-            print(f"Found {taxes.count()} taxes for charge {charge.name}")
+            logger.debug("Found %d taxes for charge %s", len(taxes), charge.name)
 
             for tax in taxes:
                 tax_percentage = Decimal(str(tax.tax_percentage))
@@ -1456,16 +1559,17 @@ class PaymentSchedulePreviewView(APIView):
                     # Convert to string
                     'tax_amount': str(tax_contribution.quantize(Decimal('0.01')))
                 })
-                print(
-                    f"Tax: {tax.tax_type}, percentage: {tax_percentage}, contribution: {tax_contribution}")
+                logger.debug(
+                    "Tax: %s, percentage: %s, contribution: %s",
+                    tax.tax_type, tax_percentage, tax_contribution)
 
-            if not taxes.exists():
-                print(
-                    f"No applicable taxes found for charge {charge.name} on {reference_date_obj}")
+            if not taxes:
+                logger.debug(
+                    "No applicable taxes found for charge %s on %s", charge.name, reference_date_obj)
 
             return tax_amount.quantize(Decimal('0.01')), tax_details
         except Exception as e:
-            print(f"Error calculating tax for charge {charge.name}: {str(e)}")
+            logger.warning("Error calculating tax for charge %s: %s", charge.name, e)
             return Decimal('0.00'), []
 
     def _generate_deposit_schedule(self, validated_data, charge_types):
@@ -1809,11 +1913,16 @@ class TenancyDetailView(APIView):
     def get_object(self, pk):
         return get_object_or_404(Tenancy, pk=pk)
 
+    def get_etag(self, request, pk):
+        return tenancy_version(pk)
+
+    @conditional_get()
     def get(self, request, pk):
         try:
-            tenancy = Tenancy.objects.select_related(
-                'tenant', 'building', 'unit').get(pk=pk)
-            serializer = TenancyListSerializer(tenancy)
+            context = sparse_context(request)
+            tenancy = optimize_queryset(
+                Tenancy.objects.all(), TenancyListSerializer, context).get(pk=pk)
+            serializer = TenancyListSerializer(tenancy, context=context)
 
             return Response({
                 'success': True,
@@ -1913,18 +2022,18 @@ class TenancyByCompanyAPIView(APIView):
             tenancies = tenancies.filter(end_date__lte=end_date)
 
         # Apply pagination
-        paginator = CustomPagination()
-        paginated_qs = paginator.paginate_queryset(tenancies, request)
-        serializer = TenancyListSerializer(paginated_qs, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        context = sparse_context(request)
+        tenancies = optimize_queryset(tenancies, TenancyListSerializer, context)
+        return paginate_queryset(tenancies, request, TenancyListSerializer, context=context)
 
 
-class PendingTenanciesByCompanyAPIView(APIView):
-    def get(self, request, company_id):
-        pending_tenancies = Tenancy.objects.filter(
-            company_id=company_id, status='pending')
-        serializer = TenancyListSerializer(pending_tenancies, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+class PendingTenanciesByCompanyAPIView(CompanyListAPIView):
+    serializer_class = TenancyListSerializer
+    query_budget = 12
+
+    def get_queryset(self, request, company_id):
+        return Tenancy.objects.filter(
+            company_id=company_id, status='pending').order_by('id')
 
 
 class TenanciesByUnitView(APIView):
@@ -1975,28 +2084,31 @@ class TenanciesByUnitView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class ActiveTenanciesByCompanyAPIView(APIView):
-    def get(self, request, company_id):
-        pending_tenancies = Tenancy.objects.filter(
-            company_id=company_id, status='active')
-        serializer = TenancyListSerializer(pending_tenancies, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+class ActiveTenanciesByCompanyAPIView(CompanyListAPIView):
+    serializer_class = TenancyListSerializer
+    query_budget = 12
 
+    def get_queryset(self, request, company_id):
+        return Tenancy.objects.filter(
+            company_id=company_id, status='active').order_by('id')
 
-class TerminatiionTenanciesByCompanyAPIView(APIView):
-    def get(self, request, company_id):
-        pending_tenancies = Tenancy.objects.filter(
-            company_id=company_id, is_termination=True)
-        serializer = TenancyListSerializer(pending_tenancies, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
 
+class TerminatiionTenanciesByCompanyAPIView(CompanyListAPIView):
+    serializer_class = TenancyListSerializer
+    query_budget = 12
+
+    def get_queryset(self, request, company_id):
+        return Tenancy.objects.filter(
+            company_id=company_id, is_termination=True).order_by('id')
 
-class CloseTenanciesByCompanyAPIView(APIView):
-    def get(self, request, company_id):
-        pending_tenancies = Tenancy.objects.filter(
-            company_id=company_id, is_close=True)
-        serializer = TenancyListSerializer(pending_tenancies, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+
+class CloseTenanciesByCompanyAPIView(CompanyListAPIView):
+    serializer_class = TenancyListSerializer
+    query_budget = 12
+
+    def get_queryset(self, request, company_id):
+        return Tenancy.objects.filter(
+            company_id=company_id, is_close=True).order_by('id')
 
 
 class VacantUnitsByBuildingView(APIView):
@@ -2013,11 +2125,16 @@ class VacantUnitsByBuildingView(APIView):
 
 
 class BuildingsWithVacantUnitsView(APIView):
+    query_budget = 2
+
     def get(self, request, company_id):
+        # Exists rather than a join, so the unit counts are not limited to
+        # the matching units and no DISTINCT is needed.
         buildings = Building.objects.filter(
+            Exists(Units.objects.filter(building=OuterRef('pk'), unit_status='vacant')),
             company_id=company_id,
-            unit_building__unit_status='vacant'
-        ).distinct()
+        ).order_by('id')
+        buildings = optimize_queryset(buildings, BuildingSerializer)
         serializer = BuildingSerializer(buildings, many=True)
         return Response(serializer.data)
 
@@ -2037,8 +2154,7 @@ class ConfirmTenancyView(APIView):
             tenancy.status = 'active'
             tenancy.save()
 
-            unit.unit_status = 'occupied'
-            unit.save()
+            occupancy.occupy(tenancy)
 
             # Create default InvoiceAutomationConfig for the tenancy
             InvoiceAutomationConfig.objects.create(
@@ -2077,11 +2193,16 @@ class BuildingUnitsByBuildingView(APIView):
 
 
 class BuildingsWithOccupiedUnitsView(APIView):
+    query_budget = 2
+
     def get(self, request, company_id):
+        # Exists rather than a join, so the unit counts are not limited to
+        # the matching units and no DISTINCT is needed.
         buildings = Building.objects.filter(
+            Exists(Units.objects.filter(building=OuterRef('pk'), unit_status='occupied')),
             company_id=company_id,
-            unit_building__unit_status='occupied'
-        ).distinct()
+        ).order_by('id')
+        buildings = optimize_queryset(buildings, BuildingSerializer)
         serializer = BuildingSerializer(buildings, many=True)
         return Response(serializer.data)
 
@@ -2105,7 +2226,7 @@ class TenancyRenewalView(APIView):
                 'message': 'This tenancy has already been renewed'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        print("Renewal request data:", request.data)
+        logger.debug("Renewal request data: %s", request.data)
 
         serializer = TenancyRenewalSerializer(
             data=request.data,
@@ -2149,6 +2270,21 @@ class UserDetailView(APIView):
             return Response({'error': 'User not found'}, status=404)
 
 
+class UserLogoView(APIView):
+    """Redirects to the user's logo at ``?size=`` (small, medium, large or original)."""
+    def get(self, request, user_id):
+        size = request.query_params.get('size', 'medium')
+        if size != 'original' and size not in variant_sizes():
+            return Response({'error': f"size must be one of {', '.join([*variant_sizes(), 'original'])}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        user = Users.objects.filter(id=user_id).only('company_logo', 'logo_variants').first()
+        if user is None or not user.company_logo:
+            return Response({'error': 'Logo not found'}, status=status.HTTP_404_NOT_FOUND)
+        response = HttpResponseRedirect(variant_url(user.company_logo, user.logo_variants, size))
+        patch_cache_control(response, private=True, max_age=300)
+        return response
+
+
 class TaxesAPIView(APIView):
     """
     API View for managing tax records with versioning support and robust error handling.
@@ -2243,7 +2379,7 @@ class TaxesAPIView(APIView):
 
         except Exception as e:
             # Log unexpected errors for debugging
-            logger.error(f"Unexpected error in GET taxes: {str(e)}")
+            logger.error("Unexpected error in GET taxes: %s", e)
             return Response(
                 {"detail": "An unexpected error occurred while retrieving taxes."},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -2344,14 +2480,14 @@ class TaxesAPIView(APIView):
             except IntegrityError as e:
                 # Handle database constraint violations
                 logger.error(
-                    f"Database integrity error in POST taxes: {str(e)}")
+                    "Database integrity error in POST taxes: %s", e)
                 return Response(
                     {"detail": "A database constraint was violated. Please check your data."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             except ValidationError as e:
                 # Handle validation errors from the model
-                logger.error(f"Validation error in POST taxes: {str(e)}")
+                logger.error("Validation error in POST taxes: %s", e)
                 return Response(
                     {"detail": f"Validation error: {str(e)}"},
                     status=status.HTTP_400_BAD_REQUEST
@@ -2359,7 +2495,7 @@ class TaxesAPIView(APIView):
 
         except Exception as e:
             # Log unexpected errors for debugging
-            logger.error(f"Unexpected error in POST taxes: {str(e)}")
+            logger.error("Unexpected error in POST taxes: %s", e)
             return Response(
                 {"detail": "An unexpected error occurred while creating the tax record."},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -2506,14 +2642,14 @@ class TaxesAPIView(APIView):
             except IntegrityError as e:
                 # Handle database constraint violations
                 logger.error(
-                    f"Database integrity error in PUT taxes: {str(e)}")
+                    "Database integrity error in PUT taxes: %s", e)
                 return Response(
                     {"detail": "A database constraint was violated. Please check your data."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             except ValidationError as e:
                 # Handle validation errors from the model
-                logger.error(f"Validation error in PUT taxes: {str(e)}")
+                logger.error("Validation error in PUT taxes: %s", e)
                 return Response(
                     {"detail": f"Validation error: {str(e)}"},
                     status=status.HTTP_400_BAD_REQUEST
@@ -2521,7 +2657,7 @@ class TaxesAPIView(APIView):
 
         except Exception as e:
             # Log unexpected errors for debugging
-            logger.error(f"Unexpected error in PUT taxes: {str(e)}")
+            logger.error("Unexpected error in PUT taxes: %s", e)
             return Response(
                 {"detail": "An unexpected error occurred while updating the tax record."},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -2598,7 +2734,7 @@ class TaxesAPIView(APIView):
             except IntegrityError as e:
                 # Handle database constraint violations
                 logger.error(
-                    f"Database integrity error in DELETE taxes: {str(e)}")
+                    "Database integrity error in DELETE taxes: %s", e)
                 return Response(
                     {"detail": "A database constraint was violated."},
                     status=status.HTTP_400_BAD_REQUEST
@@ -2606,7 +2742,7 @@ class TaxesAPIView(APIView):
 
         except Exception as e:
             # Log unexpected errors for debugging
-            logger.error(f"Unexpected error in DELETE taxes: {str(e)}")
+            logger.error("Unexpected error in DELETE taxes: %s", e)
             return Response(
                 {"detail": "An unexpected error occurred while deleting the tax record."},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -2915,7 +3051,7 @@ class AdditionalChargeDeleteView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class AdditionalChargeExportCSVView(APIView):
+class AdditionalChargeExportCSVView(ReplicaReadMixin, APIView):
     """
     Export AdditionalCharge objects as CSV, respecting tenancy, status,
     and free‑text `search` filters.
@@ -2999,7 +3135,7 @@ class AdditionalChargeExportCSVView(APIView):
             return response
 
         except Exception as exc:
-            log.exception("AdditionalCharge CSV export failed")
+            logger.exception("AdditionalCharge CSV export failed")
             return Response(
                 {
                     "success": False,
@@ -3012,7 +3148,7 @@ class AdditionalChargeExportCSVView(APIView):
 
 class CreateInvoiceAPIView(APIView):
     def post(self, request):
-        print("Request data:", request.data)
+        logger.debug("Request data: %s", request.data)
         serializer = InvoiceSerializer(data=request.data)
         if serializer.is_valid():
             invoice = serializer.save()
@@ -3020,14 +3156,9 @@ class CreateInvoiceAPIView(APIView):
             # Send email with PDF attachment
             self.send_invoice_email(invoice)
 
-            print("Created invoice:", {
-                'id': invoice.id,
-                'invoice_number': invoice.invoice_number,
-                'company': invoice.company_id,
-                'user': invoice.user_id,
-                'total_amount': str(invoice.total_amount),
-                'status': invoice.status
-            })
+            logger.debug(
+                "Created invoice %s (%s) for company %s, total %s",
+                invoice.id, invoice.invoice_number, invoice.company_id, invoice.total_amount)
             return Response({
                 'success': True,
                 'message': 'Invoice created successfully',
@@ -3038,7 +3169,7 @@ class CreateInvoiceAPIView(APIView):
                     'status': invoice.status
                 }
             }, status=status.HTTP_201_CREATED)
-        print("Serializer errors:", serializer.errors)
+        logger.debug("Serializer errors: %s", serializer.errors)
         return Response({
             'success': False,
             'message': 'Failed to create invoice',
@@ -3102,7 +3233,9 @@ class GetInvoicesByCompanyAPIView(APIView):
                 queryset = queryset.filter(status=status_filter)
 
             # Apply pagination
-            return paginate_queryset(queryset, request, InvoiceGetSerializer)
+            context = sparse_context(request)
+            queryset = optimize_queryset(queryset, InvoiceGetSerializer, context)
+            return paginate_queryset(queryset, request, InvoiceGetSerializer, context=context)
         except Exception as e:
             return Response(
                 {'success': False, 'message': str(e)},
@@ -3133,21 +3266,31 @@ class DeleteInvoiceAPIView(APIView):
 
 
 class InvoiceDetailView(APIView):
-    def get_object(self, pk):
+    def get_object(self, pk, context=None):
         try:
-            return Invoice.objects.get(pk=pk)
+            queryset = optimize_queryset(Invoice.objects.all(), InvoiceGetSerializer, context)
+            return queryset.get(pk=pk)
         except Invoice.DoesNotExist:
             return None
 
+    def get_etag(self, request, pk):
+        tenancy_id = Invoice.objects.filter(pk=pk).values_list('tenancy_id', flat=True).first()
+        return '|'.join([
+            queryset_version(Invoice.objects.filter(pk=pk), 'updated_at'),
+            tenancy_version(tenancy_id),
+        ])
+
+    @conditional_get()
     def get(self, request, pk):
-        invoice = self.get_object(pk)
+        context = sparse_context(request)
+        invoice = self.get_object(pk, context)
         if not invoice:
             return Response({'error': 'Invoice not found'}, status=status.HTTP_404_NOT_FOUND)
-        serializer = InvoiceGetSerializer(invoice)
+        serializer = InvoiceGetSerializer(invoice, context=context)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class InvoiceExportCSVView(APIView):
+class InvoiceExportCSVView(ReplicaReadMixin, APIView):
     """
     Export Invoice objects as CSV, including associated additional charges,
     respecting search, status, and company filters.
@@ -3315,7 +3458,8 @@ class PaymentScheduleAPIView(APIView):
 
                 updated_count = payment_schedules.update(
                     amount=new_amount,
-                    total=new_amount  # Adjust total if needed based on tax/vat
+                    total=new_amount,  # Adjust total if needed based on tax/vat
+                    updated_at=timezone.now()
                 )
                 return Response({
                     "message": f"Updated {updated_count} pending payment schedules with charge type {charge_type}",
@@ -3379,78 +3523,160 @@ class AutoGenerateInvoiceAPIView(APIView):
     def post(self, request):
         """Trigger automatic invoice generation for all configured tenancies"""
         try:
-            results = self.generate_invoices()
+            run = InvoiceRun.claim()
+            if run is None:
+                return Response({
+                    'success': False,
+                    'message': 'An invoice run is already in progress'
+                }, status=status.HTTP_409_CONFLICT)
+            results = self.generate_invoices(run)
             return Response({
                 'success': True,
                 'message': 'Automatic invoice generation completed',
+                'run_id': run.id,
                 'results': results
             }, status=status.HTTP_200_OK)
         except Exception as e:
-            logger.error(f"Error in auto invoice generation: {str(e)}")
+            logger.error("Error in auto invoice generation: %s", e)
             return Response({
                 'success': False,
                 'message': f'Failed to generate invoices: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def generate_invoices(self):
-        """Generate invoices based on automation configurations"""
+    def generate_invoices(self, run=None):
+        """
+        Generate invoices based on automation configurations.
+
+        Progress is checkpointed on ``run`` (a new InvoiceRun when omitted)
+        after every INVOICE_RUN_BATCH_SIZE configs; pass an unfinished run to
+        resume it. Emails go out once their batch has committed.
+        """
+        if run is None:
+            run = InvoiceRun.objects.create()
         results = []
         today = datetime.now().date()
+        batch_size = getattr(settings, 'INVOICE_RUN_BATCH_SIZE', 100)
+        configs = (
+            InvoiceAutomationConfig.objects.filter(is_active=True)
+            .select_related('tenancy__tenant', 'tenancy__unit__building', 'tenancy__company')
+            .order_by('id')
+        )
 
-        for config in InvoiceAutomationConfig.objects.filter(is_active=True):
-            tenancy = config.tenancy
-            due_date_threshold = today + timedelta(days=config.days_before_due)
-
-            try:
+        try:
+            while True:
+                batch = list(configs.filter(id__gt=run.last_config_id)[:batch_size])
+                if not batch:
+                    break
+                batch_results = []
                 with transaction.atomic():
+                    for config in batch:
+                        result = self.generate_invoice_for_config(config, run, today)
+                        batch_results.append(result)
+                        jobs.count(result['status'])
+                    self.checkpoint(run, batch[-1].id, batch_results)
+                results.extend(batch_results)
+        except Exception as e:
+            InvoiceRun.objects.filter(pk=run.pk).update(
+                status='failed', error=str(e), updated_at=timezone.now())
+            raise
+
+        run.status = 'completed'
+        run.finished_at = timezone.now()
+        run.save(update_fields=['status', 'finished_at', 'updated_at'])
+        return results
+
+    def generate_invoice_for_config(self, config, run, today):
+        tenancy = config.tenancy
+        due_date_threshold = today + timedelta(days=config.days_before_due)
+
+        try:
+            with transaction.atomic():
+                with jobs.phase('query'):
                     invoice_data = self.prepare_invoice_data(
                         tenancy,
                         due_date_threshold,
                         config.combine_charges
                     )
 
-                    # Log invoice_data for debugging
-                    logger.debug(
-                        f"Invoice data for tenancy {tenancy.id}: {invoice_data}")
-
-                    if invoice_data['items']:
-                        serializer = AutoInvoiceSerializer(data=invoice_data)
-                        if serializer.is_valid():
-                            invoice = serializer.save(is_automated=True)
-                            self.send_invoice_email(invoice)
-                            
-                            results.append({
-                                'tenancy_id': tenancy.id,
-                                'invoice_id': invoice.id,
-                                'invoice_number': invoice.invoice_number,
-                                'status': 'created',
-                                'email_sent': email_sent,
-                                'tenant_email': invoice.tenancy.tenant.email if invoice.tenancy.tenant else None
-                            })
-                        else:
-                            logger.error(
-                                f"Serializer errors for tenancy {tenancy.id}: {serializer.errors}")
-                            results.append({
-                                'tenancy_id': tenancy.id,
-                                'status': 'failed',
-                                'errors': serializer.errors
-                            })
-                    else:
-                        results.append({
+                # Log invoice_data for debugging
+                logger.debug(
+                    "Invoice data for tenancy %s: %s", tenancy.id, invoice_data)
+
+                if not invoice_data['items']:
+                    return {
+                        'tenancy_id': tenancy.id,
+                        'status': 'skipped',
+                        'message': 'No invoice items found'
+                    }
+
+                with jobs.phase('serialize'):
+                    serializer = AutoInvoiceSerializer(data=invoice_data)
+                    if not serializer.is_valid():
+                        logger.error(
+                            "Serializer errors for tenancy %s: %s", tenancy.id, serializer.errors)
+                        return {
                             'tenancy_id': tenancy.id,
-                            'status': 'skipped',
-                            'message': 'No invoice items found'
-                        })
-            except Exception as e:
-                logger.error(
-                    f"Error processing tenancy {tenancy.id}: {str(e)}", exc_info=True)
-                results.append({
-                    'tenancy_id': tenancy.id,
-                    'status': 'failed',
-                    'error': str(e)
-                })
+                            'status': 'failed',
+                            'errors': serializer.errors
+                        }
+                    invoice = serializer.save(is_automated=True)
+                    # Raises IntegrityError, rolling this tenancy back, if a
+                    # replayed batch already invoiced one of the items.
+                    InvoiceRunItem.objects.bulk_create([
+                        InvoiceRunItem(
+                            run=run, invoice=invoice, tenancy=tenancy,
+                            payment_schedule_id=item.get('schedule_id'),
+                            additional_charge_id=item.get('charge_id'),
+                        )
+                        for item in invoice_data['items']
+                    ])
+        except IntegrityError:
+            logger.warning("Items for tenancy %s were already invoiced; skipping", tenancy.id)
+            return {
+                'tenancy_id': tenancy.id,
+                'status': 'skipped',
+                'message': 'Items already invoiced'
+            }
+        except Exception as e:
+            logger.error(
+                "Error processing tenancy %s: %s", tenancy.id, e, exc_info=True)
+            return {
+                'tenancy_id': tenancy.id,
+                'status': 'failed',
+                'error': str(e)
+            }
 
-        return results
+        result = {
+            'tenancy_id': tenancy.id,
+            'invoice_id': invoice.id,
+            'invoice_number': invoice.invoice_number,
+            'status': 'created',
+            'email_sent': None,
+            'tenant_email': tenancy.tenant.email if tenancy.tenant else None
+        }
+        transaction.on_commit(lambda: self.send_committed_invoice_email(invoice, run, result))
+        return result
+
+    def send_committed_invoice_email(self, invoice, run, result):
+        email_sent = self.send_invoice_email(invoice)
+        result['email_sent'] = email_sent
+        jobs.count('email_sent' if email_sent else 'email_failed')
+        counter = 'emails_sent' if email_sent else 'emails_failed'
+        InvoiceRun.objects.filter(pk=run.pk).update(
+            **{counter: F(counter) + 1}, updated_at=timezone.now())
+
+    def checkpoint(self, run, last_config_id, batch_results):
+        """Advance the run past ``last_config_id``; commits with the batch's invoices."""
+        outcomes = Counter(result['status'] for result in batch_results)
+        run.last_config_id = last_config_id
+        InvoiceRun.objects.filter(pk=run.pk).update(
+            last_config_id=last_config_id,
+            processed=F('processed') + len(batch_results),
+            created=F('created') + outcomes['created'],
+            skipped=F('skipped') + outcomes['skipped'],
+            failed=F('failed') + outcomes['failed'],
+            updated_at=timezone.now(),
+        )
 
     def prepare_invoice_data(self, tenancy, due_date_threshold, combine_charges):
         """Prepare invoice data based on configuration - FIXED VERSION"""
@@ -3462,7 +3688,8 @@ class AutoGenerateInvoiceAPIView(APIView):
             tenancy=tenancy,
             status='pending',
             due_date__lte=due_date_threshold,
-            due_date__gte=datetime.now().date()
+            due_date__gte=datetime.now().date(),
+            invoice_run_items__isnull=True
         )
 
         for schedule in payment_schedules:
@@ -3486,7 +3713,8 @@ class AutoGenerateInvoiceAPIView(APIView):
                 tenancy=tenancy,
                 status='pending',
                 due_date__lte=due_date_threshold,
-                due_date__gte=datetime.now().date()
+                due_date__gte=datetime.now().date(),
+                invoice_run_items__isnull=True
             )
 
             for charge in additional_charges:
@@ -3517,17 +3745,18 @@ class AutoGenerateInvoiceAPIView(APIView):
         }
 
         logger.debug(
-            f"Prepared invoice data for tenancy {tenancy.id}: {invoice_data}")
+            "Prepared invoice data for tenancy %s: %s", tenancy.id, invoice_data)
         return invoice_data
 
     def send_invoice_email(self, invoice):
         """Send invoice email with PDF attachment - IMPROVED VERSION"""
         try:
             html_content = render_to_string('company/invoice_body.html', {'invoice': invoice})
-            pdf_content = render_to_string('company/invoice_pdf.html', {'invoice': invoice})
-            pdf_file = BytesIO()
-            pisa.CreatePDF(pdf_content, dest=pdf_file)
-            
+            with jobs.phase('pdf'):
+                pdf_content = render_to_string('company/invoice_pdf.html', {'invoice': invoice})
+                pdf_file = BytesIO()
+                pisa.CreatePDF(pdf_content, dest=pdf_file)
+
             subject = f"Invoice #{invoice.invoice_number} from {invoice.company.company_name}"
             from_email = settings.DEFAULT_FROM_EMAIL
             to_email = invoice.tenancy.tenant.email
@@ -3545,10 +3774,13 @@ class AutoGenerateInvoiceAPIView(APIView):
                 mimetype='application/pdf'
             )
             
-            email.send()
-            logger.info(f"Invoice email sent successfully for invoice {invoice.id}")
+            with jobs.phase('email'):
+                email.send()
+            logger.info("Invoice email sent successfully for invoice %s", invoice.id)
+            return True
         except Exception as e:
-            logger.error(f"Failed to send invoice email for invoice {invoice.id}: {str(e)}", exc_info=True)
+            logger.error("Failed to send invoice email for invoice %s: %s", invoice.id, e, exc_info=True)
+            return False
 
 
 class AutoInvoiceListAPIView(APIView):
@@ -3578,7 +3810,9 @@ class AutoInvoiceListAPIView(APIView):
                 queryset = queryset.filter(status=status_filter)
 
             # Apply pagination
-            return paginate_queryset(queryset, request, InvoiceGetSerializer)
+            context = sparse_context(request)
+            queryset = optimize_queryset(queryset, InvoiceGetSerializer, context)
+            return paginate_queryset(queryset, request, InvoiceGetSerializer, context=context)
         except Exception as e:
             return Response(
                 {'success': False, 'message': str(e)},
@@ -3588,6 +3822,8 @@ class AutoInvoiceListAPIView(APIView):
 
 class TenancyByUnitView(APIView):
     def get(self, request, unit_id):
-        tenancies = Tenancy.objects.filter(unit_id=unit_id)
-        serializer = TenancyListSerializer(tenancies, many=True)
+        context = sparse_context(request)
+        tenancies = optimize_queryset(
+            Tenancy.objects.filter(unit_id=unit_id), TenancyListSerializer, context)
+        serializer = TenancyListSerializer(tenancies, many=True, context=context)
         return Response(serializer.data)
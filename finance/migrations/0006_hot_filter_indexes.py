@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2025-07-10 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0061_hot_filter_indexes'),
+        ('finance', '0005_overpayment_paymentdistribution'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='collection',
+            index=models.Index(fields=['invoice', 'status'], name='collection_invoice_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='collection',
+            index=models.Index(fields=['collection_date'], name='collection_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['company', 'date'], name='expense_company_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentdistribution',
+            index=models.Index(fields=['payment_schedule', 'collection'], name='distribution_schedule_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentdistribution',
+            index=models.Index(fields=['additional_charge', 'collection'], name='distribution_charge_idx'),
+        ),
+    ]
@@ -77,6 +77,12 @@ class Collection(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['invoice', 'status'], name='collection_invoice_status_idx'),
+            models.Index(fields=['collection_date'], name='collection_date_idx'),
+        ]
+
 
 class Expense(models.Model):
     
@@ -109,6 +115,11 @@ class Expense(models.Model):
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'date'], name='expense_company_date_idx'),
+        ]
+
     def __str__(self):
         return self.expense_type if self.expense_type else "Untitled Expense"
 
@@ -159,6 +170,10 @@ class PaymentDistribution(models.Model):
                 name='either_payment_schedule_or_additional_charge'
             )
         ]
+        indexes = [
+            models.Index(fields=['payment_schedule', 'collection'], name='distribution_schedule_idx'),
+            models.Index(fields=['additional_charge', 'collection'], name='distribution_charge_idx'),
+        ]
     
     def __str__(self):
         if self.payment_schedule:
@@ -1,4 +1,5 @@
 import csv
+import logging
 from decimal import Decimal
 from datetime import datetime
 from accounts.models import Company
@@ -10,9 +11,12 @@ from rest_framework.response import Response
 from .models import Collection, Expense, Refund
 from django.db.models.functions import Coalesce
 from company.models import Building, Units, Tenant, Tenancy
+from rentbiz.db_router import ReplicaReadMixin
 
+logger = logging.getLogger(__name__)
 
-class CollectionCSVDownloadAPIView(APIView):
+
+class CollectionCSVDownloadAPIView(ReplicaReadMixin, APIView):
     """
     API to download collections as a CSV file with optional filters.
 
@@ -109,14 +113,14 @@ class CollectionCSVDownloadAPIView(APIView):
             return response
 
         except Exception as e:
-            print(f"Error generating CSV: {str(e)}")
+            logger.exception("Error generating CSV")
             return Response(
                 {'error': f"An error occurred: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
 
-class FinancialSummaryView(APIView):
+class FinancialSummaryView(ReplicaReadMixin, APIView):
     """
     API to retrieve financial summaries for a company, aggregated by building, tenant, tenancy, or unit.
 
@@ -9,6 +9,10 @@ from company.serializers import (
     BuildingSerializer, TenancyListSerializer,
     ChargesGetSerializer, UnitSerializer, TenantSerializer
 )
+from rentbiz.utils.sparse_fields import SparseFieldsetMixin
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class ExpenseSerializer(serializers.ModelSerializer):
@@ -182,7 +186,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
 
 
 
-class CollectionSerializer(serializers.ModelSerializer):
+class CollectionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for creating and retrieving Collection objects.
 
@@ -234,14 +238,19 @@ class CollectionSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 f"Cannot create collection for invoice {invoice.id} with status '{invoice.status}'"
             )
-        print(f"Serializer validation passed for invoice {invoice.id}, instance exists: {bool(self.instance)}")
+        logger.debug(
+            "Serializer validation passed for invoice %s, instance exists: %s",
+            invoice.id, bool(self.instance))
         return data
 
     def to_representation(self, instance):
         try:
             representation = super().to_representation(instance)
-            representation['collection_date'] = instance.collection_date.strftime('%d %b %Y')
-            representation['amount'] = f"{instance.amount:.2f}"
+            # Sparse requests may leave either field out (and unloaded).
+            if 'collection_date' in representation:
+                representation['collection_date'] = instance.collection_date.strftime('%d %b %Y')
+            if 'amount' in representation:
+                representation['amount'] = f"{instance.amount:.2f}"
             return representation
         except Exception as e:
             raise serializers.ValidationError(f"Error formatting collection data: {str(e)}")
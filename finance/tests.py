@@ -1,3 +1,64 @@
+from datetime import date, timedelta
+
 from django.test import TestCase
 
-# Create your tests here.
+from company.models import AdditionalCharge, Invoice, PaymentSchedule
+from company.tests import PortfolioMixin, QueryBudgetMixin, QueryPlanMixin
+from .models import Collection, Expense, PaymentDistribution
+from .views import ExpensesByCompanyAPIView
+
+
+class CollectionSparseFieldsTests(PortfolioMixin, TestCase):
+    def test_fields_with_view_select_related(self):
+        # The view joins invoice__tenancy__tenant; the sparse only() must keep invoice.
+        response = self.client.get(f'/finance/collections/?company_id={self.company.id}&fields=id,amount')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'amount'})
+
+
+class HotFilterIndexTests(QueryPlanMixin, PortfolioMixin, TestCase):
+    def test_completed_collections_of_an_invoice(self):
+        invoice = Invoice.objects.filter(company=self.company).first()
+        self.assertUsesIndex(
+            Collection.objects.filter(invoice=invoice, status='completed'), 'collection_invoice_status_idx')
+
+    def test_collections_in_a_date_range(self):
+        today = date.today()
+        self.assertUsesIndex(
+            Collection.objects.filter(collection_date__range=(today - timedelta(days=30), today)),
+            'collection_date_idx')
+
+    def test_expenses_by_company_and_date(self):
+        today = date.today()
+        self.assertUsesIndex(
+            Expense.objects.filter(company=self.company, date__range=(today - timedelta(days=365), today)),
+            'expense_company_date_idx')
+
+    def test_distributions_of_a_schedule(self):
+        schedule = PaymentSchedule.objects.filter(tenancy=self.tenancy).first()
+        self.assertUsesIndex(
+            PaymentDistribution.objects.filter(payment_schedule=schedule).values('collection_id'),
+            'distribution_schedule_idx')
+
+    def test_distributions_of_a_charge(self):
+        charge = AdditionalCharge.objects.filter(tenancy__company=self.company).first()
+        self.assertUsesIndex(
+            PaymentDistribution.objects.filter(additional_charge=charge).values('collection_id'),
+            'distribution_charge_idx')
+
+
+class ExpenseListQueryBudgetTests(QueryBudgetMixin, PortfolioMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Fill every nested relation so each of their prefetches runs.
+        expense = Expense.objects.filter(company=cls.company).first()
+        tenancy = cls.tenancy
+        Expense.objects.create(
+            company=cls.company, user=expense.user, expense_type='tenancy', status='paid',
+            building=tenancy.building, unit=tenancy.unit, tenant=tenancy.tenant, tenancy=tenancy,
+            charge_type=expense.charge_type, amount=100, tax=0, total_amount=100, date=expense.date,
+        )
+
+    def test_expenses(self):
+        self.assertQueryBudget(ExpensesByCompanyAPIView, f'/finance/expenses/company/{self.company.id}/')
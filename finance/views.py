@@ -19,6 +19,10 @@ from .serializers import (
     ExpenseGetSerializer, RefundSerializer
 )
 from rentbiz.utils.pagination import paginate_queryset
+from rentbiz.utils.sparse_fields import sparse_context, optimize_queryset
+from rentbiz.utils.listing import CompanyListAPIView
+from rentbiz.utils.conditional import conditional_get, queryset_version
+from company.versions import tenancy_version
 from django.db import transaction
 
 
@@ -224,40 +228,41 @@ class AddExpenseAPIView(APIView):
             )
 
 
-class ExpensesByCompanyAPIView(APIView):
+class ExpensesByCompanyAPIView(CompanyListAPIView):
     """
     API to retrieve expenses for a specific company.
 
     Endpoint: GET /api/expenses/company/<company_id>/
-    Purpose: Fetches all expenses associated with a given company ID, ordered by creation date (descending).
+    Purpose: Fetches the expenses associated with a given company ID, ordered by creation date (descending).
+    Query Parameters:
+        - page, page_size: Pagination controls.
+        - stream: Set to 'ndjson' to stream every expense as newline-delimited JSON instead of a page.
     Response:
-        - 200 OK: List of serialized expense data.
-        - 500 Internal Server Error: Unexpected server error.
+        - 200 OK: Paginated list of serialized expense data.
     Example Request:
         curl -X GET http://localhost:8000/api/expenses/company/1/
     Example Response:
-        [
-            {
-                "id": 1,
-                "company": 1,
-                "expense_type": "general",
-                "amount": "500.00",
+        {
+            "count": 25,
+            "next": "http://localhost:8000/api/expenses/company/1/?page=2",
+            "previous": null,
+            "results": [
+                {
+                    "id": 1,
+                    "company": 1,
+                    "expense_type": "general",
+                    "amount": "500.00",
+                    ...
+                },
                 ...
-            },
-            ...
-        ]
+            ]
+        }
     """
+    serializer_class = ExpenseGetSerializer
+    query_budget = 17
 
-    def get(self, request, company_id):
-        try:
-            expenses = Expense.objects.filter(company_id=company_id).order_by('-created_at')
-            serializer = ExpenseGetSerializer(expenses, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except Exception as e:
-            return Response(
-                {'error': f"An error occurred: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+    def get_queryset(self, request, company_id):
+        return Expense.objects.filter(company_id=company_id).order_by('-created_at')
 
 
 class ExpenseUpdateView(APIView):
@@ -889,7 +894,21 @@ class CollectionDetailAPIView(APIView):
                 }
             ]
         }
+
+    Conditional requests:
+        The response carries an ETag derived from the collection, its invoice and
+        the invoice's tenancy schedules; a matching If-None-Match returns 304.
     """
+    def get_etag(self, request, pk):
+        row = Collection.objects.filter(pk=pk).values('invoice_id', 'invoice__tenancy_id').first()
+        if row is None:
+            return None
+        return '|'.join([
+            queryset_version(Collection.objects.filter(pk=pk), 'updated_at', 'invoice__updated_at'),
+            tenancy_version(row['invoice__tenancy_id']),
+        ])
+
+    @conditional_get()
     def get(self, request, pk):
         try:
             # Fetch collection with related invoice data
@@ -944,7 +963,7 @@ class CollectionDetailAPIView(APIView):
             tax_details = list(unique_tax_details.values())
 
             # Serialize collection data
-            collection_data = CollectionSerializer(collection).data
+            collection_data = CollectionSerializer(collection, context=sparse_context(request)).data
             
             # Add invoice details with tax information
             collection_data['invoice'] = {
@@ -1039,6 +1058,8 @@ class CollectionListAPIView(APIView):
         - tenant_name: Filter by tenant name.
         - start_date: Filter by collection date start.
         - end_date: Filter by collection date end.
+        - fields: Comma-separated list of fields to render (sparse fieldset).
+        - expand: Comma-separated list of relations to render as nested objects.
     Response:
         - 200 OK: Paginated list of serialized collection data.
         - 500 Internal Server Error: Unexpected server error.
@@ -1109,7 +1130,9 @@ class CollectionListAPIView(APIView):
                 collections = collections.filter(collection_date__lte=end_date)
 
             collections = collections.order_by('-collection_date')
-            return paginate_queryset(collections, request, CollectionSerializer)
+            context = sparse_context(request)
+            collections = optimize_queryset(collections, CollectionSerializer, context)
+            return paginate_queryset(collections, request, CollectionSerializer, context=context)
 
         except Exception as e:
             return Response(
@@ -1343,7 +1366,7 @@ class CreateRefundAPIView(APIView):
             payment_method = data.get('payment_method')
             remarks = data.get('remarks')
             payment_date = data.get('payment_date')
-            processed_by_id = request.user.id if request.user.is_authenticated else None
+            processed_by_id = getattr(request.user, 'users_id', None)
 
             if not (tenancy_id and payment_method and payment_date and amount_refunded > 0):
                 return Response(
@@ -1549,7 +1572,7 @@ class UpdateRefundAPIView(APIView):
             account_number = data.get('account_number')
             cheque_number = data.get('cheque_number')
             cheque_date = data.get('cheque_date')
-            processed_by_id = request.user.id if request.user.is_authenticated else None
+            processed_by_id = getattr(request.user, 'users_id', None)
 
             # Validate required fields
             required_fields = [tenancy_id, payment_method, payment_date, amount_refunded]
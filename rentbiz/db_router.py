@@ -0,0 +1,193 @@
+"""
+Read-replica routing.
+
+Writes and ordinary reads go to ``default``. Reads made inside
+``read_from_replica()`` -- which ``ReplicaReadMixin`` wraps around the GET
+handlers of report, export and dashboard views, and which Celery tasks can use
+directly -- go to the ``replica`` alias instead, unless:
+
+* no replica is configured (``DATABASES`` has no ``replica`` entry),
+* the replica is more than ``REPLICA_MAX_LAG_SECONDS`` behind (checked at most
+  every ``REPLICA_LAG_CHECK_INTERVAL`` seconds per process), or
+* the requesting principal wrote something in the last
+  ``REPLICA_STICKY_SECONDS`` (recorded by ``ReplicaStickinessMiddleware``), so
+  a user always reads their own writes.
+
+The write marks live in the default cache, which must be shared by every
+worker; the settings refuse a replica without ``CACHE_URL``.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+REPLICA_ALIAS = 'replica'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_read_alias = ContextVar('read_alias', default=None)
+
+_lag_lock = threading.Lock()
+_lag_checked_at = None
+_lag_ok = False
+
+_LAG_SQL = (
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def replica_lag_seconds():
+    """Replication delay of the replica in seconds (0 for non-PostgreSQL replicas)."""
+    replica = connections[REPLICA_ALIAS]
+    if replica.vendor != 'postgresql':
+        return 0
+    with replica.cursor() as cursor:
+        cursor.execute(_LAG_SQL)
+        lag = cursor.fetchone()[0]
+    # NULL: the server is not in recovery, i.e. not actually a replica.
+    return float(lag) if lag is not None else 0
+
+
+def replica_healthy():
+    """Whether the replica is within ``REPLICA_MAX_LAG_SECONDS``, cached briefly."""
+    global _lag_checked_at, _lag_ok
+    interval = getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 5)
+    now = time.monotonic()
+    if _lag_checked_at is not None and now - _lag_checked_at < interval:
+        return _lag_ok
+    with _lag_lock:
+        if _lag_checked_at is None or now - _lag_checked_at >= interval:
+            try:
+                lag = replica_lag_seconds()
+                _lag_ok = lag <= getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 10)
+                if not _lag_ok:
+                    logger.warning('replica is %.1fs behind, reading from primary', lag)
+            except DatabaseError:
+                logger.exception('replica lag check failed, reading from primary')
+                _lag_ok = False
+            _lag_checked_at = time.monotonic()
+    return _lag_ok
+
+
+def _sticky_key(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        identity = f'{type(user).__name__}:{user}'
+    else:
+        identity = f'addr:{request.META.get("REMOTE_ADDR", "")}'
+    return f'replica:sticky:{identity}'
+
+
+def mark_recent_write(request):
+    cache.set(_sticky_key(request), 1, getattr(settings, 'REPLICA_STICKY_SECONDS', 15))
+
+
+def has_recent_write(request):
+    return cache.get(_sticky_key(request)) is not None
+
+
+def choose_read_alias(request=None):
+    """
+    ``REPLICA_ALIAS`` when the replica is configured, healthy and ``request``
+    (if given) has not written recently; ``None`` (the primary) otherwise.
+    May query the replica, so async code must call it through ``sync_to_async``.
+    """
+    if (replica_configured()
+            and not (request is not None and has_recent_write(request))
+            and replica_healthy()):
+        return REPLICA_ALIAS
+    return None
+
+
+@contextmanager
+def reading_from(alias):
+    """Route reads in the block to ``alias`` (``None`` for the primary)."""
+    token = _read_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _read_alias.reset(token)
+
+
+@contextmanager
+def read_from_replica(request=None):
+    """Route reads in the block as ``choose_read_alias(request)`` decides."""
+    with reading_from(choose_read_alias(request)) as alias:
+        yield alias is not None
+
+
+def _read_on(alias, iterable):
+    iterator = iter(iterable)
+    while True:
+        token = _read_alias.set(alias)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _read_alias.reset(token)
+        yield chunk
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
+
+
+class ReplicaReadMixin:
+    """
+    APIView mixin serving safe requests from the replica. The decision is made
+    after authentication so stickiness can be keyed on the principal.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _read_alias.set(None)
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+            alias = _read_alias.get()
+        finally:
+            _read_alias.reset(token)
+        if alias and getattr(response, 'streaming', False):
+            # Streamed exports query while the body is consumed, after dispatch.
+            response.streaming_content = _read_on(alias, response.streaming_content)
+        return response
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            _read_alias.set(choose_read_alias(request))
+
+
+class ReplicaStickinessMiddleware:
+    """Remember principals that just wrote so their next reads use the primary."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (request.method not in SAFE_METHODS and response.status_code < 400
+                and replica_configured()):
+            mark_recent_write(request)
+        return response
@@ -2,6 +2,8 @@
 
 from pathlib import Path
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
+import sys
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 import os
@@ -44,6 +46,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'rentbiz.db_router.ReplicaStickinessMiddleware',
+    'rentbiz.utils.instrumentation.QueryInstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'rentbiz.urls'
@@ -69,6 +73,33 @@ WSGI_APPLICATION = 'rentbiz.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+#
+# DB_POOL_MODE selects how connections are reused:
+#   persistent - each thread keeps its connection for DB_CONN_MAX_AGE seconds
+#                (health checked before reuse); the default.
+#   pool       - psycopg 3 connection pool per process (needs psycopg-pool,
+#                PostgreSQL only); Django then closes nothing, the pool does.
+#   pgbouncer  - persistent connections to a transaction pooling pgbouncer:
+#                no server-side cursors and no prepared statements.
+# Celery workers run few long tasks per process while web workers serve many
+# short requests, so each role has its own sizing. The role is detected from
+# the command line and can be forced with DB_PROCESS_ROLE=web|worker.
+
+DB_PROCESS_ROLE = config(
+    'DB_PROCESS_ROLE',
+    default='worker' if 'celery' in os.path.basename(sys.argv[0]) else 'web',
+)
+DB_POOL_MODE = config('DB_POOL_MODE', default='persistent')
+
+if DB_PROCESS_ROLE == 'worker':
+    DB_CONN_MAX_AGE = config('DB_WORKER_CONN_MAX_AGE', default=600, cast=int)
+    DB_POOL_MIN_SIZE = config('DB_WORKER_POOL_MIN_SIZE', default=1, cast=int)
+    DB_POOL_MAX_SIZE = config('DB_WORKER_POOL_MAX_SIZE', default=2, cast=int)
+else:
+    DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+    DB_POOL_MIN_SIZE = config('DB_POOL_MIN_SIZE', default=2, cast=int)
+    DB_POOL_MAX_SIZE = config('DB_POOL_MAX_SIZE', default=10, cast=int)
+
 DATABASES = {
     'default': {
         'ENGINE': config('DATABASE_ENGINE'),
@@ -77,7 +108,169 @@ DATABASES = {
         'PASSWORD': config('DATABASE_PASSWORD'),
         'HOST': config('DATABASE_HOST'),
         'PORT': config('DATABASE_PORT'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+        'OPTIONS': {},
+    }
+}
+
+if DB_POOL_MODE == 'pool' and 'postgresql' in DATABASES['default']['ENGINE']:
+    # Pooled connections must not also be persistent.
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': DB_POOL_MIN_SIZE,
+        'max_size': DB_POOL_MAX_SIZE,
+        'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+        'max_idle': config('DB_POOL_MAX_IDLE', default=300, cast=int),
+    }
+elif DB_POOL_MODE == 'pgbouncer':
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+    DATABASES['default']['OPTIONS']['prepare_threshold'] = None
+
+# Read replica
+# Setting DATABASE_REPLICA_HOST (or, for a second SQLite file,
+# DATABASE_REPLICA_NAME) adds a ``replica`` alias with the primary's
+# credentials. ReplicaReadMixin views then read from it unless it lags by more
+# than REPLICA_MAX_LAG_SECONDS or the caller wrote within REPLICA_STICKY_SECONDS.
+# Test runs always get the alias, mirrored onto the ``default`` test database,
+# so the routing is exercised by the test suite. Tests that hit
+# ReplicaReadMixin views list it in ``databases`` and use TransactionTestCase,
+# since the mirror cannot see a TestCase's uncommitted rows.
+
+DATABASE_REPLICA_HOST = config('DATABASE_REPLICA_HOST', default='')
+DATABASE_REPLICA_NAME = config('DATABASE_REPLICA_NAME', default='')
+TESTING = sys.argv[1:2] == ['test']
+
+if DATABASE_REPLICA_HOST or DATABASE_REPLICA_NAME or TESTING:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': DATABASE_REPLICA_NAME or DATABASES['default']['NAME'],
+        'HOST': DATABASE_REPLICA_HOST or DATABASES['default']['HOST'],
+        'PORT': config('DATABASE_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['rentbiz.db_router.ReplicaRouter']
+REPLICA_MAX_LAG_SECONDS = config('REPLICA_MAX_LAG_SECONDS', default=10, cast=int)
+REPLICA_LAG_CHECK_INTERVAL = config('REPLICA_LAG_CHECK_INTERVAL', default=5, cast=int)
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=15, cast=int)
+
+# Cache
+# Shared cache for the reference-data bundle and other cross-process state.
+# Without CACHE_URL every process gets its own in-memory cache, so signal based
+# invalidation only reaches the process that saw the write. The reference-data
+# bundle is therefore only cached (REFERENCE_BUNDLE_CACHE) with a shared cache;
+# otherwise it is rebuilt per request and its ETag is a digest of the payload.
+# A replica needs one too: the read-your-writes flag must reach every worker.
+
+CACHE_URL = config('CACHE_URL', default='')
+REFERENCE_BUNDLE_CACHE = config('REFERENCE_BUNDLE_CACHE', default=bool(CACHE_URL), cast=bool)
+
+if REFERENCE_BUNDLE_CACHE and not CACHE_URL:
+    raise ImproperlyConfigured(
+        'REFERENCE_BUNDLE_CACHE needs a cache shared by every process; set CACHE_URL.')
+if (DATABASE_REPLICA_HOST or DATABASE_REPLICA_NAME) and not CACHE_URL:
+    raise ImproperlyConfigured(
+        'A read replica needs a cache shared by every process for read-your-writes; set CACHE_URL.')
+
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
+
+# Logging
+# Every logger writes through QueueSinkHandler: emitting only enqueues the
+# record and a background thread does the formatting and stderr I/O, so
+# request handlers never block on logging. Levels are set per app from the
+# environment, e.g. COMPANY_LOG_LEVEL=DEBUG to trace the company views.
+
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'standard': {
+            'format': '%(asctime)s %(levelname)s %(process)d %(name)s: %(message)s',
+        },
+    },
+    'handlers': {
+        'queue': {
+            '()': 'rentbiz.utils.log_queue.QueueSinkHandler',
+            'maxsize': config('LOG_QUEUE_SIZE', default=10000, cast=int),
+            'formatter': 'standard',
+        },
+    },
+    'root': {
+        'handlers': ['queue'],
+        'level': LOG_LEVEL,
+    },
+    'loggers': {
+        'django': {
+            'handlers': ['queue'],
+            'level': config('DJANGO_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+        'accounts': {'level': config('ACCOUNTS_LOG_LEVEL', default=LOG_LEVEL)},
+        'company': {'level': config('COMPANY_LOG_LEVEL', default=LOG_LEVEL)},
+        'finance': {'level': config('FINANCE_LOG_LEVEL', default=LOG_LEVEL)},
+        'rentbiz': {'level': config('RENTBIZ_LOG_LEVEL', default=LOG_LEVEL)},
+        'celery': {'level': config('CELERY_LOG_LEVEL', default='INFO')},
+    },
+}
+
+# Query instrumentation
+# QueryInstrumentationMiddleware counts queries, DB and serializer time per
+# request. SERVER_TIMING adds them as a Server-Timing header; /metrics exposes
+# the per view totals of the process, including SQL fingerprints, so it is off
+# unless METRICS_ENABLED and then only answers staff sessions or scrapers
+# sending ``Authorization: Bearer <METRICS_TOKEN>``. A view's query budget is its
+# ``query_budget`` attribute, else QUERY_BUDGETS[<url name>], else
+# QUERY_BUDGET_DEFAULT. Overruns are logged and counted; QUERY_BUDGET_ACTION
+# 'raise' turns them into errors, but only under DEBUG or the test runner.
+
+SERVER_TIMING = config('SERVER_TIMING', default=DEBUG, cast=bool)
+METRICS_ENABLED = config('METRICS_ENABLED', default=False, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+QUERY_BUDGET_DEFAULT = config('QUERY_BUDGET_DEFAULT', default=None, cast=lambda v: int(v) if v else None)
+QUERY_BUDGET_ACTION = config('QUERY_BUDGET_ACTION', default='log')
+QUERY_DUPLICATE_THRESHOLD = config('QUERY_DUPLICATE_THRESHOLD', default=5, cast=int)
+# The budgets leave room for the periodic token revocation reload (2 queries).
+QUERY_BUDGETS = {
+    'dashboard-overview': 12,
+    'dashboard-occupancy': 6,
+    'properties-summary': 3,
+    'rent-collection': 4,
+    'tenency-expiring': 3,
+}
+
+# REST framework
+# Company scoped JWTs are verified without a query; COMPANY_SCOPE_ENFORCED turns
+# on rejection of bad tokens and the per-company authorization of <company_id>
+# endpoints once every client sends tokens.
+
+COMPANY_SCOPE_ENFORCED = config('COMPANY_SCOPE_ENFORCED', default=False, cast=bool)
+TOKEN_REVOCATION_CACHE_TTL = config('TOKEN_REVOCATION_CACHE_TTL', default=30, cast=int)
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'company.authentication.CompanyJWTAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': [
+        'company.permissions.IsCompanyMember',
+    ],
 }
 
 # Password validation
@@ -129,6 +322,33 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Chunked document uploads (company.uploads). Parts and assembled files go to
+# this STORAGES alias; assembly runs on Celery unless DOCUMENT_UPLOAD_ASYNC is off.
+DOCUMENT_UPLOAD_STORAGE = config('DOCUMENT_UPLOAD_STORAGE', default='default')
+DOCUMENT_UPLOAD_CHUNK_SIZE = config('DOCUMENT_UPLOAD_CHUNK_SIZE', default=5 * 1024 * 1024, cast=int)
+DOCUMENT_UPLOAD_MAX_SIZE = config('DOCUMENT_UPLOAD_MAX_SIZE', default=100 * 1024 * 1024, cast=int)
+DOCUMENT_UPLOAD_ASYNC = config('DOCUMENT_UPLOAD_ASYNC', default=True, cast=bool)
+
+# Documents expiring within this many days go into the daily expiry digest
+# (company.tasks.notify_expiring_documents).
+DOCUMENT_EXPIRY_NOTICE_DAYS = config('DOCUMENT_EXPIRY_NOTICE_DAYS', default=30, cast=int)
+
+# Longest side, in pixels, of each logo variant (rentbiz.utils.images); the
+# emails embed 'small'.
+IMAGE_VARIANTS = {'small': 128, 'medium': 512, 'large': 1024}
+IMAGE_VARIANT_QUALITY = config('IMAGE_VARIANT_QUALITY', default=82, cast=int)
+
+# Spreadsheet imports (company.imports): rows per insert transaction and the
+# largest sheet accepted.
+IMPORT_BATCH_SIZE = config('IMPORT_BATCH_SIZE', default=1000, cast=int)
+IMPORT_MAX_ROWS = config('IMPORT_MAX_ROWS', default=50000, cast=int)
+# Tenant imports match phone numbers on their last this many digits, so local
+# and international forms of a number compare equal.
+PHONE_MATCH_DIGITS = config('PHONE_MATCH_DIGITS', default=9, cast=int)
+# Building map viewports with more buildings than this come back as
+# clusters of nearby buildings instead of one marker each.
+MAP_MAX_MARKERS = config('MAP_MAX_MARKERS', default=500, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -156,3 +376,16 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'  # Or your preferred timezone
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+
+# Job run history (accounts.jobs). Only tasks started by beat are recorded
+# unless JOB_RUN_PERIODIC_ONLY is off; tracemalloc roughly doubles allocation
+# cost, so per run memory tracing is opt in.
+JOB_RUN_PERIODIC_ONLY = config('JOB_RUN_PERIODIC_ONLY', default=True, cast=bool)
+JOB_RUN_TRACE_MEMORY = config('JOB_RUN_TRACE_MEMORY', default=False, cast=bool)
+JOB_RUN_RETENTION_DAYS = config('JOB_RUN_RETENTION_DAYS', default=90, cast=int)
+
+# Automated invoicing commits a checkpoint every INVOICE_RUN_BATCH_SIZE
+# configs. A run that has not checkpointed for INVOICE_RUN_STALE_SECONDS is
+# treated as dead and resumed by the next task.
+INVOICE_RUN_BATCH_SIZE = config('INVOICE_RUN_BATCH_SIZE', default=100, cast=int)
+INVOICE_RUN_STALE_SECONDS = config('INVOICE_RUN_STALE_SECONDS', default=900, cast=int)
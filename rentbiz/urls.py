@@ -10,8 +10,11 @@ from django.conf.urls.static import static
 from django.conf import settings
  
 
+from rentbiz.utils.instrumentation import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('accounts/', include('accounts.urls')),
     path('company/', include('company.urls')),
     path('finance/', include('finance.urls')),
@@ -0,0 +1,70 @@
+"""
+Conditional GET support for read-heavy endpoints.
+
+A view opts in by defining ``get_etag(request, *args, **kwargs)`` and
+decorating its ``get`` with ``conditional_get``. ``get_etag`` returns a cheap
+version fingerprint (see ``queryset_version``) computed from count/max(id)/
+max(updated_at) aggregates; when it matches the client's ``If-None-Match`` the
+view answers 304 Not Modified without running its queries or serializers.
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+# Detail views always revalidate; a 304 is cheap.
+DETAIL_CACHE_CONTROL = 'private, no-cache'
+# Company lookup tables are edited from the same SPA that reads them, so they
+# revalidate too, but may be served stale while revalidating.
+REFERENCE_CACHE_CONTROL = 'private, no-cache, stale-while-revalidate=300'
+# Global reference data (countries, states) only changes on deploys.
+STATIC_REFERENCE_CACHE_CONTROL = 'public, max-age=86400'
+
+
+def queryset_version(queryset, *fields, relations=()):
+    """
+    Fingerprint of the rows in ``queryset`` in one aggregate query: their
+    number, the highest pk and the latest value of each of ``fields``, plus
+    the number and highest pk of the rows behind each of ``relations``
+    (for nested rows without an ``updated_at``, e.g. documents).
+    """
+    aggregates = {'count': Count('pk', distinct=True), 'max_id': Max('pk')}
+    for index, field in enumerate(fields):
+        aggregates[f'f{index}'] = Max(field)
+    for index, relation in enumerate(relations):
+        aggregates[f'r{index}_count'] = Count(relation, distinct=True)
+        aggregates[f'r{index}_max_id'] = Max(f'{relation}__id')
+    values = queryset.aggregate(**aggregates)
+    return '/'.join(str(values[key]) for key in aggregates)
+
+
+def conditional_get(cache_control=DETAIL_CACHE_CONTROL):
+    """Decorate an APIView ``get`` with ETag/If-None-Match handling."""
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            version = self.get_etag(request, *args, **kwargs)
+            if version is None:
+                return view_method(self, request, *args, **kwargs)
+
+            # The query string selects pages and sparse fieldsets, so it is
+            # part of the representation being versioned.
+            digest = hashlib.sha1(f'{version}|{request.get_full_path()}'.encode()).hexdigest()
+            etag = quote_etag(digest)
+
+            if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+
+            response['ETag'] = etag
+            if cache_control:
+                response['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return decorator
@@ -2,281 +2,405 @@
 from rest_framework.views import APIView
 from django.db import models
 from rest_framework.response import Response
-from company.models import Building,Units,Invoice,Tenancy,PaymentSchedule
+from company.models import Building,Units,Invoice,Tenancy,PaymentSchedule,UnitOccupancy
+from company.occupancy import occupancy_rates, occupied_unit_count, occupies_on, vacancy_durations
 from finance.models import Collection,Invoice,Expense
 from datetime import datetime
 from django.utils import timezone
 from django.db.models.functions import TruncMonth, TruncYear
 from rest_framework import status
 from datetime import timedelta
-from django.db.models import F, ExpressionWrapper, DurationField, IntegerField,Sum,Func
+from django.db.models import F, ExpressionWrapper, DurationField, IntegerField,Sum,Func,Count
 from rentbiz.utils.pagination import paginate_queryset, CustomPagination
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
 from django.utils import timezone
 from datetime import date
 from company.models import Invoice
 from company.serializers import DashboardInvoiceSerializer
+from rentbiz.db_router import ReplicaReadMixin, choose_read_alias, reading_from
+import asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse
+from django.views import View
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.encoders import JSONEncoder
+from company.authentication import CompanyJWTAuthentication
+
+
+
+
+def properties_summary(company_id):
+    """
+    One aggregate; occupied units come from the occupancy ledger, so they
+    are right even where ``unit_status`` has not been maintained.
+    """
+    occupied_today = Exists(UnitOccupancy.objects.filter(
+        occupies_on(timezone.localdate()), unit_id=OuterRef('unit_building')))
+    summary = Building.objects.filter(company=company_id).aggregate(
+        buildings=Count('id', distinct=True),
+        units=Count('unit_building', distinct=True),
+        occupied=Count('unit_building', distinct=True, filter=occupied_today),
+        unavailable=Count('unit_building', distinct=True, filter=~occupied_today & Q(
+            unit_building__unit_status__in=['renovation', 'disputed'])),
+    )
+    return {
+        "total_properties": summary['buildings'],
+        "total_units": summary['units'],
+        "total_acquired": summary['occupied'],
+        "total_vacant": summary['units'] - summary['occupied'] - summary['unavailable'],
+    }
+
+
+def occupancy_report(company_id, on, start, end):
+    """Point-in-time occupancy on ``on``, vacancy durations and monthly rates."""
+    vacancies = vacancy_durations(company_id, on)
+    return {
+        'date': on,
+        'occupied_units': occupied_unit_count(company_id, on),
+        'vacant_units': len(vacancies),
+        'average_vacancy_days': round(sum(vacancies.values()) / len(vacancies), 1) if vacancies else 0,
+        'vacancies': [
+            {'unit_id': unit_id, 'vacant_days': days}
+            for unit_id, days in sorted(vacancies.items(), key=lambda item: -item[1])
+        ],
+        'monthly_rates': occupancy_rates(company_id, start, end),
+    }
+
+
+def rent_collection(company_id):
+    # Total invoiced amount
+    total_invoiced = Invoice.objects.filter(
+        company=company_id
+    ).aggregate(total=Sum('total_amount'))['total'] or 0
+
+    # Total collected (completed only)
+    collected_rent = Collection.objects.filter(
+        invoice__company=company_id,
+        status='completed'
+    ).aggregate(total=Sum('amount'))['total'] or 0
+
+    # Pending = total invoiced - collected confirmed
+    pending_rent = max(total_invoiced - collected_rent, 0)
+
+    return {
+        "total": total_invoiced,
+        "collected": collected_rent,
+        "pending": pending_rent,
+        "filter_options": ["This Month", "Last 3 Months", "This Year"]
+    }
+
+
+def tenancy_expiring(company_id):
+    today = timezone.now().date()
+
+    def ending_within(first_day, last_day):
+        return Q(end_date__range=(today + timedelta(days=first_day), today + timedelta(days=last_day)))
+
+    # Count active tenancies by days left in one query; plain date ranges
+    # work on every database and can use the end_date column directly.
+    buckets = Tenancy.objects.filter(status='active', company_id=company_id).aggregate(
+        expiring_0_30=Count('id', filter=ending_within(0, 30)),
+        expiring_31_60=Count('id', filter=ending_within(31, 60)),
+        expiring_61_90=Count('id', filter=ending_within(61, 90)),
+    )
+
+    return {
+        "total_expiring": sum(buckets.values()),
+        "ranges": {
+            "0-30_days": buckets['expiring_0_30'],
+            "31-60_days": buckets['expiring_31_60'],
+            "61-90_days": buckets['expiring_61_90']
+        }
+    }
+
+
+def parse_report_year(raw_year):
+    """``None`` for all years, else the validated year; raises ``ValueError``."""
+    if not raw_year:
+        return None
+    try:
+        year = int(raw_year)
+    except ValueError:
+        raise ValueError('Invalid year format')
+    current_year = datetime.now().year
+    if year < 2023 or year > current_year:
+        raise ValueError(f'Year must be between 2023 and {current_year}')
+    return year
+
+
+def financial_report(company_id, year=None):
+    """
+    Financial report data for a company.
+    - If year is specified, returns monthly breakdown for all 12 months (Jan-Dec) of that year.
+    - If year is None ('All Years'), aggregates data across all years.
+    """
+    response_data = {
+        'monthly_breakdown': [],
+        'total_money_in': 0.00,
+        'total_money_out': 0.00,
+        'overall_percentage': 0.00,
+        'yearly_summary': {}
+    }
+
+    # Base querysets with company filter
+    expenses_qs = Expense.objects.filter(company__id=company_id)
+    collections_qs = Collection.objects.filter(invoice__company__id=company_id)
+    if year:
+        expenses_qs = expenses_qs.filter(date__year=year)
+        collections_qs = collections_qs.filter(collection_date__year=year)
+
+    # Monthly breakdown with all 12 months (Jan-Dec) if year is specified
+    if year:
+        # Generate all 12 months for the selected year in order (Jan to Dec)
+        all_months = [f"{year}-{str(month).zfill(2)}" for month in range(1, 13)]
+        expenses_by_month = expenses_qs.annotate(
+            month=TruncMonth('date')
+        ).values('month').annotate(
+            total_expenses=Sum('total_amount')
+        ).order_by('month')
 
+        collections_by_month = collections_qs.annotate(
+            month=TruncMonth('collection_date')
+        ).values('month').annotate(
+            total_collections=Sum('amount')
+        ).order_by('month')
+
+        # Initialize monthly data with all months in order
+        monthly_data = {month: {'month': month, 'expenses': 0.0, 'collections': 0.0} for month in all_months}
+
+        # Update with actual data
+        for expense in expenses_by_month:
+            month_key = expense['month'].strftime('%Y-%m')
+            if month_key in monthly_data:
+                monthly_data[month_key]['expenses'] = float(expense['total_expenses'] or 0)
+
+        for collection in collections_by_month:
+            month_key = collection['month'].strftime('%Y-%m')
+            if month_key in monthly_data:
+                monthly_data[month_key]['collections'] = float(collection['total_collections'] or 0)
+
+        # Convert to list in Jan-Dec order
+        response_data['monthly_breakdown'] = [monthly_data[month] for month in all_months]
+        for item in response_data['monthly_breakdown']:
+            item['net'] = item['collections'] - item['expenses']
+    else:
+        # For 'All Years', aggregate all months across years
+        expenses_by_month = expenses_qs.annotate(
+            month=TruncMonth('date')
+        ).values('month').annotate(
+            total_expenses=Sum('total_amount')
+        ).order_by('month')
 
+        collections_by_month = collections_qs.annotate(
+            month=TruncMonth('collection_date')
+        ).values('month').annotate(
+            total_collections=Sum('amount')
+        ).order_by('month')
 
+        monthly_data = {}
+        for expense in expenses_by_month:
+            month_key = expense['month'].strftime('%Y-%m')
+            monthly_data[month_key] = {
+                'month': month_key,
+                'expenses': float(expense['total_expenses'] or 0),
+                'collections': 0.0
+            }
 
-class PropertiesSummaryView(APIView):
-    def get(self, request, company_id):
-        company = company_id
+        for collection in collections_by_month:
+            month_key = collection['month'].strftime('%Y-%m')
+            if month_key in monthly_data:
+                monthly_data[month_key]['collections'] = float(collection['total_collections'] or 0)
+            else:
+                monthly_data[month_key] = {
+                    'month': month_key,
+                    'expenses': 0.0,
+                    'collections': float(collection['total_collections'] or 0)
+                }
 
-        total_properties = Building.objects.filter(company=company).count()
-        total_units = Units.objects.filter(building__company=company).count()
-        total_acquired = Units.objects.filter(building__company=company, unit_status='occupied').count()
-        total_vacant = Units.objects.filter(building__company=company, unit_status='vacant').count()
+        response_data['monthly_breakdown'] = list(monthly_data.values())
+        for item in response_data['monthly_breakdown']:
+            item['net'] = item['collections'] - item['expenses']
+
+    # Calculate total money in and out
+    response_data['total_money_in'] = float(collections_qs.aggregate(
+        total=Sum('amount')
+    )['total'] or 0)
+
+    response_data['total_money_out'] = float(expenses_qs.aggregate(
+        total=Sum('total_amount')
+    )['total'] or 0)
+
+    # Calculate overall percentage (money out as a percentage of money in)
+    response_data['overall_percentage'] = ((response_data['total_money_out'] / response_data['total_money_in']) * 100 
+                                         if response_data['total_money_in'] else 0.0)
+
+    # Yearly summary
+    expenses_by_year = expenses_qs.annotate(
+        year=TruncYear('date')
+    ).values('year').annotate(
+        total_expenses=Sum('total_amount')
+    ).order_by('year')
+
+    collections_by_year = collections_qs.annotate(
+        year=TruncYear('collection_date')
+    ).values('year').annotate(
+        total_collections=Sum('amount')
+    ).order_by('year')
+
+    yearly_data = {}
+    for expense in expenses_by_year:
+        year_key = expense['year'].year
+        yearly_data[year_key] = {
+            'year': year_key,
+            'expenses': float(expense['total_expenses'] or 0),
+            'collections': 0.0
+        }
 
-        return Response({
-            "total_properties": total_properties,
-            "total_units": total_units,
-            "total_acquired": total_acquired,
-            "total_vacant": total_vacant,
-        })
-    
+    for collection in collections_by_year:
+        year_key = collection['year'].year
+        if year_key in yearly_data:
+            yearly_data[year_key]['collections'] = float(collection['total_collections'] or 0)
+        else:
+            yearly_data[year_key] = {
+                'year': year_key,
+                'expenses': 0.0,
+                'collections': float(collection['total_collections'] or 0)
+            }
 
+    response_data['yearly_summary'] = yearly_data
+    return response_data
 
 
+class PropertiesSummaryView(ReplicaReadMixin, APIView):
+    def get(self, request, company_id):
+        return Response(properties_summary(company_id))
 
-class RentCollectionView(APIView):
+
+class RentCollectionView(ReplicaReadMixin, APIView):
     def get(self, request, company_id):
-        # Filter invoices by company
-        invoices = Invoice.objects.filter(company=company_id)
-        
-        # Total invoiced amount
-        total_invoiced = invoices.aggregate(total=Sum('total_amount'))['total'] or 0
-        
-        # Total collected (completed only)
-        collected_rent = Collection.objects.filter(
-            invoice__company=company_id,
-            status='completed'
-        ).aggregate(total=Sum('amount'))['total'] or 0
-
-        # Pending = total invoiced - collected confirmed
-        pending_rent = max(total_invoiced - collected_rent, 0)
-
-        return Response({
-            "total": total_invoiced,
-            "collected": collected_rent,
-            "pending": pending_rent,
-            "filter_options": ["This Month", "Last 3 Months", "This Year"]
-        })
-
-
-
-class ExtractDays(Func):
-    function = 'EXTRACT'
-    template = "%(function)s(DAY FROM %(expressions)s)"
-    output_field = IntegerField()
-
-class TenancyExpiringView(APIView):
+        return Response(rent_collection(company_id))
+
+
+class TenancyExpiringView(ReplicaReadMixin, APIView):
     def get(self, request, company_id):
-        today = timezone.now().date()
-
-        # Filter active tenancies
-        tenancies = Tenancy.objects.filter(status='active', company_id=company_id)
-
-        # Annotate with days remaining as integer
-        tenancies = tenancies.annotate(
-            days_remaining=ExtractDays(ExpressionWrapper(
-                F('end_date') - today,
-                output_field=models.DurationField()
-            ))
-        )
-
-        # Count tenancies by expiry buckets
-        expiring_0_30 = tenancies.filter(days_remaining__gte=0, days_remaining__lte=30).count()
-        expiring_31_60 = tenancies.filter(days_remaining__gte=31, days_remaining__lte=60).count()
-        expiring_61_90 = tenancies.filter(days_remaining__gte=61, days_remaining__lte=90).count()
-
-        return Response({
-            "total_expiring": expiring_0_30 + expiring_31_60 + expiring_61_90,
-            "ranges": {
-                "0-30_days": expiring_0_30,
-                "31-60_days": expiring_31_60,
-                "61-90_days": expiring_61_90
-            }
-        })
-    
+        return Response(tenancy_expiring(company_id))
 
 
-class FinancialReportView(APIView):
+class OccupancyReportView(ReplicaReadMixin, APIView):
+    def get(self, request, company_id):
+        """
+        Occupancy on ``?date=`` (default today) and monthly occupancy rates
+        from ``?from=`` to ``?to=`` (default the twelve months up to today).
+        """
+        today = timezone.localdate()
+        params = {'date': today, 'to': today, 'from': today.replace(day=1, year=today.year - 1)}
+        for name in params:
+            raw = request.query_params.get(name)
+            if raw:
+                try:
+                    parsed = date.fromisoformat(raw)
+                except ValueError:
+                    return Response({'error': f'{name} must be a YYYY-MM-DD date'}, status=status.HTTP_400_BAD_REQUEST)
+                params[name] = parsed
+        if params['from'] > params['to']:
+            return Response({'error': 'from must not be after to'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(occupancy_report(company_id, params['date'], params['from'], params['to']))
+
+
+class FinancialReportView(ReplicaReadMixin, APIView):
     def get(self, request, company_id):
         """
         Retrieve financial report data for a company, filtered by year if provided.
         - If year is specified, returns monthly breakdown for all 12 months (Jan-Dec) of that year.
         - If year is 'All Years' (not provided), aggregates data across all years.
         """
-        year = request.query_params.get('year', None)
-        
-        # Initialize response data
-        response_data = {
-            'monthly_breakdown': [],
-            'total_money_in': 0.00,
-            'total_money_out': 0.00,
-            'overall_percentage': 0.00,  # Added overall percentage
-            'yearly_summary': {}
-        }
-
-        # Validate company_id
         try:
-            company_id = int(company_id)
-        except ValueError:
-            return Response(
-                {'error': 'Invalid company_id format'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Base querysets with company filter
-        expenses_qs = Expense.objects.filter(company__id=company_id)
-        collections_qs = Collection.objects.filter(invoice__company__id=company_id)
-
-        # Apply year filter if provided and validate year
-        if year:
-            try:
-                year = int(year)
-                current_year = datetime.now().year  # 2025 based on current date: 11:16 AM IST, June 27, 2025
-                if year < 2023 or year > current_year:
-                    return Response(
-                        {'error': f'Year must be between 2023 and {current_year}'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                expenses_qs = expenses_qs.filter(date__year=year)
-                collections_qs = collections_qs.filter(collection_date__year=year)
-            except ValueError:
-                return Response(
-                    {'error': 'Invalid year format'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-        # Monthly breakdown with all 12 months (Jan-Dec) if year is specified
-        if year:
-            # Generate all 12 months for the selected year in order (Jan to Dec)
-            all_months = [f"{year}-{str(month).zfill(2)}" for month in range(1, 13)]
-            expenses_by_month = expenses_qs.annotate(
-                month=TruncMonth('date')
-            ).values('month').annotate(
-                total_expenses=Sum('total_amount')
-            ).order_by('month')
-            
-            collections_by_month = collections_qs.annotate(
-                month=TruncMonth('collection_date')
-            ).values('month').annotate(
-                total_collections=Sum('amount')
-            ).order_by('month')
-
-            # Initialize monthly data with all months in order
-            monthly_data = {month: {'month': month, 'expenses': 0.0, 'collections': 0.0} for month in all_months}
-
-            # Update with actual data
-            for expense in expenses_by_month:
-                month_key = expense['month'].strftime('%Y-%m')
-                if month_key in monthly_data:
-                    monthly_data[month_key]['expenses'] = float(expense['total_expenses'] or 0)
-
-            for collection in collections_by_month:
-                month_key = collection['month'].strftime('%Y-%m')
-                if month_key in monthly_data:
-                    monthly_data[month_key]['collections'] = float(collection['total_collections'] or 0)
-
-            # Convert to list in Jan-Dec order
-            response_data['monthly_breakdown'] = [monthly_data[month] for month in all_months]
-            for item in response_data['monthly_breakdown']:
-                item['net'] = item['collections'] - item['expenses']
-        else:
-            # For 'All Years', aggregate all months across years
-            expenses_by_month = expenses_qs.annotate(
-                month=TruncMonth('date')
-            ).values('month').annotate(
-                total_expenses=Sum('total_amount')
-            ).order_by('month')
-
-            collections_by_month = collections_qs.annotate(
-                month=TruncMonth('collection_date')
-            ).values('month').annotate(
-                total_collections=Sum('amount')
-            ).order_by('month')
-
-            monthly_data = {}
-            for expense in expenses_by_month:
-                month_key = expense['month'].strftime('%Y-%m')
-                monthly_data[month_key] = {
-                    'month': month_key,
-                    'expenses': float(expense['total_expenses'] or 0),
-                    'collections': 0.0
-                }
-
-            for collection in collections_by_month:
-                month_key = collection['month'].strftime('%Y-%m')
-                if month_key in monthly_data:
-                    monthly_data[month_key]['collections'] = float(collection['total_collections'] or 0)
-                else:
-                    monthly_data[month_key] = {
-                        'month': month_key,
-                        'expenses': 0.0,
-                        'collections': float(collection['total_collections'] or 0)
-                    }
-
-            response_data['monthly_breakdown'] = list(monthly_data.values())
-            for item in response_data['monthly_breakdown']:
-                item['net'] = item['collections'] - item['expenses']
-
-        # Calculate total money in and out
-        response_data['total_money_in'] = float(collections_qs.aggregate(
-            total=Sum('amount')
-        )['total'] or 0)
-
-        response_data['total_money_out'] = float(expenses_qs.aggregate(
-            total=Sum('total_amount')
-        )['total'] or 0)
-
-        # Calculate overall percentage (money out as a percentage of money in)
-        response_data['overall_percentage'] = ((response_data['total_money_out'] / response_data['total_money_in']) * 100 
-                                             if response_data['total_money_in'] else 0.0)
-
-        # Yearly summary
-        expenses_by_year = expenses_qs.annotate(
-            year=TruncYear('date')
-        ).values('year').annotate(
-            total_expenses=Sum('total_amount')
-        ).order_by('year')
-
-        collections_by_year = collections_qs.annotate(
-            year=TruncYear('collection_date')
-        ).values('year').annotate(
-            total_collections=Sum('amount')
-        ).order_by('year')
+            year = parse_report_year(request.query_params.get('year', None))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(financial_report(company_id, year), status=status.HTTP_200_OK)
+
+
+def _run_section(compute, *args):
+    # Runs on an executor thread with its own connection; close it when it
+    # is obsolete, since no request_finished signal fires for this thread.
+    try:
+        return compute(*args)
+    finally:
+        close_old_connections()
+
+
+async def gather_dashboard(company_id, year=None):
+    """
+    Every dashboard section, computed concurrently. Django's async ORM runs
+    all queries on one shared thread, so each section is run synchronously on
+    its own worker thread (and connection) instead.
+    """
+    sections = {
+        'properties_summary': (properties_summary, company_id),
+        'rent_collection': (rent_collection, company_id),
+        'tenancy_expiring': (tenancy_expiring, company_id),
+        'financial_report': (financial_report, company_id, year),
+    }
+    results = await asyncio.gather(*[
+        sync_to_async(_run_section, thread_sensitive=False)(*section)
+        for section in sections.values()
+    ])
+    return dict(zip(sections, results))
+
+
+def _authorize(request, company_id):
+    """``None`` if ``request`` may read ``company_id``, else an error response."""
+    try:
+        authenticated = CompanyJWTAuthentication().authenticate(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({'detail': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    if authenticated:
+        request.user = authenticated[0]
+    if getattr(settings, 'COMPANY_SCOPE_ENFORCED', False):
+        if not authenticated:
+            return JsonResponse(
+                {'detail': 'Authentication credentials were not provided.'},
+                status=status.HTTP_401_UNAUTHORIZED)
+        if authenticated[0].company_id != company_id:
+            return JsonResponse(
+                {'detail': 'You do not have access to this company.'},
+                status=status.HTTP_403_FORBIDDEN)
+    return None
+
+
+class DashboardOverviewView(View):
+    """
+    GET /company/dashboard/overview/<company_id>/?year=<year>
+
+    The properties summary, rent collection, expiring tenancies and financial
+    report payloads in one response, keyed by section. The four sections are
+    computed concurrently, so the latency is that of the slowest one rather
+    than the sum of the four dashboard requests.
+    """
+
+    async def get(self, request, company_id):
+        error = await sync_to_async(_authorize)(request, company_id)
+        if error is not None:
+            return error
 
-        yearly_data = {}
-        for expense in expenses_by_year:
-            year_key = expense['year'].year
-            yearly_data[year_key] = {
-                'year': year_key,
-                'expenses': float(expense['total_expenses'] or 0),
-                'collections': 0.0
-            }
-
-        for collection in collections_by_year:
-            year_key = collection['year'].year
-            if year_key in yearly_data:
-                yearly_data[year_key]['collections'] = float(collection['total_collections'] or 0)
-            else:
-                yearly_data[year_key] = {
-                    'year': year_key,
-                    'expenses': 0.0,
-                    'collections': float(collection['total_collections'] or 0)
-                }
-
-        response_data['yearly_summary'] = yearly_data
-
-        return Response(response_data, status=status.HTTP_200_OK)
-    
+        try:
+            year = parse_report_year(request.GET.get('year'))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+        alias = await sync_to_async(choose_read_alias)(request)
+        # The routing context variable is copied into the worker threads.
+        with reading_from(alias):
+            payload = await gather_dashboard(company_id, year)
+        return JsonResponse(payload, encoder=JSONEncoder)
 
 
-class CollectionListView(APIView):
+class CollectionListView(ReplicaReadMixin, APIView):
     def get(self, request, company_id):
         search_query = request.query_params.get('search', '').strip()
         status_filter = request.query_params.get('status', '').strip().lower()
@@ -0,0 +1,190 @@
+"""
+Geohash helpers for location queries without PostGIS.
+
+A geohash interleaves longitude and latitude bits and spells them in base 32,
+so every prefix is a rectangular cell and nearby points mostly share a
+prefix. A bounding box is covered by a handful of equal-sized cells, and
+runs of cells that are adjacent in base 32 order become single string
+ranges. The ranges are ``BETWEEN`` conditions on an indexed column. The
+rows they return are trimmed to the exact box or circle in Python, using
+the haversine distance.
+"""
+import math
+
+from django.db.models import Q
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {char: index for index, char in enumerate(BASE32)}
+PRECISION = 9  # ~5 m cells
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    if latitude is None or longitude is None:
+        return None
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def bounds(geohash):
+    """``(south, west, north, east)`` of a geohash cell."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            interval = lng_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+def cell_size(precision):
+    """``(height, width)`` in degrees of the cells of a precision."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def _cells(south, west, north, east, precision):
+    height, width = cell_size(precision)
+    cells = set()
+    row = math.floor((south + 90) / height)
+    while row * height - 90 < north and row * height < 180:
+        column = math.floor((west + 180) / width)
+        while column * width - 180 < east and column * width < 360:
+            cells.add(encode(row * height - 90 + height / 2, column * width - 180 + width / 2, precision))
+            column += 1
+        row += 1
+    return cells
+
+
+def _boxes(south, west, north, east):
+    # A box across the antimeridian is two boxes.
+    if west <= east:
+        return [(south, west, north, east)]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+
+def covering_cells(south, west, north, east, max_cells=24):
+    """The fewest cells at the finest precision (max ``max_cells``) covering the box."""
+    boxes = _boxes(south, west, north, east)
+    for precision in range(PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        estimate = sum(
+            (math.floor((n - s) / height) + 2) * (math.floor((e - w) / width) + 2) for s, w, n, e in boxes)
+        if estimate <= max_cells:
+            break
+    cells = set()
+    for box in boxes:
+        cells |= _cells(*box, precision)
+    return sorted(cells)
+
+
+def _to_int(geohash):
+    value = 0
+    for char in geohash:
+        value = value * 32 + _DECODE[char]
+    return value
+
+
+def _to_hash(value, precision):
+    chars = []
+    for _ in range(precision):
+        value, index = divmod(value, 32)
+        chars.append(BASE32[index])
+    return ''.join(reversed(chars))
+
+
+def cell_ranges(cells):
+    """Merge same-precision cells into ``(first, last)`` runs adjacent in base 32."""
+    if not cells:
+        return []
+    precision = len(cells[0])
+    values = sorted(_to_int(cell) for cell in cells)
+    runs, start, previous = [], values[0], values[0]
+    for value in values[1:]:
+        if value != previous + 1:
+            runs.append((start, previous))
+            start = value
+        previous = value
+    runs.append((start, previous))
+    return [(_to_hash(first, precision), _to_hash(last, precision)) for first, last in runs]
+
+
+def geohash_filter(field, south, west, north, east, max_cells=24):
+    """
+    Q matching rows whose ``field`` geohash lies in cells covering the box.
+    A superset of the box: refine with ``within_box`` or ``haversine_km``.
+    """
+    condition = Q()
+    for first, last in cell_ranges(covering_cells(south, west, north, east, max_cells)):
+        # Every hash in a cell of the run sorts between the first cell and
+        # the last cell padded with the highest character.
+        condition |= Q(**{f'{field}__gte': first, f'{field}__lte': last + 'z' * PRECISION})
+    return condition
+
+
+def within_box(latitude, longitude, south, west, north, east):
+    if not south <= latitude <= north:
+        return False
+    if west <= east:
+        return west <= longitude <= east
+    return longitude >= west or longitude <= east
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def box_around(latitude, longitude, radius_km):
+    """``(south, west, north, east)`` enclosing the circle of ``radius_km``."""
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = max(-90.0, latitude - d_lat), min(90.0, latitude + d_lat)
+    if south == -90.0 or north == 90.0:
+        return south, -180.0, north, 180.0
+    # The circle is widest poleward of its centre, asin(sin r / cos lat)
+    # either side: wider than r / cos lat, noticeably so near the poles.
+    ratio = math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(latitude))
+    if ratio >= 1:
+        return south, -180.0, north, 180.0
+    d_lng = math.degrees(math.asin(ratio))
+    west, east = longitude - d_lng, longitude + d_lng
+    if west < -180:
+        west += 360
+    if east > 180:
+        east -= 360
+    return south, west, north, east
+
+
+def cluster_precision(south, west, north, east, target=64):
+    """Precision whose cells split the box into about ``target`` clusters."""
+    span_lat = north - south
+    span_lng = east - west if west <= east else east + 360 - west
+    for precision in range(1, PRECISION + 1):
+        height, width = cell_size(precision)
+        if (span_lat / height) * (span_lng / width) > target:
+            return max(1, precision - 1)
+    return PRECISION
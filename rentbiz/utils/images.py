@@ -0,0 +1,178 @@
+"""
+Resized variants of uploaded logos.
+
+``register(Model, 'company_logo', 'logo_variants')`` watches the image field:
+when a save stores a new image, ``generate_image_variants`` runs on Celery
+after the commit and writes one downscaled, recompressed copy per entry of
+``IMAGE_VARIANTS`` next to the original, recording their names in the JSON
+field:
+
+    {"source": "company_photos/acme.png",
+     "small": "company_photos/variants/acme_128.png", ...}
+
+``variant_url`` serves a size from that map, falling back to the original
+until the variants exist. ``attach_inline`` embeds the small variant in an
+email instead of attaching the original upload.
+"""
+import io
+import logging
+import os
+from email.mime.image import MIMEImage
+
+from celery import shared_task
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models.signals import post_save
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VARIANTS = {'small': 128, 'medium': 512, 'large': 1024}
+DEFAULT_QUALITY = 82
+
+
+def variant_sizes():
+    return getattr(settings, 'IMAGE_VARIANTS', DEFAULT_VARIANTS)
+
+
+def render_variant(source, size):
+    """
+    ``(bytes, extension)`` of ``source`` (a file object) fitted into
+    ``size`` x ``size``. Images with transparency stay PNG, the rest become
+    progressive JPEG.
+    """
+    from PIL import Image, ImageOps
+
+    quality = getattr(settings, 'IMAGE_VARIANT_QUALITY', DEFAULT_QUALITY)
+    with Image.open(source) as image:
+        image.draft('RGB', (size, size))  # JPEG decodes at a reduced scale
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size), Image.LANCZOS)
+
+        output = io.BytesIO()
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image.convert('RGBA').save(output, 'PNG', optimize=True)
+            return output.getvalue(), '.png'
+        image.convert('RGB').save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+        return output.getvalue(), '.jpg'
+
+
+def _variant_name(source_name, label, size, extension):
+    directory, filename = os.path.split(source_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'variants', f'{stem}_{label}_{size}{extension}')
+
+
+def _delete_variants(storage, variants):
+    for label, name in (variants or {}).items():
+        if label != 'source' and name:
+            storage.delete(name)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def generate_image_variants(self, model_label, pk, field_name, variants_field):
+    model = apps.get_model(model_label)
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None:
+        return None
+    image = getattr(instance, field_name)
+    previous = getattr(instance, variants_field) or {}
+    if not image or previous.get('source') == image.name:
+        return previous
+
+    variants = {'source': image.name}
+    try:
+        for label, size in variant_sizes().items():
+            with image.storage.open(image.name, 'rb') as source:
+                content, extension = render_variant(source, size)
+            name = _variant_name(image.name, label, size, extension)
+            if image.storage.exists(name):
+                image.storage.delete(name)
+            variants[label] = image.storage.save(name, ContentFile(content))
+    except Exception as exc:
+        logger.exception('Could not generate variants of %s', image.name)
+        # Leave nothing half made; the original is served until a retry succeeds.
+        _delete_variants(image.storage, variants)
+        raise self.retry(exc=exc)
+
+    # Only record them if the image was not replaced in the meantime; update()
+    # skips post_save so this does not schedule another run.
+    updated = model._default_manager.filter(pk=pk, **{field_name: image.name}).update(**{variants_field: variants})
+    if updated:
+        _delete_variants(image.storage, previous)
+    else:
+        _delete_variants(image.storage, variants)
+    return variants
+
+
+def register(model, field_name, variants_field):
+    """Generate variants whenever a save of ``model`` stores a new image."""
+    model_label = model._meta.label
+
+    def schedule_variants(sender, instance, **kwargs):
+        image = getattr(instance, field_name)
+        variants = getattr(instance, variants_field) or {}
+        if (image.name or None) == variants.get('source'):
+            return
+        if not image:
+            # Logo removed: drop the old variants with it.
+            _delete_variants(image.storage, variants)
+            sender._default_manager.filter(pk=instance.pk).update(**{variants_field: None})
+            return
+        transaction.on_commit(lambda: generate_image_variants.delay(
+            model_label, instance.pk, field_name, variants_field))
+
+    post_save.connect(schedule_variants, sender=model, weak=False,
+                      dispatch_uid=f'image_variants_{model_label}_{field_name}')
+
+
+def variant_name(image, variants, size):
+    """Storage name of the ``size`` variant of ``image``, or of the original."""
+    if not image:
+        return None
+    variants = variants or {}
+    if size != 'original' and variants.get('source') == image.name and variants.get(size):
+        return variants[size]
+    return image.name
+
+
+def variant_url(image, variants, size):
+    name = variant_name(image, variants, size)
+    return image.storage.url(name) if name else None
+
+
+def variant_urls(image, variants):
+    """``{size: url}`` for every configured size plus the original."""
+    if not image:
+        return None
+    sizes = [*variant_sizes(), 'original']
+    return {size: variant_url(image, variants, size) for size in sizes}
+
+
+def attach_inline(email, image, variants, cid='logo', size='small'):
+    """
+    Embed the ``size`` variant of ``image`` in ``email`` as ``cid:<cid>``. If
+    the variant has not been generated yet it is rendered on the fly; the
+    original is never attached. Returns whether an image was attached.
+    """
+    if not image:
+        return False
+    name = variant_name(image, variants, size)
+    try:
+        if name != image.name:
+            with image.storage.open(name, 'rb') as stored:
+                content = stored.read()
+        else:
+            with image.storage.open(image.name, 'rb') as source:
+                content, _ = render_variant(source, variant_sizes()[size])
+    except Exception:
+        logger.exception('Could not embed %s', image.name)
+        return False
+
+    email.mixed_subtype = 'related'
+    inline = MIMEImage(content)
+    inline.add_header('Content-ID', f'<{cid}>')
+    inline.add_header('Content-Disposition', 'inline', filename=os.path.basename(name))
+    email.attach(inline)
+    return True
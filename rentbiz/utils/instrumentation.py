@@ -0,0 +1,293 @@
+"""
+Per-request query and timing instrumentation.
+
+``QueryInstrumentationMiddleware`` records, for every request: the view name,
+the number of queries, the time spent in the database, repeated query shapes
+(the usual sign of an N+1) and the time spent producing serializer ``.data``
+(excluding the queries made meanwhile). Queries are counted on every thread
+the request runs on, so the concurrent sections of the async dashboard are
+included.
+
+The numbers are
+
+* available to callers (e.g. benchmarks) as ``request.query_stats``,
+* sent as a ``Server-Timing`` header when ``SERVER_TIMING`` is on (DEBUG),
+* accumulated per view and exposed in Prometheus text format by
+  ``metrics_view`` (per process, staff or METRICS_TOKEN only), and
+* checked against the view's query budget: the ``query_budget`` attribute of
+  the view class, else ``QUERY_BUDGETS[<view name>]``, else
+  ``QUERY_BUDGET_DEFAULT``. An overrun is logged and counted. With
+  ``QUERY_BUDGET_ACTION = 'raise'`` it raises ``QueryBudgetExceeded``
+  instead, but only under DEBUG or the test runner: the view has run by
+  then, so in production a 500 would hide a committed write from a client
+  that may retry it.
+
+The queries of a streaming response (the NDJSON exports) run while the
+server iterates its body, after the middleware has returned; they are
+counted by wrapping ``streaming_content``, and the request is recorded once
+the body is exhausted. Such responses get no ``Server-Timing`` header and
+never raise, since their headers are sent before the numbers are known.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotFound
+from django.utils.crypto import constant_time_compare
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_stats', default=None)
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """Query shape: literals and IN-list lengths removed."""
+    return _LITERAL.sub('?', _IN_LIST.sub('IN (...)', sql))
+
+
+class RequestStats:
+    def __init__(self):
+        self.view_name = None
+        self.budget = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.fingerprints = Counter()
+        self._lock = threading.Lock()
+
+    def record_query(self, sql, duration):
+        with self._lock:
+            self.queries += 1
+            self.db_time += duration
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def record_serializer(self, duration):
+        with self._lock:
+            self.serializer_time += duration
+
+    def duplicates(self):
+        threshold = getattr(settings, 'QUERY_DUPLICATE_THRESHOLD', 5)
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count >= threshold]
+
+
+def _instrument(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.record_query(sql, time.perf_counter() - started)
+
+
+def _install_wrapper(sender, connection, **kwargs):
+    if _instrument not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_instrument)
+
+
+connection_created.connect(_install_wrapper, dispatch_uid='rentbiz.instrumentation')
+
+
+def _timed_data(data_property):
+    def data(self):
+        stats = _current.get()
+        if stats is None:
+            return data_property.fget(self)
+        started, db_before = time.perf_counter(), stats.db_time
+        try:
+            return data_property.fget(self)
+        finally:
+            stats.record_serializer(time.perf_counter() - started - (stats.db_time - db_before))
+    return property(data)
+
+
+_serializers_patched = False
+
+
+def _time_serializers():
+    # Only top-level serializers have ``.data`` read; nested ones go through
+    # ``to_representation``, so this times each response's serialization once.
+    global _serializers_patched
+    if _serializers_patched:
+        return
+    serializers.Serializer.data = _timed_data(serializers.Serializer.data)
+    serializers.ListSerializer.data = _timed_data(serializers.ListSerializer.data)
+    _serializers_patched = True
+
+
+class _Metrics:
+    """Per view counters, accumulated in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = defaultdict(lambda: defaultdict(float))
+
+    def observe(self, view_name, stats, duration, over_budget):
+        with self._lock:
+            view = self.values[view_name]
+            view['requests'] += 1
+            view['queries'] += stats.queries
+            view['db_seconds'] += stats.db_time
+            view['serializer_seconds'] += stats.serializer_time
+            view['request_seconds'] += duration
+            view['duplicate_queries'] += sum(count - 1 for _, count in stats.duplicates())
+            view['budget_exceeded'] += int(over_budget)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            snapshot = {name: dict(values) for name, values in self.values.items()}
+        for metric, help_text in METRIC_HELP.items():
+            name = f'rentbiz_view_{metric}_total'
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for view_name, values in sorted(snapshot.items()):
+                label = view_name.replace('\\', '\\\\').replace('"', '\\"')
+                lines.append(f'{name}{{view="{label}"}} {values.get(metric, 0):g}')
+        return '\n'.join(lines) + '\n'
+
+
+METRIC_HELP = {
+    'requests': 'Requests handled.',
+    'queries': 'Database queries run.',
+    'db_seconds': 'Time spent in database queries.',
+    'serializer_seconds': 'Time spent building serializer data, excluding queries.',
+    'request_seconds': 'Time spent handling requests.',
+    'duplicate_queries': 'Queries repeating an already seen query shape.',
+    'budget_exceeded': 'Requests that ran more queries than their budget.',
+}
+
+metrics = _Metrics()
+
+
+def _budget_for(view_func, view_name):
+    view_class = getattr(view_func, 'view_class', None)
+    budget = getattr(view_class, 'query_budget', None)
+    if budget is None:
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+    if budget is None:
+        budget = getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+    return budget
+
+
+def _raise_on_overrun():
+    if getattr(settings, 'QUERY_BUDGET_ACTION', 'log') != 'raise':
+        return False
+    return settings.DEBUG or getattr(settings, 'TESTING', False)
+
+
+class QueryInstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        _time_serializers()
+        for connection in connections.all(initialized_only=True):
+            _install_wrapper(None, connection)
+
+    def __call__(self, request):
+        stats = request.query_stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        if response.streaming and not response.is_async:
+            response.streaming_content = self._stream(response.streaming_content, stats, started)
+            return response
+
+        duration = time.perf_counter() - started
+        over_budget = self._record(stats, duration)
+        if getattr(settings, 'SERVER_TIMING', settings.DEBUG):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"',
+                f'serializer;dur={stats.serializer_time * 1000:.1f}',
+                f'total;dur={duration * 1000:.1f}',
+            ])
+        if over_budget and _raise_on_overrun():
+            raise QueryBudgetExceeded(over_budget)
+        return response
+
+    def _stream(self, content, stats, started):
+        # Count the queries of each chunk; the context is set around every
+        # next() since the server may pull chunks from different threads.
+        chunks = iter(content)
+        try:
+            while True:
+                token = _current.set(stats)
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                finally:
+                    _current.reset(token)
+                yield chunk
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+            self._record(stats, time.perf_counter() - started)
+
+    def _record(self, stats, duration):
+        """Record a finished request; the overrun message if it was over budget."""
+        view_name = stats.view_name or 'unresolved'
+        over_budget = stats.budget is not None and stats.queries > stats.budget
+        metrics.observe(view_name, stats, duration, over_budget)
+
+        duplicates = stats.duplicates()
+        if duplicates:
+            sql, count = duplicates[0]
+            logger.warning('%s repeated a query %d times (possible N+1): %s', view_name, count, sql)
+        if not over_budget:
+            return None
+        message = '%s ran %d queries (budget %d)' % (view_name, stats.queries, stats.budget)
+        logger.warning(message)
+        return message
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = _current.get()
+        if stats is not None:
+            match = request.resolver_match
+            if match and match.url_name:
+                stats.view_name = match.view_name
+            else:
+                view = getattr(view_func, 'view_class', view_func)
+                stats.view_name = f'{view.__module__}.{view.__qualname__}'
+
+            stats.budget = _budget_for(view_func, stats.view_name)
+        return None
+
+
+def _metrics_allowed(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and constant_time_compare(credentials, token):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_staff)
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of this process's per view counters, for
+    staff sessions and scrapers holding METRICS_TOKEN.
+    """
+    if not getattr(settings, 'METRICS_ENABLED', False):
+        return HttpResponseNotFound()
+    if not _metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
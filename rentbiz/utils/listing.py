@@ -0,0 +1,63 @@
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.views import APIView
+
+from rentbiz.utils.pagination import paginate_queryset
+from rentbiz.utils.sparse_fields import sparse_context, optimize_queryset
+
+
+def stream_ndjson(queryset, serializer_class, context=None, chunk_size=500):
+    """
+    Stream ``queryset`` as newline-delimited JSON, one object per line.
+
+    Rows are read with a server-side iterator and serialized ``chunk_size`` at a
+    time, so memory stays flat regardless of how many rows the company has.
+    """
+    def rows():
+        batch = []
+        for obj in queryset.iterator(chunk_size=chunk_size):
+            batch.append(obj)
+            if len(batch) >= chunk_size:
+                yield from _dump(batch)
+                batch = []
+        if batch:
+            yield from _dump(batch)
+
+    def _dump(batch):
+        for row in serializer_class(batch, many=True, context=context or {}).data:
+            yield json.dumps(row, cls=JSONEncoder) + '\n'
+
+    return StreamingHttpResponse(rows(), content_type='application/x-ndjson')
+
+
+class CompanyListAPIView(APIView):
+    """
+    Base view for the company scoped list endpoints.
+
+    Subclasses set ``serializer_class`` and implement ``get_queryset``. The
+    response is paginated with ``CustomPagination`` and honours the sparse
+    fieldset parameters; ``?stream=ndjson`` streams every row instead, for
+    bulk consumers that need the whole list.
+
+    ``query_budget`` is the maximum number of queries one page may take; it is
+    enforced by ``QueryInstrumentationMiddleware`` and pinned by the list
+    tests (``company.tests.QueryBudgetMixin``).
+    """
+    serializer_class = None
+    query_budget = None
+    stream_chunk_size = 500
+
+    def get_queryset(self, request, company_id):
+        raise NotImplementedError
+
+    def get(self, request, company_id):
+        context = sparse_context(request)
+        queryset = optimize_queryset(
+            self.get_queryset(request, company_id), self.serializer_class, context)
+
+        if request.query_params.get('stream') == 'ndjson':
+            return stream_ndjson(queryset, self.serializer_class, context, self.stream_chunk_size)
+
+        return paginate_queryset(queryset, request, self.serializer_class, context=context)
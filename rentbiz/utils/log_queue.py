@@ -0,0 +1,85 @@
+"""
+Non-blocking log sink.
+
+``QueueSinkHandler`` is the only handler attached to the configured loggers.
+Emitting a record just puts it on a bounded in-memory queue; a
+``QueueListener`` thread formats it and does the actual stream I/O. Records
+are handed over unformatted, so ``logger.debug('... %s', obj)`` costs nothing
+more than the enqueue on the request thread. When the writer falls behind and
+the queue is full, records are dropped (and counted) instead of blocking the
+request.
+"""
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Only called on shutdown, where waiting for room is fine.
+        self.queue.put(self._sentinel)
+
+
+class QueueSinkHandler(QueueHandler):
+    """
+    ``QueueHandler`` that owns its listener thread and a stream handler.
+
+    Configured from ``settings.LOGGING`` with ``'()'``; ``maxsize`` bounds the
+    queue and the handler's formatter is used by the stream handler.
+    """
+
+    def __init__(self, maxsize=10000, stream=None):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.dropped = 0
+        self._lock_dropped = threading.Lock()
+        self.listener = None
+        self._start()
+        atexit.register(self.stop)
+        if hasattr(os, 'register_at_fork'):
+            # The listener thread does not survive a fork (gunicorn --preload,
+            # celery prefork); start a fresh one in the child.
+            os.register_at_fork(after_in_child=self._restart_in_child)
+
+    def _start(self):
+        self.listener = _Listener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+
+    def _restart_in_child(self):
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.dropped = 0
+        self._lock_dropped = threading.Lock()
+        self._start()
+
+    def setFormatter(self, fmt):
+        # The listener formats; records stay unformatted on the queue.
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Same process, no pickling: skip QueueHandler's eager formatting.
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock_dropped:
+                self.dropped += 1
+
+    def stop(self):
+        listener, self.listener = self.listener, None
+        if listener is None:
+            return
+        listener.stop()
+        if self.dropped:
+            self.target.stream.write(f'log queue full: dropped {self.dropped} records\n')
+            self.target.flush()
+
+    def close(self):
+        self.stop()
+        self.target.close()
+        super().close()
@@ -7,9 +7,9 @@ class CustomPagination(PageNumberPagination):
     page_size_query_param = 'page_size'  # Optional: allow clients to override page size
    
 
-def paginate_queryset(queryset, request, serializer_class):
+def paginate_queryset(queryset, request, serializer_class, context=None):
     paginator = CustomPagination()
     paginated_qs = paginator.paginate_queryset(queryset, request)
-    serialized_data = serializer_class(paginated_qs, many=True)
+    serialized_data = serializer_class(paginated_qs, many=True, context=context or {})
     return paginator.get_paginated_response(serialized_data.data)
 
@@ -0,0 +1,203 @@
+"""
+Sparse fieldsets for the tenancy, invoice and collection endpoints.
+
+    ?fields=id,tenancy_code,status,tenant.tenant_name
+    ?expand=tenant,unit.building
+
+Without either parameter a serializer renders exactly as before, so existing
+clients keep receiving the full payload. Once one of them is present the
+response is sparse: only the listed fields are rendered (dotted names select
+fields of a nested object) and nested relations that are not listed in
+``expand`` collapse to their primary key(s).
+
+``optimize_queryset`` walks the (already sparsified) serializer and derives
+the ``select_related``/``prefetch_related``/``only`` calls the response needs,
+so a list view fetches just what it renders. A nested serializer that needs
+annotated rows (e.g. to avoid a COUNT per object) can define an
+``annotate_queryset(queryset)`` classmethod; it is applied to the top-level
+queryset, and nested relations rendered by such a serializer are prefetched
+with an annotated queryset instead of being joined.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def _split_param(request, name):
+    raw = request.query_params.get(name)
+    if raw is None:
+        return None
+    return {part.strip() for part in raw.split(',') if part.strip()}
+
+
+def sparse_context(request):
+    """Serializer context carrying the sparse fieldset of ``request``, if any."""
+    fields = _split_param(request, 'fields')
+    expand = _split_param(request, 'expand')
+    if fields is None and expand is None:
+        return {}
+    return {'sparse': {'fields': fields, 'expand': expand or set()}}
+
+
+def _children(paths, name):
+    prefix = f'{name}.'
+    return {path[len(prefix):] for path in paths if path.startswith(prefix)}
+
+
+def _collapse(field):
+    # DRF rejects a ``source`` equal to the field name as redundant.
+    kwargs = {'source': field.source} if field.source != field.field_name else {}
+    if isinstance(field, serializers.ListSerializer):
+        return serializers.PrimaryKeyRelatedField(many=True, read_only=True, **kwargs)
+    return serializers.PrimaryKeyRelatedField(read_only=True, **kwargs)
+
+
+def apply_sparse_fieldset(serializer, fields, expand):
+    """Drop unrequested fields and collapse unexpanded relations in place."""
+    top_fields = {path.split('.', 1)[0] for path in fields} if fields else None
+    top_expand = {path.split('.', 1)[0] for path in expand}
+
+    for name in list(serializer.fields):
+        if top_fields is not None and name not in top_fields:
+            serializer.fields.pop(name)
+            continue
+
+        field = serializer.fields[name]
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        if not isinstance(nested, serializers.BaseSerializer):
+            continue
+
+        if name in top_expand:
+            sub_fields = _children(fields, name) if fields else set()
+            apply_sparse_fieldset(nested, sub_fields or None, _children(expand, name))
+        else:
+            serializer.fields[name] = _collapse(field)
+
+
+class SparseFieldsetMixin:
+    """Serializer mixin honouring the ``sparse`` entry of the context."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        sparse = self.context.get('sparse')
+        if sparse:
+            apply_sparse_fieldset(self, sparse['fields'], sparse['expand'])
+
+
+def _relation_path(model, attrs):
+    """Longest prefix of ``attrs`` that walks forward/reverse relations of ``model``."""
+    path = []
+    for attr in attrs:
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            break
+        if not field.is_relation or field.related_model is None:
+            break
+        path.append((attr, field.many_to_many or field.one_to_many))
+        model = field.related_model
+    return path
+
+
+def _prefetch_with(serializer, lookup, prefetch):
+    annotate = getattr(serializer, 'annotate_queryset', None)
+    if annotate is None:
+        return False
+    prefetch[lookup] = annotate(serializer.Meta.model._default_manager.all())
+    return True
+
+
+def _collect(serializer, prefix, via_many, select, prefetch, only):
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    if model is None:
+        return
+
+    for name, field in serializer.fields.items():
+        if field.source == '*':
+            continue
+        attrs = field.source.split('.')
+
+        if isinstance(field, (serializers.ListSerializer, serializers.ManyRelatedField)):
+            lookup = prefix + '__'.join(attrs)
+            prefetch.setdefault(lookup, None)
+            if isinstance(field, serializers.ListSerializer):
+                _prefetch_with(field.child, lookup, prefetch)
+                _collect(field.child, lookup + '__', True, select, prefetch, None)
+            continue
+
+        if isinstance(field, serializers.BaseSerializer):
+            lookup = prefix + '__'.join(attrs)
+            if via_many or _prefetch_with(field, lookup, prefetch):
+                prefetch.setdefault(lookup, None)
+                _collect(field, lookup + '__', True, select, prefetch, None)
+            else:
+                select.add(lookup)
+                _collect(field, lookup + '__', False, select, prefetch, None)
+            if only is not None:
+                only.add(attrs[0])
+            continue
+
+        if isinstance(field, serializers.SerializerMethodField):
+            # Method fields may read any column; keep the row complete.
+            if only is not None:
+                only.add(None)
+            continue
+
+        if len(attrs) > 1:
+            relations = _relation_path(model, attrs[:-1])
+            walked = []
+            many = via_many
+            for attr, is_many in relations:
+                walked.append(attr)
+                many = many or is_many
+                if many:
+                    prefetch.setdefault(prefix + '__'.join(walked), None)
+                else:
+                    select.add(prefix + '__'.join(walked))
+        if only is not None:
+            only.add(attrs[0])
+
+
+def optimize_queryset(queryset, serializer_class, context=None):
+    """
+    Add the joins and prefetches ``serializer_class`` needs to render
+    ``queryset`` and, for sparse requests, restrict the loaded columns.
+    """
+    context = context or {}
+    serializer = serializer_class(context=context)
+    select, prefetch = set(), {}
+    only = set() if context.get('sparse', {}).get('fields') else None
+    _collect(serializer, '', False, select, prefetch, only)
+
+    annotate = getattr(serializer_class, 'annotate_queryset', None)
+    if annotate is not None:
+        queryset = annotate(queryset)
+    if select:
+        queryset = queryset.select_related(*sorted(select))
+    if prefetch:
+        # Sorted so a Prefetch with a custom queryset precedes its sub-lookups.
+        queryset = queryset.prefetch_related(*[
+            Prefetch(lookup, queryset=prefetch[lookup]) if prefetch[lookup] is not None else lookup
+            for lookup in sorted(prefetch)
+        ])
+    if only and None not in only:
+        model = queryset.model
+        columns = {'pk'}
+        for name in only:
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.concrete:
+                columns.add(name)
+        columns.update(lookup.split('__', 1)[0] for lookup in select)
+        existing = queryset.query.select_related
+        if existing is True:
+            # A bare select_related() follows every non-null FK; any of them
+            # would clash with a deferred column.
+            return queryset
+        if existing:
+            # Relations the view already joins must not be deferred either.
+            columns.update(existing)
+        queryset = queryset.only(*columns)
+    return queryset